@@ -164,6 +164,24 @@ GRAPHENE = {
 
 AUTHENTICATION_REQUIRED = False
 
+# Recommendations can be cached on a 'recommendations' cache.
+# The cache is disabled by default. Jobs run by different workers
+# only share it when the backend is shared too, like Memcached or
+# Redis; a local memory cache is private to each process. Every
+# write on the registry makes the stored entries stale, so set a
+# finite TIMEOUT to evict them. For example:
+#
+#    CACHES = {
+#        'default': {
+#            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+#        },
+#        'recommendations': {
+#            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+#            'LOCATION': '127.0.0.1:11211',
+#            'TIMEOUT': 3600
+#        }
+#    }
+
 RQ_QUEUES = {
     'default': {
         'HOST': 'localhost',
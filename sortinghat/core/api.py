@@ -28,6 +28,7 @@ import django.db.transaction
 from grimoirelab_toolkit.datetime import datetime_to_utc
 
 from .db import (find_individual_by_uuid,
+                 find_individuals_by_uuids,
                  find_identity,
                  find_organization,
                  find_domain,
@@ -40,19 +41,27 @@ from .db import (find_individual_by_uuid,
                  delete_identity as delete_identity_db,
                  delete_organization as delete_organization_db,
                  delete_domain as delete_domain_db,
+                 merge_organizations as merge_organizations_db,
                  update_profile as update_profile_db,
                  move_identity as move_identity_db,
+                 merge_individuals as merge_individuals_db,
                  lock as lock_db,
                  unlock as unlock_db,
-                 add_enrollment,
-                 delete_enrollment)
-from .errors import (InvalidValueError,
+                 update_enrollments as update_enrollments_db)
+from .errors import (BaseError,
+                     InvalidValueError,
                      AlreadyExistsError,
                      NotFoundError,
                      DuplicateRangeError,
-                     EqualIndividualError)
+                     EqualIndividualError,
+                     LockedIdentityError)
 from .log import TransactionsLog
-from .models import Identity, MIN_PERIOD_DATE, MAX_PERIOD_DATE
+from .models import (Enrollment,
+                     Identity,
+                     Organization,
+                     MIN_PERIOD_DATE,
+                     MAX_PERIOD_DATE)
+from .recommendations.affiliation import schedule_affiliation_recommendations
 from .utils import unaccent_string, merge_datetime_ranges
 
 
@@ -122,7 +131,8 @@ def generate_uuid(source, email=None, name=None, username=None):
 
 
 @django.db.transaction.atomic
-def add_identity(ctx, source, name=None, email=None, username=None, uuid=None):
+def add_identity(ctx, source, name=None, email=None, username=None, uuid=None,
+                 if_exists='error'):
     """Add an identity to the registry.
 
     This function adds a new identity to the registry. By default,
@@ -150,6 +160,12 @@ def add_identity(ctx, source, name=None, email=None, username=None, uuid=None):
     exception will be raised when the function tries to insert a
     tuple that exists in the registry.
 
+    Set `if_exists` to `'return'` to get the stored identity instead
+    of the exception. In that case, the identifier of the identity is
+    looked up before anything is written, and when it is found the
+    identity is returned as it is, whatever individual it belongs to;
+    no transaction is logged and no individual is modified.
+
     The function returns the new identity associated to the new
     registered identity.
 
@@ -160,17 +176,23 @@ def add_identity(ctx, source, name=None, email=None, username=None, uuid=None):
     :param username: user name used by the identity
     :param uuid: associates the new identity to the individual
         identified by this id
+    :param if_exists: what to do when the identity already exists;
+        `'error'` raises an `AlreadyExistsError` and `'return'`
+        returns the stored identity
 
     :returns: a universal unique identifier
 
     :raises InvalidValueError: when `source` is `None` or empty;
-        when all the identity parameters are `None` or empty.
+        when all the identity parameters are `None` or empty;
+        when `if_exists` is not a valid value.
     :raises AlreadyExistsError: raised when the identity already
         exists in the registry.
     :raises NotFoundError: raised when the individual
         associated to the given `uuid` is not in the registry.
     """
-    trxl = TransactionsLog.open('add_identity', ctx)
+    if if_exists not in ('error', 'return'):
+        msg = "'if_exists' must be 'error' or 'return'; {} given".format(if_exists)
+        raise InvalidValueError(msg=msg)
 
     try:
         id_ = generate_uuid(source, email=email,
@@ -178,6 +200,15 @@ def add_identity(ctx, source, name=None, email=None, username=None, uuid=None):
     except ValueError as e:
         raise InvalidValueError(msg=str(e))
 
+    if if_exists == 'return':
+        identity = Identity.objects.filter(uuid=id_).select_related('individual').first()
+
+        if identity:
+            logger.debug(f"Identity {identity.uuid} already exists; returned")
+            return identity
+
+    trxl = TransactionsLog.open('add_identity', ctx)
+
     if not uuid:
         individual = add_individual_db(trxl, id_)
         # In case there is no name, set `username` as profile name
@@ -202,6 +233,9 @@ def add_identity(ctx, source, name=None, email=None, username=None, uuid=None):
     except ValueError as e:
         raise InvalidValueError(msg=str(e))
 
+    if identity.email:
+        schedule_affiliation_recommendations(mks=[identity.individual_id])
+
     trxl.close()
 
     if not uuid:
@@ -257,6 +291,7 @@ def delete_identity(ctx, uuid):
     else:
         delete_identity_db(trxl, identity)
         individual.refresh_from_db()
+        schedule_affiliation_recommendations(mks=[individual.mk])
 
     trxl.close()
 
@@ -370,6 +405,7 @@ def move_identity(ctx, from_uuid, to_uuid):
     trxl = TransactionsLog.open('move_identity', ctx)
 
     identity = find_identity(from_uuid)
+    from_mk = identity.individual.mk
 
     if identity.uuid == identity.individual.mk:
         msg = "'from_uuid' is an individual and it cannot be moved; use 'merge' instead"
@@ -388,6 +424,8 @@ def move_identity(ctx, from_uuid, to_uuid):
         # Case when the identity is already assigned to the individual
         individual = to_indv
 
+    schedule_affiliation_recommendations(mks=[from_mk, individual.mk])
+
     trxl.close()
 
     logger.info(f"Identity {from_uuid} moved to {to_uuid}")
@@ -558,6 +596,8 @@ def add_domain(ctx, organization, domain_name, is_top_domain=True):
     except AlreadyExistsError as exc:
         raise exc
 
+    schedule_affiliation_recommendations(domain_names=[domain.domain])
+
     trxl.close()
 
     logger.info(f"Domain {domain.domain} created for organization {organization.name}")
@@ -596,8 +636,12 @@ def delete_organization(ctx, name):
     except NotFoundError as exc:
         raise exc
 
+    domain_names = list(org.domains.values_list('domain', flat=True))
+
     delete_organization_db(trxl, organization=org)
 
+    schedule_affiliation_recommendations(domain_names=domain_names)
+
     trxl.close()
 
     logger.info(f"Organization {name} deleted")
@@ -605,6 +649,77 @@ def delete_organization(ctx, name):
     return org
 
 
+@django.db.transaction.atomic
+def merge_organizations(ctx, from_org, to_org):
+    """Merge an organization into another one.
+
+    This function moves the domains and the enrollments of the
+    organization `from_org` to the organization `to_org`. After
+    that, `from_org` is removed from the registry. Enrollments of
+    an individual in both organizations which overlap are merged
+    into a single enrollment.
+
+    Both organizations must exist on the registry. Otherwise, it
+    will raise a `NotFoundError` exception. When any individual
+    enrolled in `from_org` is locked, the organizations are not
+    merged and a `LockedIdentityError` exception is raised.
+
+    :param ctx: context from where this method is called
+    :param from_org: name of the organization to merge
+    :param to_org: name of the organization where `from_org`
+        will be merged
+
+    :returns: the organization resulting from the merge
+
+    :raises InvalidValueError: raised when any of the names is None
+        or an empty string, or when both names are equal
+    :raises NotFoundError: raised when any of the organizations does
+        not exist in the registry
+    :raises LockedIdentityError: raised when any individual enrolled
+        in `from_org` is locked
+    """
+    if from_org is None:
+        raise InvalidValueError(msg="'from_org' cannot be None")
+    if from_org == '':
+        raise InvalidValueError(msg="'from_org' cannot be an empty string")
+    if to_org is None:
+        raise InvalidValueError(msg="'to_org' cannot be None")
+    if to_org == '':
+        raise InvalidValueError(msg="'to_org' cannot be an empty string")
+    if from_org == to_org:
+        msg = "'to_org' {} cannot be equal to 'from_org'".format(to_org)
+        raise InvalidValueError(msg=msg)
+
+    trxl = TransactionsLog.open('merge_organizations', ctx)
+
+    try:
+        from_organization = find_organization(from_org)
+        to_organization = find_organization(to_org)
+    except ValueError as e:
+        raise InvalidValueError(msg=str(e))
+    except NotFoundError as exc:
+        raise exc
+
+    domain_names = list(from_organization.domains.values_list('domain', flat=True))
+    enrollments = Enrollment.objects.filter(organization__in=[from_organization,
+                                                              to_organization])
+    mks = list(enrollments.values_list('individual', flat=True).distinct())
+
+    merge_organizations_db(trxl, from_organization, to_organization)
+
+    # Enrollments and domains changed, so the recommendations
+    # of the individuals involved must be calculated again
+    schedule_affiliation_recommendations(mks=mks, domain_names=domain_names)
+
+    trxl.close()
+
+    to_organization.refresh_from_db()
+
+    logger.info(f"Organization {from_org} merged with {to_org}")
+
+    return to_organization
+
+
 @django.db.transaction.atomic
 def delete_domain(ctx, domain_name):
     """Remove a domain from the registry.
@@ -637,6 +752,8 @@ def delete_domain(ctx, domain_name):
 
     delete_domain_db(trxl, domain)
 
+    schedule_affiliation_recommendations(domain_names=[domain_name])
+
     trxl.close()
 
     logger.info(f"Domain {domain_name} deleted")
@@ -670,6 +787,9 @@ def enroll(ctx, uuid, organization, from_date=None, to_date=None, force=False):
     or end dates, the range will be overwritten with the new `from_date` and
     `to_date` values.
 
+    Only the enrollments that change are removed or added, so the
+    operations logged are the ones that modify the registry.
+
     The individual object with updated enrollment data is returned
     as the result of calling this function.
 
@@ -713,40 +833,23 @@ def enroll(ctx, uuid, organization, from_date=None, to_date=None, force=False):
     individual = find_individual_by_uuid(uuid)
     org = find_organization(organization)
 
-    # Get the list of current ranges
-    # Check whether the new one already exist
+    # Get the list of current ranges that overlap with
+    # the new one and calculate the new list of ranges
     enrollments_db = search_enrollments_in_period(individual.mk, organization,
                                                   from_date=from_date,
                                                   to_date=to_date)
 
-    periods = [[enr_db.start, enr_db.end] for enr_db in enrollments_db]
-
-    for period in periods:
-        if from_date >= period[0] and to_date <= period[1]:
-            # If any of the dates are the default ones
-            default_values = (period[0] == MIN_PERIOD_DATE) or (period[1] == MAX_PERIOD_DATE)
-            if default_values and force:
-                # Default values will be overwritten with input values
-                continue
-            raise DuplicateRangeError(start=from_date, end=to_date, org=organization)
-        if to_date < period[0]:
-            break
-
-    periods.append([from_date, to_date])
+    periods = [(enr_db.start, enr_db.end) for enr_db in enrollments_db]
+    periods = _add_period(periods, from_date, to_date, organization, force=force)
 
-    # Remove old enrollments and add new ones based in the new ranges
-    for enrollment_db in enrollments_db:
-        delete_enrollment(trxl, enrollment_db)
-
-    try:
-        dt_ranges = merge_datetime_ranges(periods, exclude_limits=force)
-        for start_dt, end_dt in dt_ranges:
-            add_enrollment(trxl, individual, org, start=start_dt, end=end_dt)
-    except ValueError as e:
-        raise InvalidValueError(msg=str(e))
+    # Only the ranges that changed are written
+    removed, added = _diff_enrollments(individual, org, enrollments_db, periods)
+    update_enrollments_db(trxl, removed, added)
 
     individual.refresh_from_db()
 
+    schedule_affiliation_recommendations(mks=[individual.mk])
+
     trxl.close()
 
     logger.info(
@@ -757,6 +860,139 @@ def enroll(ctx, uuid, organization, from_date=None, to_date=None, force=False):
     return individual
 
 
+@django.db.transaction.atomic
+def enroll_many(ctx, enrollments):
+    """Enroll several individuals in organizations at once.
+
+    Each enrollment is a tuple with the identifier of the individual,
+    the name of the organization and the dates when the enrollment
+    starts and ends; `None` dates take the default values. The result
+    is the same as calling `enroll` for each enrollment, in order,
+    without forcing the dates, but individuals, organizations and
+    their current enrollments are found before any of them is
+    processed. Periods are merged in memory and, after that, only
+    the enrollments that changed are removed or added, using bulk
+    queries inside a single transaction.
+
+    Errors are reported per enrollment. When the values of an
+    enrollment are not valid, the individual or the organization
+    do not exist, the period is already part of an enrollment or the
+    individual is locked, the enrollment is not applied and the error
+    is returned with the rest of errors, but the other enrollments
+    are applied.
+
+    :param ctx: context from where this method is called
+    :param enrollments: list of `(uuid, organization, from_date, to_date)`
+        tuples
+
+    :returns: a tuple with the list of enrollments applied and the
+        list of errors found
+
+    :raises InvalidValueError: raised when `enrollments` is None
+    """
+    def _check_enrollment(uuid, organization, from_date, to_date):
+        """Check the values of an enrollment and return its period"""
+
+        if uuid is None:
+            raise InvalidValueError(msg="'uuid' cannot be None")
+        if uuid == '':
+            raise InvalidValueError(msg="'uuid' cannot be an empty string")
+        if organization is None:
+            raise InvalidValueError(msg="'organization' cannot be None")
+        if organization == '':
+            raise InvalidValueError(msg="'organization' cannot be an empty string")
+
+        from_date = datetime_to_utc(from_date) if from_date else MIN_PERIOD_DATE
+        to_date = datetime_to_utc(to_date) if to_date else MAX_PERIOD_DATE
+
+        if from_date > to_date:
+            msg = "'start' date {} cannot be greater than {}".format(from_date, to_date)
+            raise InvalidValueError(msg=msg)
+
+        return from_date, to_date
+
+    if enrollments is None:
+        raise InvalidValueError(msg="'enrollments' cannot be None")
+
+    trxl = TransactionsLog.open('enroll_many', ctx)
+
+    uuids = {enrollment[0] for enrollment in enrollments}
+    names = {enrollment[1] for enrollment in enrollments}
+
+    individuals = find_individuals_by_uuids(uuids)
+    organizations = {org.name: org for org in Organization.objects.filter(name__in=names)}
+
+    # Current enrollments of each pair of individual and organization
+    stored = {}
+
+    enrollments_db = Enrollment.objects.filter(individual__in={indv.mk for indv in individuals.values()},
+                                               organization__in=organizations.values())\
+        .select_related('individual', 'organization')
+
+    for enrollment_db in enrollments_db:
+        key = (enrollment_db.individual_id, enrollment_db.organization.name)
+        stored.setdefault(key, []).append(enrollment_db)
+
+    # Merge the new periods in memory
+    periods = {}
+    entities = {}
+    applied = []
+    errors = []
+
+    for uuid, organization, from_date, to_date in enrollments:
+        try:
+            from_date, to_date = _check_enrollment(uuid, organization, from_date, to_date)
+
+            try:
+                individual = individuals[uuid]
+            except KeyError:
+                raise NotFoundError(entity=uuid)
+            try:
+                org = organizations[organization]
+            except KeyError:
+                raise NotFoundError(entity=organization)
+
+            key = (individual.mk, org.name)
+            if key in periods:
+                current = periods[key]
+            else:
+                current = [(enr_db.start, enr_db.end) for enr_db in stored.get(key, [])]
+
+            new_periods = _add_period(current, from_date, to_date, organization)
+
+            if individual.is_locked:
+                raise LockedIdentityError(uuid=individual.mk)
+        except BaseError as exc:
+            errors.append(exc)
+            continue
+
+        periods[key] = new_periods
+        entities[key] = (individual, org)
+        applied.append((uuid, organization, from_date, to_date))
+
+    # Write only the enrollments that changed
+    removed = []
+    added = []
+
+    for key, key_periods in periods.items():
+        individual, org = entities[key]
+        key_removed, key_added = _diff_enrollments(individual, org,
+                                                   stored.get(key, []),
+                                                   key_periods)
+        removed.extend(key_removed)
+        added.extend(key_added)
+
+    update_enrollments_db(trxl, removed, added)
+
+    schedule_affiliation_recommendations(mks=[mk for mk, _ in periods.keys()])
+
+    trxl.close()
+
+    logger.info(f"{len(applied)} enrollments applied; {len(errors)} errors found")
+
+    return applied, errors
+
+
 @django.db.transaction.atomic
 def withdraw(ctx, uuid, organization, from_date=None, to_date=None):
     """Withdraw an individual from an organization.
@@ -825,40 +1061,23 @@ def withdraw(ctx, uuid, organization, from_date=None, to_date=None):
     individual = find_individual_by_uuid(uuid)
     org = find_organization(organization)
 
-    # Get the list of current ranges
-    # Check whether any enrollment for the given period exist
+    # Get the list of current ranges that overlap with
+    # the given period and calculate the new list of ranges
     enrollments_db = search_enrollments_in_period(individual.mk, organization,
                                                   from_date=from_date,
                                                   to_date=to_date)
 
-    if not enrollments_db:
-        eid = "enrollment with range '{}'-'{}' for {}".format(from_date,
-                                                              to_date,
-                                                              organization)
-        raise NotFoundError(entity=eid)
+    periods = [(enr_db.start, enr_db.end) for enr_db in enrollments_db]
+    periods = _remove_period(periods, from_date, to_date, organization)
 
-    # Remove enrollments and generate new periods
-    mins = []
-    maxs = []
-
-    for enrollment_db in enrollments_db:
-        mins.append(enrollment_db.start)
-        maxs.append(enrollment_db.end)
-        delete_enrollment(trxl, enrollment_db)
-
-    min_range = min(mins)
-    max_range = max(maxs)
-
-    try:
-        if min_range < from_date:
-            add_enrollment(trxl, individual, org, start=min_range, end=from_date)
-        if max_range > to_date:
-            add_enrollment(trxl, individual, org, start=to_date, end=max_range)
-    except ValueError as e:
-        raise InvalidValueError(msg=str(e))
+    # Only the ranges that changed are written
+    removed, added = _diff_enrollments(individual, org, enrollments_db, periods)
+    update_enrollments_db(trxl, removed, added)
 
     individual.refresh_from_db()
 
+    schedule_affiliation_recommendations(mks=[individual.mk])
+
     trxl.close()
 
     logger.info(
@@ -883,6 +1102,10 @@ def update_enrollment(ctx, uuid, organization, from_date, to_date,
     parameter is set to `True`, as it overwrites default dates in case a more
     specific date is provided when the updated enrollment is added.
 
+    The new ranges are calculated before writing anything, so only
+    the enrollments that change are removed or added, inside a single
+    transaction.
+
     In case any of the new dates are missing, the former value for that date
     will be preserved.
 
@@ -940,11 +1163,41 @@ def update_enrollment(ctx, uuid, organization, from_date, to_date,
 
     trxl = TransactionsLog.open('update_enrollment', ctx)
 
-    # Remove the enrollment(s) associated with the old dates
-    withdraw(ctx, uuid, organization, from_date=from_date, to_date=to_date)
+    from_date = datetime_to_utc(from_date)
+    to_date = datetime_to_utc(to_date)
+    new_from_date = datetime_to_utc(new_from_date)
+    new_to_date = datetime_to_utc(new_to_date)
+
+    if from_date < MIN_PERIOD_DATE or from_date > MAX_PERIOD_DATE:
+        raise InvalidValueError(msg="'from_date' date {} is out of bounds".format(from_date))
+    if to_date < MIN_PERIOD_DATE or to_date > MAX_PERIOD_DATE:
+        raise InvalidValueError(msg="'to_date' date {} is out of bounds".format(to_date))
+
+    # Find and check entities
+    individual = find_individual_by_uuid(uuid)
+    org = find_organization(organization)
+
+    # Remove the old dates from the current ranges
+    # and add the new ones to calculate the new list
+    enrollments_db = search_enrollments_in_period(individual.mk, organization,
+                                                  from_date=MIN_PERIOD_DATE,
+                                                  to_date=MAX_PERIOD_DATE)
+
+    periods = [(enr_db.start, enr_db.end) for enr_db in enrollments_db]
+    periods = _remove_period(periods, from_date, to_date, organization)
+
+    if individual.is_locked:
+        raise LockedIdentityError(uuid=individual.mk)
+
+    periods = _add_period(periods, new_from_date, new_to_date, organization, force=force)
 
-    # Add the enrollment with the new dates
-    indv = enroll(ctx, uuid, organization, from_date=new_from_date, to_date=new_to_date, force=force)
+    # Only the ranges that changed are written
+    removed, added = _diff_enrollments(individual, org, enrollments_db, periods)
+    update_enrollments_db(trxl, removed, added)
+
+    individual.refresh_from_db()
+
+    schedule_affiliation_recommendations(mks=[individual.mk])
 
     trxl.close()
 
@@ -953,7 +1206,7 @@ def update_enrollment(ctx, uuid, organization, from_date, to_date,
         f"from='{from_date}' to='{to_date}'; new_from='{new_from_date}' new_to='{new_to_date}';"
     )
 
-    return indv
+    return individual
 
 
 @django.db.transaction.atomic
@@ -982,6 +1235,10 @@ def merge(ctx, from_uuids, to_uuid):
     The function raises a `NotFoundError` exception when either any `from_uuid`
     or `to_uuid` do not exist in the registry.
 
+    Individuals are found, and their identities, enrollments and profiles
+    are updated, using bulk queries (see `merge_many`), so the number of
+    queries does not depend on the number of identities or enrollments.
+
     :param ctx: context from where this method is called
     :param from_uuids: List of identifiers of the individuals set to merge
     :param to_uuid: identifier of the individual where `from_uuids`
@@ -997,98 +1254,37 @@ def merge(ctx, from_uuids, to_uuid):
     def _find_individuals(from_uuids, to_uuid):
         """Find the individuals to be merged from their uuids"""
 
-        individuals = []
+        uuids = [to_uuid] + [from_uuid for from_uuid in from_uuids if from_uuid]
+        individuals = find_individuals_by_uuids(uuids)
+
+        try:
+            to_individual = individuals[to_uuid]
+        except KeyError:
+            raise NotFoundError(entity=to_uuid)
+
+        from_individuals = {}
         for from_uuid in from_uuids:
             # Check whether input values are valid
             if from_uuid is None:
                 raise InvalidValueError(msg="'from_uuid' cannot be None")
             if from_uuid == '':
                 raise InvalidValueError(msg="'from_uuid' cannot be an empty string")
-            if from_uuid == to_uuid:
-                msg = "'to_uuid' {} cannot be part of 'from_uuids'".format(to_uuid)
+            if from_uuid == to_individual.mk:
+                msg = "'to_uuid' {} cannot be part of 'from_uuids'".format(to_individual.mk)
                 raise EqualIndividualError(msg=msg)
 
             try:
-                from_indv = find_individual_by_uuid(from_uuid)
-                individuals.append(from_indv)
-            except NotFoundError as exc:
-                raise exc
-
-        return individuals
-
-    def _get_identities(from_individuals):
-        """Get all the sub-identities from all the individuals to be merged"""
-
-        identities = Identity.objects.none()  # Initialize empty QuerySet
-        for from_indv in from_individuals:
-            try:
-                identities = identities | from_indv.identities.all()
-            except ValueError as e:
-                raise InvalidValueError(msg=str(e))
-
-        return identities
-
-    def _move_identities(trxl, from_individuals, to_individual):
-        """Move single identities into the target individual"""
+                from_indv = individuals[from_uuid]
+            except KeyError:
+                raise NotFoundError(entity=from_uuid)
 
-        identities = _get_identities(from_individuals)
-        for identity in identities:
-            move_identity_db(trxl, identity, to_individual)
-
-    def _merge_enrollments(trxl, from_individuals, to_individual):
-        """Merge enrollments from `Individual` objects"""
-
-        # Get current enrollments from all individuals
-        enrollments_db = to_individual.enrollments.all()
-        for from_indv in from_individuals:
-            enrollments_db = enrollments_db | from_indv.enrollments.all()
-
-        enrollments = {}
-        for enrollment in enrollments_db:
-            org = enrollment.organization
-            dates = enrollments.setdefault(org, [])
-            dates.append((enrollment.start, enrollment.end))
-            enrollments[org] = dates
+            if from_indv.mk == to_individual.mk:
+                msg = "'to_uuid' {} cannot be part of 'from_uuids'".format(to_individual.mk)
+                raise EqualIndividualError(msg=msg)
 
-        # Remove old enrollments and add new ones based in the new ranges
-        for enrollment_db in enrollments_db:
-            delete_enrollment(trxl, enrollment_db)
+            from_individuals[from_indv.mk] = from_indv
 
-        # Add new enrollments merging datetime ranges
-        for org in enrollments.keys():
-            periods = enrollments[org]
-            try:
-                for start_dt, end_dt in merge_datetime_ranges(periods, exclude_limits=True):
-                    add_enrollment(trxl, to_individual, org, start=start_dt, end=end_dt)
-            except ValueError as e:
-                raise InvalidValueError(msg=str(e))
-
-        return to_individual
-
-    def _merge_profiles(from_individuals, to_individual):
-        """Merge the profiles from `Individual` objects"""
-
-        for from_indv in from_individuals:
-            if not to_individual.profile.is_bot and from_indv.profile.is_bot:
-                to_individual.profile.is_bot = True
-            if not to_individual.profile.name:
-                to_individual.profile.name = from_indv.profile.name
-            if not to_individual.profile.email:
-                to_individual.profile.email = from_indv.profile.email
-            if not to_individual.profile.gender:
-                to_individual.profile.gender = from_indv.profile.gender
-            if not to_individual.profile.gender_acc:
-                to_individual.profile.gender_acc = from_indv.profile.gender_acc
-            if not to_individual.profile.country:
-                to_individual.profile.country = from_indv.profile.country
-
-        return to_individual
-
-    def _delete_individuals(trxl, individuals):
-        """Delete individuals from the database"""
-
-        for indv in individuals:
-            delete_individual_db(trxl, indv)
+        return to_individual, list(from_individuals.values())
 
     # Check input values
     if from_uuids is None:
@@ -1102,33 +1298,149 @@ def merge(ctx, from_uuids, to_uuid):
 
     trxl = TransactionsLog.open('merge', ctx)
 
-    try:
-        to_individual = find_individual_by_uuid(to_uuid)
-        from_individuals = _find_individuals(from_uuids,
-                                             to_individual.mk)
-    except NotFoundError as exc:
-        # At least one individual was not found, so they cannot be merged
-        raise exc
+    to_individual, from_individuals = _find_individuals(from_uuids, to_uuid)
 
-    _move_identities(trxl, from_individuals, to_individual)
+    merge_individuals_db(trxl, [(to_individual, from_individuals)])
 
-    to_individual = _merge_enrollments(trxl, from_individuals, to_individual)
-    to_individual.refresh_from_db()
-
-    to_individual = _merge_profiles(from_individuals, to_individual)
-    update_profile_db(trxl, to_individual)
-
-    _delete_individuals(trxl, from_individuals)
+    schedule_affiliation_recommendations(mks=[to_individual.mk])
 
     trxl.close()
 
-    to_individual.refresh_from_db()
-
     logger.info(f"Individuals {from_uuids} merged with {to_uuid}")
 
     return to_individual
 
 
+@django.db.transaction.atomic
+def merge_many(ctx, groups):
+    """Merge several groups of individuals at once.
+
+    Each group is a tuple with the identifier of the individual where
+    the rest of individuals will be merged (`to_uuid`) and the list
+    of identifiers of the individuals to merge (`from_uuids`). The
+    result is the same as calling `merge` for each group, in order,
+    but individuals are found and data is written using bulk queries
+    for all the groups, inside a single transaction.
+
+    Groups are merged in rounds. When a group includes an individual
+    that is part of a previous group, it is merged on the next round,
+    after the previous groups were merged, so individuals are found
+    again.
+
+    Errors are reported per group. When the values of a group are
+    not valid, any of its individuals does not exist or is locked,
+    the group is not merged and the error is returned with the rest
+    of errors, but the other groups are merged.
+
+    :param ctx: context from where this method is called
+    :param groups: list of `(to_uuid, from_uuids)` tuples
+
+    :returns: a tuple with the list of main keys of the individuals
+        resulting from the merges and the list of errors found
+
+    :raises InvalidValueError: raised when `groups` is None
+    """
+    def _check_group(to_uuid, from_uuids):
+        """Check whether the values of a group are valid"""
+
+        if from_uuids is None:
+            raise InvalidValueError(msg="'from_uuids' cannot be None")
+        if len(from_uuids) == 0:
+            raise InvalidValueError(msg="'from_uuids' cannot be an empty list")
+        if to_uuid is None:
+            raise InvalidValueError(msg="'to_uuid' cannot be None")
+        if to_uuid == '':
+            raise InvalidValueError(msg="'to_uuid' cannot be an empty string")
+
+        for from_uuid in from_uuids:
+            if from_uuid is None:
+                raise InvalidValueError(msg="'from_uuid' cannot be None")
+            if from_uuid == '':
+                raise InvalidValueError(msg="'from_uuid' cannot be an empty string")
+
+    def _find_group(to_uuid, from_uuids, individuals):
+        """Find the individuals of a group"""
+
+        try:
+            to_individual = individuals[to_uuid]
+        except KeyError:
+            raise NotFoundError(entity=to_uuid)
+
+        from_individuals = {}
+        for from_uuid in from_uuids:
+            try:
+                from_individual = individuals[from_uuid]
+            except KeyError:
+                raise NotFoundError(entity=from_uuid)
+
+            if from_individual.mk == to_individual.mk:
+                msg = "'to_uuid' {} cannot be part of 'from_uuids'".format(to_uuid)
+                raise EqualIndividualError(msg=msg)
+
+            from_individuals[from_individual.mk] = from_individual
+
+        for individual in [*from_individuals.values(), to_individual]:
+            if individual.is_locked:
+                raise LockedIdentityError(uuid=individual.mk)
+
+        return to_individual, list(from_individuals.values())
+
+    if groups is None:
+        raise InvalidValueError(msg="'groups' cannot be None")
+
+    trxl = TransactionsLog.open('merge_many', ctx)
+
+    merged = []
+    errors = []
+
+    pending = []
+    for to_uuid, from_uuids in groups:
+        try:
+            _check_group(to_uuid, from_uuids)
+        except BaseError as exc:
+            errors.append(exc)
+        else:
+            pending.append((to_uuid, from_uuids))
+
+    while pending:
+        uuids = [uuid for to_uuid, from_uuids in pending for uuid in [to_uuid, *from_uuids]]
+        individuals = find_individuals_by_uuids(uuids)
+
+        merges = []
+        deferred = []
+        involved = set()
+
+        for to_uuid, from_uuids in pending:
+            try:
+                to_individual, from_individuals = _find_group(to_uuid, from_uuids, individuals)
+            except BaseError as exc:
+                errors.append(exc)
+                continue
+
+            mks = {to_individual.mk, *(individual.mk for individual in from_individuals)}
+
+            if involved.isdisjoint(mks):
+                merges.append((to_individual, from_individuals))
+            else:
+                deferred.append((to_uuid, from_uuids))
+
+            involved.update(mks)
+
+        merge_individuals_db(trxl, merges)
+
+        merged.extend(to_individual.mk for to_individual, _ in merges)
+
+        pending = deferred
+
+    schedule_affiliation_recommendations(mks=merged)
+
+    trxl.close()
+
+    logger.info(f"{len(merged)} groups of individuals merged; {len(errors)} errors found")
+
+    return merged, errors
+
+
 @django.db.transaction.atomic
 def unmerge_identities(ctx, uuids):
     """
@@ -1211,15 +1523,120 @@ def unmerge_identities(ctx, uuids):
     trxl = TransactionsLog.open('unmerge_identities', ctx)
 
     identities = _find_identities(uuids)
+    mks = {identity.individual.mk for identity in identities}
 
     new_individuals = []
     for identity in identities:
         indv = _set_destination_for_identity(trxl, identity)
         individual = _move_to_destination(trxl, identity, indv)
         new_individuals.append(individual)
+        mks.add(individual.mk)
+
+    schedule_affiliation_recommendations(mks=mks)
 
     trxl.close()
 
     logger.info(f"Identities {uuids} unmerged from their individuals")
 
     return new_individuals
+
+
+def _add_period(periods, from_date, to_date, organization, force=False):
+    """Add a period to a list of enrollment periods.
+
+    The periods that overlap with the new one are merged into it,
+    as `enroll` does. When `force` is set, default dates of the
+    periods are overwritten by the new ones.
+
+    :param periods: list of `(start, end)` periods
+    :param from_date: date when the new period starts
+    :param to_date: date when the new period ends
+    :param organization: name of the organization of the periods
+    :param force: overwrite default dates in case a more specific date
+        is provided
+
+    :returns: the new sorted list of periods
+
+    :raises DuplicateRangeError: when the new period is part of
+        any of the periods
+    :raises InvalidValueError: when any of the dates is out of bounds
+    """
+    overlapped = [period for period in periods
+                  if period[0] <= to_date and period[1] >= from_date]
+
+    for period in overlapped:
+        if from_date >= period[0] and to_date <= period[1]:
+            # If any of the dates are the default ones
+            default_values = (period[0] == MIN_PERIOD_DATE) or (period[1] == MAX_PERIOD_DATE)
+            if default_values and force:
+                # Default values will be overwritten with input values
+                continue
+            raise DuplicateRangeError(start=from_date, end=to_date, org=organization)
+
+    try:
+        merged = merge_datetime_ranges(overlapped + [(from_date, to_date)],
+                                       exclude_limits=force)
+        merged = list(merged)
+    except ValueError as e:
+        raise InvalidValueError(msg=str(e))
+
+    return sorted([period for period in periods if period not in overlapped] + merged)
+
+
+def _remove_period(periods, from_date, to_date, organization):
+    """Remove a period from a list of enrollment periods.
+
+    The periods that overlap with the given one are replaced by
+    the parts of them that are out of it, as `withdraw` does.
+
+    :param periods: list of `(start, end)` periods
+    :param from_date: date when the period to remove starts
+    :param to_date: date when the period to remove ends
+    :param organization: name of the organization of the periods
+
+    :returns: the new sorted list of periods
+
+    :raises NotFoundError: when none of the periods overlap with
+        the given one
+    """
+    overlapped = [period for period in periods
+                  if period[0] <= to_date and period[1] >= from_date]
+
+    if not overlapped:
+        eid = "enrollment with range '{}'-'{}' for {}".format(from_date,
+                                                              to_date,
+                                                              organization)
+        raise NotFoundError(entity=eid)
+
+    min_range = min(period[0] for period in overlapped)
+    max_range = max(period[1] for period in overlapped)
+
+    remaining = [period for period in periods if period not in overlapped]
+
+    if min_range < from_date:
+        remaining.append((min_range, from_date))
+    if max_range > to_date:
+        remaining.append((to_date, max_range))
+
+    return sorted(remaining)
+
+
+def _diff_enrollments(individual, organization, enrollments, periods):
+    """Find the changes needed to turn a set of enrollments into a list of periods.
+
+    :param individual: individual of the enrollments
+    :param organization: organization of the enrollments
+    :param enrollments: current enrollments
+    :param periods: list of `(start, end)` periods to store
+
+    :returns: a tuple with the list of enrollments to remove and
+        the list of `(individual, organization, start, end)` tuples
+        to add
+    """
+    stored = {(enrollment.start, enrollment.end): enrollment for enrollment in enrollments}
+
+    removed = [enrollment for period, enrollment in stored.items() if period not in periods]
+    added = [(individual, organization, start, end)
+             for start, end in periods if (start, end) not in stored]
+
+    return removed, added
@@ -25,9 +25,11 @@ import logging
 import re
 
 import django.core.exceptions
+import django.db.transaction
 import django.db.utils
 
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 
 from grimoirelab_toolkit.datetime import datetime_utcnow, datetime_to_utc
 
@@ -41,8 +43,27 @@ from .models import (MIN_PERIOD_DATE,
                      Identity,
                      Profile,
                      Enrollment,
-                     Operation)
-from .utils import validate_field
+                     MatchingKey,
+                     MatchingBlacklist,
+                     Operation,
+                     RegistryVersion)
+from .utils import (validate_field,
+                    merge_datetime_ranges,
+                    normalize_identity_name,
+                    normalize_identity_username,
+                    canonicalize_email)
+
+
+MATCHING_CRITERIA = ['email', 'name', 'username']
+MATCHING_INDEX_BATCH_SIZE = 10000
+MERGE_ORGANIZATIONS_BATCH_SIZE = 1000
+REGISTRY_VERSION = 'registry'
+DOMAINS_VERSION = 'domains'
+
+# Operations that add, delete or move domains; organizations
+# are included because deleting or merging them also changes
+# their domains
+DOMAINS_ENTITY_TYPES = ['domain', 'organization']
 
 
 logger = logging.getLogger(__name__)
@@ -117,6 +138,36 @@ def find_individual_by_uuid(uuid):
         return individual
 
 
+def find_individuals_by_uuids(uuids):
+    """Find the individuals of a list of UUIDs.
+
+    UUIDs can be main keys of individuals or identifiers of
+    their identities. Main keys take precedence when a UUID
+    is both. Individuals are fetched with their profiles using
+    a constant number of queries. UUIDs not found are not
+    included in the result.
+
+    :param uuids: list of ids to search the individuals
+
+    :returns: a dictionary with the individual of each UUID
+    """
+    uuids = set(uuids)
+
+    mks = dict(Identity.objects.filter(uuid__in=uuids).values_list('uuid', 'individual'))
+
+    individuals = Individual.objects.filter(mk__in=uuids | set(mks.values()))\
+        .select_related('profile')
+    individuals = {individual.mk: individual for individual in individuals}
+
+    found = {}
+    for uuid in uuids:
+        mk = uuid if uuid in individuals else mks.get(uuid, None)
+        if mk:
+            found[uuid] = individuals[mk]
+
+    return found
+
+
 def find_identity(uuid):
     """Find an identity.
 
@@ -222,7 +273,55 @@ def search_enrollments_in_period(mk, org_name,
     )
     return Enrollment.objects.filter(individual__mk=mk,
                                      organization__name=org_name,
-                                     start__lte=to_date, end__gte=from_date).order_by('start')
+                                     start__lte=to_date, end__gte=from_date)\
+        .select_related('individual', 'organization').order_by('start')
+
+
+def find_registry_version(name=REGISTRY_VERSION):
+    """Find the version of the registry or of a part of it.
+
+    Versions are counters increased once the transactions that
+    change the registry are committed. Unlike the timestamps of
+    the operations, a version always changes after the data was
+    committed, even when the transactions are committed in a
+    different order than they were started.
+
+    Besides the version of the whole registry, the counter
+    `DOMAINS_VERSION` is only increased when domains or
+    organizations change.
+
+    :param name: name of the version counter
+
+    :returns: the value of the counter; 0 when it was never
+        increased
+    """
+    versions = RegistryVersion.objects.filter(name=name)
+    version = versions.values_list('version', flat=True).first()
+
+    return version or 0
+
+
+def increase_registry_versions(names):
+    """Increase a set of version counters of the registry.
+
+    Counters that do not exist are created.
+
+    :param names: names of the version counters to increase
+    """
+    for name in sorted(names):
+        versions = RegistryVersion.objects.filter(name=name)
+
+        if versions.update(version=F('version') + 1):
+            continue
+
+        try:
+            with django.db.transaction.atomic():
+                RegistryVersion.objects.create(name=name, version=1)
+        except django.db.utils.IntegrityError:
+            # Created by another transaction in the meantime
+            versions.update(version=F('version') + 1)
+
+    logger.debug(f"Registry versions increased; names={sorted(names)}")
 
 
 def add_organization(trxl, name):
@@ -290,6 +389,120 @@ def delete_organization(trxl, organization):
                        target=op_args['organization'])
 
 
+def merge_organizations(trxl, from_org, to_org):
+    """Merge an organization into another one in the database.
+
+    Domains and enrollments of `from_org` are moved to `to_org`
+    using bulk queries and, after that, `from_org` is removed.
+    When an individual is enrolled in both organizations, the
+    periods of its enrollments are merged.
+
+    Besides the operation of the merge, the operations logged
+    for each domain and enrollment are the same ones logged when
+    they are moved one by one with `delete_domain`, `add_domain`,
+    `delete_enrollment` and `add_enrollment`, so the merge can be
+    audited and replayed. They are inserted with bulk queries too.
+
+    Enrollments of locked individuals cannot be modified, so
+    nothing is done when any of the individuals enrolled in
+    `from_org` is locked.
+
+    :param trxl: TransactionsLog object from the method calling this one
+    :param from_org: organization to merge
+    :param to_org: organization where `from_org` will be merged
+
+    :raises LockedIdentityError: when any of the individuals
+        enrolled in `from_org` is locked
+    """
+    # Setting operation arguments before they are modified
+    op_args = {
+        'from_org': from_org.name,
+        'to_org': to_org.name
+    }
+
+    individuals = Individual.objects.filter(enrollments__organization=from_org)
+
+    locked = individuals.filter(is_locked=True).values_list('mk', flat=True).first()
+    if locked:
+        raise LockedIdentityError(uuid=locked)
+
+    mks = sorted(set(individuals.values_list('mk', flat=True)))
+
+    operations = []
+
+    def _log(op_type, entity_type, args, target):
+        operations.append({
+            'op_type': op_type,
+            'entity_type': entity_type,
+            'timestamp': datetime_utcnow(),
+            'args': args,
+            'target': target
+        })
+
+    domains = Domain.objects.filter(organization=from_org)
+
+    for domain_name, is_top_domain in domains.values_list('domain', 'is_top_domain'):
+        _log(Operation.OpType.DELETE, 'domain',
+             {'domain': domain_name},
+             domain_name)
+        _log(Operation.OpType.ADD, 'domain',
+             {'organization': to_org.name,
+              'domain_name': domain_name,
+              'is_top_domain': is_top_domain},
+             to_org.name)
+
+    domains.update(organization=to_org)
+
+    trxl.log_operations(operations)
+    operations.clear()
+
+    org_names = {from_org.id: from_org.name, to_org.id: to_org.name}
+    last_modified = datetime_utcnow()
+
+    for i in range(0, len(mks), MERGE_ORGANIZATIONS_BATCH_SIZE):
+        batch = mks[i:i + MERGE_ORGANIZATIONS_BATCH_SIZE]
+        enrollments = Enrollment.objects.filter(individual__in=batch,
+                                                organization__in=[from_org, to_org])
+        periods = {}
+
+        values = enrollments.order_by('individual', 'start', 'end', 'organization')\
+            .values_list('individual', 'organization', 'start', 'end')
+        for mk, org_id, start, end in values:
+            periods.setdefault(mk, []).append((start, end))
+            _log(Operation.OpType.DELETE, 'enrollment',
+                 {'mk': mk,
+                  'organization': org_names[org_id],
+                  'start': str(start),
+                  'end': str(end)},
+                 mk)
+
+        enrollments.delete()
+
+        merged = []
+        for mk, dates in periods.items():
+            for start, end in merge_datetime_ranges(dates, exclude_limits=True):
+                merged.append(Enrollment(individual_id=mk, organization=to_org,
+                                         start=start, end=end))
+                _log(Operation.OpType.ADD, 'enrollment',
+                     {'individual': mk,
+                      'organization': to_org.name,
+                      'start': str(start),
+                      'end': str(end)},
+                     mk)
+        Enrollment.objects.bulk_create(merged)
+
+        Individual.objects.filter(mk__in=batch).update(last_modified=last_modified)
+
+        trxl.log_operations(operations)
+        operations.clear()
+
+    from_org.delete()
+
+    trxl.log_operation(op_type=Operation.OpType.UPDATE, entity_type='organization',
+                       timestamp=datetime_utcnow(), args=op_args,
+                       target=op_args['to_org'])
+
+
 def add_domain(trxl, organization, domain_name, is_top_domain=True):
     """Add a domain to the database.
 
@@ -446,6 +659,10 @@ def add_identity(trxl, individual, uuid, source,
     be `None` or empty. Moreover, `name`, `email` or `username`
     parameters need a non empty value.
 
+    The normalized forms of `name`, `email` and `username`
+    are stored too, so identities can be found by these values
+    using indexed lookups.
+
     As a result, the function returns a new `Identity` object.
 
     :param trxl: TransactionsLog object from the method calling this one
@@ -486,12 +703,20 @@ def add_identity(trxl, individual, uuid, source,
     try:
         identity = Identity(uuid=uuid, name=name, email=email,
                             username=username, source=source,
-                            individual=individual)
+                            individual=individual,
+                            normalized_name=normalize_identity_name(name),
+                            canonical_email=canonicalize_email(email),
+                            normalized_username=normalize_identity_username(username))
         identity.save(force_insert=True)
         individual.save()
     except django.db.utils.IntegrityError as exc:
         _handle_integrity_error(Identity, exc)
 
+    MatchingKey.objects.bulk_create(_generate_matching_keys(identity.uuid,
+                                                            name=name,
+                                                            email=email,
+                                                            username=username))
+
     trxl.log_operation(op_type=Operation.OpType.ADD, entity_type='identity',
                        timestamp=datetime_utcnow(), args=op_args,
                        target=op_args['individual'])
@@ -504,7 +729,8 @@ def delete_identity(trxl, identity):
 
     This function removes from the database the identity given
     in `identity`. Take into account this function does not
-    remove individual in the case they get empty.
+    remove individual in the case they get empty. The matching
+    keys of the identity are removed with it.
 
     :param trxl: TransactionsLog object from the method calling this one
     :param identity: identity to remove
@@ -718,12 +944,94 @@ def delete_enrollment(trxl, enrollment):
                        target=op_args['mk'])
 
 
+def update_enrollments(trxl, removed, added):
+    """Remove and add sets of enrollments in the database.
+
+    The enrollments of `removed` are deleted and the ones of
+    `added` are inserted using bulk queries, so the number of
+    queries does not depend on the number of enrollments. Each
+    item of `added` is a tuple with the individual, the organization
+    and the dates when the enrollment starts and ends. Dates must be
+    valid; they are not checked by this function.
+
+    The operations logged are the same ones logged when each
+    enrollment is removed and added with `delete_enrollment` and
+    `add_enrollment`, and they are inserted in a single query.
+
+    :param trxl: TransactionsLog object from the method calling this one
+    :param removed: list of enrollments to remove
+    :param added: list of `(individual, organization, start, end)` tuples
+
+    :returns: the list of new enrollments
+
+    :raises LockedIdentityError: when any of the individuals is locked
+    """
+    individuals = [enrollment.individual for enrollment in removed]
+    individuals += [individual for individual, _, _, _ in added]
+
+    for individual in individuals:
+        if individual.is_locked:
+            raise LockedIdentityError(uuid=individual.mk)
+
+    operations = []
+
+    for enrollment in removed:
+        operations.append({
+            'op_type': Operation.OpType.DELETE,
+            'entity_type': 'enrollment',
+            'timestamp': datetime_utcnow(),
+            'args': {
+                'mk': enrollment.individual.mk,
+                'organization': enrollment.organization.name,
+                'start': str(enrollment.start),
+                'end': str(enrollment.end)
+            },
+            'target': enrollment.individual.mk
+        })
+
+    enrollments = []
+
+    for individual, organization, start, end in added:
+        enrollments.append(Enrollment(individual=individual, organization=organization,
+                                      start=start, end=end))
+        operations.append({
+            'op_type': Operation.OpType.ADD,
+            'entity_type': 'enrollment',
+            'timestamp': datetime_utcnow(),
+            'args': {
+                'individual': individual.mk,
+                'organization': organization.name,
+                'start': str(start),
+                'end': str(end)
+            },
+            'target': individual.mk
+        })
+
+    if removed:
+        Enrollment.objects.filter(id__in=[enrollment.id for enrollment in removed]).delete()
+
+    Enrollment.objects.bulk_create(enrollments)
+
+    last_modified = datetime_utcnow()
+    mks = {individual.mk for individual in individuals}
+
+    Individual.objects.filter(mk__in=mks).update(last_modified=last_modified)
+
+    for individual in individuals:
+        individual.last_modified = last_modified
+
+    trxl.log_operations(operations)
+
+    return enrollments
+
+
 def move_identity(trxl, identity, individual):
     """Move an identity to an individual.
 
     Shifts `identity` to the individual given in `individual`.
     As a result, it will return `individual` object with list of
-    identities updated.
+    identities updated. Matching keys are linked to the identity,
+    so they remain valid after the move.
 
     When `identity` is already assigned to `individual`, the function
     will raise an `ValueError` exception.
@@ -764,6 +1072,145 @@ def move_identity(trxl, identity, individual):
     return individual
 
 
+def merge_individuals(trxl, merges):
+    """Merge sets of individuals in the database.
+
+    Each item of `merges` is a tuple with an individual and
+    the list of individuals to merge into it. Identities of
+    the latter are moved to the former, enrollments of all of
+    them are merged, the empty fields of the profile of the
+    former are filled with the values of the latter and, after
+    that, the latter are removed. An individual cannot be part
+    of more than one item.
+
+    Rows are read and written with bulk queries, so the number
+    of queries does not depend on the number of individuals,
+    identities or enrollments. The operations logged are the
+    same ones logged when each identity is moved, each enrollment
+    is removed and added again, each profile is updated and each
+    individual is removed, and they are inserted in a single query.
+
+    :param trxl: TransactionsLog object from the method calling this one
+    :param merges: list of `(individual, from_individuals)` tuples
+
+    :raises LockedIdentityError: when any of the individuals is locked
+    """
+    owners = {}
+
+    for to_individual, from_individuals in merges:
+        for individual in [*from_individuals, to_individual]:
+            if individual.is_locked:
+                raise LockedIdentityError(uuid=individual.mk)
+            owners[individual.mk] = to_individual.mk
+
+    operations = {to_individual.mk: [] for to_individual, _ in merges}
+    last_modified = datetime_utcnow()
+
+    def _log(target_mk, op_type, entity_type, args, target):
+        operations[target_mk].append({
+            'op_type': op_type,
+            'entity_type': entity_type,
+            'timestamp': datetime_utcnow(),
+            'args': args,
+            'target': target
+        })
+
+    # Move the identities to their new individuals
+    from_mks = [mk for mk, owner in owners.items() if mk != owner]
+
+    identities = Identity.objects.filter(individual__in=from_mks)\
+        .only('uuid', 'individual').order_by('uuid')
+    identities = list(identities)
+
+    for identity in identities:
+        owner = owners[identity.individual_id]
+        identity.individual_id = owner
+        identity.last_modified = last_modified
+        _log(owner, Operation.OpType.UPDATE, 'identity',
+             {'identity': identity.uuid, 'individual': owner},
+             identity.uuid)
+
+    Identity.objects.bulk_update(identities, ['individual', 'last_modified'])
+
+    # Replace the enrollments by the merged ones
+    enrollments = Enrollment.objects.filter(individual__in=owners.keys())\
+        .select_related('organization')
+    periods = {}
+
+    for enrollment in enrollments:
+        owner = owners[enrollment.individual_id]
+        org_periods = periods.setdefault(owner, {})
+        org_periods.setdefault(enrollment.organization, []).append((enrollment.start,
+                                                                    enrollment.end))
+        _log(owner, Operation.OpType.DELETE, 'enrollment',
+             {
+                 'mk': enrollment.individual_id,
+                 'organization': enrollment.organization.name,
+                 'start': str(enrollment.start),
+                 'end': str(enrollment.end)
+             },
+             enrollment.individual_id)
+
+    enrollments.delete()
+
+    merged = []
+
+    for owner, org_periods in periods.items():
+        for organization, dates in org_periods.items():
+            for start, end in merge_datetime_ranges(dates, exclude_limits=True):
+                merged.append(Enrollment(individual_id=owner, organization=organization,
+                                         start=start, end=end))
+                _log(owner, Operation.OpType.ADD, 'enrollment',
+                     {
+                         'individual': owner,
+                         'organization': organization.name,
+                         'start': str(start),
+                         'end': str(end)
+                     },
+                     owner)
+
+    Enrollment.objects.bulk_create(merged)
+
+    # Fill the empty fields of the profiles
+    fields = ['name', 'email', 'gender', 'gender_acc', 'country_id']
+    profiles = []
+
+    for to_individual, from_individuals in merges:
+        profile = to_individual.profile
+
+        for from_individual in from_individuals:
+            from_profile = from_individual.profile
+            if not profile.is_bot and from_profile.is_bot:
+                profile.is_bot = True
+            for field in fields:
+                if not getattr(profile, field):
+                    setattr(profile, field, getattr(from_profile, field))
+
+        profile.last_modified = last_modified
+        profiles.append(profile)
+        _log(to_individual.mk, Operation.OpType.UPDATE, 'profile',
+             {'individual': to_individual.mk},
+             to_individual.mk)
+
+    Profile.objects.bulk_update(profiles, ['is_bot', 'name', 'email', 'gender',
+                                           'gender_acc', 'country', 'last_modified'])
+
+    # Remove the merged individuals
+    for to_individual, from_individuals in merges:
+        for from_individual in from_individuals:
+            _log(to_individual.mk, Operation.OpType.DELETE, 'individual',
+                 {'individual': from_individual.mk},
+                 from_individual.mk)
+
+    Individual.objects.filter(mk__in=from_mks).delete()
+    Individual.objects.filter(mk__in=operations.keys()).update(last_modified=last_modified)
+
+    for to_individual, _ in merges:
+        to_individual.last_modified = last_modified
+
+    trxl.log_operations([op for ops in operations.values() for op in ops])
+
+
 def lock(trxl, individual):
     """Lock a given individual.
 
@@ -814,6 +1261,178 @@ def unlock(trxl, individual):
     return individual
 
 
+@django.db.transaction.atomic
+def rebuild_matching_index(batch_size=MATCHING_INDEX_BATCH_SIZE):
+    """Rebuild the index of matching keys from scratch.
+
+    Removes every matching key stored in the database and
+    creates them again using the identities of the registry.
+    Keys are inserted in batches of `batch_size` elements.
+
+    :param batch_size: number of keys inserted on each batch
+
+    :returns: number of keys created
+    """
+    logger.info("Rebuilding matching index ...")
+
+    MatchingKey.objects.all().delete()
+
+    nkeys = 0
+    keys = []
+    identities = Identity.objects.values_list('uuid', *MATCHING_CRITERIA)
+
+    for uuid, *values in identities.iterator():
+        keys.extend(_generate_matching_keys(uuid, **dict(zip(MATCHING_CRITERIA, values))))
+
+        if len(keys) >= batch_size:
+            MatchingKey.objects.bulk_create(keys)
+            nkeys += len(keys)
+            keys = []
+
+    MatchingKey.objects.bulk_create(keys)
+    nkeys += len(keys)
+
+    logger.info(f"Matching index rebuilt; {nkeys} keys created")
+
+    return nkeys
+
+
+@django.db.transaction.atomic
+def rebuild_normalized_values(batch_size=MATCHING_INDEX_BATCH_SIZE):
+    """Store again the normalized values of every identity.
+
+    Normalized values are set when identities are added using
+    `add_identity`. This function sets them for identities stored
+    by other means, like loading a fixture, or when the rules
+    to normalize values change. Identities are updated in batches
+    of `batch_size` elements.
+
+    :param batch_size: number of identities updated on each batch
+
+    :returns: number of identities updated
+    """
+    logger.info("Rebuilding normalized values of identities ...")
+
+    nidentities = 0
+    batch = []
+    fields = ['normalized_name', 'canonical_email', 'normalized_username']
+    identities = Identity.objects.only('uuid', 'name', 'email', 'username')
+
+    for identity in identities.iterator():
+        identity.normalized_name = normalize_identity_name(identity.name)
+        identity.canonical_email = canonicalize_email(identity.email)
+        identity.normalized_username = normalize_identity_username(identity.username)
+        batch.append(identity)
+
+        if len(batch) >= batch_size:
+            Identity.objects.bulk_update(batch, fields)
+            nidentities += len(batch)
+            batch = []
+
+    Identity.objects.bulk_update(batch, fields)
+    nidentities += len(batch)
+
+    logger.info(f"Normalized values rebuilt; {nidentities} identities updated")
+
+    return nidentities
+
+
+def check_matching_index(batch_size=MATCHING_INDEX_BATCH_SIZE):
+    """Check whether the index of matching keys is consistent.
+
+    Compares the matching keys stored in the database with
+    the keys expected for each identity of the registry.
+    Identities are checked in batches of `batch_size` elements.
+
+    The function returns a list with the inconsistencies found.
+    Each inconsistency is a tuple composed by the identity uuid,
+    the set of missing keys and the set of unexpected keys. Keys
+    are `(criterion, value)` tuples.
+
+    :param batch_size: number of identities checked on each batch
+
+    :returns: a list of inconsistencies; empty when the index
+        is consistent
+    """
+    def _check_batch(batch):
+        stored = {uuid: set() for uuid in batch}
+        keys = MatchingKey.objects.filter(identity__in=list(batch.keys()))
+
+        for uuid, criterion, value in keys.values_list('identity', 'criterion', 'value'):
+            stored[uuid].add((criterion, value))
+
+        for uuid, expected in batch.items():
+            missing = expected - stored[uuid]
+            unexpected = stored[uuid] - expected
+            if missing or unexpected:
+                inconsistencies.append((uuid, missing, unexpected))
+
+    logger.debug("Checking matching index ...")
+
+    inconsistencies = []
+    batch = {}
+    identities = Identity.objects.values_list('uuid', *MATCHING_CRITERIA)
+
+    for uuid, *values in identities.iterator():
+        batch[uuid] = {
+            (key.criterion, key.value)
+            for key in _generate_matching_keys(uuid, **dict(zip(MATCHING_CRITERIA, values)))
+        }
+        if len(batch) >= batch_size:
+            _check_batch(batch)
+            batch = {}
+
+    _check_batch(batch)
+
+    logger.debug(f"Matching index checked; {len(inconsistencies)} inconsistencies found")
+
+    return inconsistencies
+
+
+def add_to_matching_blacklist(values):
+    """Add a list of values to the matching blacklist.
+
+    Values already included in the blacklist are ignored. As the
+    blacklist does not distinguish case, values are compared in
+    lower case; when several values only differ in case, the first
+    one is added.
+
+    :param values: list of values to exclude from matching
+
+    :returns: number of values added to the blacklist
+    """
+    blacklisted = MatchingBlacklist.objects.annotate(lowered=Lower('excluded'))\
+        .filter(lowered__in={value.lower() for value in values})\
+        .values_list('lowered', flat=True)
+    blacklisted = set(blacklisted)
+
+    entries = {}
+    for value in values:
+        key = value.lower()
+        if key not in blacklisted and key not in entries:
+            entries[key] = MatchingBlacklist(excluded=value)
+
+    # The collation of the column might consider equal other values,
+    # like accented ones, so conflicts are ignored too
+    MatchingBlacklist.objects.bulk_create(entries.values(), ignore_conflicts=True)
+
+    logger.info(f"{len(entries)} values added to the matching blacklist")
+
+    return len(entries)
+
+
+def _generate_matching_keys(uuid, **values):
+    """Generate the matching keys of an identity from its values."""
+
+    keys = [
+        MatchingKey(criterion=criterion, value=values[criterion],
+                    identity_id=uuid)
+        for criterion in MATCHING_CRITERIA
+        if values.get(criterion, None) is not None
+    ]
+    return keys
+
+
 _MYSQL_DUPLICATE_ENTRY_ERROR_REGEX = re.compile(r"Duplicate entry '(?P<value>.+)' for key")
 
 
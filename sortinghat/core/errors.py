@@ -49,6 +49,7 @@ class BaseError(Exception):
     def __init__(self, **kwargs):
         super().__init__()
         self.msg = self.message % kwargs
+        self._kwargs = kwargs
 
     def __str__(self):
         return self.msg
@@ -56,6 +57,17 @@ class BaseError(Exception):
     def __int__(self):
         return self.code
 
+    def __reduce__(self):
+        # Errors are rebuilt from their keyword arguments, so
+        # they can be sent between processes
+        return (_rebuild_error, (self.__class__, self._kwargs))
+
+
+def _rebuild_error(cls, kwargs):
+    """Create an error of class `cls` when it is unpickled"""
+
+    return cls(**kwargs)
+
 
 class AlreadyExistsError(BaseError):
     """Exception raised when an entity already exists in the registry"""
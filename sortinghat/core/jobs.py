@@ -20,24 +20,70 @@
 #     Miguel Ángel Fernández <mafesan@bitergia.com>
 #
 
+import datetime
 import itertools
 import logging
+import pickle
+import time
 
+import django.db.transaction
 import django_rq
 import django_rq.utils
-import pandas
+import redis.exceptions
 import rq
+import rq.defaults
+import rq.exceptions
+import rq.job
+import rq.registry
+import rq.utils
 
-from .api import enroll, merge
+from .api import enroll_many, merge_many, merge_organizations, update_profile
 from .context import SortingHatContext
 from .errors import BaseError, NotFoundError, EqualIndividualError
 from .log import TransactionsLog
-from .models import Individual
+from .models import Individual, Identity
+from .recommendations.affiliation import (mark_stale_affiliation_recommendations,
+                                          pop_pending_affiliation_recommendations,
+                                          update_affiliation_recommendations,
+                                          update_domain_affiliation_recommendations)
+from .recommendations.bots import DEFAULT_BOT_SCORE
+from .recommendations.clustering import DisjointSet
 from .recommendations.engine import RecommendationEngine
+from .recommendations.fuzzy import DEFAULT_SIMILARITY_THRESHOLD
+from .recommendations.organizations import DEFAULT_ORGANIZATION_SIMILARITY
 
 
 MAX_CHUNK_SIZE = 2000
 
+# Partial results of the child jobs are kept
+# in these keys until all the children finish
+FAN_IN_PENDING_KEY = 'sortinghat:job:{}:pending'
+FAN_IN_RESULTS_KEY = 'sortinghat:job:{}:results'
+FAN_IN_TTL = 86400
+
+# The last child waits up to this number of seconds for the worker
+# of the parent to finish it before writing the aggregated result
+FAN_IN_WAIT = 10
+FAN_IN_WAIT_INTERVAL = 0.1
+
+# Seconds between two checks of the children of a job
+CHECK_CHILDREN_INTERVAL = 60
+
+# Statuses of the child jobs that will never fan in their results
+DEAD_JOB_STATUSES = [
+    rq.job.JobStatus.FAILED,
+    rq.job.JobStatus.STOPPED,
+    rq.job.JobStatus.CANCELED
+]
+
+# Minimum number of seconds between two updates of the progress
+PROGRESS_INTERVAL = 5
+
+# Results of the jobs split in child jobs are stored
+# in pages of this number of items
+JOB_RESULTS_KEY = 'sortinghat:job:{}:pages'
+RESULTS_PAGE_SIZE = 1000
+
 
 logger = logging.getLogger(__name__)
 
@@ -69,43 +115,327 @@ def find_job(job_id):
     return jobs[0]
 
 
-def get_jobs():
-    """Get a list of all jobs
+def get_jobs(statuses=None):
+    """Get the list of jobs of the main queue.
+
+    This function returns a lazy list of the jobs found in the
+    main queue and in its registries. Jobs are sorted by their
+    status (`queued`, `started`, `deferred`, `scheduled`,
+    `finished` and `failed`) and then by their position in
+    the queue or registry.
 
-    This function returns a list of all jobs found in the main queue and its
-    registries, sorted by date.
+    The child jobs of the jobs split in chunks, and the jobs
+    that check them, are included too. They store the identifier
+    of their parent job under the key `parent` of their metadata.
 
-    :returns: a list of Job instances
+    The number of jobs of each registry is read in a single
+    request. Jobs are only read when the list is sliced, so
+    paginating over it only reads the jobs of the requested
+    page. Use `statuses` to get only the jobs with any of
+    these statuses.
+
+    :param statuses: list of job statuses; `None` to get
+        the jobs of any status
+
+    :returns: a JobList instance
+
+    :raises ValueError: when any of the statuses is not valid
     """
-    logger.debug("Retrieving list of jobs ...")
+    logger.debug(f"Retrieving list of jobs; statuses={statuses} ...")
 
     queue = django_rq.get_queue()
-    started_jobs = [find_job(id)
-                    for id
-                    in queue.started_job_registry.get_job_ids()]
-    deferred_jobs = [find_job(id)
-                     for id
-                     in queue.deferred_job_registry.get_job_ids()]
-    finished_jobs = [find_job(id)
-                     for id
-                     in queue.finished_job_registry.get_job_ids()]
-    failed_jobs = [find_job(id)
-                   for id
-                   in queue.failed_job_registry.get_job_ids()]
-    scheduled_jobs = [find_job(id)
-                      for id
-                      in queue.scheduled_job_registry.get_job_ids()]
-    jobs = (queue.jobs + started_jobs + deferred_jobs + finished_jobs + failed_jobs + scheduled_jobs)
-
-    sorted_jobs = sorted(jobs, key=lambda x: x.enqueued_at)
-
-    logger.debug(f"List of jobs retrieved; total jobs: {len(sorted_jobs)};")
-
-    return sorted_jobs
+    jobs = JobList(queue, statuses=statuses)
+
+    logger.debug(f"List of jobs retrieved; total jobs: {len(jobs)};")
+
+    return jobs
+
+
+class JobList:
+    """Lazy list of the jobs of a queue.
+
+    The list reads the identifiers of the jobs directly from
+    the queue and from the sorted sets of its registries, and
+    it fetches the jobs of a slice in a single request with
+    `Job.fetch_many`. Jobs that expire between counting and
+    reading them are not included in the slices.
+
+    :param queue: queue of the jobs
+    :param statuses: list of job statuses; `None` to include
+        the jobs of any status
+
+    :raises ValueError: when any of the statuses is not valid
+    """
+    STATUSES = ['queued', 'started', 'deferred', 'scheduled', 'finished', 'failed']
+
+    def __init__(self, queue, statuses=None):
+        if statuses is None:
+            statuses = self.STATUSES
+
+        for status in statuses:
+            if status not in self.STATUSES:
+                raise ValueError(f"'{status}' is not a valid job status")
+
+        self.queue = queue
+        self.statuses = [status for status in self.STATUSES if status in statuses]
+
+        registries = {
+            'started': queue.started_job_registry,
+            'deferred': queue.deferred_job_registry,
+            'scheduled': queue.scheduled_job_registry,
+            'finished': queue.finished_job_registry,
+            'failed': queue.failed_job_registry
+        }
+
+        self._sources = []
+
+        with queue.connection.pipeline() as pipe:
+            for status in self.statuses:
+                if status == 'queued':
+                    self._sources.append((queue.key, False))
+                    pipe.llen(queue.key)
+                else:
+                    # Remove the expired jobs like
+                    # registries do before listing them
+                    registry = registries[status]
+                    registry.cleanup()
+                    self._sources.append((registry.key, True))
+                    pipe.zcard(registry.key)
+            self._counts = pipe.execute()
+
+    def __len__(self):
+        return sum(self._counts)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            index = range(len(self))[index]
+            jobs = self[index:index + 1]
+            if not jobs:
+                raise IndexError('job index out of range')
+            return jobs[0]
+
+        start, stop, step = index.indices(len(self))
+
+        with self.queue.connection.pipeline() as pipe:
+            offset = 0
+            for (key, is_registry), count in zip(self._sources, self._counts):
+                first = max(start - offset, 0)
+                last = min(stop - offset, count) - 1
+                offset += count
+
+                if first > last:
+                    continue
+                elif is_registry:
+                    pipe.zrange(key, first, last)
+                else:
+                    pipe.lrange(key, first, last)
+            job_ids = [rq.utils.as_text(job_id)
+                       for ids in pipe.execute()
+                       for job_id in ids]
+
+        jobs = rq.job.Job.fetch_many(job_ids,
+                                     connection=self.queue.connection,
+                                     serializer=self.queue.serializer)
+
+        return [job for job in jobs if job][::step]
+
+
+def get_job_status(job):
+    """Get the status of a job, including the status of its children.
+
+    Jobs that split their work in child jobs (see `affiliate`)
+    finish before their children do. The status of these jobs
+    is `started` until all their children have finished and
+    their results have been aggregated. When any of the children
+    failed, the status is `failed`. Children that died without
+    reporting their results are checked periodically by the job
+    `check_children`, so this function only reads the status.
+
+    :param job: a Job instance
+
+    :returns: the status of the job
+    """
+    status = job.get_status()
+
+    if status != 'finished' or 'children' not in job.meta:
+        return status
+
+    if job.meta.get('failed'):
+        return 'failed'
+    elif job.result is None:
+        return 'started'
+    else:
+        return status
+
+
+def get_job_progress(job):
+    """Get the progress of a job.
+
+    The progress is a dictionary with the number of items
+    `processed`, the `total` number of items (`None` when
+    it is unknown), the current `rate` in items per second
+    and the estimated seconds to finish (`eta`). Jobs that
+    do not report their progress return `None`.
+
+    The progress of jobs split in child jobs is the sum of
+    the progress of their children until all of them finish.
+
+    :param job: a Job instance
+
+    :returns: a dictionary with the progress of the job
+    """
+    progress = job.meta.get('progress', None)
+
+    if progress is None or get_job_status(job) != 'started' or 'children' not in job.meta:
+        return progress
+
+    children = rq.job.Job.fetch_many(job.meta['children'], connection=job.connection)
+
+    processed = 0
+    rate = 0
+
+    for child in children:
+        if not child or 'progress' not in child.meta:
+            continue
+        processed += child.meta['progress']['processed']
+        rate += child.meta['progress']['rate'] or 0
+
+    return JobProgress.describe(processed, progress['total'], rate or None)
+
+
+class JobProgress:
+    """Report the progress of a job in its metadata.
+
+    The progress is stored under the key `progress` of the
+    metadata of the job (see `get_job_progress`). Call `update`
+    every time some items are processed and `finish` at the end.
+
+    The metadata is only written when `interval` seconds passed
+    since the last time it was written, so the progress can be
+    updated from the loop of a job without slowing it down.
+    The rate is calculated with the items processed between
+    two writes.
+
+    :param job: job which progress is reported
+    :param total: total number of items to process; `None`
+        when it is unknown
+    :param interval: minimum number of seconds between writes
+    """
+    def __init__(self, job, total=None, interval=PROGRESS_INTERVAL):
+        self.job = job
+        self.total = total
+        self.interval = interval
+        self.processed = 0
+        self.rate = None
+
+        self._started_at = time.monotonic()
+        self._saved_at = self._started_at
+        self._saved_processed = 0
+
+        self._save()
+
+    def update(self, nitems=1):
+        """Add processed items and write the progress when it is due"""
+
+        self.processed += nitems
+
+        now = time.monotonic()
+        if now - self._saved_at < self.interval:
+            return
+
+        self.rate = (self.processed - self._saved_processed) / (now - self._saved_at)
+        self._saved_at = now
+        self._saved_processed = self.processed
+        self._save()
+
+    def add_total(self, nitems):
+        """Add items to process once they are known and write the progress"""
+
+        self.total = (self.total or 0) + nitems
+        self._save()
+
+    def finish(self):
+        """Write the final progress of the job"""
+
+        elapsed = time.monotonic() - self._started_at
+        self.rate = self.processed / elapsed if elapsed > 0 else None
+        self.total = self.processed
+        self._save()
+
+    @staticmethod
+    def describe(processed, total, rate):
+        """Build the dictionary of a progress"""
+
+        eta = None
+        if total is not None and rate:
+            eta = max(total - processed, 0) / rate
+
+        return {
+            'processed': processed,
+            'total': total,
+            'rate': rate,
+            'eta': eta
+        }
+
+    def _save(self):
+        self.job.meta['progress'] = self.describe(self.processed, self.total, self.rate)
+        self.job.save_meta()
+
+
+class JobResults:
+    """Lazy list of the results of a job stored in pages.
+
+    Results are `(key, value)` tuples, stored in a Redis list
+    where each element is a page of `page_size` pickled results.
+    Slicing the list only reads the pages that include the
+    requested results, so results can be fetched incrementally
+    without loading all of them.
+
+    :param job_id: identifier of the job
+    :param total: number of results
+    :param page_size: number of results of each page
+    """
+    def __init__(self, job_id, total, page_size=RESULTS_PAGE_SIZE):
+        self.job_id = job_id
+        self.total = total
+        self.page_size = page_size
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        for npage in range(0, -(-self.total // self.page_size)):
+            yield from self._read_pages(npage, npage)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            index = range(self.total)[index]
+            return self[index:index + 1][0]
+
+        start, stop, step = index.indices(self.total)
+        if start >= stop:
+            return []
+
+        first = start // self.page_size
+        last = (stop - 1) // self.page_size
+        offset = first * self.page_size
+
+        results = self._read_pages(first, last)
+
+        return results[start - offset:stop - offset:step]
+
+    def _read_pages(self, first, last):
+        connection = django_rq.get_queue().connection
+        pages = connection.lrange(JOB_RESULTS_KEY.format(self.job_id), first, last)
+
+        return [result for page in pages for result in pickle.loads(page)]
 
 
 @django_rq.job
-def recommend_affiliations(ctx, uuids=None):
+def recommend_affiliations(ctx, uuids=None, workers=1):
     """Generate a list of affiliation recommendations from a set of individuals.
 
     This function generates a list of recommendations which include the
@@ -117,28 +447,35 @@ def recommend_affiliations(ctx, uuids=None):
     When the parameter `uuids` is empty, the job will take all
     the individuals stored in the registry.
 
+    Individuals are split in chunks of `MAX_CHUNK_SIZE` that are
+    processed by child jobs, so the work is distributed among the
+    workers of the queue. The results of the children are aggregated
+    into the result of this job when all of them finish. Until then,
+    the result is `None` and the status given by `get_job_status`
+    is `started`. Results are stored in pages and read on demand
+    (see `JobResults`).
+
     :param ctx: context where this job is run
     :param uuids: list of individuals identifiers
+    :param workers: number of processes used by each child job to
+        generate the recommendations; the result does not depend
+        on this number
 
-    :returns: a dictionary with which individuals are recommended to be
-        affiliated to which organization.
+    :returns: a dictionary with the lazy list of individuals and the
+        organizations they are recommended to be affiliated to;
+        individuals without recommendations are not included
     """
     job = rq.get_current_job()
 
     if not uuids:
         logger.info(f"Running job {job.id} 'recommend affiliations'; uuids='all'; ...")
-        uuids = Individual.objects.values_list('mk', flat=True).iterator()
     else:
         logger.info(f"Running job {job.id} 'recommend affiliations'; uuids={uuids}; ...")
-        uuids = iter(uuids)
 
-    results = {}
     job_result = {
-        'results': results
+        'results': {}
     }
 
-    engine = RecommendationEngine()
-
     # Create a new context to include the reference
     # to the job id that will perform the transaction.
     job_ctx = SortingHatContext(ctx.user, job.id)
@@ -147,22 +484,76 @@ def recommend_affiliations(ctx, uuids=None):
     # will generate the enroll transactions.
     trxl = TransactionsLog.open('recommend_affiliations', job_ctx)
 
-    for chunk in _iter_split(uuids, size=MAX_CHUNK_SIZE):
-        for rec in engine.recommend('affiliation', chunk):
-            results[rec.key] = rec.options
+    total = len(uuids) if uuids else Individual.objects.count()
+    job.meta['progress'] = JobProgress.describe(0, total, None)
+
+    job_result = _fan_out(job, recommend_affiliations_chunk, _split_keys(uuids, MAX_CHUNK_SIZE),
+                          job_result, ctx, workers=workers)
 
     trxl.close()
 
-    logger.info(
-        f"Job {job.id} 'recommend affiliations' completed; "
-        f"{len(results)} recommendations generated"
-    )
+    if job_result is None:
+        logger.info(
+            f"Job {job.id} 'recommend affiliations' split; "
+            f"{len(job.meta['children'])} child jobs running"
+        )
+    else:
+        logger.info(
+            f"Job {job.id} 'recommend affiliations' completed; "
+            f"{len(job_result['results'])} recommendations generated"
+        )
 
     return job_result
 
 
 @django_rq.job
-def recommend_matches(ctx, source_uuids, target_uuids, criteria, verbose=False):
+def recommend_affiliations_chunk(ctx, parent_id, index, uuids=None, mk_range=None, workers=1):
+    """Generate affiliation recommendations for a chunk of individuals.
+
+    Child job of `recommend_affiliations`. Individuals are given
+    by a list of identifiers or by a range of main keys. The
+    results are aggregated into the result of the parent job
+    when all its children finish.
+
+    :param ctx: context where this job is run
+    :param parent_id: identifier of the parent job
+    :param index: position of the chunk in the parent job
+    :param uuids: list of individuals identifiers
+    :param mk_range: tuple with the first main key of the individuals
+        and the main key where they end, not included; `None` when
+        the range is open
+    :param workers: number of processes used to generate the
+        recommendations
+
+    :returns: a dictionary with which individuals are recommended to be
+        affiliated to which organization.
+    """
+    def _recommend():
+        results = {}
+        engine = RecommendationEngine(workers=workers)
+
+        keys = _chunk_keys(uuids, mk_range)
+        progress = JobProgress(job, total=len(keys))
+
+        for rec in engine.recommend('affiliation', keys):
+            if rec.options:
+                results[rec.key] = rec.options
+            progress.update()
+
+        progress.finish()
+
+        return {'results': results}
+
+    job = rq.get_current_job()
+
+    logger.debug(f"Running job {job.id} 'recommend affiliations' chunk; parent={parent_id}; ...")
+
+    return _run_child(job, parent_id, index, _recommend)
+
+
+@django_rq.job
+def recommend_matches(ctx, source_uuids, target_uuids, criteria, verbose=False,
+                      fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD, workers=1):
     """Generate a list of affiliation recommendations from a set of individuals.
 
     This function generates a list of recommendations which include the
@@ -180,9 +571,15 @@ def recommend_matches(ctx, source_uuids, target_uuids, criteria, verbose=False):
     :param source_uuids: list of individuals identifiers to look matches for
     :param target_uuids: list of individuals identifiers where to look for matches
     :param criteria: list of fields which the match will be based on
-        (`email`, `name` and/or `username`)
+        (`email`, `name`, `username` and/or `fuzzy_name`); lists of
+        fields are compound criteria, which match when all their
+        fields match (`email`, `name`, `username` and/or `source`)
     :param verbose: if set to `True`, the match results will be composed by individual
         identities (even belonging to the same individual).
+    :param fuzzy_threshold: minimum similarity between names to match
+        when `fuzzy_name` criterion is given
+    :param workers: number of processes used to find the matches;
+        the result does not depend on this number
 
     :returns: a dictionary with which individuals are recommended to be
         merged to which individual or which identities.
@@ -206,7 +603,8 @@ def recommend_matches(ctx, source_uuids, target_uuids, criteria, verbose=False):
 
     trxl = TransactionsLog.open('recommend_matches', job_ctx)
 
-    for rec in engine.recommend('matches', source_uuids, target_uuids, criteria, verbose):
+    for rec in engine.recommend('matches', source_uuids, target_uuids, criteria, verbose,
+                                fuzzy_threshold=fuzzy_threshold, workers=workers):
         results[rec.key] = list(rec.options)
 
     trxl.close()
@@ -220,7 +618,7 @@ def recommend_matches(ctx, source_uuids, target_uuids, criteria, verbose=False):
 
 
 @django_rq.job
-def affiliate(ctx, uuids=None):
+def affiliate(ctx, uuids=None, workers=1):
     """Affiliate a set of individuals using recommendations.
 
     This function automates the affiliation process obtaining
@@ -233,22 +631,209 @@ def affiliate(ctx, uuids=None):
     When the parameter `uuids` is empty, the job will take all
     the individuals stored in the registry.
 
+    Individuals are split in chunks of `MAX_CHUNK_SIZE` that are
+    processed by child jobs, so the work is distributed among the
+    workers of the queue. The results of the children are aggregated
+    into the result of this job when all of them finish. Until then,
+    the result is `None` and the status given by `get_job_status`
+    is `started`. Results are stored in pages and read on demand
+    (see `JobResults`).
+
+    :param ctx: context where this job is run
+    :param uuids: list of individuals identifiers
+    :param workers: number of processes used by each child job to
+        generate the recommendations; the result does not depend
+        on this number
+
+    :returns: a dictionary with the lazy list of individuals and the
+        organizations they were enrolled to, and the errors found
+        running the job; individuals without new enrollments are
+        not included
+    """
+    job = rq.get_current_job()
+
+    if not uuids:
+        logger.info(f"Running job {job.id} 'affiliate'; uuids='all'; ...")
+    else:
+        logger.info(f"Running job {job.id} 'affiliate'; uuids={uuids}; ...")
+
+    job_result = {
+        'results': {},
+        'errors': []
+    }
+
+    # Create a new context to include the reference
+    # to the job id that will perform the transaction.
+    job_ctx = SortingHatContext(ctx.user, job.id)
+
+    # Create an empty transaction to log which job
+    # will generate the enroll transactions.
+    trxl = TransactionsLog.open('affiliate', job_ctx)
+
+    total = len(uuids) if uuids else Individual.objects.count()
+    job.meta['progress'] = JobProgress.describe(0, total, None)
+
+    job_result = _fan_out(job, affiliate_chunk, _split_keys(uuids, MAX_CHUNK_SIZE),
+                          job_result, ctx, workers=workers)
+
+    trxl.close()
+
+    if job_result is None:
+        logger.info(
+            f"Job {job.id} 'affiliate' split; "
+            f"{len(job.meta['children'])} child jobs running"
+        )
+    else:
+        nsuccess = len(job_result['results'])
+        logger.info(
+            f"Job {job.id} 'affiliate' completed; "
+            f"{nsuccess} individuals have new affiliations"
+        )
+
+    return job_result
+
+
+@django_rq.job
+def affiliate_chunk(ctx, parent_id, index, uuids=None, mk_range=None, workers=1):
+    """Affiliate a chunk of individuals using recommendations.
+
+    Child job of `affiliate`. Individuals are given by a list
+    of identifiers or by a range of main keys. Transactions are
+    logged on behalf of the parent job. The results and errors
+    are aggregated into the result of the parent job when all
+    its children finish.
+
     :param ctx: context where this job is run
+    :param parent_id: identifier of the parent job
+    :param index: position of the chunk in the parent job
     :param uuids: list of individuals identifiers
+    :param mk_range: tuple with the first main key of the individuals
+        and the main key where they end, not included; `None` when
+        the range is open
+    :param workers: number of processes used to generate the
+        recommendations
 
     :returns: a dictionary with which individuals were enrolled
         and the errors found running the job
     """
+    def _affiliate():
+        results = {}
+        errors = []
+        engine = RecommendationEngine(workers=workers)
+
+        keys = _chunk_keys(uuids, mk_range)
+        progress = JobProgress(job, total=len(keys))
+
+        enrollments = []
+        for rec in engine.recommend('affiliation', keys):
+            enrollments.extend((rec.key, name, None, None) for name in rec.options)
+            progress.update()
+
+        # Enrollments of the whole chunk are applied at once
+        enrolled, errs = enroll_many(job_ctx, enrollments)
+
+        for uuid, name, _, _ in enrolled:
+            results.setdefault(uuid, []).append(name)
+        errors.extend(str(exc) for exc in errs)
+
+        progress.finish()
+
+        return {'results': results, 'errors': errors}
+
+    job = rq.get_current_job()
+
+    logger.debug(f"Running job {job.id} 'affiliate' chunk; parent={parent_id}; ...")
+
+    # Transactions are logged with the id of the parent job
+    job_ctx = SortingHatContext(ctx.user, parent_id)
+
+    return _run_child(job, parent_id, index, _affiliate)
+
+
+@django_rq.job
+def recommend_bots(ctx, uuids=None, min_score=DEFAULT_BOT_SCORE):
+    """Generate a list of bot recommendations from a set of individuals.
+
+    This function generates a list of individuals that might be
+    bots, based on the names, email addresses and usernames of
+    their identities. This job returns a dictionary with the
+    score of each recommended individual.
+
+    Individuals are defined by any of their valid keys or UUIDs.
+    When the parameter `uuids` is empty, the job will take all
+    the individuals stored in the registry.
+
+    :param ctx: context where this job is run
+    :param uuids: list of individuals identifiers
+    :param min_score: minimum score to recommend an individual
+
+    :returns: a dictionary with the score of the individuals
+        recommended as bots
+    """
     job = rq.get_current_job()
 
     if not uuids:
-        logger.info(f"Running job {job.id} 'affiliate'; uuids='all'; ...")
-        uuids = Individual.objects.values_list('mk', flat=True).iterator()
+        logger.info(f"Running job {job.id} 'recommend bots'; uuids='all'; ...")
+        uuids = None
     else:
-        logger.info(f"Running job {job.id} 'affiliate'; uuids={uuids}; ...")
-        uuids = iter(uuids)
+        logger.info(f"Running job {job.id} 'recommend bots'; uuids={uuids}; ...")
 
     results = {}
+    job_result = {
+        'results': results
+    }
+
+    engine = RecommendationEngine()
+
+    # Create a new context to include the reference
+    # to the job id that will perform the transaction.
+    job_ctx = SortingHatContext(ctx.user, job.id)
+
+    trxl = TransactionsLog.open('recommend_bots', job_ctx)
+
+    for rec in engine.recommend('bots', uuids, min_score=min_score):
+        results[rec.key] = rec.options
+
+    trxl.close()
+
+    logger.info(
+        f"Job {job.id} 'recommend bots' completed; "
+        f"{len(results)} recommendations generated"
+    )
+
+    return job_result
+
+
+@django_rq.job
+def mark_bots(ctx, uuids=None, min_score=DEFAULT_BOT_SCORE):
+    """Mark a set of individuals as bots using recommendations.
+
+    This function automates the process of flagging bots. It
+    obtains the list of individuals that might be bots and
+    updates their profiles setting `is_bot` to `True`. This
+    job returns a dictionary with which individuals were marked
+    and the errors generated during this process.
+
+    Individuals are defined by any of their valid keys or UUIDs.
+    When the parameter `uuids` is empty, the job will take all
+    the individuals stored in the registry.
+
+    :param ctx: context where this job is run
+    :param uuids: list of individuals identifiers
+    :param min_score: minimum score to mark an individual
+
+    :returns: a dictionary with which individuals were marked
+        and the errors found running the job
+    """
+    job = rq.get_current_job()
+
+    if not uuids:
+        logger.info(f"Running job {job.id} 'mark bots'; uuids='all'; ...")
+        uuids = None
+    else:
+        logger.info(f"Running job {job.id} 'mark bots'; uuids={uuids}; ...")
+
+    results = []
     errors = []
     job_result = {
         'results': results,
@@ -262,37 +847,46 @@ def affiliate(ctx, uuids=None):
     job_ctx = SortingHatContext(ctx.user, job.id)
 
     # Create an empty transaction to log which job
-    # will generate the enroll transactions.
-    trxl = TransactionsLog.open('affiliate', job_ctx)
+    # will generate the update profile transactions.
+    trxl = TransactionsLog.open('mark_bots', job_ctx)
+
+    # Recommendations are read before updating any profile,
+    # so the registry is not modified while it is scanned.
+    recs = list(engine.recommend('bots', uuids, min_score=min_score))
 
-    nsuccess = 0
+    progress = JobProgress(job, total=len(recs))
 
-    for chunk in _iter_split(uuids, size=MAX_CHUNK_SIZE):
-        for rec in engine.recommend('affiliation', chunk):
-            affiliated, errs = _affiliate_individual(job_ctx, rec.key, rec.options)
-            results[rec.key] = affiliated
-            errors.extend(errs)
+    for rec in recs:
+        try:
+            update_profile(job_ctx, rec.key, is_bot=True)
+        except BaseError as exc:
+            errors.append(str(exc))
+        else:
+            results.append(rec.key)
+        progress.update()
 
-            if affiliated:
-                nsuccess += 1
+    progress.finish()
 
     trxl.close()
 
     logger.info(
-        f"Job {job.id} 'affiliate' completed; "
-        f"{nsuccess} individuals have new affiliations"
+        f"Job {job.id} 'mark bots' completed; "
+        f"{len(results)} individuals marked as bots"
     )
 
     return job_result
 
 
 @django_rq.job
-def unify(ctx, source_uuids, target_uuids, criteria):
+def unify(ctx, source_uuids, target_uuids, criteria,
+          fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD, workers=1):
     """Unify a set of individuals by merging them using matching recommendations.
 
     This function automates the identities unify process obtaining
     a list of recommendations where matching individuals can be merged.
-    After that, matching individuals are merged.
+    After that, matching individuals are merged. Groups of matching
+    individuals are merged in batches of `MAX_CHUNK_SIZE` groups,
+    each one inside a single transaction (see `merge_many`).
     This job returns a list with the individuals which have been merged
     and the errors generated during this process.
 
@@ -301,11 +895,22 @@ def unify(ctx, source_uuids, target_uuids, criteria):
     the matches and the later merges will take place comparing the identities
     from the individuals in `source_uuids` against all the identities on the registry.
 
+    The progress of the job is reported in two phases. First, each
+    individual of `source_uuids` is an item processed once its matches
+    are found. Then, the groups of matching individuals are added to
+    the total, and each one is an item processed once it is merged.
+
     :param ctx: context where this job is run
     :param source_uuids: list of individuals identifiers to look matches for
     :param target_uuids: list of individuals identifiers where to look for matches
     :param criteria: list of fields which the unify will be based on
-        (`email`, `name` and/or `username`)
+        (`email`, `name`, `username` and/or `fuzzy_name`); lists of
+        fields are compound criteria, which match when all their
+        fields match (`email`, `name`, `username` and/or `source`)
+    :param fuzzy_threshold: minimum similarity between names to match
+        when `fuzzy_name` criterion is given
+    :param workers: number of processes used to find the matches;
+        the result does not depend on this number
 
     :returns: a list with the individuals resulting from merge operations
         and the errors found running the job
@@ -318,17 +923,23 @@ def unify(ctx, source_uuids, target_uuids, criteria):
         for keys A, B and C will be the group {A, B, C}. As D has no matches,
         it won't be included in any group and it won't be returned.
 
+        Keys are replaced by the main keys of their individuals, so
+        a group will not include two identifiers of the same individual.
+
         :param recs: recommendations of matching identities
 
         :returns: a list including unique groups of matches
         """
-        groups = []
+        mks = _find_main_keys(list(recs.keys()))
+
+        dset = DisjointSet()
         for group_key in recs:
-            g_uuids = pandas.Series(recs[group_key])
-            g_uuids = g_uuids.append(pandas.Series([group_key]))
-            g_uuids = list(g_uuids.sort_values().unique())
-            if (len(g_uuids) > 1) and (g_uuids not in groups):
-                groups.append(g_uuids)
+            mk = mks.get(group_key, group_key)
+            dset.add(mk)
+            for uuid in recs[group_key]:
+                dset.union(mk, uuid)
+
+        groups = [sorted(group) for group in dset.groups() if len(group) > 1]
         return groups
 
     check_criteria(criteria)
@@ -353,20 +964,27 @@ def unify(ctx, source_uuids, target_uuids, criteria):
 
     trxl = TransactionsLog.open('unify', job_ctx)
 
+    progress = JobProgress(job, total=len(source_uuids))
+
     match_recs = {}
-    for rec in engine.recommend('matches', source_uuids, target_uuids, criteria):
+    for rec in engine.recommend('matches', source_uuids, target_uuids, criteria,
+                                fuzzy_threshold=fuzzy_threshold, workers=workers):
         match_recs[rec.key] = list(rec.options)
+        progress.update()
 
     match_groups = _group_recommendations(match_recs)
 
+    progress.add_total(len(match_groups))
+
     # Apply the merge of the matching identities
-    for group in match_groups:
-        uuid = group[0]
-        result = group[1:]
-        merged_to, errs = _merge_individuals(job_ctx, uuid, result)
-        if merged_to:
-            results.append(merged_to)
-        errors.extend(errs)
+    for chunk in _iter_split(iter(match_groups), size=MAX_CHUNK_SIZE):
+        groups = [(group[0], group[1:]) for group in chunk]
+        merged, errs = merge_many(job_ctx, groups)
+        results.extend(merged)
+        errors.extend(_merge_errors(errs))
+        progress.update(len(groups))
+
+    progress.finish()
 
     trxl.close()
 
@@ -378,84 +996,665 @@ def unify(ctx, source_uuids, target_uuids, criteria):
     return job_result
 
 
-def _merge_individuals(job_ctx, source_indv, target_indvs):
-    """Merge a set of individuals.
+@django_rq.job
+def recommend_organizations(ctx, names=None, threshold=DEFAULT_ORGANIZATION_SIMILARITY):
+    """Generate a list of duplicate organizations recommendations.
+
+    This function generates a list of organizations that might
+    be duplicates, based on the similarity of their names and
+    on their domains. This job returns a dictionary with the
+    names of the duplicates of each canonical organization.
 
-    Returns a tuple with two elements: list of the uuids from
-    the individuals who were merged; list of errors found
-    during the process.
+    When the parameter `names` is empty, the job will take all
+    the organizations stored in the registry.
 
-    :param job_ctx: job context
-    :param source_indv: valid individual identifier where
-        the rest of individuals will be merged to
-    :param target_indvs: list of identifiers of the individuals
-        who will be merged with the source individual
+    :param ctx: context where this job is run
+    :param names: list of organization names
+    :param threshold: minimum similarity between names to consider
+        two organizations duplicates
 
-    :returns: tuple with the uuid from the individual resulting from the merge
-     operation (if any), and list of errors found during the process
+    :returns: a dictionary with the names of the duplicates
+        of each canonical organization
     """
-    logger.debug(
-        f"Merging individuals; "
-        f"job={job_ctx.job_id} source={source_indv} target={target_indvs}; ..."
+    job = rq.get_current_job()
+
+    if not names:
+        logger.info(f"Running job {job.id} 'recommend organizations'; names='all'; ...")
+        names = None
+    else:
+        logger.info(f"Running job {job.id} 'recommend organizations'; names={names}; ...")
+
+    results = {}
+    job_result = {
+        'results': results
+    }
+
+    engine = RecommendationEngine()
+
+    # Create a new context to include the reference
+    # to the job id that will perform the transaction.
+    job_ctx = SortingHatContext(ctx.user, job.id)
+
+    trxl = TransactionsLog.open('recommend_organizations', job_ctx)
+
+    for rec in engine.recommend('organizations', names, threshold=threshold):
+        results[rec.key] = rec.options
+
+    trxl.close()
+
+    logger.info(
+        f"Job {job.id} 'recommend organizations' completed; "
+        f"{len(results)} recommendations generated"
     )
 
+    return job_result
+
+
+@django_rq.job
+def unify_organizations(ctx, names=None, threshold=DEFAULT_ORGANIZATION_SIMILARITY):
+    """Unify duplicate organizations using recommendations.
+
+    This function automates the process of merging duplicate
+    organizations. It obtains the list of duplicates of each
+    canonical organization and merges them into it; domains and
+    enrollments of the duplicates are moved to the canonical one.
+    This job returns a dictionary with which organizations were
+    merged into each canonical organization and the errors
+    generated during this process.
+
+    When the parameter `names` is empty, the job will take all
+    the organizations stored in the registry.
+
+    :param ctx: context where this job is run
+    :param names: list of organization names
+    :param threshold: minimum similarity between names to consider
+        two organizations duplicates
+
+    :returns: a dictionary with which organizations were merged
+        and the errors found running the job
+    """
+    job = rq.get_current_job()
+
+    if not names:
+        logger.info(f"Running job {job.id} 'unify organizations'; names='all'; ...")
+        names = None
+    else:
+        logger.info(f"Running job {job.id} 'unify organizations'; names={names}; ...")
+
+    results = {}
     errors = []
+    job_result = {
+        'results': results,
+        'errors': errors
+    }
 
-    try:
-        to_indv = merge(job_ctx, target_indvs, source_indv)
-    except EqualIndividualError:
-        # When source identity is already part of the destination, the merge is not applied
-        to_indv = None
-        pass
-    except BaseError as exc:
-        to_indv = None
-        errors.append(str(exc))
+    engine = RecommendationEngine()
 
-    to_indv = to_indv.mk if to_indv else None
+    # Create a new context to include the reference
+    # to the job id that will perform the transaction.
+    job_ctx = SortingHatContext(ctx.user, job.id)
 
-    logger.debug(
-        f"Individuals merging completed with {len(errors)} errors;"
-        f"job={job_ctx.job_id} source={source_indv} target={target_indvs}"
+    # Create an empty transaction to log which job
+    # will generate the merge transactions.
+    trxl = TransactionsLog.open('unify_organizations', job_ctx)
+
+    # Recommendations are read before merging any organization,
+    # so the registry is not modified while they are generated.
+    recs = list(engine.recommend('organizations', names, threshold=threshold))
+
+    progress = JobProgress(job, total=len(recs))
+
+    for rec in recs:
+        merged = []
+
+        for duplicate in rec.options:
+            try:
+                merge_organizations(job_ctx, duplicate, rec.key)
+            except BaseError as exc:
+                errors.append(str(exc))
+            else:
+                merged.append(duplicate)
+
+        if merged:
+            results[rec.key] = merged
+
+        progress.update()
+
+    progress.finish()
+
+    trxl.close()
+
+    logger.info(
+        f"Job {job.id} 'unify organizations' completed; "
+        f"{sum(len(merged) for merged in results.values())} organizations merged"
     )
 
-    return to_indv, errors
+    return job_result
+
 
+@django_rq.job
+def update_stored_affiliation_recommendations(mks=None, domain_names=None):
+    """Update the stored affiliation recommendations.
 
-def _affiliate_individual(job_ctx, uuid, organizations):
-    """Affiliate an individual to a list of organizations.
+    The API schedules this job after committing any change on
+    the data the affiliation recommendations depend on, so they
+    are calculated off the write path. The recommendations of
+    the individuals pending to update, the ones marked as stale,
+    and the ones identified by `mks` are calculated again and
+    stored. The same happens to the individuals with an email
+    address in any of the pending domains or `domain_names`,
+    or in their sub-domains.
 
-    Returns a tuple with two elements: list of the organizations
-    the individual was enrolled to; list of the errors found
-    during the process.
+    When the update fails, the pending individuals are marked
+    as stale so the next job calculates them again.
 
-    :param job_ctx: job context
-    :param uuid: valid individual identifier
-    :param organizations: list of organization names
+    :param mks: main keys of the individuals to update
+    :param domain_names: names of the domains that changed
 
-    :returns: tuple with the organizations affiliated to the i
+    :returns: number of recommendations stored
     """
+    job = rq.get_current_job()
+
+    mks = set(mks or [])
+    domain_names = set(domain_names or [])
+
     logger.debug(
-        f"Affiliating individual; "
-        f"job={job_ctx.job_id} uuid={uuid} organizations={organizations}; ..."
+        f"Running job {job.id} 'update stored affiliation recommendations'; "
+        f"mks={mks}; domains={domain_names}; ..."
     )
 
-    affiliated = []
-    errors = []
-
-    for name in organizations:
-        try:
-            enroll(job_ctx, uuid, name)
-        except BaseError as exc:
-            errors.append(str(exc))
-        else:
-            affiliated.append(name)
+    try:
+        with django.db.transaction.atomic():
+            pending_mks, pending_domains = pop_pending_affiliation_recommendations()
+            mks.update(pending_mks)
+            domain_names.update(pending_domains)
+
+            nrecs = update_affiliation_recommendations(sorted(mks))
+            for domain_name in sorted(domain_names):
+                nrecs += update_domain_affiliation_recommendations(domain_name)
+    except Exception:
+        mark_stale_affiliation_recommendations(mks, domain_names)
+        raise
 
     logger.debug(
-        f"Individual affiliation completed with {len(errors)} errors; "
-        f"job={job_ctx.job_id} uuid={uuid} organizations={organizations}; ..."
+        f"Job {job.id} 'update stored affiliation recommendations' completed; "
+        f"{nrecs} recommendations stored"
     )
 
-    return affiliated, errors
+    return nrecs
+
+
+@django_rq.job
+def check_children(parent_id):
+    """Check whether the children of a job died without finishing.
+
+    Jobs split in child jobs (see `_fan_out`) schedule this job
+    to find the children that died without fanning in their
+    results, like when their work horse was killed. Their errors
+    are fanned in, so the parent does not wait for them forever.
+    The job schedules itself again while the parent has pending
+    children.
+
+    :param parent_id: identifier of the parent job
+
+    :returns: `True` when the parent finished; `False` otherwise
+    """
+    job = rq.get_current_job()
+    connection = job.connection
+
+    try:
+        parent = rq.job.Job.fetch(parent_id, connection=connection)
+    except rq.exceptions.NoSuchJobError:
+        logger.debug(f"Job {parent_id} not found; children not checked")
+        return False
+
+    finished = _check_children(parent)
+
+    if not finished and connection.exists(FAN_IN_PENDING_KEY.format(parent_id)):
+        _schedule_check_children(django_rq.get_queue(parent.origin), parent_id)
+
+    logger.debug(f"Children of job {parent_id} checked; finished={finished}")
+
+    return finished
+
+
+def _find_main_keys(uuids):
+    """Find the main keys of the individuals of a list of identifiers.
+
+    Identifiers can be main keys of individuals or UUIDs of
+    their identities. Main keys take precedence when an
+    identifier is both. Identifiers not found in the registry
+    are not included in the result.
+
+    :param uuids: list of identifiers
+
+    :returns: a dictionary with the main key of each identifier
+    """
+    mks = {}
+
+    for chunk in _iter_split(iter(uuids), size=MAX_CHUNK_SIZE):
+        chunk = list(chunk)
+        identities = Identity.objects.filter(uuid__in=chunk)
+        mks.update(identities.values_list('uuid', 'individual'))
+        individuals = Individual.objects.filter(mk__in=chunk)
+        mks.update((mk, mk) for mk in individuals.values_list('mk', flat=True))
+
+    return mks
+
+
+def _merge_errors(errors):
+    """Get the messages of the errors found merging individuals.
+
+    When an individual is already part of the individual where
+    it would be merged, the merge is not applied and the error
+    is not reported.
+
+    :param errors: list of errors raised merging groups of individuals
+
+    :returns: list of error messages
+    """
+    return [str(exc) for exc in errors if not isinstance(exc, EqualIndividualError)]
+
+
+def _split_keys(uuids, size):
+    """Split the individuals to process in chunks.
+
+    When `uuids` is empty, every individual of the registry
+    is processed and the chunks are ranges of main keys, so
+    child jobs do not carry long lists of keys. Otherwise,
+    the chunks are lists of the given identifiers.
+
+    Ranges are contiguous: each one starts at the first key of
+    its chunk and ends before the first key of the next one,
+    while the first and the last ranges are open. Individuals
+    added after splitting the keys are processed by the child
+    of the range they fall in, so none of them is skipped, and
+    chunks might end up with more than `size` individuals. When
+    the registry is empty, there are no chunks.
+
+    :param uuids: list of individuals identifiers
+    :param size: maximum number of individuals of a chunk
+
+    :returns: generator of dictionaries with the arguments
+        `uuids` or `mk_range` of each chunk
+    """
+    if not uuids:
+        mks = Individual.objects.order_by('mk').values_list('mk', flat=True).iterator()
+        bounds = [list(chunk)[0] for chunk in _iter_split(mks, size=size)]
+        if not bounds:
+            return
+        bounds = [None] + bounds[1:] + [None]
+        for start, end in zip(bounds, bounds[1:]):
+            yield {'mk_range': (start, end)}
+    else:
+        for chunk in _iter_split(iter(uuids), size=size):
+            yield {'uuids': list(chunk)}
+
+
+def _chunk_keys(uuids=None, mk_range=None):
+    """Get the keys of the individuals of a chunk"""
+
+    if mk_range:
+        start, end = mk_range
+        mks = Individual.objects.order_by('mk')
+        if start is not None:
+            mks = mks.filter(mk__gte=start)
+        if end is not None:
+            mks = mks.filter(mk__lt=end)
+        return list(mks.values_list('mk', flat=True))
+    else:
+        return uuids
+
+
+def _fan_out(job, func, chunks, job_result, *args, **kwargs):
+    """Split the work of a job in child jobs.
+
+    A child job running `func` is enqueued in the queue of `job`
+    for each chunk. Children receive `args`, the identifier of
+    the parent job, the position of the chunk and the arguments
+    of the chunk, together with `kwargs`. Children are kept for
+    `FAN_IN_TTL` seconds, so the parent can report their progress
+    until all of them finish. The identifier of the parent is
+    stored under the key `parent` of the metadata of the children.
+
+    The parent and its children share a counter of pending jobs.
+    Every job stores its partial result and decreases the counter
+    when it finishes. The last one aggregates the partial results,
+    starting with `job_result`, into the result of the parent
+    (see `_fan_in`), so workers do not wait for other jobs.
+
+    Children that die without fanning in are found by the job
+    `check_children`, scheduled every `CHECK_CHILDREN_INTERVAL`
+    seconds while the children are running. Scheduled jobs are
+    only run by workers started with the scheduler enabled
+    (`rqworker --with-scheduler`).
+
+    :param job: parent job
+    :param func: job function run by the children
+    :param chunks: iterable of dictionaries with the arguments
+        of each chunk
+    :param job_result: initial result of the parent job
+
+    :returns: the aggregated result when all the children already
+        finished; `None` otherwise
+    """
+    connection = job.connection
+    queue = django_rq.get_queue(job.origin)
+
+    # The parent holds a slot of the counter, so the children
+    # cannot fan in before all of them are enqueued
+    connection.set(FAN_IN_PENDING_KEY.format(job.id), 1, ex=FAN_IN_TTL)
+    connection.delete(FAN_IN_RESULTS_KEY.format(job.id))
+
+    children = []
+
+    for index, chunk in enumerate(chunks):
+        connection.incr(FAN_IN_PENDING_KEY.format(job.id))
+        child_kwargs = dict(kwargs, **chunk)
+        child = queue.enqueue(func, *args, job.id, index,
+                              job_id=f"{job.id}-{index}",
+                              job_timeout=job.timeout,
+                              result_ttl=FAN_IN_TTL,
+                              meta={'parent': job.id},
+                              **child_kwargs)
+        children.append(child.id)
+
+    # The last child sets the time to live of the parent
+    # when it finishes, so it is kept with the job
+    job.meta['children'] = children
+    job.meta['result_ttl'] = job.get_result_ttl(rq.defaults.DEFAULT_RESULT_TTL)
+    job.save_meta()
+
+    fan_in = _fan_in(connection, job.id, -1, job_result)
+
+    if fan_in is None:
+        # Keep the parent until its children finish
+        job.result_ttl = FAN_IN_TTL
+        _schedule_check_children(queue, job.id)
+        return None
+
+    job_result, failed = fan_in
+
+    if failed:
+        job.meta['failed'] = failed
+    _finish_progress(job)
+    job.save_meta()
+
+    _expire_results(connection, job.id,
+                    job.get_result_ttl(rq.defaults.DEFAULT_RESULT_TTL))
+
+    return job_result
+
+
+def _run_child(job, parent_id, index, func):
+    """Run the work of a child job and fan in its result.
+
+    The result of `func` is stored as the partial result of the
+    child. When `func` fails, an error is stored instead and the
+    exception is raised again. The child that finishes last writes
+    the aggregated result into the parent job.
+
+    :param job: child job
+    :param parent_id: identifier of the parent job
+    :param index: position of the chunk in the parent job
+    :param func: function that returns the result of the child
+
+    :returns: the result of `func`
+    """
+    try:
+        result = func()
+    except Exception as exc:
+        result = {'errors': [f"Job {job.id} failed; {exc}"]}
+        _finish_child(job, parent_id, index, result, failed=True)
+        raise
+
+    _finish_child(job, parent_id, index, result)
+
+    return result
+
+
+def _finish_child(job, parent_id, index, result, failed=False):
+    """Fan in the result of a child job"""
+
+    connection = job.connection
+
+    fan_in = _fan_in(connection, parent_id, index, result,
+                     child_id=job.id if failed else None)
+    if fan_in is None:
+        return
+
+    job_result, failed = fan_in
+
+    _finish_parent(connection, parent_id, job_result, failed)
+
+
+def _finish_parent(connection, parent_id, job_result, failed):
+    """Write the aggregated result of the children into the parent job.
+
+    The worker of the parent saves it with the time to live of the
+    fan in once the parent returns. The result and the original
+    time to live of the parent are written in a transaction after
+    that happens, so the worker does not override them. The last
+    child waits up to `FAN_IN_WAIT` seconds for the parent to
+    finish; after that, the result is written anyway.
+    """
+    parent_key = rq.job.Job.key_for(parent_id)
+    deadline = time.monotonic() + FAN_IN_WAIT
+
+    with connection.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(parent_key)
+
+                status = rq.utils.as_text(pipe.hget(parent_key, 'status'))
+                if status is None:
+                    logger.warning(f"Job {parent_id} not found; aggregated result discarded")
+                    return
+
+                finished = status == rq.job.JobStatus.FINISHED
+                if not finished and time.monotonic() < deadline:
+                    pipe.unwatch()
+                    time.sleep(FAN_IN_WAIT_INTERVAL)
+                    continue
+
+                parent = rq.job.Job.fetch(parent_id, connection=connection)
+
+                if failed:
+                    parent.meta['failed'] = failed
+                _finish_progress(parent)
+
+                # The worker saved the parent with the time to live
+                # of the fan in, so the original one is read from meta
+                ttl = parent.meta.get('result_ttl', rq.defaults.DEFAULT_RESULT_TTL)
+
+                pipe.multi()
+                pipe.hset(parent_key, 'result', parent.serializer.dumps(job_result))
+                pipe.hset(parent_key, 'meta', parent.serializer.dumps(parent.meta))
+                _expire_key(pipe, parent_key, ttl)
+                _expire_results(pipe, parent_id, ttl)
+
+                if finished:
+                    registry = rq.registry.FinishedJobRegistry(parent.origin,
+                                                               connection=connection)
+                    if ttl == 0:
+                        registry.remove(parent, pipeline=pipe)
+                    else:
+                        registry.add(parent, ttl, pipeline=pipe)
+
+                pipe.execute()
+                break
+            except redis.exceptions.WatchError:
+                continue
+
+    logger.info(f"Job {parent_id} completed; {len(parent.meta['children'])} child jobs finished")
+
+
+def _check_children(job):
+    """Fan in the results of the children that died without doing it.
+
+    Children killed while running, like when the work horse runs
+    out of memory, and children stopped, canceled or removed before
+    running never fan in their results, so their parent would be
+    `started` forever. RQ marks them as failed, stopped or canceled,
+    also when their worker died and its registries were cleaned up.
+    An error is fanned in for each of these children and, when they
+    were the last pending ones, the parent finishes as failed.
+    This function is run by the job `check_children`.
+
+    :param job: parent job
+
+    :returns: `True` when the parent finished; `False` otherwise
+    """
+    connection = job.connection
+    children_ids = job.meta['children']
+
+    # Nothing can be fanned in once the partial results expired
+    if not connection.exists(FAN_IN_PENDING_KEY.format(job.id)):
+        return False
+
+    children = rq.job.Job.fetch_many(children_ids, connection=connection)
+    fanned_in = {int(index) for index in connection.hkeys(FAN_IN_RESULTS_KEY.format(job.id))}
+
+    for index, (child_id, child) in enumerate(zip(children_ids, children)):
+        if index in fanned_in:
+            continue
+
+        if not child:
+            reason = "job not found"
+        elif child.get_status(refresh=False) in DEAD_JOB_STATUSES:
+            reason = f"job {child.get_status(refresh=False)}"
+        else:
+            continue
+
+        result = {'errors': [f"Job {child_id} failed; {reason}"]}
+        fan_in = _fan_in(connection, job.id, index, result, child_id=child_id)
+
+        if fan_in is not None:
+            _finish_parent(connection, job.id, *fan_in)
+            return True
+
+    return False
+
+
+def _schedule_check_children(queue, parent_id):
+    """Schedule the next check of the children of a job"""
+
+    queue.enqueue_in(datetime.timedelta(seconds=CHECK_CHILDREN_INTERVAL),
+                     check_children, parent_id,
+                     result_ttl=0,
+                     meta={'parent': parent_id})
+
+
+def _finish_progress(job):
+    """Set the final progress of a job split in child jobs"""
+
+    progress = job.meta.get('progress', None)
+    if progress is None:
+        return
+
+    elapsed = 0
+    if job.started_at:
+        elapsed = (rq.utils.utcnow() - job.started_at).total_seconds()
+
+    total = progress['total']
+    rate = total / elapsed if elapsed > 0 else None
+
+    job.meta['progress'] = JobProgress.describe(total, total, rate)
+
+
+def _fan_in(connection, parent_id, index, result, child_id=None):
+    """Store a partial result of a job and aggregate them when all finished.
+
+    Partial results are aggregated by position. The items of
+    the dictionaries of `results` are stored in pages (see
+    `JobResults`), reading one partial result at a time; the
+    rest of the values, which are lists, are extended.
+
+    :param connection: Redis connection
+    :param parent_id: identifier of the parent job
+    :param index: position of the partial result
+    :param result: partial result
+    :param child_id: identifier of the child job when it failed
+
+    :returns: a tuple with the aggregated result and the list of
+        failed children when this was the last pending job;
+        `None` otherwise or when the result of `index` was
+        already stored
+    """
+    pending_key = FAN_IN_PENDING_KEY.format(parent_id)
+    results_key = FAN_IN_RESULTS_KEY.format(parent_id)
+    pages_key = JOB_RESULTS_KEY.format(parent_id)
+
+    # A result is only stored once, so a child that is checked
+    # while it fans in does not decrease the counter twice
+    with connection.pipeline() as pipe:
+        pipe.hsetnx(results_key, index, pickle.dumps((result, child_id)))
+        pipe.expire(results_key, FAN_IN_TTL)
+        stored = pipe.execute()[0]
+
+    if not stored:
+        return None
+
+    pending = connection.decr(pending_key)
+
+    if pending > 0:
+        return None
+
+    connection.delete(pages_key)
+
+    job_result = {}
+    failed = []
+    page = []
+    nresults = 0
+
+    for key in sorted(connection.hkeys(results_key), key=int):
+        result, child_id = pickle.loads(connection.hget(results_key, key))
+
+        if child_id:
+            failed.append(child_id)
+
+        for field, value in result.items():
+            if field != 'results':
+                job_result.setdefault(field, []).extend(value)
+                continue
+
+            for item in value.items():
+                page.append(item)
+                if len(page) == RESULTS_PAGE_SIZE:
+                    connection.rpush(pages_key, pickle.dumps(page))
+                    nresults += len(page)
+                    page = []
+
+    if page:
+        connection.rpush(pages_key, pickle.dumps(page))
+        nresults += len(page)
+
+    connection.expire(pages_key, FAN_IN_TTL)
+    connection.delete(pending_key, results_key)
+
+    job_result['results'] = JobResults(parent_id, nresults)
+
+    return job_result, failed
+
+
+def _expire_results(connection, job_id, ttl):
+    """Set the time to live of the pages of results of a job"""
+
+    _expire_key(connection, JOB_RESULTS_KEY.format(job_id), ttl)
+
+
+def _expire_key(connection, key, ttl):
+    """Set the time to live of a key like RQ does with results.
+
+    A `ttl` of zero removes the key, and `None` or a negative
+    value keeps it forever.
+    """
+    if ttl == 0:
+        connection.delete(key)
+    elif ttl is None or ttl < 0:
+        connection.persist(key)
+    else:
+        connection.expire(key, ttl)
 
 
 def _iter_split(iterator, size=None):
@@ -485,10 +1684,29 @@ def check_criteria(criteria):
     """ Check if all given criteria are valid.
 
     Raises an error if a criterion is not in the valid criteria list
-    (`email`, `name` and/or `username`).
+    (`email`, `name`, `username` and/or `fuzzy_name`).
+
+    Compound criteria are given as lists of fields that must match
+    at the same time. Their fields must be in the list of valid
+    fields for compound criteria (`email`, `name`, `username` and/or
+    `source`) and, at least, one of them must be other than `source`.
+    Lists with only one field are considered simple criteria.
 
     :param criteria: list of criteria to check
     """
-    valid_criteria = ['name', 'email', 'username']
-    if any(criterion not in valid_criteria for criterion in criteria):
-        raise ValueError(f"Invalid criteria {criteria}. Valid values are: {valid_criteria}")
+    valid_criteria = ['name', 'email', 'username', 'fuzzy_name']
+    valid_compound_criteria = ['name', 'email', 'username', 'source']
+
+    for criterion in criteria:
+        if not isinstance(criterion, str) and len(criterion) == 1:
+            criterion = criterion[0]
+        if isinstance(criterion, str):
+            if criterion not in valid_criteria:
+                raise ValueError(f"Invalid criteria {criteria}. Valid values are: {valid_criteria}")
+            continue
+
+        if not criterion or any(field not in valid_compound_criteria for field in criterion):
+            msg = f"Invalid compound criterion {criterion}. Valid values are: {valid_compound_criteria}"
+            raise ValueError(msg)
+        if all(field == 'source' for field in criterion):
+            raise ValueError(f"Invalid compound criterion {criterion}. 'source' cannot be used alone")
@@ -20,12 +20,14 @@
 #
 
 
+import datetime
 import json
 import logging
 import re
 import uuid
 
 import django.core.exceptions
+import django.db.transaction
 import django.db.utils
 
 from django.contrib.auth.models import User, AnonymousUser
@@ -33,6 +35,10 @@ from django.contrib.auth.models import User, AnonymousUser
 from grimoirelab_toolkit.datetime import datetime_utcnow
 
 from .context import SortingHatContext
+from .db import (DOMAINS_ENTITY_TYPES,
+                 DOMAINS_VERSION,
+                 REGISTRY_VERSION,
+                 increase_registry_versions)
 from .errors import AlreadyExistsError, ClosedTransactionError
 from .models import (Operation,
                      Transaction)
@@ -61,6 +67,9 @@ class TransactionsLog:
     this field has a `NULL` value in the DB) and it also sets to `True` the
     `is_closed` flag.
 
+    Once the database transaction where the operations were logged is
+    committed, the version of the registry is increased.
+
     :param trx: Transaction object generated with the class method `open`
 
     :raises ClosedTransactionError: When trying to log an operation on a closed transaction
@@ -69,6 +78,7 @@ class TransactionsLog:
     def __init__(self, trx, ctx):
         self.trx = trx
         self.ctx = ctx
+        self._versions = set()
 
     @classmethod
     def open(cls, name, ctx):
@@ -147,6 +157,71 @@ class TransactionsLog:
 
         :returns: a new Operation object
         """
+        operation = self._new_operation(op_type, entity_type, timestamp, args, target)
+
+        try:
+            operation.save(force_insert=True)
+        except django.db.utils.IntegrityError as exc:
+            _handle_integrity_error(Operation, exc, self.trx.tuid)
+
+        self._schedule_versions_update([entity_type])
+
+        logger.debug(
+            f"Operation {operation.ouid} completed; "
+            f"trx='{operation.trx.tuid}' op='{operation.op_type}' "
+            f"type='{entity_type}' target='{target}' args={args};"
+        )
+
+        return operation
+
+    def log_operations(self, operations):
+        """Create a set of operation objects and save them into the DB.
+
+        Operations are inserted using a single bulk query. Each
+        operation is a dictionary with the parameters of `log_operation`
+        (`op_type`, `entity_type`, `timestamp`, `args` and `target`).
+        Operations keep the order of the list: when an operation has
+        a timestamp earlier or equal than the previous one, it is moved
+        forward a microsecond.
+
+        :param operations: list of operations to create
+
+        :raises ClosedTransactionError: When trying to log an operation on a closed transaction
+        :raises TypeError: When the `op_type` is not an instance of `Operation.OpType` class
+
+        :returns: a list of new Operation objects
+        """
+        objs = []
+        last_timestamp = None
+
+        for operation in operations:
+            timestamp = operation['timestamp']
+            if last_timestamp and timestamp <= last_timestamp:
+                timestamp = last_timestamp + datetime.timedelta(microseconds=1)
+            last_timestamp = timestamp
+
+            objs.append(self._new_operation(operation['op_type'],
+                                            operation['entity_type'],
+                                            timestamp,
+                                            operation['args'],
+                                            operation['target']))
+
+        try:
+            Operation.objects.bulk_create(objs)
+        except django.db.utils.IntegrityError as exc:
+            _handle_integrity_error(Operation, exc, self.trx.tuid)
+
+        self._schedule_versions_update([obj.entity_type for obj in objs])
+
+        logger.debug(
+            f"{len(objs)} operations completed; trx='{self.trx.tuid}'"
+        )
+
+        return objs
+
+    def _new_operation(self, op_type, entity_type, timestamp, args, target):
+        """Create a new operation object checking its values"""
+
         if self.trx.is_closed:
             msg = 'Log operation not allowed, transaction {} is already closed'.format(self.trx.tuid)
             raise ClosedTransactionError(msg=msg)
@@ -162,21 +237,34 @@ class TransactionsLog:
 
         ouid = uuid.uuid4().hex
 
-        operation = Operation(ouid=ouid, trx=self.trx, op_type=op_type, target=target,
-                              entity_type=entity_type, timestamp=timestamp, args=args_dump)
+        return Operation(ouid=ouid, trx=self.trx, op_type=op_type, target=target,
+                         entity_type=entity_type, timestamp=timestamp, args=args_dump)
 
-        try:
-            operation.save(force_insert=True)
-        except django.db.utils.IntegrityError as exc:
-            _handle_integrity_error(Operation, exc, self.trx.tuid)
+    def _schedule_versions_update(self, entity_types):
+        """Increase the versions of the registry once the transaction is committed"""
 
-        logger.debug(
-            f"Operation {operation.ouid} completed; "
-            f"trx='{operation.trx.tuid}' op='{operation.op_type}' "
-            f"type='{entity_type}' target='{target}' args={args};"
-        )
+        if not entity_types:
+            return
 
-        return operation
+        pending = bool(self._versions)
+        self._versions.add(REGISTRY_VERSION)
+
+        if any(entity_type in DOMAINS_ENTITY_TYPES for entity_type in entity_types):
+            self._versions.add(DOMAINS_VERSION)
+
+        if not pending:
+            django.db.transaction.on_commit(self._update_versions)
+
+    def _update_versions(self):
+        """Increase the versions of the registry changed by the transaction"""
+
+        names, self._versions = self._versions, set()
+
+        try:
+            increase_registry_versions(names)
+        except django.db.utils.Error as exc:
+            logger.error(f"Unable to increase registry versions; "
+                         f"trx='{self.trx.tuid}' names={sorted(names)}; error: {exc}")
 
 
 _MYSQL_DUPLICATE_ENTRY_ERROR_REGEX = re.compile(r"Duplicate entry '(?P<value>.+)' for key")
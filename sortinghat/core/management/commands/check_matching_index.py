@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...db import MATCHING_INDEX_BATCH_SIZE, check_matching_index
+
+
+class Command(BaseCommand):
+    help = "Check whether the index of matching keys is consistent with the registry."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=MATCHING_INDEX_BATCH_SIZE,
+                            help="number of identities checked on each batch")
+
+    def handle(self, *args, **options):
+        inconsistencies = check_matching_index(batch_size=options['batch_size'])
+
+        for uuid, missing, unexpected in inconsistencies:
+            self.stdout.write(f"{uuid}: missing={sorted(missing)} unexpected={sorted(unexpected)}")
+
+        if inconsistencies:
+            msg = f"{len(inconsistencies)} identities are not consistent; run 'rebuild_matching_index'"
+            raise CommandError(msg)
+
+        self.stdout.write("Matching index is consistent")
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from ...recommendations.affiliation import rebuild_affiliation_recommendations
+
+
+class Command(BaseCommand):
+    help = "Calculate and store the affiliation recommendations of every individual."
+
+    def handle(self, *args, **options):
+        nrecs = rebuild_affiliation_recommendations()
+
+        self.stdout.write(f"Affiliation recommendations rebuilt; {nrecs} recommendations stored")
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from ...db import MATCHING_INDEX_BATCH_SIZE, rebuild_normalized_values
+
+
+class Command(BaseCommand):
+    help = "Store again the normalized name, email and username of every identity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=MATCHING_INDEX_BATCH_SIZE,
+                            help="number of identities updated on each batch")
+
+    def handle(self, *args, **options):
+        nidentities = rebuild_normalized_values(batch_size=options['batch_size'])
+
+        self.stdout.write(f"Normalized values rebuilt; {nidentities} identities updated")
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from ...db import MATCHING_CRITERIA, add_to_matching_blacklist
+from ...recommendations.matching import (DEFAULT_BLACKLIST_MIN_FREQUENCY,
+                                         recommend_blacklist)
+
+
+class Command(BaseCommand):
+    help = "Find values shared by many identities and propose them as matching blacklist entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--criteria', nargs='+', choices=MATCHING_CRITERIA,
+                            default=MATCHING_CRITERIA,
+                            help="criteria to analyze")
+        parser.add_argument('--min-frequency', type=int,
+                            default=DEFAULT_BLACKLIST_MIN_FREQUENCY,
+                            help="minimum number of identities sharing a value")
+        parser.add_argument('--add', action='store_true',
+                            help="add the proposed values to the blacklist")
+
+    def handle(self, *args, **options):
+        recommendations = list(recommend_blacklist(options['criteria'],
+                                                   min_frequency=options['min_frequency']))
+
+        for criterion, value, frequency in recommendations:
+            self.stdout.write(f"{criterion}\t{value}\t{frequency}")
+
+        if options['add']:
+            nvalues = add_to_matching_blacklist([rec[1] for rec in recommendations])
+            self.stdout.write(f"{nvalues} values added to the matching blacklist")
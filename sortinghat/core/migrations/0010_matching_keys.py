@@ -0,0 +1,55 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+MATCHING_CRITERIA = ['email', 'name', 'username']
+BATCH_SIZE = 10000
+
+
+def fill_matching_keys(apps, schema_editor):
+    """Create the matching keys of the identities stored in the registry."""
+
+    Identity = apps.get_model('core', 'Identity')
+    MatchingKey = apps.get_model('core', 'MatchingKey')
+
+    keys = []
+    identities = Identity.objects.values_list('uuid', *MATCHING_CRITERIA)
+
+    for uuid, *values in identities.iterator():
+        for criterion, value in zip(MATCHING_CRITERIA, values):
+            if value is None:
+                continue
+            keys.append(MatchingKey(criterion=criterion, value=value,
+                                    identity_id=uuid))
+        if len(keys) >= BATCH_SIZE:
+            MatchingKey.objects.bulk_create(keys)
+            keys = []
+
+    MatchingKey.objects.bulk_create(keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_replace_django_mysql'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchingKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criterion', models.CharField(max_length=32)),
+                ('value', models.CharField(max_length=128)),
+                ('identity', models.ForeignKey(db_column='uuid', on_delete=django.db.models.deletion.CASCADE, related_name='matching_keys', to='core.identity')),
+            ],
+            options={
+                'db_table': 'matching_keys',
+                'unique_together': {('criterion', 'value', 'identity')},
+            },
+        ),
+        migrations.RunPython(fill_matching_keys,
+                             reverse_code=migrations.RunPython.noop),
+    ]
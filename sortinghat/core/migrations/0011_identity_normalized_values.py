@@ -0,0 +1,59 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+from sortinghat.core.utils import (normalize_identity_name,
+                                   normalize_identity_username,
+                                   canonicalize_email)
+
+
+BATCH_SIZE = 10000
+
+
+def fill_normalized_values(apps, schema_editor):
+    """Store the normalized values of the identities of the registry."""
+
+    Identity = apps.get_model('core', 'Identity')
+
+    batch = []
+    fields = ['normalized_name', 'canonical_email', 'normalized_username']
+    identities = Identity.objects.only('uuid', 'name', 'email', 'username')
+
+    for identity in identities.iterator():
+        identity.normalized_name = normalize_identity_name(identity.name)
+        identity.canonical_email = canonicalize_email(identity.email)
+        identity.normalized_username = normalize_identity_username(identity.username)
+        batch.append(identity)
+
+        if len(batch) >= BATCH_SIZE:
+            Identity.objects.bulk_update(batch, fields)
+            batch = []
+
+    Identity.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_matching_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='identity',
+            name='canonical_email',
+            field=models.CharField(db_index=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='identity',
+            name='normalized_name',
+            field=models.CharField(db_index=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='identity',
+            name='normalized_username',
+            field=models.CharField(db_index=True, max_length=128, null=True),
+        ),
+        migrations.RunPython(fill_normalized_values,
+                             reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_identity_normalized_values'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='operation',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_operation_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AffiliationRecommendation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('individual', models.ForeignKey(db_column='mk', on_delete=django.db.models.deletion.CASCADE, related_name='affiliation_recommendations', to='core.individual')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='affiliation_recommendations', to='core.organization')),
+            ],
+            options={
+                'db_table': 'affiliation_recommendations',
+                'unique_together': {('individual', 'organization')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_affiliation_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='operation',
+            index=models.Index(fields=['entity_type', 'timestamp'], name='operations_entity__b73cda_idx'),
+        ),
+    ]
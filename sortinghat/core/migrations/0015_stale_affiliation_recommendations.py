@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_operation_entity_type_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleAffiliationRecommendation',
+            fields=[
+                ('individual', models.OneToOneField(db_column='mk', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stale_affiliation_recommendation', serialize=False, to='core.individual')),
+            ],
+            options={
+                'db_table': 'stale_affiliation_recommendations',
+            },
+        ),
+    ]
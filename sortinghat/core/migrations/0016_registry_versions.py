@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_stale_affiliation_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistryVersion',
+            fields=[
+                ('name', models.CharField(max_length=128, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'registry_versions',
+            },
+        ),
+    ]
@@ -31,8 +31,10 @@ from django.db.models import (CASCADE,
                               CharField,
                               DateTimeField,
                               PositiveIntegerField,
+                              PositiveBigIntegerField,
                               ForeignKey,
-                              OneToOneField)
+                              OneToOneField,
+                              Index)
 
 from django.db.models import JSONField
 
@@ -121,17 +123,37 @@ class Operation(Model):
     target = CharField(max_length=MAX_SIZE_CHAR_FIELD)
     trx = ForeignKey(Transaction, related_name='operations',
                      on_delete=CASCADE, db_column='tuid')
-    timestamp = DateTimeField()
+    timestamp = DateTimeField(db_index=True)
     args = JSONField()
 
     class Meta:
         db_table = 'operations'
         ordering = ('timestamp', 'ouid', 'trx')
+        indexes = [
+            Index(fields=['entity_type', 'timestamp']),
+        ]
 
     def __str__(self):
         return '%s - %s - %s - %s - %s' % (self.ouid, self.trx, self.op_type, self.entity_type, self.target)
 
 
+class RegistryVersion(Model):
+    """Version counters of the registry.
+
+    Counters are increased once the transactions that change
+    the registry are committed, so they can be used to invalidate
+    data calculated from a version of the registry.
+    """
+    name = CharField(max_length=MAX_SIZE_CHAR_FIELD, primary_key=True)
+    version = PositiveBigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'registry_versions'
+
+    def __str__(self):
+        return '%s - %s' % (self.name, self.version)
+
+
 class Organization(EntityBase):
     name = CharField(max_length=MAX_SIZE_CHAR_INDEX)
 
@@ -190,6 +212,10 @@ class Identity(EntityBase):
     source = CharField(max_length=32)
     individual = ForeignKey(Individual, related_name='identities',
                             on_delete=CASCADE, db_column='mk')
+    # Normalized values to run indexed lookups
+    normalized_name = CharField(max_length=MAX_SIZE_CHAR_FIELD, null=True, db_index=True)
+    canonical_email = CharField(max_length=MAX_SIZE_CHAR_FIELD, null=True, db_index=True)
+    normalized_username = CharField(max_length=MAX_SIZE_CHAR_FIELD, null=True, db_index=True)
 
     class Meta:
         db_table = 'identities'
@@ -199,6 +225,66 @@ class Identity(EntityBase):
         return self.uuid
 
 
+class MatchingKey(Model):
+    """Index of identity values used to find matching identities.
+
+    Each entry links a value of an identity field (`criterion`)
+    to that identity. Keys are linked to identities and not to
+    individuals, so they are valid even when identities are moved
+    between individuals; they are removed with their identity.
+    """
+    criterion = CharField(max_length=32)
+    value = CharField(max_length=MAX_SIZE_CHAR_FIELD)
+    identity = ForeignKey(Identity, related_name='matching_keys',
+                          on_delete=CASCADE, db_column='uuid')
+
+    class Meta:
+        db_table = 'matching_keys'
+        unique_together = ('criterion', 'value', 'identity',)
+
+    def __str__(self):
+        return '%s - %s - %s' % (self.identity.uuid, self.criterion, self.value)
+
+
+class AffiliationRecommendation(Model):
+    """Affiliation recommendations of the individuals.
+
+    Each entry recommends enrolling an individual in an
+    organization. Entries are calculated and stored by a job
+    enqueued when the data they depend on changes (identities,
+    domains and enrollments), so the recommendations can be read
+    at any time without generating them again.
+    """
+    individual = ForeignKey(Individual, related_name='affiliation_recommendations',
+                            on_delete=CASCADE, db_column='mk')
+    organization = ForeignKey(Organization, related_name='affiliation_recommendations',
+                              on_delete=CASCADE)
+
+    class Meta:
+        db_table = 'affiliation_recommendations'
+        unique_together = ('individual', 'organization',)
+
+    def __str__(self):
+        return '%s - %s' % (self.individual.mk, self.organization.name)
+
+
+class StaleAffiliationRecommendation(Model):
+    """Individuals with outdated affiliation recommendations.
+
+    Entries are added when the update of the recommendations of
+    an individual cannot be scheduled, and they are removed once
+    its recommendations are calculated again.
+    """
+    individual = OneToOneField(Individual, related_name='stale_affiliation_recommendation',
+                               on_delete=CASCADE, db_column='mk', primary_key=True)
+
+    class Meta:
+        db_table = 'stale_affiliation_recommendations'
+
+    def __str__(self):
+        return '%s' % self.individual_id
+
+
 class Profile(EntityBase):
     individual = OneToOneField(Individual, related_name='profile',
                                on_delete=CASCADE, db_column='mk')
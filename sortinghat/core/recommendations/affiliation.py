@@ -19,18 +19,43 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
-import functools
+import itertools
 import logging
 import re
 
-from ..db import (find_individual_by_uuid,
-                  find_domain,
-                  search_enrollments_in_period)
-from ..errors import NotFoundError
+import django.db.transaction
+import django_rq
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+
+from ..db import DOMAINS_VERSION, find_registry_version
+from ..models import (AffiliationRecommendation,
+                      Domain,
+                      Enrollment,
+                      Identity,
+                      Individual,
+                      Organization,
+                      StaleAffiliationRecommendation,
+                      MIN_PERIOD_DATE)
+from .domains import DomainTrie
 
 
 EMAIL_ADDRESS_PATTERN = re.compile(r"^(?P<email>[^\s@]+@[^\s@.]+\.[^\s@]+)$")
 
+MAX_BATCH_SIZE = 1000
+
+# Job that updates the stored recommendations; it is referenced
+# by name because the jobs module depends on the API
+UPDATE_RECOMMENDATIONS_JOB = 'sortinghat.core.jobs.update_stored_affiliation_recommendations'
+
+# Individuals and domains pending to update are kept in these
+# sets until an update job drains them. The job key is set while
+# a job is enqueued, so writes do not enqueue more than one.
+PENDING_MKS_KEY = 'sortinghat:affiliation_recommendations:mks'
+PENDING_DOMAINS_KEY = 'sortinghat:affiliation_recommendations:domains'
+PENDING_JOB_KEY = 'sortinghat:affiliation_recommendations:job'
+PENDING_JOB_TTL = 3600
+
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +83,18 @@ def recommend_affiliations(uuids):
     The function will not return the organizations in which
     the individual is already enrolled.
 
+    Individuals are processed in batches of `MAX_BATCH_SIZE`.
+    The individuals, their email addresses and their enrollments
+    are read with a fixed number of queries per batch and the
+    recommendations are calculated in memory.
+
+    Domains are looked up on a trie kept in memory. It is loaded
+    when the function is called for the first time, and loaded
+    again when any domain is added or deleted, or when the version
+    of the domains changed since it was loaded. That version is
+    increased once a transaction that logged operations on domains
+    or organizations is committed, even by another process.
+
     :param uuids: list of individual keys
 
     :returns: a generator of recommendations
@@ -67,84 +104,400 @@ def recommend_affiliations(uuids):
         f"uuids={uuids}; ..."
     )
 
-    for uuid in uuids:
-        try:
-            individual = find_individual_by_uuid(uuid)
-        except NotFoundError:
-            continue
-        else:
-            yield (uuid, _suggest_affiliations(individual))
+    domains = _get_domains_trie()
+
+    iterator = iter(uuids)
+
+    while True:
+        batch = list(itertools.islice(iterator, MAX_BATCH_SIZE))
+        if not batch:
+            break
+        yield from _recommend_batch(batch, domains)
 
     logger.info(f"Affiliation recommendations generated; uuids='{uuids}'")
 
 
-def _suggest_affiliations(individual):
-    """Generate a list of organizations where the individual is not affiliated."""
+def schedule_affiliation_recommendations(mks=None, domain_names=None):
+    """Schedule an update of the stored affiliation recommendations.
+
+    The recommendations of the individuals identified by `mks`,
+    and of the individuals with an email address in any of
+    `domain_names` or in their sub-domains, are updated by a job.
+    This function must be called every time the data the
+    recommendations depend on changes: email addresses of the
+    identities, domains of the organizations and enrollments.
+
+    The individuals and domains of a transaction are collected and
+    scheduled once it is committed, so the recommendations are not
+    calculated while the data is written and the job always reads
+    the committed data. Nothing is scheduled when the transaction
+    is rolled back. Scheduled individuals and domains are added to
+    a set drained by a single pending job, so many writes in a row
+    do not enqueue one job each.
+
+    Writes do not fail when the update cannot be scheduled, like
+    when Redis is not available. The individuals are marked as
+    stale instead; the next update job or a rebuild of the
+    recommendations will calculate them again.
+
+    :param mks: main keys of the individuals to update
+    :param domain_names: names of the domains that changed
+    """
+    mks = set(mks or [])
+    domain_names = set(domain_names or [])
+
+    if not mks and not domain_names:
+        return
+
+    connection = django.db.transaction.get_connection()
+
+    if not connection.in_atomic_block:
+        _schedule_updates(mks, domain_names)
+        return
+
+    updates = getattr(connection, '_affiliation_updates', None)
+
+    # The hook is gone when its transaction was rolled back
+    if not updates or not any(hook[1] is updates for hook in connection.run_on_commit):
+        updates = _PendingUpdates(connection)
+        connection._affiliation_updates = updates
+        django.db.transaction.on_commit(updates)
+
+    updates.mks.update(mks)
+    updates.domain_names.update(domain_names)
+
+
+def pop_pending_affiliation_recommendations():
+    """Get the individuals and domains pending to update.
+
+    Individuals and domains scheduled for an update, and the
+    individuals marked as stale, are removed from the pending
+    lists and returned, so the next update job is enqueued when
+    anything else is scheduled.
+
+    :returns: a tuple with the set of main keys and the set
+        of domain names to update
+    """
+    connection = django_rq.get_connection()
+
+    with connection.pipeline() as pipe:
+        pipe.delete(PENDING_JOB_KEY)
+        pipe.smembers(PENDING_MKS_KEY)
+        pipe.smembers(PENDING_DOMAINS_KEY)
+        pipe.delete(PENDING_MKS_KEY, PENDING_DOMAINS_KEY)
+        _, mks, domain_names, _ = pipe.execute()
+
+    mks = {mk.decode('utf-8') for mk in mks}
+    domain_names = {domain_name.decode('utf-8') for domain_name in domain_names}
+
+    stale = StaleAffiliationRecommendation.objects.all()
+    mks.update(stale.values_list('individual', flat=True))
+    stale.filter(individual__in=mks).delete()
+
+    return mks, domain_names
+
+
+def mark_stale_affiliation_recommendations(mks=None, domain_names=None):
+    """Mark the recommendations of a set of individuals as stale.
+
+    Individuals with an email address in any of `domain_names`,
+    or in their sub-domains, are also marked.
+
+    :param mks: main keys of the individuals
+    :param domain_names: names of the domains that changed
+    """
+    mks = set(mks or [])
+
+    for domain_name in domain_names or []:
+        mks.update(_find_domain_main_keys(domain_name))
+
+    stale = [StaleAffiliationRecommendation(individual_id=mk) for mk in mks]
+    StaleAffiliationRecommendation.objects.bulk_create(stale, ignore_conflicts=True)
+
+
+def update_affiliation_recommendations(mks):
+    """Update the stored affiliation recommendations of a set of individuals.
+
+    The recommendations of each individual are calculated again
+    and they replace the ones stored on the registry.
+
+    Individuals are processed in batches of `MAX_BATCH_SIZE`.
+    Main keys not found in the registry are ignored.
+
+    :param mks: main keys of the individuals to update
+
+    :returns: number of recommendations stored
+    """
+    mks = sorted(set(mks))
+    domains = _get_domains_trie()
+    nrecs = 0
+
+    for i in range(0, len(mks), MAX_BATCH_SIZE):
+        batch = mks[i:i + MAX_BATCH_SIZE]
+        affiliations = _calculate_affiliations(batch, domains)
+
+        AffiliationRecommendation.objects.filter(individual__in=batch).delete()
+
+        org_names = set(itertools.chain.from_iterable(affiliations.values()))
+        orgs = Organization.objects.filter(name__in=org_names)
+        org_ids = dict(orgs.values_list('name', 'id'))
+
+        recs = [
+            AffiliationRecommendation(individual_id=mk, organization_id=org_ids[org_name])
+            for mk, org_names in affiliations.items()
+            for org_name in org_names
+        ]
+        # Jobs updating the same individuals might run at the same time
+        AffiliationRecommendation.objects.bulk_create(recs, ignore_conflicts=True)
+        nrecs += len(recs)
+
+    return nrecs
+
+
+def update_domain_affiliation_recommendations(domain_name):
+    """Update the affiliation recommendations linked to a domain.
+
+    The recommendations of the individuals with an email address
+    in the domain, or in any of its sub-domains, are calculated
+    again.
+
+    :param domain_name: name of the domain
+
+    :returns: number of recommendations stored
+    """
+    mks = _find_domain_main_keys(domain_name)
+
+    return update_affiliation_recommendations(mks)
+
+
+@django.db.transaction.atomic
+def rebuild_affiliation_recommendations():
+    """Calculate and store the affiliation recommendations from scratch.
 
-    orgs = set()
-    domains = _retrieve_individual_email_domains(individual)
+    Removes every affiliation recommendation stored in the
+    registry and calculates them again for all the individuals.
 
-    for domain in domains:
-        org_name = domain.organization.name
+    :returns: number of recommendations stored
+    """
+    logger.info("Rebuilding affiliation recommendations ...")
+
+    AffiliationRecommendation.objects.all().delete()
+    StaleAffiliationRecommendation.objects.all().delete()
+
+    mks = Identity.objects.filter(email__isnull=False).values_list('individual', flat=True)
+    nrecs = update_affiliation_recommendations(mks.iterator())
+
+    logger.info(f"Affiliation recommendations rebuilt; {nrecs} recommendations stored")
+
+    return nrecs
+
+
+class _PendingUpdates:
+    """Updates of the recommendations collected in a transaction.
+
+    Instances are registered as the commit hook of the transaction.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.mks = set()
+        self.domain_names = set()
+
+    def __call__(self):
+        if getattr(self.connection, '_affiliation_updates', None) is self:
+            del self.connection._affiliation_updates
+
+        _schedule_updates(self.mks, self.domain_names)
+
+
+def _schedule_updates(mks, domain_names):
+    """Add individuals and domains to the pending sets and enqueue a job."""
+
+    enqueue = False
+
+    try:
+        connection = django_rq.get_connection()
 
-        if _is_enrolled(individual, org_name):
+        with connection.pipeline() as pipe:
+            if mks:
+                pipe.sadd(PENDING_MKS_KEY, *mks)
+            if domain_names:
+                pipe.sadd(PENDING_DOMAINS_KEY, *domain_names)
+            pipe.set(PENDING_JOB_KEY, 1, nx=True, ex=PENDING_JOB_TTL)
+            enqueue = pipe.execute()[-1]
+
+        if enqueue:
+            django_rq.enqueue(UPDATE_RECOMMENDATIONS_JOB)
+    except Exception as exc:
+        logger.error(
+            f"Unable to schedule the update of affiliation recommendations; "
+            f"{len(mks)} individuals and {len(domain_names)} domains marked as stale; "
+            f"error: {exc}"
+        )
+        mark_stale_affiliation_recommendations(mks, domain_names)
+
+        # Let the next write enqueue the job
+        if enqueue:
+            try:
+                connection.delete(PENDING_JOB_KEY)
+            except Exception:
+                pass
+
+
+def _find_domain_main_keys(domain_name):
+    """Find the individuals with an email address in a domain or its sub-domains."""
+
+    identities = Identity.objects.filter(Q(email__iendswith='@' + domain_name) |
+                                         Q(email__iendswith='.' + domain_name))
+    return list(identities.values_list('individual', flat=True).distinct())
+
+
+def _recommend_batch(uuids, domains):
+    """Generate the recommendations for a batch of individuals."""
+
+    mks = _find_main_keys(uuids)
+    affiliations = _calculate_affiliations(set(mks.values()), domains)
+
+    for uuid in uuids:
+        mk = mks.get(uuid, None)
+        if mk is None:
             continue
 
-        orgs.add(org_name)
+        yield (uuid, sorted(affiliations.get(mk, [])))
+
+
+def _calculate_affiliations(mks, domains):
+    """Calculate the organizations recommended to a set of individuals.
+
+    Individuals without recommendations are not included
+    in the result.
+
+    :returns: a dictionary with the set of organization names
+        of each main key
+    """
+    emails = {}
+    identities = Identity.objects.filter(individual__in=mks,
+                                         email__isnull=False)
+    for mk, email in identities.values_list('individual', 'email'):
+        emails.setdefault(mk, []).append(email)
+
+    enrolled = _find_enrolled_organizations(mks)
+
+    affiliations = {}
+
+    for mk, addresses in emails.items():
+        org_names = _retrieve_email_organizations(addresses, domains)
+        org_names -= enrolled.get(mk, set())
+
+        if org_names:
+            affiliations[mk] = org_names
+
+    return affiliations
+
+
+def _find_main_keys(uuids):
+    """Find the main keys of the individuals of a list of identifiers.
 
-    return sorted(list(orgs))
+    Main keys take precedence over the UUIDs of the identities.
+    Identifiers not found in the registry are not included
+    in the result.
+    """
+    mks = {}
+
+    identities = Identity.objects.filter(uuid__in=uuids)
+    mks.update(identities.values_list('uuid', 'individual'))
+    individuals = Individual.objects.filter(mk__in=uuids)
+    mks.update((mk, mk) for mk in individuals.values_list('mk', flat=True))
+
+    return mks
+
+
+def _find_enrolled_organizations(mks):
+    """Find the organizations where each individual is enrolled.
+
+    Like `search_enrollments_in_period` with its default dates,
+    only enrollments which period includes `MIN_PERIOD_DATE` are
+    taken into account.
+    """
+    enrolled = {}
 
+    enrollments = Enrollment.objects.filter(individual__in=mks,
+                                            start__lte=MIN_PERIOD_DATE,
+                                            end__gte=MIN_PERIOD_DATE)
+    for mk, org_name in enrollments.values_list('individual', 'organization__name'):
+        enrolled.setdefault(mk, set()).add(org_name)
 
-def _retrieve_individual_email_domains(individual):
-    """Return a list of possible domains linked to an individual."""
+    return enrolled
 
-    domains = set()
 
-    for identity in individual.identities.all():
+def _retrieve_email_organizations(emails, domains):
+    """Return the organizations linked to the domains of a list of email addresses."""
+
+    org_names = set()
+    email_domains = set()
+
+    for email in emails:
         # Only check email address to find new affiliations
-        if not identity.email:
+        if not email:
             continue
-        if not EMAIL_ADDRESS_PATTERN.match(identity.email):
+        if not EMAIL_ADDRESS_PATTERN.match(email):
             continue
 
-        domain = identity.email.split('@')[-1]
+        domain = email.split('@')[-1]
 
-        if domain in domains:
+        if domain in email_domains:
             continue
+        email_domains.add(domain)
+
+        org_name = domains.find(domain)
+
+        if org_name:
+            org_names.add(org_name)
+
+    return org_names
+
+
+# Trie of domains loaded on this process and the
+# version of the domains when it was loaded
+_domains_state = {}
 
-        dom = _find_matching_domain(domain)
 
-        if dom:
-            domains.add(dom)
+def _get_domains_trie():
+    """Get the trie of domains, loading it when the domains changed."""
 
-    return domains
+    version = find_registry_version(DOMAINS_VERSION)
 
+    if 'trie' not in _domains_state or _domains_state['version'] != version:
+        _domains_state['trie'] = _load_domains_trie()
+        _domains_state['version'] = version
 
-def _is_enrolled(individual, org_name):
-    """Determine if an individual is enrolled to an organization."""
+    return _domains_state['trie']
 
-    result = search_enrollments_in_period(individual.mk,
-                                          org_name)
-    return len(result) > 0
 
+def _load_domains_trie():
+    """Load the domains of the registry and their organizations in a trie."""
 
-@functools.lru_cache()
-def _find_matching_domain(domain):
-    """Look for domains and sub-domains that match with the given one."""
+    trie = DomainTrie()
+
+    domains = Domain.objects.values_list('domain', 'is_top_domain', 'organization__name')
+    for domain, is_top_domain, org_name in domains.iterator():
+        trie.add(domain, org_name, is_top_domain=is_top_domain)
+
+    logger.debug(f"Domains trie loaded; {len(trie)} domains")
+
+    return trie
+
+
+def invalidate_domains_trie(**kwargs):
+    """Discard the trie of domains so it will be loaded on the next call.
+
+    Domains can be changed without logging an operation, so the
+    trie is also discarded every time a domain is saved or deleted
+    on this process.
+    """
+    _domains_state.clear()
 
-    keep_looking = True
 
-    # Splits the domain into root domains until
-    # is found in the database.
-    while keep_looking:
-        try:
-            result = find_domain(domain)
-            keep_looking = False
-        except NotFoundError:
-            index = domain.find('.')
-            if index > -1:
-                domain = domain[index + 1:]
-            else:
-                result = None
-                keep_looking = False
-    return result
+post_save.connect(invalidate_domains_trie, sender=Domain,
+                  dispatch_uid='invalidate_domains_trie_on_save')
+post_delete.connect(invalidate_domains_trie, sender=Domain,
+                    dispatch_uid='invalidate_domains_trie_on_delete')
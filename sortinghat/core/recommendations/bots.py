@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import itertools
+import logging
+import re
+
+from django.db.models import Count
+
+from ..models import Identity
+from .affiliation import _find_main_keys
+from .matching import _stream_identities
+
+
+MAX_BATCH_SIZE = 1000
+DEFAULT_BOT_SCORE = 0.5
+
+# Names of well-known automation services and accounts
+BOT_SERVICES = (
+    r"jenkins|travis(-?ci)?|circleci|buildbot|zuul|gitlab-ci|github-actions|"
+    r"dependabot(-preview)?|renovate|greenkeeper(io)?|snyk-bot|codecov|mergify|"
+    r"weblate|transifex|allcontributors|pre-commit-ci|imgbot|semantic-release-bot"
+)
+
+BOT_PATTERNS = {
+    'name': [
+        r"\[bot\]",
+        r"^(" + BOT_SERVICES + r")$",
+        r"^bot[-_. ]",
+        r"[-_. ]bot$",
+        r"[-_. ]ci$",
+        r"\bautomation\b",
+        r"\bno-?reply\b"
+    ],
+    'email': [
+        r"\[bot\]@",
+        r"^(no-?reply|do-?not-?reply|bot|ci|build|automation)@",
+        r"^(" + BOT_SERVICES + r")@",
+        r"[-_.+]bot@",
+        r"[-_.+]ci@"
+    ],
+    'username': [
+        r"\[bot\]",
+        r"^(" + BOT_SERVICES + r")$",
+        r"^bot[-_.]",
+        r"[-_.]bot$",
+        r"[-_.]ci$",
+        r"^(no-?reply|automation)$"
+    ]
+}
+
+
+def _compile_patterns(patterns):
+    """Join the patterns of each field in a single regular expression"""
+
+    return {
+        field: re.compile('|'.join(f"(?:{pattern})" for pattern in field_patterns),
+                          re.IGNORECASE)
+        for field, field_patterns in patterns.items()
+    }
+
+
+BOT_REGEXES = _compile_patterns(BOT_PATTERNS)
+BOT_FIELDS = list(BOT_REGEXES.keys())
+
+
+logger = logging.getLogger(__name__)
+
+
+def recommend_bots(uuids=None, min_score=DEFAULT_BOT_SCORE):
+    """Recommend individuals that might be bots.
+
+    Returns a generator of bot recommendations based on the
+    names, email addresses and usernames of the identities of
+    the individuals, which are checked against the patterns
+    of `BOT_PATTERNS`, like `[bot]`, `noreply` or `jenkins`.
+
+    Each identity gets a score that is the fraction of its
+    non-empty fields that match any pattern. The score of an
+    individual is the mean of the scores of its identities.
+    Each recommendation contains the main key of an individual
+    and its score, and it is only generated when the score is
+    equal or greater than `min_score`. Individuals already
+    marked as bots are not recommended.
+
+    Patterns are compiled into a single regular expression by
+    field, which is applied to the rows of the identities table
+    as they are read. When `uuids` is `None`, the whole table
+    is read in chunks; otherwise, individuals are read in batches
+    of `MAX_BATCH_SIZE`. Only the scores of the individuals that
+    matched any pattern are kept in memory.
+
+    :param uuids: list of individual keys; `None` to check all
+        the individuals of the registry
+    :param min_score: minimum score to recommend an individual
+
+    :returns: a generator of recommendations
+    """
+    logger.debug(
+        f"Generating bot recommendations; "
+        f"uuids={uuids} min_score={min_score}; ..."
+    )
+
+    identities = Identity.objects.exclude(individual__profile__is_bot=True)
+
+    if uuids is None:
+        rows = _stream_identities(identities, ['individual'] + BOT_FIELDS)
+        yield from _recommend_from_rows(rows, min_score)
+    else:
+        iterator = iter(uuids)
+
+        while True:
+            batch = list(itertools.islice(iterator, MAX_BATCH_SIZE))
+            if not batch:
+                break
+
+            mks = set(_find_main_keys(batch).values())
+            rows = identities.filter(individual__in=mks)\
+                .values_list('individual', *BOT_FIELDS)
+            yield from _recommend_from_rows(rows, min_score)
+
+    logger.info(f"Bot recommendations generated; uuids='{uuids}'")
+
+
+def _recommend_from_rows(rows, min_score):
+    """Generate the recommendations from the identities data.
+
+    Rows are tuples with the main key of the individual followed
+    by the values of `BOT_FIELDS`. Recommendations are sorted by
+    main key.
+    """
+    scores = _score_identities(rows)
+
+    mks = sorted(scores.keys())
+
+    for i in range(0, len(mks), MAX_BATCH_SIZE):
+        batch = mks[i:i + MAX_BATCH_SIZE]
+        counts = Identity.objects.filter(individual__in=batch)\
+            .values_list('individual')\
+            .annotate(total=Count('uuid'))
+        counts = dict(counts)
+
+        for mk in batch:
+            score = round(scores[mk] / counts[mk], 2)
+            if score >= min_score:
+                yield (mk, score)
+
+
+def _score_identities(rows):
+    """Add up the scores of the identities of each individual.
+
+    Individuals without any identity matching the patterns
+    are not included in the result.
+
+    :returns: a dictionary with the sum of the scores of the
+        identities of each main key
+    """
+    regexes = [BOT_REGEXES[field] for field in BOT_FIELDS]
+    scores = {}
+
+    for mk, *values in rows:
+        nvalues = 0
+        nmatches = 0
+
+        for regex, value in zip(regexes, values):
+            if not value:
+                continue
+            nvalues += 1
+            if regex.search(value):
+                nmatches += 1
+
+        if nmatches:
+            scores[mk] = scores.get(mk, 0) + nmatches / nvalues
+
+    return scores
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+class DisjointSet:
+    """Disjoint-set (union-find) data structure.
+
+    This class keeps track of a set of elements partitioned
+    into disjoint groups. Elements are added to the structure
+    with `add` and two groups are joined with `union`. Groups
+    are transitive: when `A` is joined with `B`, and `B` with
+    `C`, the three elements will be part of the same group.
+
+    The implementation uses path compression and union by rank,
+    so any sequence of operations runs in near-linear time.
+
+    Elements can be any hashable object.
+    """
+    def __init__(self, elements=None):
+        self._parent = {}
+        self._rank = {}
+
+        for element in elements or []:
+            self.add(element)
+
+    def __contains__(self, element):
+        return element in self._parent
+
+    def __len__(self):
+        return len(self._parent)
+
+    def add(self, element):
+        """Add an element as a new group of one element.
+
+        When the element was already added, nothing is done.
+
+        :param element: element to add
+        """
+        if element not in self._parent:
+            self._parent[element] = element
+            self._rank[element] = 0
+
+    def find(self, element):
+        """Find the representative of the group of an element.
+
+        :param element: element to look for
+
+        :returns: the representative element of the group
+
+        :raises KeyError: when the element was not added
+        """
+        root = element
+
+        while self._parent[root] != root:
+            root = self._parent[root]
+
+        # Compress the path, so next searches will be faster
+        while self._parent[element] != root:
+            self._parent[element], element = root, self._parent[element]
+
+        return root
+
+    def union(self, x, y):
+        """Join the groups of two elements.
+
+        Elements not added yet will be added before joining
+        their groups.
+
+        :param x: element of the first group
+        :param y: element of the second group
+
+        :returns: the representative element of the joined group
+        """
+        self.add(x)
+        self.add(y)
+
+        root_x = self.find(x)
+        root_y = self.find(y)
+
+        if root_x == root_y:
+            return root_x
+
+        if self._rank[root_x] < self._rank[root_y]:
+            root_x, root_y = root_y, root_x
+
+        self._parent[root_y] = root_x
+
+        if self._rank[root_x] == self._rank[root_y]:
+            self._rank[root_x] += 1
+
+        return root_x
+
+    def groups(self):
+        """Return the groups of elements.
+
+        Groups are returned in the same order their first element
+        was added. Elements of each group keep the order in which
+        they were added too.
+
+        :returns: a list of groups, where each group is a list
+            of elements
+        """
+        groups = {}
+
+        for element in self._parent:
+            groups.setdefault(self.find(element), []).append(element)
+
+        return list(groups.values())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Key of the nodes where the data of a domain is stored;
+# labels are strings so it can never clash with them.
+_ENTRY = None
+
+
+class DomainTrie:
+    """Trie to find the domain that matches a domain name.
+
+    Domains are stored by their labels in reverse order, so
+    `u.example.com` is stored under the path `com`, `example`
+    and `u`. Each domain is linked to a value, like the name
+    of its organization.
+
+    Searching for a domain name walks the path of its labels
+    and returns the value of the deepest domain that matches.
+    A domain matches when it is equal to the name or when it
+    is a top domain and the name is one of its sub-domains.
+    For example, `it.u.example.com` will match `u.example.com`
+    only when it is a top domain.
+
+    Names are compared ignoring their case, so searches take
+    as many steps as labels has the name, no matter the number
+    of domains stored.
+    """
+    def __init__(self):
+        self._root = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, domain, value, is_top_domain=False):
+        """Add a domain to the trie.
+
+        When the domain was already added, its value is replaced.
+
+        :param domain: name of the domain
+        :param value: value linked to the domain
+        :param is_top_domain: whether the domain matches its sub-domains
+        """
+        node = self._root
+
+        for label in reversed(domain.lower().split('.')):
+            node = node.setdefault(label, {})
+
+        if _ENTRY not in node:
+            self._size += 1
+
+        node[_ENTRY] = (value, is_top_domain)
+
+    def find(self, domain):
+        """Find the value of the domain that matches a domain name.
+
+        :param domain: name of the domain to look for
+
+        :returns: the value linked to the matching domain or `None`
+            when no domain matches
+        """
+        labels = domain.lower().split('.')
+        node = self._root
+        result = None
+
+        for depth, label in enumerate(reversed(labels), start=1):
+            node = node.get(label)
+            if node is None:
+                break
+
+            entry = node.get(_ENTRY)
+            if entry and (entry[1] or depth == len(labels)):
+                result = entry[0]
+
+        return result
@@ -20,10 +20,31 @@
 #
 
 import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
 
+import django.db
+from django.conf import settings
+from django.core.cache import caches
+
+from ..db import find_registry_version
 from ..errors import RecommendationEngineError
 from .affiliation import recommend_affiliations
+from .bots import recommend_bots
 from .matching import recommend_matches
+from .organizations import recommend_organizations
+
+
+RECOMMENDATIONS_CACHE = 'recommendations'
+MAX_CACHED_OPTIONS = 100000
+DEFAULT_CHUNK_SIZE = 500
+
+
+logger = logging.getLogger(__name__)
 
 
 Recommendation = collections.namedtuple(
@@ -38,11 +59,56 @@ class RecommendationEngine:
     This class implements a basic recommendation system that
     generates a set of suggestions regarding the data stored
     on the registry.
+
+    When the cache `recommendations` is configured on the
+    settings, recommendations are stored on it. They are
+    returned from the cache when the same type of recommendation
+    is requested using the same arguments and the registry
+    was not modified in the meantime. To know whether the
+    registry changed, the version of the registry is part of
+    the cache key. The version is increased once a transaction
+    that logged operations is committed. Thus, changes made
+    without logging operations are not detected; call
+    `clear_cache` after them.
+
+    Eviction of old entries depends on the cache backend.
+    A recommendation is not cached when the total number of
+    options generated is greater than `MAX_CACHED_OPTIONS`;
+    single values, like scores, count as one option.
+
+    Recommendations can also be generated by a pool of `workers`
+    processes. The keys given as the first argument are split in
+    chunks of `chunk_size` keys and each chunk is sent to one of
+    the processes. Recommendations are returned in the same order
+    the keys were given, no matter which process ends first. Only
+    the types listed in `PARALLEL_TYPES` are run this way, because
+    the recommendations for a key must not depend on the rest of
+    the keys. Each process opens its own database connection, so
+    they cannot read data not committed yet; when the engine runs
+    inside a transaction, recommendations are generated by the
+    current process.
+
+    :param workers: number of processes that generate recommendations
+    :param chunk_size: number of keys sent to a process at once
     """
     RECOMMENDATION_TYPES = {
         'affiliation': recommend_affiliations,
-        'matches': recommend_matches
+        'bots': recommend_bots,
+        'matches': recommend_matches,
+        'organizations': recommend_organizations
     }
+    PARALLEL_TYPES = ['affiliation']
+
+    def __init__(self, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+        if workers < 1:
+            msg = "'workers' must be greater than 0; {} given".format(workers)
+            raise ValueError(msg)
+        if chunk_size < 1:
+            msg = "'chunk_size' must be greater than 0; {} given".format(chunk_size)
+            raise ValueError(msg)
+
+        self.workers = workers
+        self.chunk_size = chunk_size
 
     def recommend(self, name, *args, **kwargs):
         """Generate a list of recommendations.
@@ -74,10 +140,27 @@ class RecommendationEngine:
             msg = "Unknown '{}' recommendation type".format(name)
             raise RecommendationEngineError(msg=msg)
 
-        return self._generate_recommendations(name,
-                                              recommender,
-                                              *args,
-                                              **kwargs)
+        if self.workers > 1 and name in self.PARALLEL_TYPES:
+            recs = self._generate_parallel_recommendations(name,
+                                                           recommender,
+                                                           *args,
+                                                           **kwargs)
+        else:
+            recs = self._generate_recommendations(name,
+                                                  recommender,
+                                                  *args,
+                                                  **kwargs)
+
+        cache = self._get_cache()
+
+        if cache is None:
+            return recs
+        else:
+            return self._generate_cached_recommendations(cache,
+                                                         name,
+                                                         recs,
+                                                         *args,
+                                                         **kwargs)
 
     @staticmethod
     def _generate_recommendations(name, recommender, *args, **kwargs):
@@ -86,8 +169,143 @@ class RecommendationEngine:
         for rec in recommender(*args, **kwargs):
             yield Recommendation(rec[0], name, rec[1])
 
+    def _generate_parallel_recommendations(self, name, recommender, keys, *args, **kwargs):
+        """Generator of recommendations that uses a pool of processes.
+
+        Keys are split in chunks that are run by the processes
+        of the pool. To keep the memory bounded, the number of
+        chunks submitted and not consumed yet is limited to twice
+        the number of workers.
+        """
+        if django.db.connection.in_atomic_block:
+            logger.debug(f"Recommendations '{name}' generated sequentially; "
+                         "running inside a transaction")
+            yield from self._generate_recommendations(name, recommender,
+                                                      keys, *args, **kwargs)
+            return
+
+        # Forked processes must not share the connections
+        # opened by the parent; they will open their own.
+        django.db.connections.close_all()
+
+        mp_context = multiprocessing.get_context('fork')
+        max_pending = 2 * self.workers
+        pending = collections.deque()
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                    mp_context=mp_context,
+                                                    initializer=_init_recommender_worker) as executor:
+            for chunk in _iter_chunks(keys, self.chunk_size):
+                future = executor.submit(_run_recommender, recommender, chunk, args, kwargs)
+                pending.append(future)
+
+                if len(pending) >= max_pending:
+                    for rec_key, options in pending.popleft().result():
+                        yield Recommendation(rec_key, name, options)
+
+            while pending:
+                for rec_key, options in pending.popleft().result():
+                    yield Recommendation(rec_key, name, options)
+
+    @classmethod
+    def _generate_cached_recommendations(cls, cache, name, recommendations, *args, **kwargs):
+        """Generator of recommendations that uses a cache.
+
+        Recommendations are only stored once all of them were
+        generated, so partial results are never cached.
+        """
+        key = cls._cache_key(name, *args, **kwargs)
+        cached = cache.get(key)
+
+        if cached is not None:
+            logger.debug(f"Recommendations '{name}' found in cache; key={key}")
+            for rec_key, options in cached:
+                yield Recommendation(rec_key, name, options)
+            return
+
+        recs = []
+        noptions = 0
+
+        for rec in recommendations:
+            if recs is not None:
+                noptions += _count_options(rec.options)
+                if noptions > MAX_CACHED_OPTIONS:
+                    recs = None
+                else:
+                    recs.append((rec.key, rec.options))
+            yield rec
+
+        if recs is not None:
+            cache.set(key, recs)
+
+    @staticmethod
+    def _cache_key(name, *args, **kwargs):
+        """Generate the cache key of a recommendation request"""
+
+        version = find_registry_version()
+        params = json.dumps([args, sorted(kwargs.items())], default=str)
+        digest = hashlib.sha1(params.encode('utf-8')).hexdigest()
+
+        return f"{name}:{version}:{digest}"
+
+    @staticmethod
+    def _get_cache():
+        """Return the cache of recommendations or `None` when it is not set"""
+
+        if RECOMMENDATIONS_CACHE not in settings.CACHES:
+            return None
+        return caches[RECOMMENDATIONS_CACHE]
+
+    @classmethod
+    def clear_cache(cls):
+        """Remove every recommendation stored in the cache."""
+
+        cache = cls._get_cache()
+        if cache is not None:
+            cache.clear()
+
     @classmethod
     def types(cls):
         """List of supported types of recommendations."""
 
         return [v for v in cls.RECOMMENDATION_TYPES.keys()]
+
+
+def _count_options(options):
+    """Count the options of a recommendation.
+
+    Some recommenders return a single value, like a score,
+    instead of a list of options; it counts as one option.
+    """
+    if isinstance(options, (list, tuple, set, dict)):
+        return len(options)
+    return 1
+
+
+def _iter_chunks(keys, size):
+    """Split an iterable of keys in lists of `size` keys"""
+
+    it = iter(keys)
+    chunk = list(itertools.islice(it, size))
+
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(it, size))
+
+
+def _init_recommender_worker():
+    """Initialize a process of the pool.
+
+    Connections inherited from the parent process are closed,
+    so the process will open its own when needed.
+    """
+    django.db.connections.close_all()
+
+
+def _run_recommender(recommender, keys, args, kwargs):
+    """Run a recommender over a chunk of keys.
+
+    Generators cannot be sent between processes, so
+    recommendations are returned as a list of tuples.
+    """
+    return [(rec[0], rec[1]) for rec in recommender(keys, *args, **kwargs)]
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import random
+import re
+import zlib
+
+import numpy
+
+from ..utils import unaccent_string
+
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.6
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 64
+
+# Parameters of the hash functions used to simulate the
+# permutations; they are fixed so signatures are the same
+# on every process.
+_MERSENNE_PRIME = (1 << 31) - 1
+_rnd = random.Random(0)
+_PERM_A = numpy.array([_rnd.randrange(1, _MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)],
+                      dtype=numpy.uint64)
+_PERM_B = numpy.array([_rnd.randrange(0, _MERSENNE_PRIME) for _ in range(NUM_PERMUTATIONS)],
+                      dtype=numpy.uint64)
+_BAND_WEIGHTS = numpy.array([_rnd.randrange(1, 1 << 63) for _ in range(NUM_PERMUTATIONS)],
+                            dtype=numpy.uint64)
+
+_NAME_TOKEN_REGEX = re.compile(r"\w+")
+
+
+class FuzzyNameIndex:
+    """Index to find similar names using MinHash and LSH.
+
+    Names are normalized removing accents, case and punctuation,
+    and sorting their words. The similarity between two names is
+    the Jaccard index of the sets of character n-grams (shingles)
+    of their normalized forms.
+
+    To avoid comparing every pair of names, each name gets a
+    MinHash signature which is split into bands. Names that share
+    any band are candidates (locality-sensitive hashing) and only
+    these candidates are compared. The number of bands is chosen
+    from the threshold, so pairs of names above it are very likely
+    to share a band.
+
+    Each name added to the index is linked to a key. Searching a
+    name returns the keys of the names which similarity is equal
+    or greater than `threshold`.
+
+    :param threshold: minimum similarity between two names to
+        consider they match; in the range (0, 1]
+
+    :raises ValueError: when `threshold` is out of range
+    """
+    def __init__(self, threshold=DEFAULT_SIMILARITY_THRESHOLD):
+        if not isinstance(threshold, (int, float)) or not 0 < threshold <= 1:
+            msg = "'threshold' ({}) is not in range (0,1]".format(threshold)
+            raise ValueError(msg)
+
+        self.threshold = threshold
+        self.bands, self.rows = _lsh_parameters(threshold, NUM_PERMUTATIONS)
+        self._keys = {}
+        self._shingles = {}
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, name, key):
+        """Add a name to the index.
+
+        :param name: name to add
+        :param key: key linked to the name
+        """
+        norm = normalize_name(name)
+        shingles = _shingle(norm)
+
+        if not shingles:
+            return
+
+        if norm not in self._keys:
+            self._keys[norm] = set()
+            self._shingles[norm] = shingles
+            for bucket, band in zip(self._buckets, self._band_hashes(shingles)):
+                bucket.setdefault(band, []).append(norm)
+
+        self._keys[norm].add(key)
+
+    def search(self, name):
+        """Find the keys of the names similar to the given one.
+
+        :param name: name to look for
+
+        :returns: a set with the keys of the similar names
+        """
+        norm = normalize_name(name)
+        shingles = _shingle(norm)
+
+        if not shingles:
+            return set()
+
+        candidates = set()
+        for bucket, band in zip(self._buckets, self._band_hashes(shingles)):
+            candidates.update(bucket.get(band, []))
+
+        found = set()
+        for candidate in candidates:
+            if jaccard(shingles, self._shingles[candidate]) >= self.threshold:
+                found.update(self._keys[candidate])
+
+        return found
+
+    def _band_hashes(self, shingles):
+        """Calculate the hash of each band of the MinHash signature."""
+
+        signature = minhash(shingles)
+        bands = (signature * _BAND_WEIGHTS).reshape(self.bands, self.rows)
+        return bands.sum(axis=1).tolist()
+
+
+def normalize_name(name):
+    """Normalize a name to compare it with others.
+
+    Accents, case and punctuation are removed and the
+    words are sorted, so 'Smith, John' and 'john smith'
+    have the same normalized form.
+
+    :param name: name to normalize
+
+    :returns: the normalized name
+    """
+    tokens = _NAME_TOKEN_REGEX.findall(unaccent_string(name).lower())
+    return ' '.join(sorted(tokens))
+
+
+def jaccard(set_a, set_b):
+    """Calculate the Jaccard index of two sets."""
+
+    if not set_a and not set_b:
+        return 1.0
+
+    common = len(set_a & set_b)
+    return common / (len(set_a) + len(set_b) - common)
+
+
+def minhash(shingles):
+    """Calculate the MinHash signature of a set of shingles.
+
+    :param shingles: set of strings
+
+    :returns: a numpy array of `NUM_PERMUTATIONS` integers
+    """
+    hashes = numpy.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                            dtype=numpy.uint64, count=len(shingles))
+    hashes %= _MERSENNE_PRIME
+
+    permuted = (numpy.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+
+    return permuted.min(axis=1)
+
+
+def _shingle(norm):
+    """Split a normalized name into a set of character n-grams."""
+
+    if not norm:
+        return frozenset()
+
+    padded = ' ' + norm + ' '
+    size = min(SHINGLE_SIZE, len(padded))
+
+    return frozenset(padded[i:i + size] for i in range(len(padded) - size + 1))
+
+
+def _lsh_parameters(threshold, num_perm):
+    """Choose the number of bands and rows for a threshold.
+
+    Pairs with similarity `s` share a band with probability
+    `1 - (1 - s^rows)^bands`, which grows quickly around
+    `(1 / bands)^(1 / rows)`. The function takes the split
+    which estimated threshold is the closest below the given
+    one, favouring recall over the number of candidates.
+    """
+    splits = [(num_perm // rows, rows)
+              for rows in range(1, num_perm + 1)
+              if num_perm % rows == 0]
+
+    best = splits[0]
+    for bands, rows in splits:
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+
+    return best
@@ -21,26 +21,56 @@
 #
 
 
+import collections
+import concurrent.futures
 import logging
-import pandas
 
-from django.forms.models import model_to_dict
+from django.db.models import Count
 
 from ..db import (find_individual_by_uuid)
 from ..errors import NotFoundError
-from ..models import Identity
+from ..models import Identity, MatchingKey, MatchingBlacklist
+from .clustering import DisjointSet
+from .fuzzy import FuzzyNameIndex, DEFAULT_SIMILARITY_THRESHOLD
+
+
+MAX_LOOKUP_SIZE = 1000
+MAX_STREAM_CHUNK_SIZE = 10000
+MAX_PARTITION_SIZE = 10000
+DEFAULT_BLACKLIST_MIN_FREQUENCY = 100
+
+# Criteria which values are compared by similarity;
+# the identity field they are based on
+FUZZY_CRITERIA = {
+    'fuzzy_name': 'name'
+}
+# Criteria stored on the index of matching keys
+INDEXED_CRITERIA = ['email', 'name', 'username']
 
 
 logger = logging.getLogger(__name__)
 
 
-def recommend_matches(source_uuids, target_uuids, criteria, verbose=False):
+def recommend_matches(source_uuids, target_uuids, criteria, verbose=False,
+                      fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD, workers=1):
     """Recommend identity matches for a list of individuals.
 
     Returns a generator of identity matches recommendations
     based on a list of criteria composed by email addresses,
     name and/or usernames of the individuals.
 
+    Criteria can be simple, like `email`, or compound, like
+    `['name', 'source']`. A compound criterion is a list of
+    fields that must match at the same time on both identities,
+    so it only matches identities with the same name that were
+    obtained from the same source. Identities match when any of
+    the criteria matches.
+
+    Besides exact values, names can be compared by similarity
+    using the `fuzzy_name` criterion. Two names match when the
+    similarity of their normalized forms is equal or greater
+    than `fuzzy_threshold`.
+
     The function checks if any identity from each individual
     matches with a given set of target individuals. First,
     it filters by the fields from the criteria and then it
@@ -58,51 +88,111 @@ def recommend_matches(source_uuids, target_uuids, criteria, verbose=False):
 
     When there are no `target_uuids`, the recommendations will
     be returned for each `source_uuids` against all identities
-    on the registry.
+    on the registry. In this case, the candidates are obtained
+    looking up the values of the source identities on the
+    index of matching keys, instead of scanning the registry.
+    Fuzzy criteria cannot use this index, so the identities of
+    the registry are streamed when any of them is given.
+
+    Target identities are read in chunks of `MAX_STREAM_CHUNK_SIZE`
+    rows and they are never kept in memory, so the memory needed
+    depends on the number of source identities and matches found,
+    but not on the size of the registry.
+
+    When `workers` is greater than one, matches are found by
+    a pool of processes. See `_find_matches` for more info.
+
+    Values included in the matching blacklist are never used to
+    find matches. The blacklist is loaded once, when the function
+    starts, and values are compared ignoring their case.
 
     :param source_uuids: list of individual keys to find matches for
     :param target_uuids: list of individual keys where to find matches
-    :param criteria: list of matching criteria (`email`, `name`, `username`)
+    :param criteria: list of matching criteria (`email`, `name`, `username`,
+        `fuzzy_name`); compound criteria are given as lists of fields
+        (`email`, `name`, `username`, `source`)
     :param verbose: if set to `True`, the list of results will include individual
     identities. Otherwise, results will include main keys from individuals
+    :param fuzzy_threshold: minimum similarity for `fuzzy_name` matches;
+        in the range (0, 1]
+    :param workers: number of processes used to find matches
 
     :returns: a generator of recommendations
     """
+    fields, parsed_criteria = _parse_criteria(criteria)
 
     def _get_identities(uuid):
-        """Get the identities from a given Individual based on one of its uuids"""
+        """Get the identities data from a given Individual based on one of its uuids"""
 
         try:
             individual = find_individual_by_uuid(uuid)
         except NotFoundError:
             identities = []
         else:
-            identities = individual.identities.all()
+            identities = individual.identities.values_list(*fields)
 
         return identities
 
+    def _find_indexed_identities(identities):
+        """Find the identities data sharing any value with the given identities.
+
+        Compound criteria are looked up using the first of their
+        indexed fields. Candidates found this way might not match
+        the rest of the fields; they will be discarded later.
+        """
+        lookups = {}
+
+        for criterion, pos in parsed_criteria:
+            if isinstance(pos, tuple):
+                indexed = [field for field in criterion if field in INDEXED_CRITERIA]
+                lookup = indexed[0]
+                values = {identity[fields.index(lookup)] for identity in identities
+                          if _get_compound_value(identity, pos, blacklist)}
+            else:
+                lookup = criterion
+                values = {identity[pos] for identity in identities
+                          if _is_matchable(identity[pos], blacklist)}
+            lookups.setdefault(lookup, set()).update(values)
+
+        for criterion, values in lookups.items():
+            values = sorted(values)
+
+            for i in range(0, len(values), MAX_LOOKUP_SIZE):
+                keys = MatchingKey.objects.filter(criterion=criterion,
+                                                  value__in=values[i:i + MAX_LOOKUP_SIZE])
+                matching = Identity.objects.filter(uuid__in=keys.values('identity'))
+                yield from _stream_identities(matching, fields)
+
+    def _iter_target_identities(identities):
+        """Stream the identities data where to look for matches"""
+
+        if target_uuids:
+            for uuid in target_uuids:
+                yield from _get_identities(uuid)
+        elif any(criterion in FUZZY_CRITERIA for criterion, _ in parsed_criteria):
+            yield from _stream_identities(Identity.objects.all(), fields)
+        else:
+            yield from _find_indexed_identities(identities)
+
     logger.debug(
         f"Generating matching recommendations; "
         f"source={source_uuids} target={target_uuids} criteria='{criteria}'; ..."
     )
 
+    blacklist = _load_blacklist()
+
     aliases = {}
     input_set = set()
-    target_set = set()
     for uuid in source_uuids:
-        identities = _get_identities(uuid)
-        aliases[uuid] = [identity.uuid for identity in identities]
+        identities = list(_get_identities(uuid))
+        aliases[uuid] = [identity[0] for identity in identities]
         input_set.update(identities)
 
-    if target_uuids:
-        for uuid in target_uuids:
-            identities = _get_identities(uuid)
-            target_set.update(identities)
-    else:
-        identities = Identity.objects.all()
-        target_set.update(identities)
-
-    matched = _find_matches(input_set, target_set, criteria, verbose=verbose)
+    matched = _find_matches(input_set, _iter_target_identities(input_set),
+                            criteria, verbose=verbose,
+                            fuzzy_threshold=fuzzy_threshold,
+                            blacklist=blacklist,
+                            workers=workers)
     # Return filtered results
     for uuid in source_uuids:
         result = set()
@@ -112,111 +202,390 @@ def recommend_matches(source_uuids, target_uuids, criteria, verbose=False):
             for alias in aliases[uuid]:
                 if alias in matched.keys():
                     result = matched[alias]
-        # Remove input uuid from results if needed
-        try:
-            result.remove(uuid)
-        except KeyError:
-            pass
+        # Remove input uuid from results if needed; groups
+        # are shared among keys so they cannot be modified
+        result = result - {uuid}
         yield uuid, list(result)
 
     logger.info(f"Matching recommendations generated; criteria='{criteria}'")
 
 
-def _find_matches(set_x, set_y, criteria, verbose):
-    """Find identities matches between two sets using Pandas' library.
+def recommend_blacklist(criteria, min_frequency=DEFAULT_BLACKLIST_MIN_FREQUENCY):
+    """Recommend values to add to the matching blacklist.
+
+    Values shared by a large number of identities, like
+    `root@localhost` or `unknown`, do not identify anyone.
+    When they are used to find matches, they join many
+    unrelated individuals in huge groups.
+
+    The function looks for these values on the index of matching
+    keys. A value is recommended when the number of identities
+    that have it for a criterion is equal or greater than
+    `min_frequency`. Values already in the blacklist are not
+    recommended again.
+
+    Each recommendation is a tuple with the criterion, the value
+    and the number of identities that have it. They are sorted
+    by frequency, from the most to the least frequent.
+
+    :param criteria: list of criteria to analyze (`email`, `name`,
+        `username`)
+    :param min_frequency: minimum number of identities sharing a
+        value to recommend it
+
+    :returns: a generator of recommendations
+    """
+    logger.debug(
+        f"Generating blacklist recommendations; "
+        f"criteria='{criteria}' min_frequency={min_frequency}; ..."
+    )
+
+    blacklist = _load_blacklist()
+    recommendations = []
+
+    for criterion in criteria:
+        keys = MatchingKey.objects.filter(criterion=criterion)
+        frequencies = keys.values_list('value')\
+            .annotate(frequency=Count('identity'))\
+            .filter(frequency__gte=min_frequency)
+
+        for value, frequency in frequencies.iterator():
+            if _is_matchable(value, blacklist):
+                recommendations.append((criterion, value, frequency))
+
+    recommendations.sort(key=lambda rec: (-rec[2], rec[0], rec[1]))
+
+    yield from recommendations
+
+    logger.info(f"Blacklist recommendations generated; criteria='{criteria}'")
+
+
+def _load_blacklist():
+    """Load the values of the matching blacklist in lower case"""
+
+    entries = MatchingBlacklist.objects.values_list('excluded', flat=True)
+    return {entry.lower() for entry in entries}
+
+
+def _is_matchable(value, blacklist):
+    """Check whether a value can be used to find matches"""
+
+    if value is None:
+        return False
+    return not blacklist or value.lower() not in blacklist
+
+
+def _get_compound_value(row, positions, blacklist):
+    """Get the values of a compound criterion or `None` when any is not matchable"""
+
+    values = tuple(row[pos] for pos in positions)
+
+    for value in values:
+        if not _is_matchable(value, blacklist):
+            return None
+    return values
+
+
+def _parse_criteria(criteria):
+    """Get the identity fields needed to match a list of criteria.
+
+    Each criterion is returned with the position of its field
+    on the identities data. For compound criteria, the names
+    and positions of their fields are returned as tuples.
+    Compound criteria with only one field are considered simple
+    criteria.
+
+    :param criteria: list of simple or compound criteria
+
+    :returns: a tuple with the list of fields, starting by `uuid`
+        and `individual`, and the list of `(criterion, position)`
+        pairs
+    """
+    fields = ['uuid', 'individual']
+    parsed = []
+
+    for criterion in criteria:
+        members = (criterion,) if isinstance(criterion, str) else tuple(criterion)
+        positions = []
+
+        for member in members:
+            field = FUZZY_CRITERIA.get(member, member)
+            if field not in fields:
+                fields.append(field)
+            positions.append(fields.index(field))
+
+        if len(members) == 1:
+            parsed.append((members[0], positions[0]))
+        else:
+            parsed.append((members, tuple(positions)))
+
+    return fields, parsed
+
+
+def _stream_identities(queryset, fields, chunk_size=MAX_STREAM_CHUNK_SIZE):
+    """Stream the identities data of a queryset in chunks.
+
+    Rows are read in chunks of `chunk_size` ordered by uuid,
+    starting each chunk after the last uuid read. Unlike
+    `QuerySet.iterator`, this does not depend on the database
+    driver to support server-side cursors, so only one chunk
+    is kept in memory at a time.
+    """
+    queryset = queryset.order_by('uuid')
+    last_uuid = None
+
+    while True:
+        chunk = queryset
+        if last_uuid is not None:
+            chunk = chunk.filter(uuid__gt=last_uuid)
+        rows = list(chunk.values_list(*fields)[:chunk_size])
+
+        yield from rows
+
+        if len(rows) < chunk_size:
+            break
+        last_uuid = rows[-1][0]
+
+
+def _find_matches(set_x, set_y, criteria, verbose,
+                  fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                  blacklist=None, workers=1):
+    """Find identities matches between two sets using hash joins.
 
     This method find matches for the identities in `set_x` looking at
     the identities from `set_y` given a list of criteria.
 
-    The identities sets are transformed into Pandas dataframes and
-    they are filtered according to the different criteria, then
-    merged and grouped by the identities from `set_x`. The grouped
-    results are transformed into sets of results taking into account
-    the results from the rest of results to generate complete sets
-    of matches per each identity from `set_x`.
-
-    :param set_x: list of individual keys to find matches for
-    :param set_y: list of individual keys where to find matches
-    :param criteria: list of matching criteria (`email`, `name`, `username`).
+    Identities are given as tuples of values with the format
+    `(uuid, individual, *fields)`, where fields are the ones
+    needed by the criteria, in the order they are first used
+    (see `_parse_criteria`). The values of the identities from
+    `set_x` are stored in one hash table per criterion, which
+    maps each value to the set of identities that have it. Then,
+    identities from `set_y` are streamed and their values probed
+    on these tables. Compound criteria use a composite key made
+    of the values of all their fields, so identities only match
+    when all of them are equal. Fuzzy criteria work the same
+    way, but values from `set_x` are added to a `FuzzyNameIndex`
+    instead, where similar values are searched.
+
+    Matches are not stored. Once found, they are joined in a
+    disjoint-set with the previous matches of the same identity,
+    so identities that share any of their matches will share the
+    same group too. Memory does not grow with the size of `set_y`
+    but with the size of `set_x` and the number of matches.
+
+    Values included in `blacklist` are ignored on both sets, so
+    they never take part in the joins.
+
+    When `workers` is greater than one, identities from `set_y`
+    are split in partitions of `MAX_PARTITION_SIZE` while they are
+    streamed. Each partition is matched by a pool of `workers`
+    processes, which receive a copy of the tables and indexes when
+    they start. Every process returns the partial groups of matches
+    of its partition and these groups are joined in the disjoint-set,
+    so the result is the same than the one obtained with a single
+    process.
+
+    :param set_x: identities data to find matches for
+    :param set_y: identities data where to find matches; it can be
+        any iterable, so identities can be streamed from the database
+    :param criteria: list of matching criteria (`email`, `name`, `username`,
+        `fuzzy_name`); compound criteria are given as lists of fields
     :param verbose: if set to `True`, the list of results will include individual
         identities. Otherwise, results will include main keys from individuals.
+    :param fuzzy_threshold: minimum similarity for fuzzy criteria matches
+    :param blacklist: set of values, in lower case, not to be matched
+    :param workers: number of processes used to find matches
 
     :returns: a dictionary including the set of matches found for each
         identity from `set_x`.
     """
-    def _to_df(data_set):
-        """Convert identities set into a Pandas `Dataframe` object"""
-        df = pandas.DataFrame(data_set)
-        return df.sort_values(['individual'])
-
-    def _filter_criteria(df, c):
-        """Filter dataframe creating a basic subset including a given column"""
-        cols = ['uuid', 'individual', c]
-        cdf = df[cols]
-        return cdf.dropna(subset=[c])
-
-    def _calculate_matches_groups(grouped_uids, verbose=False):
-        """Calculate groups of matching identities from identity groups.
+    def _calculate_matches_groups(dset, anchors):
+        """Calculate the set of matches for each identity.
 
         For instance, given a list of matched unique identities like
         A = {A, B}; B = {B,A,C}, C = {C,} and D = {D,} the output
         for keys A, B and C will be the set {A, B, C}. As D has no matches,
         it won't be included in any group and it won't be returned.
 
-        :param grouped_uids: groups of unique identities
-        :param verbose: if true, the grouping will be calculated using
-            unique identities (uuids) instead of main keys from individuals.
+        :param dset: disjoint-set with the matched identifiers
+        :param anchors: dictionary with one of the matched identifiers
+            of each identity
 
         :returns: a dictionary including the set of matches for each
             group key.
         """
-        matches = {}
-        # Group by main keys from Individuals or by uuids from Identities
-        col_name = 'uuid_y' if verbose else 'individual_y'
-
-        sorted_keys = sorted(grouped_uids.groups.keys())
-
-        while sorted_keys:
-            group_key = sorted_keys.pop(0)
-            uuid_set = set()
-            for uuid in grouped_uids.get_group(group_key)[col_name]:
-                uuid_set.add(uuid)
-
-            for key in matches:
-                prev_match = matches[key]
-                if prev_match == uuid_set:
-                    continue
-                elif prev_match.intersection(uuid_set):
-                    prev_match.update(uuid_set)
-                    uuid_set = prev_match
-            matches[group_key] = uuid_set
+        groups = {}
+        for members in dset.groups():
+            group = set(members)
+            for uid in members:
+                groups[uid] = group
 
-        return matches
+        matches = {
+            group_key: groups[anchor]
+            for group_key, anchor in anchors.items()
+        }
 
-    data_x = [model_to_dict(fl) for fl in set_x]
-    data_y = [model_to_dict(fl) for fl in set_y]
+        return matches
 
-    if (not data_x) or (not data_y):
+    if not set_x:
         return {}
 
-    df_x = _to_df(data_x)
-    df_y = _to_df(data_y)
+    # Group by main keys from Individuals or by uuids from Identities
+    id_pos = 0 if verbose else 1
+
+    tables = []
+    compound_tables = []
+    fuzzy_indexes = []
 
-    cdfs = []
+    _, parsed_criteria = _parse_criteria(criteria)
 
-    for c in criteria:
-        cdf_x = _filter_criteria(df_x, c)
-        cdf_y = _filter_criteria(df_y, c)
-        cdf = pandas.merge(cdf_x, cdf_y, on=c, how='inner')
-        cdf = cdf[['individual_y', 'uuid_x', 'uuid_y']]
-        cdfs.append(cdf)
+    for criterion, pos in parsed_criteria:
+        if isinstance(pos, tuple):
+            table = {}
+            compound_tables.append((pos, table))
 
-    result = pandas.concat(cdfs)
-    result = result.drop_duplicates()
+            for row in set_x:
+                values = _get_compound_value(row, pos, blacklist)
+                if values:
+                    table.setdefault(values, set()).add(row[0])
+            continue
 
-    g_result = result.groupby(by=['uuid_x'],
-                              as_index=True, sort=True)
+        if criterion in FUZZY_CRITERIA:
+            fuzzy_index = FuzzyNameIndex(threshold=fuzzy_threshold)
+            fuzzy_indexes.append((pos, fuzzy_index))
+        else:
+            table = {}
+            tables.append((pos, table))
+
+        for row in set_x:
+            value = row[pos]
+            if not _is_matchable(value, blacklist):
+                continue
+            if criterion in FUZZY_CRITERIA:
+                fuzzy_index.add(value, row[0])
+            else:
+                table.setdefault(value, set()).add(row[0])
+
+    dset = DisjointSet()
+    anchors = {}
+
+    if workers > 1:
+        partitions = _iter_partitions(set_y, MAX_PARTITION_SIZE)
+        results = _match_partitions_in_parallel(partitions, workers,
+                                                tables, compound_tables,
+                                                fuzzy_indexes, id_pos,
+                                                blacklist)
+        for partial_anchors, partial_groups in results:
+            for group in partial_groups:
+                for uid in group[1:]:
+                    dset.union(group[0], uid)
+            for uuid, uid in partial_anchors.items():
+                anchor = anchors.setdefault(uuid, uid)
+                dset.union(anchor, uid)
+    else:
+        _match_partition(set_y, dset, anchors,
+                         tables, compound_tables, fuzzy_indexes,
+                         id_pos, blacklist)
 
-    matched = _calculate_matches_groups(g_result, verbose=verbose)
+    matched = _calculate_matches_groups(dset, anchors)
 
     return matched
+
+
+def _match_partition(rows, dset, anchors, tables, compound_tables,
+                     fuzzy_indexes, id_pos, blacklist):
+    """Find the matches of a set of rows.
+
+    Tables, compound tables and fuzzy indexes are probed with
+    the values of each row. Once found, the identifier of the
+    row is joined in `dset` with the previous matches of the
+    same identity. The first match of each identity is stored
+    in `anchors`.
+    """
+    for row in rows:
+        found = set()
+
+        for pos, table in tables:
+            value = row[pos]
+            if not _is_matchable(value, blacklist):
+                continue
+            found.update(table.get(value, ()))
+        for positions, table in compound_tables:
+            values = _get_compound_value(row, positions, blacklist)
+            if values:
+                found.update(table.get(values, ()))
+        for pos, fuzzy_index in fuzzy_indexes:
+            value = row[pos]
+            if not _is_matchable(value, blacklist):
+                continue
+            found.update(fuzzy_index.search(value))
+
+        uid = row[id_pos]
+        for uuid in found:
+            anchor = anchors.setdefault(uuid, uid)
+            dset.union(anchor, uid)
+
+
+def _iter_partitions(rows, size):
+    """Split a stream of rows in lists of `size` elements"""
+
+    partition = []
+
+    for row in rows:
+        partition.append(row)
+        if len(partition) >= size:
+            yield partition
+            partition = []
+
+    if partition:
+        yield partition
+
+
+def _match_partitions_in_parallel(partitions, workers, tables, compound_tables,
+                                  fuzzy_indexes, id_pos, blacklist):
+    """Find the matches of each partition using a pool of processes.
+
+    Results are generated in the same order partitions are given.
+    To keep memory bounded, no more than two partitions per process
+    are sent to the pool at the same time.
+    """
+    initargs = (tables, compound_tables, fuzzy_indexes, id_pos, blacklist)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                initializer=_init_partition_worker,
+                                                initargs=initargs) as executor:
+        pending = collections.deque()
+
+        for partition in partitions:
+            pending.append(executor.submit(_match_partition_worker, partition))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+_worker_state = {}
+
+
+def _init_partition_worker(tables, compound_tables, fuzzy_indexes, id_pos, blacklist):
+    """Store the matching data on the global state of a pool process"""
+
+    _worker_state['args'] = (tables, compound_tables, fuzzy_indexes, id_pos, blacklist)
+
+
+def _match_partition_worker(rows):
+    """Find the matches of a partition on a pool process.
+
+    Returns the first match of each identity and the groups
+    of matched identifiers with more than one element.
+    """
+    dset = DisjointSet()
+    anchors = {}
+
+    _match_partition(rows, dset, anchors, *_worker_state['args'])
+
+    groups = [group for group in dset.groups() if len(group) > 1]
+
+    return anchors, groups
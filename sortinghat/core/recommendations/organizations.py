@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import itertools
+import logging
+import re
+
+from django.db.models import Count
+
+from ..models import Domain, Organization
+from .fuzzy import FuzzyNameIndex, jaccard, normalize_name, _shingle
+
+
+DEFAULT_ORGANIZATION_SIMILARITY = 0.8
+DOMAIN_EVIDENCE_BONUS = 0.3
+
+# Domain names shared by more organizations than this number,
+# like public suffixes such as 'co.uk', are not taken as evidence
+MAX_DOMAIN_OWNERS = 20
+
+# Words that do not help to tell organizations apart
+LEGAL_FORMS = {
+    'ab', 'ag', 'as', 'bv', 'co', 'company', 'corp', 'corporation',
+    'gmbh', 'inc', 'incorporated', 'limited', 'llc', 'llp', 'ltd',
+    'nv', 'oy', 'plc', 'sa', 'sarl', 'sas', 'sl', 'spa', 'srl'
+}
+
+# Dots between single letters, like in 'S.L.'
+ABBREVIATION_REGEX = re.compile(r"\b(\w)\.(?=\w\b)")
+
+
+logger = logging.getLogger(__name__)
+
+
+def recommend_organizations(names=None, threshold=DEFAULT_ORGANIZATION_SIMILARITY):
+    """Recommend organizations that might be duplicates.
+
+    Returns a generator of recommendations to merge organizations
+    which names are written in different ways, like `Example Inc`,
+    `Example, Inc.` and `example`.
+
+    Names are normalized removing accents, case, punctuation and
+    legal forms (`LEGAL_FORMS`), and sorting their words. To avoid
+    comparing every pair of organizations, candidates are blocked
+    by their normalized names: organizations with the same normalized
+    name are duplicates, and similar names are found on an index of
+    character trigrams (see `FuzzyNameIndex`). Two names are similar
+    when their similarity is equal or greater than `threshold`.
+
+    Domains are taken as evidence too. Organizations share a domain
+    name when they own the same domain except for its last label,
+    like `example.com` and `example.org`, or when the domain of one
+    of them is a suffix of the domain of the other, like `example.com`
+    and `eu.example.com`. These organizations are duplicates when
+    the similarity of their names is equal or greater than
+    `threshold - DOMAIN_EVIDENCE_BONUS`. Domain names shared by more
+    than `MAX_DOMAIN_OWNERS` organizations are ignored.
+
+    Duplicates are grouped with complete linkage: starting with the
+    most similar pairs, two groups are joined only when every member
+    of one is a duplicate of every member of the other. Thus, chains
+    of similar names, where `A` is similar to `B` and `B` to `C` but
+    `A` is not similar to `C`, are not grouped together. The
+    organization of each group with more enrollments, then with more
+    domains and then with the shortest name is chosen as the canonical
+    one. Each recommendation contains the name of the canonical
+    organization and the list of names of its duplicates.
+
+    :param names: list of organization names; only the groups that
+        include any of them are recommended. When `None`, every group
+        is recommended.
+    :param threshold: minimum similarity between two names to
+        consider the organizations duplicates; in the range (0, 1]
+
+    :returns: a generator of recommendations
+
+    :raises ValueError: when `threshold` is out of range
+    """
+    logger.debug(
+        f"Generating organization recommendations; "
+        f"names={names} threshold={threshold}; ..."
+    )
+
+    index = FuzzyNameIndex(threshold=threshold)
+
+    organizations = Organization.objects.annotate(nenrollments=Count('enrollments', distinct=True),
+                                                  ndomains=Count('domains', distinct=True))
+    ranks = {}
+    keys = {}
+
+    for name, nenrollments, ndomains in organizations.values_list('name', 'nenrollments', 'ndomains'):
+        ranks[name] = (-nenrollments, -ndomains, len(name), name)
+        keys[name] = normalize_organization_name(name)
+        index.add(keys[name], name)
+
+    pairs = {}
+
+    # Blocking by normalized name and by trigram similarity
+    for name, key in keys.items():
+        for similar in index.search(key):
+            if similar != name:
+                pairs[_pair(name, similar)] = None
+
+    # Evidence given by domains
+    min_similarity = threshold - DOMAIN_EVIDENCE_BONUS
+
+    for owners in _find_domain_owners().values():
+        for name_a, name_b in itertools.combinations(sorted(owners), 2):
+            similarity = jaccard(_shingle(keys[name_a]), _shingle(keys[name_b]))
+            if similarity >= min_similarity:
+                pairs[_pair(name_a, name_b)] = similarity
+
+    for pair, similarity in pairs.items():
+        if similarity is None:
+            pairs[pair] = jaccard(_shingle(keys[pair[0]]), _shingle(keys[pair[1]]))
+
+    selected = set(names) if names is not None else None
+    recommendations = []
+
+    for group in _group_duplicates(ranks.keys(), pairs):
+        if len(group) < 2:
+            continue
+        if selected is not None and selected.isdisjoint(group):
+            continue
+
+        group.sort(key=lambda n: ranks[n])
+        recommendations.append((group[0], sorted(group[1:])))
+
+    recommendations.sort()
+
+    yield from recommendations
+
+    logger.info(f"Organization recommendations generated; names='{names}'")
+
+
+def normalize_organization_name(name):
+    """Normalize the name of an organization to compare it with others.
+
+    Abbreviations, like `S.L.`, are joined into a single word.
+    Then, the name is normalized like any other name (see
+    `normalize_name`) and the words of `LEGAL_FORMS` are removed,
+    unless the name only has these words.
+
+    :param name: name to normalize
+
+    :returns: the normalized name
+    """
+    name = ABBREVIATION_REGEX.sub(r"\1", name)
+    tokens = normalize_name(name).split()
+    filtered = [token for token in tokens if token not in LEGAL_FORMS]
+
+    return ' '.join(filtered or tokens)
+
+
+def _pair(name_a, name_b):
+    """Sorted tuple of two organization names"""
+
+    return (name_a, name_b) if name_a < name_b else (name_b, name_a)
+
+
+def _group_duplicates(names, pairs):
+    """Group duplicate organizations with complete linkage.
+
+    Pairs are processed from the most to the least similar one.
+    The groups of a pair are joined when all the pairs of
+    organizations between both groups are duplicates.
+
+    :param names: names of the organizations
+    :param pairs: dictionary with the similarity of each pair
+        of duplicate organizations
+
+    :returns: a list with the groups of names
+    """
+    groups = {name: [name] for name in names}
+
+    ordered = sorted(pairs.items(), key=lambda item: (-item[1], item[0]))
+
+    for (name_a, name_b), _ in ordered:
+        group_a = groups[name_a]
+        group_b = groups[name_b]
+
+        if group_a is group_b:
+            continue
+        if not all(_pair(x, y) in pairs for x in group_a for y in group_b):
+            continue
+
+        group_a.extend(group_b)
+        for name in group_b:
+            groups[name] = group_a
+
+    unique = {id(group): group for group in groups.values()}
+
+    return list(unique.values())
+
+
+def _find_domain_owners():
+    """Find the organizations that share domain names.
+
+    Each domain gives a domain name for itself and for each of its
+    parent domains, removing their last label. For example,
+    `eu.example.com` gives `eu.example` and `example`, so it shares
+    domain names with `example.com` and `example.org`.
+
+    :returns: a dictionary with the set of organization names
+        of each domain name; only entries with more than one
+        and up to `MAX_DOMAIN_OWNERS` organizations are included
+    """
+    owners = {}
+
+    domains = Domain.objects.values_list('domain', 'organization__name')
+    for domain, org_name in domains.iterator():
+        labels = domain.lower().split('.')
+        for start in range(len(labels) - 1):
+            owners.setdefault('.'.join(labels[start:-1]), set()).add(org_name)
+
+    return {key: orgs for key, orgs in owners.items()
+            if 1 < len(orgs) <= MAX_DOMAIN_OWNERS}
@@ -54,20 +54,28 @@ from .api import (add_identity,
                   add_organization,
                   add_domain,
                   delete_organization,
+                  merge_organizations,
                   delete_domain,
                   enroll,
                   withdraw,
                   update_enrollment)
 from .context import SortingHatContext
 from .decorators import check_auth
-from .errors import InvalidFilterError
+from .errors import InvalidFilterError, InvalidValueError
 from .jobs import (affiliate,
+                   mark_bots,
                    unify,
+                   unify_organizations,
                    find_job,
                    get_jobs,
+                   get_job_progress,
+                   get_job_status,
                    recommend_affiliations,
-                   recommend_matches)
-from .models import (Organization,
+                   recommend_bots,
+                   recommend_matches,
+                   recommend_organizations)
+from .models import (AffiliationRecommendation,
+                     Organization,
                      Domain,
                      Country,
                      Individual,
@@ -76,6 +84,12 @@ from .models import (Organization,
                      Enrollment,
                      Transaction,
                      Operation)
+from .recommendations.bots import DEFAULT_BOT_SCORE
+from .recommendations.fuzzy import DEFAULT_SIMILARITY_THRESHOLD
+from .recommendations.organizations import DEFAULT_ORGANIZATION_SIMILARITY
+from .utils import (normalize_identity_name,
+                    normalize_identity_username,
+                    canonicalize_email)
 
 
 @convert_django_field.register(JSONField)
@@ -187,6 +201,7 @@ class IndividualType(DjangoObjectType):
 class IdentityType(DjangoObjectType):
     class Meta:
         model = Identity
+        exclude = ('normalized_name', 'canonical_email', 'normalized_username',)
 
 
 class ProfileType(DjangoObjectType):
@@ -209,6 +224,19 @@ class MatchesRecommendationType(graphene.ObjectType):
     matches = graphene.List(graphene.String, description='List of recommended matches.')
 
 
+class BotRecommendationType(graphene.ObjectType):
+    uuid = graphene.String(description='The unique identifier of an individual.')
+    score = graphene.Float(description='Score of the individual being a bot (range of 0 to 1).')
+
+
+class OrganizationsRecommendationType(graphene.ObjectType):
+    organization = graphene.String(description='Name of the canonical organization.')
+    duplicates = graphene.List(
+        graphene.String,
+        description='List of organizations recommended to be merged into the canonical one.'
+    )
+
+
 class AffiliationResultType(graphene.ObjectType):
     uuid = graphene.String(description='The unique identifier of an individual.')
     organizations = graphene.List(
@@ -224,21 +252,89 @@ class UnifyResultType(graphene.ObjectType):
     )
 
 
+class UnifyOrganizationsResultType(graphene.ObjectType):
+    organization = graphene.String(description='Name of the canonical organization.')
+    merged = graphene.List(
+        graphene.String,
+        description='List of organizations that were merged into the canonical one.'
+    )
+
+
+class MarkBotsResultType(graphene.ObjectType):
+    marked = graphene.List(
+        graphene.String,
+        description='List of individuals that were marked as bots using bot recommendations.'
+    )
+
+
 class JobResultType(graphene.Union):
     class Meta:
         types = (AffiliationResultType,
                  AffiliationRecommendationType,
+                 BotRecommendationType,
                  MatchesRecommendationType,
+                 MarkBotsResultType,
+                 OrganizationsRecommendationType,
+                 UnifyOrganizationsResultType,
                  UnifyResultType)
 
 
+class JobResultList:
+    """Lazy list of the results of a job.
+
+    Results are converted to their type only when they are
+    read, so a page of results does not need to convert
+    the rest of them.
+
+    :param results: list of `(key, value)` results; dictionaries
+        are converted to lists of items
+    :param convert: function that converts a result
+    """
+    def __init__(self, results, convert):
+        if isinstance(results, dict):
+            results = list(results.items())
+        self.results = results
+        self.convert = convert
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, index):
+        return [self.convert(*result) for result in self.results[index]]
+
+
 class JobType(graphene.ObjectType):
     job_id = graphene.String(description='Job identifier.')
     job_type = graphene.String(description='Type of job.')
     status = graphene.String(description='Job status (`started`, `deferred`, `finished`, `failed` or `scheduled`).')
-    result = graphene.List(JobResultType, description='List of job results.')
+    result = graphene.List(
+        JobResultType,
+        page=graphene.Int(),
+        page_size=graphene.Int(),
+        description='List of job results. Use `page` and `pageSize` to get the results by pages.'
+    )
     errors = graphene.List(graphene.String, description='List of errors.')
     enqueued_at = graphene.DateTime(description='Time the job was enqueued at.')
+    processed = graphene.Int(description='Number of items processed by the job.')
+    total = graphene.Int(description='Total number of items to process, when it is known.')
+    rate = graphene.Float(description='Current number of items processed per second.')
+    eta = graphene.Float(description='Estimated number of seconds to finish the job.')
+
+    def resolve_result(self, info, page=None, page_size=None):
+        if self.result is None:
+            return None
+        elif page is None and page_size is None:
+            return self.result[:]
+
+        page = 1 if page is None else page
+        page_size = settings.DEFAULT_GRAPHQL_PAGE_SIZE if page_size is None else page_size
+
+        if page < 1 or page_size < 1:
+            raise InvalidValueError(msg="'page' and 'pageSize' must be greater than 0")
+
+        start = (page - 1) * page_size
+
+        return self.result[start:start + page_size]
 
 
 class ProfileInputType(graphene.InputObjectType):
@@ -287,6 +383,20 @@ class IdentityFilterType(graphene.InputObjectType):
         required=False,
         description='Filter individuals whose name, email or username contain the term.'
     )
+    name = graphene.String(
+        required=False,
+        description='Filter individuals with an identity with this name, ignoring case and accents.'
+    )
+    email = graphene.String(
+        required=False,
+        description='Filter individuals with an identity with an email address equivalent to this one.\
+                     Case is ignored and so are the dots and tags that some domains do not take\
+                     into account. Example: `john.smith+dev@gmail.com` equals to `johnsmith@gmail.com`.'
+    )
+    username = graphene.String(
+        required=False,
+        description='Filter individuals with an identity with this username, ignoring case.'
+    )
     is_locked = graphene.Boolean(
         required=False,
         description='Filters individuals by whether their profiles are locked and cannot be edited.'
@@ -357,6 +467,15 @@ class TransactionFilterType(graphene.InputObjectType):
     )
 
 
+class JobFilterType(graphene.InputObjectType):
+    status = graphene.List(
+        graphene.String,
+        required=False,
+        description='Filter jobs by their status in the queue\
+        (`queued`, `started`, `deferred`, `scheduled`, `finished` or `failed`).'
+    )
+
+
 class OperationFilterType(graphene.InputObjectType):
     ouid = graphene.String(
         required=False,
@@ -384,6 +503,17 @@ class OperationFilterType(graphene.InputObjectType):
     )
 
 
+class AffiliationRecommendationFilterType(graphene.InputObjectType):
+    uuid = graphene.String(
+        required=False,
+        description='Find the recommendations of an individual using its main key.'
+    )
+    organization = graphene.String(
+        required=False,
+        description='Filter individuals with recommendations for this organization.'
+    )
+
+
 class AbstractPaginatedType(graphene.ObjectType):
 
     @classmethod
@@ -438,6 +568,12 @@ class JobPaginatedType(AbstractPaginatedType):
     page_info = graphene.Field(PaginationType, description='Information to aid in pagination.')
 
 
+class AffiliationRecommendationPaginatedType(AbstractPaginatedType):
+    entities = graphene.List(AffiliationRecommendationType,
+                             description='A list of affiliation recommendations.')
+    page_info = graphene.Field(PaginationType, description='Information to aid in pagination.')
+
+
 class AddOrganization(graphene.Mutation):
     class Arguments:
         name = graphene.String()
@@ -474,6 +610,25 @@ class DeleteOrganization(graphene.Mutation):
         )
 
 
+class MergeOrganizations(graphene.Mutation):
+    class Arguments:
+        from_org = graphene.String()
+        to_org = graphene.String()
+
+    organization = graphene.Field(lambda: OrganizationType)
+
+    @check_auth
+    def mutate(self, info, from_org, to_org):
+        user = info.context.user
+        ctx = SortingHatContext(user)
+
+        org = merge_organizations(ctx, from_org, to_org)
+
+        return MergeOrganizations(
+            organization=org
+        )
+
+
 class AddDomain(graphene.Mutation):
     class Arguments:
         organization = graphene.String()
@@ -522,6 +677,7 @@ class AddIdentity(graphene.Mutation):
         email = graphene.String()
         username = graphene.String()
         uuid = graphene.String()
+        if_exists = graphene.String()
 
     uuid = graphene.Field(lambda: graphene.String)
     individual = graphene.Field(lambda: IndividualType)
@@ -529,7 +685,7 @@ class AddIdentity(graphene.Mutation):
     @check_auth
     def mutate(self, info, source,
                name=None, email=None, username=None,
-               uuid=None):
+               uuid=None, if_exists='error'):
         user = info.context.user
         ctx = SortingHatContext(user)
 
@@ -538,7 +694,8 @@ class AddIdentity(graphene.Mutation):
                                 name=name,
                                 email=email,
                                 username=username,
-                                uuid=uuid)
+                                uuid=uuid,
+                                if_exists=if_exists)
         individual = identity.individual
 
         return AddIdentity(
@@ -799,16 +956,23 @@ class RecommendMatches(graphene.Mutation):
         target_uuids = graphene.List(graphene.String,
                                      required=False)
         criteria = graphene.List(graphene.String)
+        compound_criteria = graphene.List(graphene.List(graphene.String),
+                                          required=False)
         verbose = graphene.Boolean(required=False)
+        fuzzy_threshold = graphene.Float(required=False)
 
     job_id = graphene.Field(lambda: graphene.String)
 
     @check_auth
-    def mutate(self, info, source_uuids, criteria, target_uuids=None, verbose=False):
+    def mutate(self, info, source_uuids, criteria=None, target_uuids=None, verbose=False,
+               fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD, compound_criteria=None):
         user = info.context.user
         ctx = SortingHatContext(user)
 
-        job = enqueue(recommend_matches, ctx, source_uuids, target_uuids, criteria, verbose)
+        criteria = (criteria or []) + (compound_criteria or [])
+
+        job = enqueue(recommend_matches, ctx, source_uuids, target_uuids, criteria, verbose,
+                      fuzzy_threshold)
 
         return RecommendMatches(
             job_id=job.id
@@ -834,21 +998,107 @@ class Affiliate(graphene.Mutation):
         )
 
 
+class RecommendBots(graphene.Mutation):
+    class Arguments:
+        uuids = graphene.List(graphene.String,
+                              required=False)
+        min_score = graphene.Float(required=False)
+
+    job_id = graphene.Field(lambda: graphene.String)
+
+    @check_auth
+    def mutate(self, info, uuids=None, min_score=DEFAULT_BOT_SCORE):
+        user = info.context.user
+        ctx = SortingHatContext(user)
+
+        job = enqueue(recommend_bots, ctx, uuids, min_score)
+
+        return RecommendBots(
+            job_id=job.id
+        )
+
+
+class MarkBots(graphene.Mutation):
+    class Arguments:
+        uuids = graphene.List(graphene.String,
+                              required=False)
+        min_score = graphene.Float(required=False)
+
+    job_id = graphene.Field(lambda: graphene.String)
+
+    @check_auth
+    def mutate(self, info, uuids=None, min_score=DEFAULT_BOT_SCORE):
+        user = info.context.user
+        ctx = SortingHatContext(user)
+
+        job = enqueue(mark_bots, ctx, uuids, min_score)
+
+        return MarkBots(
+            job_id=job.id
+        )
+
+
+class RecommendOrganizations(graphene.Mutation):
+    class Arguments:
+        names = graphene.List(graphene.String,
+                              required=False)
+        threshold = graphene.Float(required=False)
+
+    job_id = graphene.Field(lambda: graphene.String)
+
+    @check_auth
+    def mutate(self, info, names=None, threshold=DEFAULT_ORGANIZATION_SIMILARITY):
+        user = info.context.user
+        ctx = SortingHatContext(user)
+
+        job = enqueue(recommend_organizations, ctx, names, threshold)
+
+        return RecommendOrganizations(
+            job_id=job.id
+        )
+
+
+class UnifyOrganizations(graphene.Mutation):
+    class Arguments:
+        names = graphene.List(graphene.String,
+                              required=False)
+        threshold = graphene.Float(required=False)
+
+    job_id = graphene.Field(lambda: graphene.String)
+
+    @check_auth
+    def mutate(self, info, names=None, threshold=DEFAULT_ORGANIZATION_SIMILARITY):
+        user = info.context.user
+        ctx = SortingHatContext(user)
+
+        job = enqueue(unify_organizations, ctx, names, threshold)
+
+        return UnifyOrganizations(
+            job_id=job.id
+        )
+
+
 class Unify(graphene.Mutation):
     class Arguments:
         source_uuids = graphene.List(graphene.String)
         target_uuids = graphene.List(graphene.String,
                                      required=False)
         criteria = graphene.List(graphene.String)
+        compound_criteria = graphene.List(graphene.List(graphene.String),
+                                          required=False)
+        fuzzy_threshold = graphene.Float(required=False)
 
     job_id = graphene.Field(lambda: graphene.String)
 
     @check_auth
-    def mutate(self, info, source_uuids, criteria, target_uuids=None):
+    def mutate(self, info, source_uuids, criteria=None, target_uuids=None,
+               fuzzy_threshold=DEFAULT_SIMILARITY_THRESHOLD, compound_criteria=None):
         user = info.context.user
         ctx = SortingHatContext(user)
 
-        job = enqueue(unify, ctx, source_uuids, target_uuids, criteria)
+        criteria = (criteria or []) + (compound_criteria or [])
+
+        job = enqueue(unify, ctx, source_uuids, target_uuids, criteria, fuzzy_threshold)
 
         return Unify(
             job_id=job.id
@@ -902,8 +1152,19 @@ class SortingHatQuery:
         JobPaginatedType,
         page_size=graphene.Int(),
         page=graphene.Int(),
+        filters=JobFilterType(required=False),
         description='Get all jobs.'
     )
+    affiliation_recommendations = graphene.Field(
+        AffiliationRecommendationPaginatedType,
+        page_size=graphene.Int(),
+        page=graphene.Int(),
+        filters=AffiliationRecommendationFilterType(required=False),
+        description='Find the individuals with pending affiliation recommendations\
+        and the organizations recommended to them. Recommendations are stored\
+        and updated in the background when the registry changes, so they are\
+        not generated again.'
+    )
 
     @check_auth
     def resolve_countries(self, info, filters=None,
@@ -965,6 +1226,21 @@ class SortingHatQuery:
                                                          Q(individual__profile__name__icontains=search_term) |
                                                          Q(individual__profile__email__icontains=search_term))
                                                  .values_list('individual__mk')))
+        if filters and 'name' in filters:
+            name = normalize_identity_name(filters['name'])
+            query = query.filter(mk__in=Subquery(Identity.objects
+                                                 .filter(normalized_name=name)
+                                                 .values_list('individual__mk')))
+        if filters and 'email' in filters:
+            email = canonicalize_email(filters['email'])
+            query = query.filter(mk__in=Subquery(Identity.objects
+                                                 .filter(canonical_email=email)
+                                                 .values_list('individual__mk')))
+        if filters and 'username' in filters:
+            username = normalize_identity_username(filters['username'])
+            query = query.filter(mk__in=Subquery(Identity.objects
+                                                 .filter(normalized_username=username)
+                                                 .values_list('individual__mk')))
         if filters and 'is_locked' in filters:
             query = query.filter(is_locked=filters['is_locked'])
         if filters and 'is_bot' in filters:
@@ -1051,7 +1327,7 @@ class SortingHatQuery:
     def resolve_job(self, info, job_id):
         job = find_job(job_id)
 
-        status = job.get_status()
+        status = get_job_status(job)
         job_type = job.func_name.split('.')[-1]
         enqueued_at = job.enqueued_at
 
@@ -1060,15 +1336,16 @@ class SortingHatQuery:
 
         if (job.result) and (job_type == 'affiliate'):
             errors = job.result['errors']
-            result = [
-                AffiliationResultType(uuid=uuid, organizations=orgs)
-                for uuid, orgs in job.result['results'].items()
-            ]
+            result = JobResultList(
+                job.result['results'],
+                lambda uuid, orgs: AffiliationResultType(uuid=uuid, organizations=orgs)
+            )
         elif (job.result) and (job_type == 'recommend_affiliations'):
-            result = [
-                AffiliationRecommendationType(uuid=uuid, organizations=orgs)
-                for uuid, orgs in job.result['results'].items()
-            ]
+            errors = job.result.get('errors', None)
+            result = JobResultList(
+                job.result['results'],
+                lambda uuid, orgs: AffiliationRecommendationType(uuid=uuid, organizations=orgs)
+            )
         elif (job.result) and (job_type == 'recommend_matches'):
             result = [
                 MatchesRecommendationType(uuid=uuid, matches=matches)
@@ -1079,37 +1356,100 @@ class SortingHatQuery:
             result = [
                 UnifyResultType(merged=job.result['results'])
             ]
+        elif (job.result) and (job_type == 'recommend_bots'):
+            result = [
+                BotRecommendationType(uuid=uuid, score=score)
+                for uuid, score in job.result['results'].items()
+            ]
+        elif (job.result) and (job_type == 'mark_bots'):
+            errors = job.result['errors']
+            result = [
+                MarkBotsResultType(marked=job.result['results'])
+            ]
+        elif (job.result) and (job_type == 'recommend_organizations'):
+            result = [
+                OrganizationsRecommendationType(organization=org, duplicates=duplicates)
+                for org, duplicates in job.result['results'].items()
+            ]
+        elif (job.result) and (job_type == 'unify_organizations'):
+            errors = job.result['errors']
+            result = [
+                UnifyOrganizationsResultType(organization=org, merged=merged)
+                for org, merged in job.result['results'].items()
+            ]
         elif status == 'failed':
             errors = [job.exc_info]
 
+        progress = get_job_progress(job) or {}
+
         return JobType(job_id=job_id,
                        job_type=job_type,
                        status=status,
                        result=result,
                        errors=errors,
-                       enqueued_at=enqueued_at)
+                       enqueued_at=enqueued_at,
+                       **progress)
+
+    @check_auth
+    def resolve_jobs(self, info, filters=None,
+                     page=1,
+                     page_size=settings.DEFAULT_GRAPHQL_PAGE_SIZE):
+        statuses = filters.get('status', None) if filters else None
+
+        try:
+            jobs = get_jobs(statuses=statuses)
+        except ValueError as e:
+            raise InvalidFilterError(filter_name='status', msg=e)
+
+        result = JobPaginatedType.create_paginated_result(jobs,
+                                                          page,
+                                                          page_size=page_size)
+
+        # Only the jobs of the page are read from the queue
+        result.entities = [
+            JobType(job_id=job.get_id(),
+                    job_type=job.func_name.split('.')[-1],
+                    status=get_job_status(job),
+                    result=[],
+                    errors=[],
+                    enqueued_at=job.enqueued_at,
+                    **(get_job_progress(job) or {}))
+            for job in result.entities
+        ]
+
+        return result
 
     @check_auth
-    def resolve_jobs(self, info, page=1, page_size=settings.DEFAULT_GRAPHQL_PAGE_SIZE):
-        jobs = get_jobs()
-        result = []
-
-        for job in jobs:
-            job_id = job.get_id()
-            status = job.get_status()
-            job_type = job.func_name.split('.')[-1]
-            enqueued_at = job.enqueued_at
-
-            result.append(JobType(job_id=job_id,
-                                  job_type=job_type,
-                                  status=status,
-                                  result=[],
-                                  errors=[],
-                                  enqueued_at=enqueued_at))
-
-        return JobPaginatedType.create_paginated_result(result,
-                                                        page,
-                                                        page_size=page_size)
+    def resolve_affiliation_recommendations(self, info, filters=None,
+                                            page=1,
+                                            page_size=settings.DEFAULT_GRAPHQL_PAGE_SIZE,
+                                            **kwargs):
+        query = AffiliationRecommendation.objects.values_list('individual', flat=True)
+
+        if filters and 'uuid' in filters:
+            query = query.filter(individual=filters['uuid'])
+        if filters and 'organization' in filters:
+            query = query.filter(organization__name=filters['organization'])
+
+        query = query.distinct().order_by('individual_id')
+
+        result = AffiliationRecommendationPaginatedType.create_paginated_result(query,
+                                                                               page,
+                                                                               page_size=page_size)
+        mks = list(result.entities)
+
+        organizations = {mk: [] for mk in mks}
+        recs = AffiliationRecommendation.objects.filter(individual__in=mks)
+        recs = recs.order_by('organization__name').values_list('individual', 'organization__name')
+        for mk, org_name in recs:
+            organizations[mk].append(org_name)
+
+        result.entities = [
+            AffiliationRecommendationType(uuid=mk, organizations=organizations[mk])
+            for mk in mks
+        ]
+
+        return result
 
     @check_auth
     def resolve_transactions(self, info, filters=None,
@@ -1168,6 +1508,11 @@ class SortingHatMutation(graphene.ObjectType):
         description='Remove an organization from the registry. Related information\
         such as domains or enrollments is also removed.'
     )
+    merge_organizations = MergeOrganizations.Field(
+        description='Merge the organization `from_org` into `to_org`. Domains and\
+        enrollments of `from_org` are moved to `to_org` and `from_org` is removed\
+        from the registry.'
+    )
     add_domain = AddDomain.Field(
         description='Add a new domain to an organization. The new domain is set\
         as a top domain by default. A domain can only be assigned to one organization.'
@@ -1179,7 +1524,8 @@ class SortingHatMutation(graphene.ObjectType):
         description='Add a new identity to the registry. A new individual will be\
         also added and associated to the new identity unless an `uuid` is provided.\
         When `uuid` is set, it creates a new identity associated to the individual\
-        defined by this identifier.'
+        defined by this identifier. Set `ifExists` to `return` to get the stored\
+        identity, without changing the registry, when it already exists.'
     )
     delete_identity = DeleteIdentity.Field(
         description='Remove an identity from the registry. If the `uuid` also\
@@ -1227,13 +1573,32 @@ class SortingHatMutation(graphene.ObjectType):
     )
     recommend_matches = RecommendMatches.Field(
         description='Recommend identity matches for a list of individuals based\
-        on a list of criteria composed by `email`, `name` and/or `username`.'
+        on a list of criteria composed by `email`, `name` and/or `username`.\
+        Compound criteria, given as lists of fields, match when all their\
+        fields match; `source` can be used as one of these fields.'
     )
     affiliate = Affiliate.Field(
         description='Affiliate a set of individuals using recommendations.'
     )
+    recommend_bots = RecommendBots.Field(
+        description='Recommend individuals that might be bots based on the names,\
+        emails and usernames of their identities.'
+    )
+    recommend_organizations = RecommendOrganizations.Field(
+        description='Recommend organizations that might be duplicates based on\
+        the similarity of their names and on their domains.'
+    )
+    unify_organizations = UnifyOrganizations.Field(
+        description='Merge duplicate organizations into their canonical organization\
+        using organization recommendations.'
+    )
+    mark_bots = MarkBots.Field(
+        description='Mark as bots the individuals with a bot score equal or greater\
+        than `min_score`, using bot recommendations.'
+    )
     unify = Unify.Field(
-        description='Unify a set of individuals by merging them using matching recommendations.'
+        description='Unify a set of individuals by merging them using matching recommendations.\
+        Compound criteria, given as lists of fields, match when all their fields match.'
     )
 
     # JWT authentication
@@ -22,7 +22,16 @@
 import re
 import unicodedata
 
-from .models import MIN_PERIOD_DATE, MAX_PERIOD_DATE
+from .models import MIN_PERIOD_DATE, MAX_PERIOD_DATE, MAX_SIZE_CHAR_FIELD
+
+
+# Rules to obtain the canonical form of email addresses
+# of a domain; `strip_plus_tag` removes the text after '+'
+# and `strip_dots` removes the dots of the local part
+EMAIL_DOMAIN_POLICIES = {
+    'gmail.com': {'strip_plus_tag': True, 'strip_dots': True},
+    'googlemail.com': {'strip_plus_tag': True, 'strip_dots': True}
+}
 
 
 def merge_datetime_ranges(dates, exclude_limits=False):
@@ -122,6 +131,72 @@ def unaccent_string(unistr):
     return string
 
 
+def normalize_identity_name(name):
+    """Normalize the name of an identity.
+
+    The normalized form of a name is in lower case and
+    without accents. For instance, 'Jöhn Smith' and
+    'john smith' have the same normalized form.
+
+    :param name: name to normalize; it can be `None`
+
+    :returns: the normalized name or `None`
+    """
+    if name is None:
+        return None
+
+    return unaccent_string(name.lower())[:MAX_SIZE_CHAR_FIELD]
+
+
+def normalize_identity_username(username):
+    """Normalize the username of an identity.
+
+    The normalized form of a username is in lower case.
+
+    :param username: username to normalize; it can be `None`
+
+    :returns: the normalized username or `None`
+    """
+    if username is None:
+        return None
+
+    return username.lower()[:MAX_SIZE_CHAR_FIELD]
+
+
+def canonicalize_email(email):
+    """Obtain the canonical form of an email address.
+
+    The canonical form of an email address is in lower case.
+    Moreover, the rules of its domain defined in `EMAIL_DOMAIN_POLICIES`
+    are applied. For instance, 'John.Smith+dev@gmail.com' and
+    'johnsmith@gmail.com' have the same canonical form, because
+    Gmail ignores dots and tags added after a plus sign.
+
+    Values that are not valid email addresses are only
+    converted to lower case.
+
+    :param email: email address to canonicalize; it can be `None`
+
+    :returns: the canonical email address or `None`
+    """
+    if email is None:
+        return None
+
+    email = email.lower()
+    local, sep, domain = email.rpartition('@')
+
+    policy = EMAIL_DOMAIN_POLICIES.get(domain, None) if sep and local else None
+
+    if policy:
+        if policy.get('strip_plus_tag', False):
+            local = local.split('+', 1)[0]
+        if policy.get('strip_dots', False):
+            local = local.replace('.', '')
+        email = local + '@' + domain
+
+    return email[:MAX_SIZE_CHAR_FIELD]
+
+
 def validate_field(name, value, allow_none=False):
     """Validate a given string field following a set of rules.
 
@@ -19,12 +19,26 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+from unittest import mock
+
+import django_rq
+import redis
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from sortinghat.core import api
 from sortinghat.core.context import SortingHatContext
-from sortinghat.core.recommendations.affiliation import recommend_affiliations
+from sortinghat.core.jobs import update_stored_affiliation_recommendations
+from sortinghat.core.models import (AffiliationRecommendation,
+                                    Domain,
+                                    Organization,
+                                    StaleAffiliationRecommendation)
+from sortinghat.core.recommendations import affiliation
+from sortinghat.core.recommendations.affiliation import (recommend_affiliations,
+                                                         rebuild_affiliation_recommendations)
 
 
 class TestRecommendAffiliations(TestCase):
@@ -219,3 +233,483 @@ class TestRecommendAffiliations(TestCase):
         recs = list(recommend_affiliations('FFFFFFFFFFFFFFFFFF'))
 
         self.assertListEqual(recs, [])
+
+    def test_sub_domain_not_top_domain(self):
+        """Check if sub-domains only match with top domains"""
+
+        ctx = SortingHatContext(self.user)
+
+        api.add_domain(ctx, 'LibreSoft', 'libresoft.es', is_top_domain=False)
+
+        jsmith = api.add_identity(ctx,
+                                  source='scm',
+                                  email='jsmith@gsyc.libresoft.es')
+        jdoe = api.add_identity(ctx,
+                                source='scm',
+                                email='jdoe@libresoft.es')
+
+        # Test
+        recs = list(recommend_affiliations([jsmith.uuid, jdoe.uuid]))
+
+        self.assertEqual(len(recs), 2)
+        self.assertEqual(recs[0], (jsmith.uuid, []))
+        self.assertEqual(recs[1], (jdoe.uuid, ['LibreSoft']))
+
+    def test_domains_updated(self):
+        """Check if added and deleted domains are taken into account"""
+
+        ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(ctx,
+                                  source='scm',
+                                  email='jsmith@libresoft.es')
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, []))
+
+        api.add_domain(ctx, 'LibreSoft', 'libresoft.es')
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, ['LibreSoft']))
+
+        api.delete_domain(ctx, 'libresoft.es')
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, []))
+
+    def test_registry_updated(self):
+        """Check if domains are loaded again when the registry changed"""
+
+        ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(ctx,
+                                  source='scm',
+                                  email='jsmith@libresoft.es')
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, []))
+
+        # Bulk operations do not send signals, so the domain
+        # will be found once a change on organizations is committed
+        org = Organization.objects.get(name='LibreSoft')
+        Domain.objects.bulk_create([Domain(domain='libresoft.es',
+                                           is_top_domain=True,
+                                           organization=org)])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            api.add_organization(ctx, 'Example Corp.')
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, []))
+
+        for callback in callbacks:
+            callback()
+
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, ['LibreSoft']))
+
+    def test_domains_not_reloaded(self):
+        """Check if domains are not loaded again when other entities changed"""
+
+        ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(ctx,
+                                  source='scm',
+                                  email='jsmith@bitergia.com')
+        recs = list(recommend_affiliations([jsmith.uuid]))
+        self.assertEqual(recs[0], (jsmith.uuid, ['Bitergia']))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            api.add_identity(ctx,
+                             source='git',
+                             email='jdoe@example.com')
+            api.enroll(ctx, jsmith.uuid, 'Example')
+
+        for callback in callbacks:
+            if not isinstance(callback, affiliation._PendingUpdates):
+                callback()
+
+        with mock.patch.object(affiliation, '_load_domains_trie',
+                               wraps=affiliation._load_domains_trie) as load_mock:
+            recs = list(recommend_affiliations([jsmith.uuid]))
+            load_mock.assert_not_called()
+
+        self.assertEqual(recs[0], (jsmith.uuid, ['Bitergia']))
+
+    def test_number_of_queries(self):
+        """Check if the number of queries does not depend on the number of individuals"""
+
+        ctx = SortingHatContext(self.user)
+
+        uuids = []
+        for i in range(10):
+            indv = api.add_identity(ctx,
+                                    source='scm',
+                                    email=f'user{i}@bitergia.com')
+            api.add_identity(ctx,
+                             source='git',
+                             email=f'user{i}@u.example.com',
+                             uuid=indv.uuid)
+            if i % 2:
+                api.enroll(ctx, indv.uuid, 'Bitergia')
+            uuids.append(indv.uuid)
+
+        # Load the domains before counting
+        list(recommend_affiliations([]))
+
+        # Version of the domains, main keys, emails and enrollments
+        with self.assertNumQueries(5):
+            recs = list(recommend_affiliations(uuids + ['FFFFFFFFFFFFFFFFFF']))
+
+        self.assertEqual(len(recs), 10)
+
+        for i, rec in enumerate(recs):
+            expected = ['Example Int.'] if i % 2 else ['Bitergia', 'Example Int.']
+            self.assertEqual(rec, (uuids[i], expected))
+
+    def test_identity_uuid(self):
+        """Check if individuals are found by the UUIDs of their identities"""
+
+        ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(ctx,
+                                  source='scm',
+                                  name='John Smith')
+        jsmith2 = api.add_identity(ctx,
+                                   source='scm',
+                                   email='jsmith@bitergia.com',
+                                   uuid=jsmith.uuid)
+
+        # Test
+        recs = list(recommend_affiliations([jsmith2.uuid]))
+
+        self.assertListEqual(recs, [(jsmith2.uuid, ['Bitergia'])])
+
+
+class TestScheduleAffiliationRecommendations(TestCase):
+    """Unit tests for schedule_affiliation_recommendations"""
+
+    def setUp(self):
+        """Initialize database with a set of organizations and domains"""
+
+        self.conn = django_rq.get_connection()
+        self.conn.flushall()
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            api.add_organization(self.ctx, 'Example')
+            api.add_domain(self.ctx, 'Example', 'example.com', is_top_domain=True)
+
+            api.add_organization(self.ctx, 'Bitergia')
+            api.add_domain(self.ctx, 'Bitergia', 'bitergia.com')
+
+    def tearDown(self):
+        self.conn.flushall()
+
+    @staticmethod
+    def _affiliation_updates(callbacks):
+        return [callback for callback in callbacks
+                if isinstance(callback, affiliation._PendingUpdates)]
+
+    def test_update_on_commit(self):
+        """Check if recommendations are updated once the transaction is committed"""
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            jsmith = api.add_identity(self.ctx, source='scm',
+                                      email='jsmith@example.com')
+
+        updates = self._affiliation_updates(callbacks)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(AffiliationRecommendation.objects.count(), 0)
+
+        updates[0]()
+
+        recs = AffiliationRecommendation.objects.values_list('individual', 'organization__name')
+        self.assertListEqual(list(recs), [(jsmith.uuid, 'Example')])
+
+    def test_one_update_per_transaction(self):
+        """Check if the updates of a transaction are scheduled once"""
+
+        with mock.patch('django_rq.enqueue', wraps=django_rq.enqueue) as enqueue:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                jsmith = api.add_identity(self.ctx, source='scm',
+                                          email='jsmith@example.com')
+                jdoe = api.add_identity(self.ctx, source='scm',
+                                        email='jdoe@bitergia.com')
+                api.add_identity(self.ctx, source='scm',
+                                 email='jsmith@bitergia.com',
+                                 uuid=jsmith.uuid)
+
+        self.assertEqual(len(self._affiliation_updates(callbacks)), 1)
+        self.assertEqual(enqueue.call_count, 1)
+
+        recs = AffiliationRecommendation.objects.order_by('individual', 'organization__name')
+        recs = recs.values_list('individual', 'organization__name')
+        expected = sorted([(jsmith.uuid, 'Bitergia'),
+                           (jsmith.uuid, 'Example'),
+                           (jdoe.uuid, 'Bitergia')])
+        self.assertListEqual(list(recs), expected)
+
+    def test_job_already_pending(self):
+        """Check if no job is enqueued while there is one pending"""
+
+        self.conn.set(affiliation.PENDING_JOB_KEY, 1)
+
+        with mock.patch('django_rq.enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                jsmith = api.add_identity(self.ctx, source='scm',
+                                          email='jsmith@example.com')
+
+        enqueue.assert_not_called()
+        self.assertEqual(AffiliationRecommendation.objects.count(), 0)
+
+        mks = self.conn.smembers(affiliation.PENDING_MKS_KEY)
+        self.assertSetEqual(mks, {jsmith.uuid.encode('utf-8')})
+
+        # The pending job drains the individuals of any write
+        nrecs = django_rq.enqueue(update_stored_affiliation_recommendations).result
+
+        self.assertEqual(nrecs, 1)
+        self.assertEqual(self.conn.exists(affiliation.PENDING_MKS_KEY), 0)
+        self.assertEqual(self.conn.exists(affiliation.PENDING_JOB_KEY), 0)
+
+    def test_queue_not_available(self):
+        """Check if writes do not fail when the update cannot be scheduled"""
+
+        failing_conn = redis.Redis(port=1, socket_connect_timeout=0.1)
+
+        with mock.patch.object(affiliation.django_rq, 'get_connection',
+                               return_value=failing_conn):
+            with self.captureOnCommitCallbacks(execute=True):
+                jsmith = api.add_identity(self.ctx, source='scm',
+                                          email='jsmith@example.com')
+
+        self.assertEqual(jsmith.email, 'jsmith@example.com')
+        self.assertEqual(AffiliationRecommendation.objects.count(), 0)
+
+        stale = StaleAffiliationRecommendation.objects.values_list('individual', flat=True)
+        self.assertListEqual(list(stale), [jsmith.uuid])
+
+        # The next job calculates the stale recommendations
+        django_rq.enqueue(update_stored_affiliation_recommendations)
+
+        recs = AffiliationRecommendation.objects.values_list('individual', 'organization__name')
+        self.assertListEqual(list(recs), [(jsmith.uuid, 'Example')])
+        self.assertEqual(StaleAffiliationRecommendation.objects.count(), 0)
+
+    def test_nothing_to_update(self):
+        """Check if no update is scheduled when identities do not have emails"""
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            api.add_identity(self.ctx, source='scm', name='John Smith')
+
+        self.assertEqual(len(self._affiliation_updates(callbacks)), 0)
+
+    def test_add_identity_number_of_queries(self):
+        """Check if adding an identity does not read or write any recommendation"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+
+        # Savepoint, transaction, individual, profile and identity;
+        # the cost is the same whether the domain is known or not
+        for email in ['jsmith@bitergia.com', 'jsmith@example.org']:
+            with CaptureQueriesContext(connection) as queries:
+                with self.assertNumQueries(16):
+                    api.add_identity(self.ctx, source='git', email=email)
+
+            for query in queries.captured_queries:
+                self.assertNotIn('affiliation_recommendations', query['sql'])
+                self.assertNotIn('"domains"', query['sql'])
+                self.assertNotIn('MAX(', query['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            api.add_identity(self.ctx, source='scm',
+                             email='jsmith@bitergia.com',
+                             uuid=jsmith.uuid)
+
+        for query in queries.captured_queries:
+            self.assertNotIn('affiliation_recommendations', query['sql'])
+
+
+class TestStoredAffiliationRecommendations(TransactionTestCase):
+    """Unit tests for the stored affiliation recommendations.
+
+    Updates are enqueued once the transactions are committed, so
+    these tests do not run inside a transaction.
+    """
+
+    def setUp(self):
+        """Initialize database with a set of organizations and domains"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        api.add_organization(self.ctx, 'Example')
+        api.add_domain(self.ctx, 'Example', 'example.com', is_top_domain=True)
+
+        api.add_organization(self.ctx, 'Example Int.')
+        api.add_domain(self.ctx, 'Example Int.', 'u.example.com',
+                       is_top_domain=True)
+
+        api.add_organization(self.ctx, 'Bitergia')
+        api.add_domain(self.ctx, 'Bitergia', 'bitergia.com')
+
+        api.add_organization(self.ctx, 'LibreSoft')
+
+    def tearDown(self):
+        django_rq.get_connection().flushall()
+
+    @staticmethod
+    def _stored_recommendations():
+        recs = AffiliationRecommendation.objects.order_by('individual_id', 'organization__name')
+        return list(recs.values_list('individual', 'organization__name'))
+
+    def test_add_identity(self):
+        """Check if recommendations are stored when identities are added"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Example')])
+
+        api.add_identity(self.ctx, source='scm',
+                         email='jsmith@bitergia.com',
+                         uuid=jsmith.uuid)
+        api.add_identity(self.ctx, source='scm',
+                         email='jsmith@example.org',
+                         uuid=jsmith.uuid)
+        api.add_identity(self.ctx, source='scm',
+                         name='John Smith',
+                         uuid=jsmith.uuid)
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Bitergia'),
+                              (jsmith.uuid, 'Example')])
+
+    def test_delete_identity(self):
+        """Check if recommendations are updated when identities are deleted"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        jsmith2 = api.add_identity(self.ctx, source='scm',
+                                   email='jsmith@bitergia.com',
+                                   uuid=jsmith.uuid)
+
+        api.delete_identity(self.ctx, jsmith2.uuid)
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Example')])
+
+        api.delete_identity(self.ctx, jsmith.uuid)
+        self.assertListEqual(self._stored_recommendations(), [])
+
+    def test_move_identity(self):
+        """Check if recommendations are updated when identities are moved"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        jsmith2 = api.add_identity(self.ctx, source='scm',
+                                   email='jsmith@bitergia.com',
+                                   uuid=jsmith.uuid)
+        jdoe = api.add_identity(self.ctx, source='scm',
+                                name='John Doe')
+
+        api.move_identity(self.ctx, jsmith2.uuid, jdoe.uuid)
+
+        expected = sorted([(jsmith.uuid, 'Example'),
+                           (jdoe.uuid, 'Bitergia')])
+        self.assertListEqual(self._stored_recommendations(), expected)
+
+    def test_merge_unmerge(self):
+        """Check if recommendations are updated when individuals are merged and unmerged"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        jdoe = api.add_identity(self.ctx, source='scm',
+                                email='jdoe@bitergia.com')
+
+        api.merge(self.ctx, [jdoe.uuid], jsmith.uuid)
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Bitergia'),
+                              (jsmith.uuid, 'Example')])
+
+        api.unmerge_identities(self.ctx, [jdoe.uuid])
+
+        expected = sorted([(jsmith.uuid, 'Example'),
+                           (jdoe.uuid, 'Bitergia')])
+        self.assertListEqual(self._stored_recommendations(), expected)
+
+    def test_enrollments(self):
+        """Check if recommendations are updated when enrollments change"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        api.add_identity(self.ctx, source='scm',
+                         email='jsmith@bitergia.com',
+                         uuid=jsmith.uuid)
+
+        api.enroll(self.ctx, jsmith.uuid, 'Bitergia')
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Example')])
+
+        api.withdraw(self.ctx, jsmith.uuid, 'Bitergia')
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Bitergia'),
+                              (jsmith.uuid, 'Example')])
+
+    def test_domains(self):
+        """Check if recommendations are updated when domains change"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@it.u.example.com')
+        jdoe = api.add_identity(self.ctx, source='scm',
+                                email='jdoe@libresoft.es')
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Example Int.')])
+
+        api.add_domain(self.ctx, 'LibreSoft', 'libresoft.es')
+        api.delete_domain(self.ctx, 'u.example.com')
+
+        expected = sorted([(jsmith.uuid, 'Example'),
+                           (jdoe.uuid, 'LibreSoft')])
+        self.assertListEqual(self._stored_recommendations(), expected)
+
+    def test_delete_organization(self):
+        """Check if recommendations are updated when organizations are deleted"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@u.example.com')
+
+        api.delete_organization(self.ctx, 'Example Int.')
+        self.assertListEqual(self._stored_recommendations(),
+                             [(jsmith.uuid, 'Example')])
+
+        api.delete_organization(self.ctx, 'Example')
+        self.assertListEqual(self._stored_recommendations(), [])
+
+    def test_rebuild(self):
+        """Check if recommendations are stored from scratch"""
+
+        jsmith = api.add_identity(self.ctx, source='scm',
+                                  email='jsmith@example.com')
+        api.add_identity(self.ctx, source='scm',
+                         email='jsmith@bitergia.com',
+                         uuid=jsmith.uuid)
+        jdoe = api.add_identity(self.ctx, source='scm',
+                                email='jdoe@u.example.com')
+        api.add_identity(self.ctx, source='scm',
+                         name='Jane Rae')
+
+        expected = sorted([(jsmith.uuid, 'Bitergia'),
+                           (jsmith.uuid, 'Example'),
+                           (jdoe.uuid, 'Example Int.')])
+
+        AffiliationRecommendation.objects.all().delete()
+        StaleAffiliationRecommendation.objects.create(individual_id=jdoe.uuid)
+
+        nrecs = rebuild_affiliation_recommendations()
+
+        self.assertEqual(nrecs, 3)
+        self.assertListEqual(self._stored_recommendations(), expected)
+        self.assertEqual(StaleAffiliationRecommendation.objects.count(), 0)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from sortinghat.core import api
+from sortinghat.core.context import SortingHatContext
+from sortinghat.core.recommendations.bots import recommend_bots
+
+
+class TestRecommendBots(TestCase):
+    """Unit tests for recommend_bots"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        self.dependabot = api.add_identity(ctx,
+                                           source='github',
+                                           email='49699333+dependabot[bot]@users.noreply.github.com',
+                                           name='dependabot[bot]',
+                                           username='dependabot[bot]')
+        self.jenkins = api.add_identity(ctx,
+                                        source='scm',
+                                        email='jenkins@example.com',
+                                        name='Jenkins',
+                                        username='jenkins')
+
+        # Humans with names similar to bots
+        self.jjenkins = api.add_identity(ctx,
+                                         source='scm',
+                                         email='jjenkins@example.com',
+                                         name='John Jenkins',
+                                         username='jjenkins')
+        self.jsmith = api.add_identity(ctx,
+                                       source='github',
+                                       email='1234+jsmith@users.noreply.github.com',
+                                       name='John Smith',
+                                       username='jsmith')
+
+        # Half of the identities of Jane Roe look like a bot
+        self.jroe = api.add_identity(ctx,
+                                     source='scm',
+                                     email='jroe@example.com',
+                                     name='Jane Roe',
+                                     username='jroe')
+        self.jroe_ci = api.add_identity(ctx,
+                                        source='gitlab',
+                                        username='jroe-ci',
+                                        uuid=self.jroe.uuid)
+
+        # Individuals already marked as bots are not recommended
+        release_bot = api.add_identity(ctx,
+                                       source='github',
+                                       username='release-bot')
+        api.update_profile(ctx, release_bot.uuid, is_bot=True)
+
+    def test_recommend_all(self):
+        """Check if the individuals that look like bots are recommended"""
+
+        recs = list(recommend_bots())
+
+        expected = sorted([
+            (self.dependabot.uuid, 1.0),
+            (self.jenkins.uuid, 1.0),
+            (self.jroe.uuid, 0.5)
+        ])
+        self.assertListEqual(recs, expected)
+
+    def test_recommend_uuids(self):
+        """Check if only the given individuals are checked"""
+
+        uuids = [self.jenkins.uuid, self.jjenkins.uuid, self.jroe_ci.uuid, 'FFFFFFFFFFFF']
+        recs = list(recommend_bots(uuids))
+
+        # Identities are returned by the main key of their individual
+        expected = sorted([
+            (self.jenkins.uuid, 1.0),
+            (self.jroe.uuid, 0.5)
+        ])
+        self.assertListEqual(recs, expected)
+
+    def test_min_score(self):
+        """Check if individuals below the minimum score are not recommended"""
+
+        recs = list(recommend_bots(min_score=0.8))
+
+        expected = sorted([
+            (self.dependabot.uuid, 1.0),
+            (self.jenkins.uuid, 1.0)
+        ])
+        self.assertListEqual(recs, expected)
+
+    def test_empty_registry(self):
+        """Check if no recommendations are generated when there are no identities"""
+
+        recs = list(recommend_bots([]))
+        self.assertListEqual(recs, [])
+
+        recs = list(recommend_bots(['FFFFFFFFFFFF']))
+        self.assertListEqual(recs, [])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.test import TestCase
+
+from sortinghat.core.recommendations.clustering import DisjointSet
+
+
+class TestDisjointSet(TestCase):
+    """Unit tests for DisjointSet"""
+
+    def test_initialization(self):
+        """Check if every element is a group when the set is created"""
+
+        dset = DisjointSet(['A', 'B', 'C'])
+
+        self.assertEqual(len(dset), 3)
+        self.assertIn('A', dset)
+        self.assertNotIn('D', dset)
+        self.assertListEqual(dset.groups(), [['A'], ['B'], ['C']])
+
+    def test_add(self):
+        """Check if adding an existing element does not modify its group"""
+
+        dset = DisjointSet()
+        dset.add('A')
+        dset.union('A', 'B')
+        dset.add('B')
+
+        self.assertEqual(len(dset), 2)
+        self.assertListEqual(dset.groups(), [['A', 'B']])
+
+    def test_union(self):
+        """Check if groups are joined transitively"""
+
+        dset = DisjointSet()
+        dset.union('A', 'B')
+        dset.union('C', 'D')
+        dset.union('E', 'F')
+        dset.union('D', 'B')
+        dset.add('G')
+
+        self.assertEqual(dset.find('A'), dset.find('C'))
+        self.assertEqual(dset.find('B'), dset.find('D'))
+        self.assertNotEqual(dset.find('A'), dset.find('E'))
+
+        groups = dset.groups()
+        self.assertListEqual(groups, [['A', 'B', 'C', 'D'],
+                                      ['E', 'F'],
+                                      ['G']])
+
+    def test_union_same_group(self):
+        """Check if joining elements of the same group does not change it"""
+
+        dset = DisjointSet()
+        root = dset.union('A', 'B')
+
+        self.assertEqual(dset.union('B', 'A'), root)
+        self.assertEqual(dset.union('A', 'A'), root)
+        self.assertListEqual(dset.groups(), [['A', 'B']])
+
+    def test_long_chain(self):
+        """Check if a long chain of unions ends in a single group"""
+
+        dset = DisjointSet()
+        for i in range(10000):
+            dset.union(i, i + 1)
+
+        groups = dset.groups()
+        self.assertEqual(len(groups), 1)
+        self.assertListEqual(groups[0], list(range(10001)))
+
+    def test_find_not_found(self):
+        """Check if an error is raised when the element was not added"""
+
+        dset = DisjointSet(['A'])
+
+        with self.assertRaises(KeyError):
+            dset.find('B')
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.test import TestCase
+
+from sortinghat.core.recommendations.domains import DomainTrie
+
+
+class TestDomainTrie(TestCase):
+    """Unit tests for DomainTrie"""
+
+    def setUp(self):
+        """Create a trie with a set of domains"""
+
+        self.trie = DomainTrie()
+        self.trie.add('example.com', 'Example', is_top_domain=True)
+        self.trie.add('u.example.com', 'Example Int.', is_top_domain=True)
+        self.trie.add('es.u.example.com', 'Example Int. ES')
+        self.trie.add('bitergia.com', 'Bitergia')
+
+    def test_find_exact(self):
+        """Check if domains are found by their name"""
+
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(self.trie.find('example.com'), 'Example')
+        self.assertEqual(self.trie.find('u.example.com'), 'Example Int.')
+        self.assertEqual(self.trie.find('es.u.example.com'), 'Example Int. ES')
+        self.assertEqual(self.trie.find('bitergia.com'), 'Bitergia')
+
+    def test_find_top_domain(self):
+        """Check if sub-domains match the deepest top domain"""
+
+        self.assertEqual(self.trie.find('us.example.com'), 'Example')
+        self.assertEqual(self.trie.find('it.u.example.com'), 'Example Int.')
+        self.assertEqual(self.trie.find('a.b.u.example.com'), 'Example Int.')
+
+        # 'es.u.example.com' is not a top domain
+        self.assertEqual(self.trie.find('a.es.u.example.com'), 'Example Int.')
+
+    def test_find_not_top_domain(self):
+        """Check if sub-domains do not match domains that are not top domains"""
+
+        self.assertIsNone(self.trie.find('dev.bitergia.com'))
+
+    def test_find_case_insensitive(self):
+        """Check if domains are compared ignoring their case"""
+
+        self.assertEqual(self.trie.find('Example.COM'), 'Example')
+        self.assertEqual(self.trie.find('IT.U.example.com'), 'Example Int.')
+
+    def test_find_not_found(self):
+        """Check if None is returned when no domain matches"""
+
+        self.assertIsNone(self.trie.find('example.org'))
+        self.assertIsNone(self.trie.find('com'))
+        self.assertIsNone(self.trie.find('example'))
+        self.assertIsNone(DomainTrie().find('example.com'))
+
+    def test_add_existing(self):
+        """Check if adding an existing domain replaces its value"""
+
+        self.trie.add('Bitergia.com', 'Bitergia Int.', is_top_domain=True)
+
+        self.assertEqual(len(self.trie), 4)
+        self.assertEqual(self.trie.find('bitergia.com'), 'Bitergia Int.')
+        self.assertEqual(self.trie.find('dev.bitergia.com'), 'Bitergia Int.')
@@ -19,15 +19,37 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
-from django.test import TestCase
+import datetime
+import os
+import unittest.mock
 
+import django_rq
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from sortinghat.core import api
+from sortinghat.core.context import SortingHatContext
 from sortinghat.core.errors import RecommendationEngineError
+from sortinghat.core.log import TransactionsLog
+from sortinghat.core.models import Operation
 from sortinghat.core.recommendations.engine import RecommendationEngine
 
 
 UNKNOWN_TYPE_ERROR = "Unknown '{}' recommendation type"
 ENGINE_ERROR = "Engine error"
 
+RECOMMENDATIONS_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-recommendations',
+        'TIMEOUT': None
+    }
+}
+
 
 # Mock recommendations
 options = ['A', 'B', 'C']
@@ -46,13 +68,35 @@ def generate_error():
     raise RecommendationEngineError(msg=ENGINE_ERROR)
 
 
+def generate_counted_recommendations(*args, **kwargs):
+    """Generate fake recommendations counting the calls."""
+
+    generate_counted_recommendations.calls += 1
+    yield from generate_recommendations()
+
+
+generate_counted_recommendations.calls = 0
+
+
+def generate_keys_recommendations(keys, suffix=''):
+    """Generate fake recommendations for a list of keys."""
+
+    for key in keys:
+        if key is None:
+            raise RecommendationEngineError(msg=ENGINE_ERROR)
+        yield (key, [key + suffix, os.getpid()])
+
+
 class MockEngine(RecommendationEngine):
     """Mocks RecommendationEngine"""
 
     RECOMMENDATION_TYPES = {
         'mock': generate_recommendations,
-        'error': generate_error
+        'counted': generate_counted_recommendations,
+        'error': generate_error,
+        'keys': generate_keys_recommendations
     }
+    PARALLEL_TYPES = ['keys']
 
 
 class TestRecommendationEngine(TestCase):
@@ -95,4 +139,234 @@ class TestRecommendationEngine(TestCase):
         """Test the list of supported recommendation types"""
 
         types = RecommendationEngine.types()
-        self.assertListEqual(types, ['affiliation', 'matches'])
+        self.assertListEqual(types, ['affiliation', 'bots', 'matches', 'organizations'])
+
+    def test_invalid_workers(self):
+        """Check if an error is raised when the number of workers is invalid"""
+
+        with self.assertRaisesRegex(ValueError, "'workers' must be greater than 0"):
+            RecommendationEngine(workers=0)
+
+        with self.assertRaisesRegex(ValueError, "'chunk_size' must be greater than 0"):
+            RecommendationEngine(chunk_size=0)
+
+    def test_parallel_in_transaction(self):
+        """Check if recommendations are generated by this process inside a transaction"""
+
+        engine = MockEngine(workers=2, chunk_size=2)
+        recs = [rec for rec in engine.recommend('keys', ['A', 'B', 'C'])]
+
+        self.assertListEqual([rec.key for rec in recs], ['A', 'B', 'C'])
+        for rec in recs:
+            self.assertEqual(rec.options[1], os.getpid())
+
+
+class TestRecommendationEngineParallel(SimpleTestCase):
+    """Unit tests for RecommendationEngine using a pool of processes"""
+
+    def test_recommend(self):
+        """Check if recommendations are generated by the pool in order"""
+
+        keys = ['key{}'.format(i) for i in range(25)]
+
+        engine = MockEngine(workers=2, chunk_size=3)
+        recs = [rec for rec in engine.recommend('keys', iter(keys), suffix='-x')]
+
+        self.assertListEqual([rec.key for rec in recs], keys)
+
+        for rec in recs:
+            self.assertEqual(rec.type, 'keys')
+            self.assertEqual(rec.options[0], rec.key + '-x')
+            self.assertNotEqual(rec.options[1], os.getpid())
+
+    def test_recommend_empty(self):
+        """Check if no recommendations are generated when there are no keys"""
+
+        engine = MockEngine(workers=2)
+        recs = [rec for rec in engine.recommend('keys', [])]
+
+        self.assertListEqual(recs, [])
+
+    def test_not_parallel_type(self):
+        """Check if types not listed as parallel are run by this process"""
+
+        engine = MockEngine(workers=2)
+        recs = [rec for rec in engine.recommend('mock')]
+
+        self.assertListEqual([rec.key for rec in recs], [0, 1, 2])
+
+    def test_generator_error(self):
+        """Check if errors raised by the processes are propagated"""
+
+        engine = MockEngine(workers=2, chunk_size=2)
+
+        with self.assertRaisesRegex(RecommendationEngineError,
+                                    ENGINE_ERROR):
+            _ = [rec for rec in engine.recommend('keys', ['A', 'B', None])]
+
+
+@override_settings(CACHES=RECOMMENDATIONS_CACHES)
+class TestRecommendationEngineCache(TestCase):
+    """Unit tests for the cache of RecommendationEngine"""
+
+    def setUp(self):
+        """Initialize the counter of calls and the context"""
+
+        generate_counted_recommendations.calls = 0
+        MockEngine.clear_cache()
+
+        self.conn = django_rq.get_connection()
+        self.conn.flushall()
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+    def tearDown(self):
+        self.conn.flushall()
+
+    def test_cached_recommendations(self):
+        """Check if recommendations are taken from the cache"""
+
+        engine = MockEngine()
+
+        for _ in range(3):
+            recs = [rec for rec in engine.recommend('counted', ['A', 'B'], verbose=True)]
+
+            self.assertEqual(len(recs), 3)
+            for i in range(len(options)):
+                rec = recs[i]
+                self.assertEqual(rec.key, i)
+                self.assertEqual(rec.type, 'counted')
+                self.assertListEqual(rec.options, options[0:i])
+
+        self.assertEqual(generate_counted_recommendations.calls, 1)
+
+    def test_different_arguments(self):
+        """Check if recommendations are generated again for other arguments"""
+
+        engine = MockEngine()
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        _ = [rec for rec in engine.recommend('counted', ['A', 'C'])]
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'], verbose=True)]
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 3)
+
+    def test_registry_modified(self):
+        """Check if the cache is not used after modifying the registry"""
+
+        engine = MockEngine()
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        with self.captureOnCommitCallbacks(execute=True):
+            api.add_organization(self.ctx, 'Example')
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 2)
+
+    def test_registry_modified_back_dated(self):
+        """Check if the cache is not used after committing older changes"""
+
+        engine = MockEngine()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            api.add_organization(self.ctx, 'Example')
+
+        # The transaction started before the last change
+        # is committed after it
+        with self.captureOnCommitCallbacks(execute=True):
+            trxl = TransactionsLog.open('add_organization', self.ctx)
+            trxl.log_operation(op_type=Operation.OpType.ADD, entity_type='organization',
+                               timestamp=datetime.datetime(2000, 1, 1),
+                               args={'name': 'Bitergia'}, target='Bitergia')
+
+            _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+            _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+            self.assertEqual(generate_counted_recommendations.calls, 1)
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 2)
+
+    def test_partial_results_not_cached(self):
+        """Check if recommendations are not cached when they were not consumed"""
+
+        engine = MockEngine()
+
+        recs = engine.recommend('counted', ['A', 'B'])
+        next(recs)
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 2)
+
+    @unittest.mock.patch('sortinghat.core.recommendations.engine.MAX_CACHED_OPTIONS', 2)
+    def test_max_cached_options(self):
+        """Check if large recommendations are not cached"""
+
+        engine = MockEngine()
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        recs = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(len(recs), 3)
+        self.assertEqual(generate_counted_recommendations.calls, 2)
+
+    def test_clear_cache(self):
+        """Check if recommendations are generated again after clearing the cache"""
+
+        engine = MockEngine()
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        MockEngine.clear_cache()
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 2)
+
+    def test_matches_recommendations(self):
+        """Check if cached matches are updated when a new identity is added"""
+
+        jsmith = api.add_identity(self.ctx, 'scm', email='jsmith@example.com')
+        engine = RecommendationEngine()
+
+        recs = list(engine.recommend('matches', [jsmith.uuid], None, ['email']))
+        self.assertListEqual(recs[0].options, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jsmith2 = api.add_identity(self.ctx, 'git', email='jsmith@example.com')
+
+        recs = list(engine.recommend('matches', [jsmith.uuid], None, ['email']))
+        self.assertListEqual(recs[0].options, [jsmith2.uuid])
+
+
+    def test_bots_recommendations(self):
+        """Check if bot recommendations, which options are scores, are cached"""
+
+        api.add_identity(self.ctx, 'github', username='dependabot[bot]')
+        engine = RecommendationEngine()
+
+        recs = list(engine.recommend('bots'))
+        self.assertEqual(len(recs), 1)
+        self.assertEqual(recs[0].options, 1.0)
+
+        with unittest.mock.patch('sortinghat.core.recommendations.bots._score_identities') as mock_score:
+            cached = list(engine.recommend('bots'))
+            mock_score.assert_not_called()
+
+        self.assertListEqual(cached, recs)
+
+class TestRecommendationEngineNoCache(TestCase):
+    """Unit tests for RecommendationEngine when the cache is not set"""
+
+    def test_not_cached(self):
+        """Check if recommendations are always generated"""
+
+        generate_counted_recommendations.calls = 0
+
+        engine = MockEngine()
+
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+        _ = [rec for rec in engine.recommend('counted', ['A', 'B'])]
+
+        self.assertEqual(generate_counted_recommendations.calls, 2)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.test import TestCase
+
+from sortinghat.core.recommendations.fuzzy import (FuzzyNameIndex,
+                                                   jaccard,
+                                                   minhash,
+                                                   normalize_name)
+
+
+THRESHOLD_RANGE_ERROR = r"'threshold' \({}\) is not in range \(0,1\]"
+
+
+class TestFuzzyNameIndex(TestCase):
+    """Unit tests for FuzzyNameIndex"""
+
+    def test_search(self):
+        """Check if similar names are found"""
+
+        index = FuzzyNameIndex(threshold=0.6)
+        index.add('John Smith', 'A')
+        index.add('John Smith Doe', 'B')
+        index.add('Jane Rae', 'C')
+        index.add('jsmith', 'D')
+
+        self.assertEqual(len(index), 4)
+        self.assertSetEqual(index.search('John Smith'), {'A', 'B'})
+        self.assertSetEqual(index.search('Smith, John'), {'A', 'B'})
+        self.assertSetEqual(index.search('Jöhn  SMITH'), {'A', 'B'})
+        self.assertSetEqual(index.search('John A. Smith'), {'A', 'B'})
+        self.assertSetEqual(index.search('Jane Rae Doe'), {'C'})
+        self.assertSetEqual(index.search('Jane Doe'), set())
+
+    def test_search_keys(self):
+        """Check if all the keys of a name are returned"""
+
+        index = FuzzyNameIndex()
+        index.add('John Smith', 'A')
+        index.add('john smith', 'B')
+        index.add('Smith John', 'C')
+
+        self.assertEqual(len(index), 1)
+        self.assertSetEqual(index.search('John Smith'), {'A', 'B', 'C'})
+
+    def test_threshold(self):
+        """Check if the threshold sets the minimum similarity"""
+
+        index = FuzzyNameIndex(threshold=1.0)
+        index.add('John Smith', 'A')
+        index.add('John A. Smith', 'B')
+
+        self.assertSetEqual(index.search('John Smith'), {'A'})
+
+        index = FuzzyNameIndex(threshold=0.3)
+        index.add('John Smith', 'A')
+        index.add('J. Smith', 'B')
+
+        self.assertSetEqual(index.search('John Smith'), {'A', 'B'})
+
+    def test_empty_names(self):
+        """Check if names without words are ignored"""
+
+        index = FuzzyNameIndex()
+        index.add('...', 'A')
+
+        self.assertEqual(len(index), 0)
+        self.assertSetEqual(index.search('...'), set())
+
+    def test_invalid_threshold(self):
+        """Check if an error is raised when the threshold is out of range"""
+
+        for threshold in [0, -0.5, 1.5]:
+            with self.assertRaisesRegex(ValueError,
+                                        THRESHOLD_RANGE_ERROR.format(threshold)):
+                FuzzyNameIndex(threshold=threshold)
+
+
+class TestNormalizeName(TestCase):
+    """Unit tests for normalize_name"""
+
+    def test_normalize(self):
+        """Check if accents, case, punctuation and word order are removed"""
+
+        self.assertEqual(normalize_name('John Smith'), 'john smith')
+        self.assertEqual(normalize_name('Smith, John'), 'john smith')
+        self.assertEqual(normalize_name('Jöhn   SMÍTH'), 'john smith')
+        self.assertEqual(normalize_name('J. Smith'), 'j smith')
+        self.assertEqual(normalize_name('...'), '')
+
+
+class TestMinHash(TestCase):
+    """Unit tests for minhash and jaccard"""
+
+    def test_jaccard(self):
+        """Check the Jaccard index of two sets"""
+
+        self.assertEqual(jaccard({'a', 'b'}, {'a', 'b'}), 1.0)
+        self.assertEqual(jaccard({'a', 'b'}, {'b', 'c'}), 1 / 3)
+        self.assertEqual(jaccard({'a'}, {'b'}), 0.0)
+        self.assertEqual(jaccard(set(), set()), 1.0)
+
+    def test_minhash(self):
+        """Check if signatures are deterministic and estimate the similarity"""
+
+        sig_a = minhash({'abc', 'bcd', 'cde', 'def'})
+        sig_b = minhash({'def', 'cde', 'bcd', 'abc'})
+        sig_c = minhash({'xyz', 'yzw'})
+
+        self.assertListEqual(sig_a.tolist(), sig_b.tolist())
+        self.assertLess((sig_a == sig_c).mean(), 0.2)
@@ -20,12 +20,17 @@
 #     Miguel Ángel Fernández <mafesan@bitergia.com>
 #
 
+import unittest.mock
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
 from sortinghat.core import api
 from sortinghat.core.context import SortingHatContext
-from sortinghat.core.recommendations.matching import recommend_matches
+from sortinghat.core.models import Identity, MatchingBlacklist
+from sortinghat.core.recommendations.matching import (recommend_matches,
+                                                      recommend_blacklist,
+                                                      _stream_identities)
 
 
 class TestRecommendMatches(TestCase):
@@ -180,6 +185,221 @@ class TestRecommendMatches(TestCase):
         self.assertEqual(len(result), 3)
         self.assertDictEqual(result, expected)
 
+    def test_recommend_matches_empty_target(self):
+        """Check if recommendations are obtained against the whole registry when no targets are given"""
+
+        # Test
+        expected = {
+            self.john_smith.uuid: [self.jsmith.uuid],
+            self.jrae3.uuid: sorted([self.jrae.uuid,
+                                     self.jane_rae.uuid])
+        }
+
+        source_uuids = [self.john_smith.uuid, self.jrae3.uuid]
+        criteria = ['email', 'name', 'username']
+
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      criteria))
+
+        # Preserve results order for the comparison against the expected results
+        result = {}
+        for key in recs:
+            result[key] = sorted(recs[key])
+
+        self.assertEqual(len(result), 2)
+        self.assertDictEqual(result, expected)
+
+    def test_recommend_matches_fuzzy_name(self):
+        """Check if recommendations are obtained comparing similar names"""
+
+        source_uuids = [self.john_smith.uuid]
+        criteria = ['fuzzy_name']
+
+        # Same names are found with the default threshold
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      criteria))
+
+        expected = {
+            self.john_smith.uuid: [self.jsmith.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+        # 'J. Smith' and 'Smith. J' are similar enough with a lower threshold
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      criteria,
+                                      fuzzy_threshold=0.4))
+
+        expected = {
+            self.john_smith.uuid: sorted([self.jsmith.uuid,
+                                          self.js_alt.uuid])
+        }
+        self.assertDictEqual({k: sorted(v) for k, v in recs.items()}, expected)
+
+    def test_recommend_matches_fuzzy_name_verbose(self):
+        """Check if fuzzy recommendations are obtained at identity level"""
+
+        source_uuids = [self.jrae.uuid]
+        target_uuids = [self.jane_rae.uuid]
+        criteria = ['fuzzy_name']
+
+        # 'Jane Rae Doe' and 'Janer Rae' are not similar enough
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      criteria,
+                                      verbose=True))
+
+        expected = {
+            self.jrae.uuid: [self.jr2.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+    def test_recommend_matches_compound_criteria(self):
+        """Check if compound criteria only match when all their fields match"""
+
+        source_uuids = [self.john_smith.uuid, self.jsmith.uuid]
+        target_uuids = [self.john_smith.uuid, self.js2.uuid, self.js3.uuid,
+                        self.jsmith.uuid, self.jsm2.uuid, self.jsm3.uuid,
+                        self.js_alt.uuid, self.js_alt2.uuid,
+                        self.js_alt3.uuid, self.js_alt4.uuid]
+
+        # 'John Smith' is used in 'scm' and 'alt' sources
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      [['name', 'source']]))
+
+        expected = {
+            self.john_smith.uuid: [],
+            self.jsmith.uuid: []
+        }
+        self.assertDictEqual(recs, expected)
+
+        # Only 'J. Smith' identities have the same name and username
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      [['name', 'username']]))
+
+        expected = {
+            self.john_smith.uuid: [],
+            self.jsmith.uuid: [self.js_alt.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+        # Compound and simple criteria can be mixed
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      [['name', 'username', 'source'], 'email']))
+
+        expected = {
+            self.john_smith.uuid: [self.jsmith.uuid],
+            self.jsmith.uuid: [self.john_smith.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+    def test_recommend_matches_compound_criteria_empty_target(self):
+        """Check if compound criteria are looked up on the whole registry"""
+
+        source_uuids = [self.jsmith.uuid, self.jrae.uuid]
+
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      [['username', 'name'], ['name', 'source']]))
+
+        expected = {
+            self.jsmith.uuid: [self.js_alt.uuid],
+            self.jrae.uuid: [self.jane_rae.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+    def test_recommend_matches_compound_criteria_verbose(self):
+        """Check if compound criteria matches are obtained at identity level"""
+
+        source_uuids = [self.jrae.uuid]
+
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      [['name', 'source'], ['email']],
+                                      verbose=True))
+
+        expected = {
+            self.jrae.uuid: [self.jr2.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+    def test_recommend_matches_blacklist(self):
+        """Check if blacklisted values are not used to find matches"""
+
+        MatchingBlacklist.objects.create(excluded='john smith')
+
+        source_uuids = [self.john_smith.uuid]
+        target_uuids = [self.jsmith.uuid, self.jane_rae.uuid]
+
+        # Identities still match by email
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      ['email', 'name']))
+
+        expected = {
+            self.john_smith.uuid: [self.jsmith.uuid]
+        }
+        self.assertDictEqual(recs, expected)
+
+        # Names are compared ignoring case
+        recs = dict(recommend_matches(source_uuids,
+                                      target_uuids,
+                                      ['name']))
+
+        expected = {
+            self.john_smith.uuid: []
+        }
+        self.assertDictEqual(recs, expected)
+
+        # Blacklisted emails are not matched either
+        MatchingBlacklist.objects.create(excluded='jsmith@example.com')
+
+        recs = dict(recommend_matches(source_uuids,
+                                      None,
+                                      ['email', 'name']))
+        self.assertDictEqual(recs, expected)
+
+    def test_recommend_matches_blacklist_fuzzy_name(self):
+        """Check if blacklisted names are not compared by similarity"""
+
+        MatchingBlacklist.objects.create(excluded='John Smith')
+
+        recs = dict(recommend_matches([self.john_smith.uuid],
+                                      None,
+                                      ['fuzzy_name']))
+
+        expected = {
+            self.john_smith.uuid: []
+        }
+        self.assertDictEqual(recs, expected)
+
+    @unittest.mock.patch('sortinghat.core.recommendations.matching.MAX_PARTITION_SIZE', 2)
+    def test_recommend_matches_workers(self):
+        """Check if the results are the same when several processes are used"""
+
+        source_uuids = [self.john_smith.uuid, self.jrae3.uuid, self.jr2.uuid,
+                        self.js_alt.uuid]
+
+        for criteria in [['email', 'name', 'username'],
+                         ['email', 'fuzzy_name']]:
+            for verbose in [False, True]:
+                expected = dict(recommend_matches(source_uuids, None, criteria,
+                                                  verbose=verbose,
+                                                  fuzzy_threshold=0.4))
+                recs = dict(recommend_matches(source_uuids, None, criteria,
+                                              verbose=verbose,
+                                              fuzzy_threshold=0.4,
+                                              workers=3))
+
+                self.assertEqual(len(recs), 4)
+                for uuid in source_uuids:
+                    self.assertListEqual(sorted(recs[uuid]), sorted(expected[uuid]))
+
     def test_recommend_source_not_mk(self):
         """Check if recommendations work when the provided uuid is not an Individual's main key"""
 
@@ -236,3 +456,112 @@ class TestRecommendMatches(TestCase):
                                       criteria))
 
         self.assertDictEqual(recs, expected)
+
+
+class TestRecommendBlacklist(TestCase):
+    """Unit tests for recommend_blacklist"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(self.ctx, name='John Smith',
+                                  username='jsmith', source='scm')
+        api.add_identity(self.ctx, name='John Smith',
+                         username='root', source='git')
+        api.add_identity(self.ctx, name='John Smith',
+                         username='root', source='mls',
+                         uuid=jsmith.uuid)
+        api.add_identity(self.ctx, name='Jane Rae',
+                         username='root', source='mls')
+        api.add_identity(self.ctx, name='Jane Rae',
+                         username='jrae', source='scm')
+        api.add_identity(self.ctx, name='unknown',
+                         email='unknown', source='scm')
+
+    def test_recommend_blacklist(self):
+        """Check if the most frequent values are recommended"""
+
+        recs = list(recommend_blacklist(['name', 'username'],
+                                        min_frequency=3))
+
+        expected = [
+            ('name', 'John Smith', 3),
+            ('username', 'root', 3)
+        ]
+        self.assertListEqual(recs, expected)
+
+        recs = list(recommend_blacklist(['name'],
+                                        min_frequency=2))
+
+        expected = [
+            ('name', 'John Smith', 3),
+            ('name', 'Jane Rae', 2)
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_blacklisted_values(self):
+        """Check if values already in the blacklist are not recommended"""
+
+        MatchingBlacklist.objects.create(excluded='ROOT')
+
+        recs = list(recommend_blacklist(['name', 'username'],
+                                        min_frequency=3))
+
+        expected = [
+            ('name', 'John Smith', 3)
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_no_recommendations(self):
+        """Check if nothing is recommended when no value is frequent enough"""
+
+        recs = list(recommend_blacklist(['email', 'name', 'username'],
+                                        min_frequency=4))
+        self.assertListEqual(recs, [])
+
+
+class TestStreamIdentities(TestCase):
+    """Unit tests for _stream_identities"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        self.uuids = sorted([
+            api.add_identity(self.ctx, name=name, source='scm').uuid
+            for name in ['John Smith', 'Jane Rae', 'John Doe',
+                         'Jane Doe', 'Jonh Smith']
+        ])
+
+    def test_stream(self):
+        """Check if every identity is streamed in chunks"""
+
+        fields = ['uuid', 'individual', 'name']
+
+        for chunk_size in [1, 2, 5, 10]:
+            rows = list(_stream_identities(Identity.objects.all(), fields,
+                                           chunk_size=chunk_size))
+            self.assertListEqual([row[0] for row in rows], self.uuids)
+            self.assertEqual(len(rows[0]), 3)
+
+    def test_stream_filtered(self):
+        """Check if the filters of the queryset are kept between chunks"""
+
+        queryset = Identity.objects.filter(name__startswith='Jane')
+        rows = list(_stream_identities(queryset, ['uuid', 'name'], chunk_size=1))
+
+        names = sorted(row[1] for row in rows)
+        self.assertListEqual(names, ['Jane Doe', 'Jane Rae'])
+
+    def test_stream_empty(self):
+        """Check if nothing is streamed when the queryset is empty"""
+
+        queryset = Identity.objects.filter(name='Unknown')
+        rows = list(_stream_identities(queryset, ['uuid'], chunk_size=2))
+
+        self.assertListEqual(rows, [])
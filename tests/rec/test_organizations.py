@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from sortinghat.core import api
+from sortinghat.core.context import SortingHatContext
+from sortinghat.core.recommendations.organizations import (normalize_organization_name,
+                                                           recommend_organizations)
+
+
+class TestRecommendOrganizations(TestCase):
+    """Unit tests for recommend_organizations"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example Inc')
+        api.add_organization(ctx, 'Example, Inc.')
+        api.add_organization(ctx, 'example')
+        api.add_organization(ctx, 'Bitergia')
+        api.add_organization(ctx, 'Bitergia S.L.')
+        api.add_organization(ctx, 'LibreSoft')
+        api.add_organization(ctx, 'LibreSoft Lab')
+
+        # 'Example Inc' has more enrollments, so it is the canonical one
+        jsmith = api.add_identity(ctx, 'scm', email='jsmith@example.com')
+        api.enroll(ctx, jsmith.uuid, 'Example Inc')
+
+    def test_recommend(self):
+        """Check if duplicate organizations are recommended"""
+
+        recs = list(recommend_organizations())
+
+        expected = [
+            ('Bitergia', ['Bitergia S.L.']),
+            ('Example Inc', ['Example, Inc.', 'example'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_recommend_names(self):
+        """Check if only the groups of the given organizations are recommended"""
+
+        recs = list(recommend_organizations(['example', 'LibreSoft']))
+
+        expected = [
+            ('Example Inc', ['Example, Inc.', 'example'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_domain_evidence(self):
+        """Check if organizations with similar domains need less similar names"""
+
+        ctx = SortingHatContext(self.user)
+
+        recs = list(recommend_organizations(['LibreSoft']))
+        self.assertListEqual(recs, [])
+
+        api.add_domain(ctx, 'LibreSoft', 'libresoft.es')
+        api.add_domain(ctx, 'LibreSoft Lab', 'libresoft.org')
+
+        recs = list(recommend_organizations(['LibreSoft']))
+
+        expected = [
+            ('LibreSoft', ['LibreSoft Lab'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_domain_suffix_evidence(self):
+        """Check if domains that are suffixes of other domains are evidence"""
+
+        ctx = SortingHatContext(self.user)
+
+        api.add_domain(ctx, 'LibreSoft', 'libresoft.es')
+        api.add_domain(ctx, 'LibreSoft Lab', 'lab.libresoft.es')
+
+        recs = list(recommend_organizations(['LibreSoft']))
+
+        expected = [
+            ('LibreSoft', ['LibreSoft Lab'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_chained_names(self):
+        """Check if organizations are not grouped through a chain of similar names"""
+
+        ctx = SortingHatContext(self.user)
+
+        # A is similar to B and B to C, but A is not similar to C
+        api.add_organization(ctx, 'Mozilla Foundation')
+        api.add_organization(ctx, 'Mozilla Foundations')
+        api.add_organization(ctx, 'Mozila Foundations')
+
+        recs = list(recommend_organizations(['Mozilla Foundations'], threshold=0.75))
+
+        expected = [
+            ('Mozila Foundations', ['Mozilla Foundations'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_threshold(self):
+        """Check if the threshold controls which names are similar"""
+
+        recs = list(recommend_organizations(['LibreSoft'], threshold=0.6))
+
+        expected = [
+            ('LibreSoft', ['LibreSoft Lab'])
+        ]
+        self.assertListEqual(recs, expected)
+
+    def test_invalid_threshold(self):
+        """Check if an error is raised when the threshold is out of range"""
+
+        with self.assertRaises(ValueError):
+            list(recommend_organizations(threshold=0))
+
+    def test_normalize_organization_name(self):
+        """Check if legal forms and punctuation are removed"""
+
+        self.assertEqual(normalize_organization_name('Example, Inc.'), 'example')
+        self.assertEqual(normalize_organization_name('Bitergia S.L.'), 'bitergia')
+        self.assertEqual(normalize_organization_name('Ltd. Inc.'), 'inc ltd')
+        self.assertEqual(normalize_organization_name('Café Company GmbH'), 'cafe')
@@ -23,11 +23,15 @@
 import datetime
 import json
 
+import django_rq
+
 from dateutil.tz import UTC
 
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from grimoirelab_toolkit.datetime import datetime_utcnow, datetime_to_utc
 
@@ -53,6 +57,7 @@ ENROLLMENT_RANGE_INVALID = "range date '{start}'-'{end}' is part of an existing
 ALREADY_EXISTS_ERROR = "{entity} already exists in the registry"
 SOURCE_NONE_OR_EMPTY_ERROR = "'source' cannot be"
 IDENTITY_NONE_OR_EMPTY_ERROR = "identity data cannot be empty"
+IF_EXISTS_INVALID_ERROR = "'if_exists' must be 'error' or 'return'; update given"
 UUID_NONE_OR_EMPTY_ERROR = "'uuid' cannot be"
 UUID_LOCKED_ERROR = "Individual {uuid} is locked"
 UUIDS_NONE_OR_EMPTY_ERROR = "'uuids' cannot be"
@@ -83,6 +88,9 @@ DOMAIN_NOT_FOUND_ERROR = "{domain_name} not found in the registry"
 DOMAIN_ALREADY_EXISTS_ERROR = "'{domain_name}' already exists in the registry"
 DOMAIN_VALUE_ERROR = "field value must be a string; int given"
 DOMAIN_ORG_NAME_NONE_OR_EMPTY_ERROR = "'org_name' cannot be"
+FROM_ORG_NONE_OR_EMPTY_ERROR = "'from_org' cannot be"
+TO_ORG_NONE_OR_EMPTY_ERROR = "'to_org' cannot be"
+FROM_ORG_TO_ORG_EQUAL_ERROR = "'to_org' {to_org} cannot be equal to 'from_org'"
 
 
 class TestUUID(TestCase):
@@ -581,6 +589,62 @@ class TestAddIdentity(TestCase):
         transactions = Transaction.objects.filter(created_at__gt=trx_date)
         self.assertEqual(len(transactions), 0)
 
+    def test_existing_identity_return(self):
+        """Check if the stored identity is returned when it already exists"""
+
+        jsmith = api.add_identity(self.ctx, 'scm', email='jsmith@example.com')
+        api.add_identity(self.ctx, 'git', email='jsmith@example.com', uuid=jsmith.uuid)
+
+        individual = Individual.objects.get(mk=jsmith.uuid)
+        before_dt = individual.last_modified
+
+        trx_date = datetime_utcnow()  # After this datetime no transactions should be created
+
+        with CaptureQueriesContext(connection) as queries:
+            identity = api.add_identity(self.ctx, 'scm', email='JSMITH@example.com',
+                                        if_exists='return')
+
+        self.assertIsInstance(identity, Identity)
+        self.assertEqual(identity.uuid, jsmith.uuid)
+        self.assertEqual(identity.email, 'jsmith@example.com')
+        self.assertEqual(identity.individual.mk, jsmith.uuid)
+
+        # Only the identity was looked up
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('SELECT')]), 1)
+
+        # The individual was not modified
+        individual = Individual.objects.get(mk=jsmith.uuid)
+        self.assertEqual(individual.last_modified, before_dt)
+        self.assertEqual(len(individual.identities.all()), 2)
+
+        # Check if there are no transactions created
+        transactions = Transaction.objects.filter(created_at__gt=trx_date)
+        self.assertEqual(len(transactions), 0)
+
+    def test_new_identity_return(self):
+        """Check if a new identity is added when it does not exist and mode is 'return'"""
+
+        identity = api.add_identity(self.ctx, 'scm', email='jsmith@example.com',
+                                    if_exists='return')
+
+        self.assertEqual(identity.uuid, '334da68fcd3da4e799791f73dfada2afb22648c6')
+
+        individual = Individual.objects.get(mk=identity.uuid)
+        self.assertEqual(len(individual.identities.all()), 1)
+
+        transactions = Transaction.objects.filter(name='add_identity')
+        self.assertEqual(len(transactions), 1)
+
+    def test_if_exists_invalid(self):
+        """Check if it fails when the value of 'if_exists' is not valid"""
+
+        with self.assertRaisesRegex(InvalidValueError, IF_EXISTS_INVALID_ERROR):
+            api.add_identity(self.ctx, 'scm', email='jsmith@example.com',
+                             if_exists='update')
+
+        identities = Identity.objects.all()
+        self.assertEqual(len(identities), 0)
+
     def test_utf8_4bytes_identities(self):
         """Check if it inserts identities with 4bytes UTF-8 characters"""
 
@@ -2515,6 +2579,217 @@ class TestDeleteOrganization(TestCase):
         self.assertEqual(op1_args['organization'], 'Example')
 
 
+class TestMergeOrganizations(TestCase):
+    """Unit tests for merge_organizations"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        self.conn = django_rq.get_connection()
+        self.conn.flushall()
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        # Run the updates of the dataset, so each test
+        # only captures the updates of its own writes
+        with self.captureOnCommitCallbacks(execute=True):
+            api.add_organization(self.ctx, name='Example')
+            api.add_organization(self.ctx, name='Example Inc.')
+            api.add_organization(self.ctx, name='Bitergia')
+
+            api.add_domain(self.ctx, 'Example', 'example.com')
+            api.add_domain(self.ctx, 'Example Inc.', 'example.org')
+            api.add_domain(self.ctx, 'Example Inc.', 'example.net')
+
+            # John Smith is enrolled in both organizations
+            self.jsmith = api.add_identity(self.ctx, 'scm', email='jsmith@example.com')
+            api.enroll(self.ctx, self.jsmith.uuid, 'Example',
+                       from_date=datetime.datetime(1999, 6, 1),
+                       to_date=datetime.datetime(2001, 1, 1))
+            api.enroll(self.ctx, self.jsmith.uuid, 'Example Inc.',
+                       from_date=datetime.datetime(1999, 1, 1),
+                       to_date=datetime.datetime(2000, 1, 1))
+
+            self.jdoe = api.add_identity(self.ctx, 'scm', email='jdoe@example.org')
+            api.enroll(self.ctx, self.jdoe.uuid, 'Example Inc.',
+                       from_date=datetime.datetime(2010, 1, 1),
+                       to_date=datetime.datetime(2011, 1, 1))
+            api.enroll(self.ctx, self.jdoe.uuid, 'Bitergia')
+
+            self.jroe = api.add_identity(self.ctx, 'scm', email='jroe@example.net')
+
+    def tearDown(self):
+        self.conn.flushall()
+
+    def test_merge_organizations(self):
+        """Check if domains and enrollments are moved to the organization"""
+
+        org = api.merge_organizations(self.ctx, 'Example Inc.', 'Example')
+
+        self.assertIsInstance(org, Organization)
+        self.assertEqual(org.name, 'Example')
+
+        with self.assertRaises(ObjectDoesNotExist):
+            Organization.objects.get(name='Example Inc.')
+
+        # Domains were moved
+        domains = Domain.objects.filter(organization__name='Example').order_by('domain')
+        self.assertListEqual([domain.domain for domain in domains],
+                             ['example.com', 'example.net', 'example.org'])
+
+        # Enrollments of John Smith were merged
+        enrollments = Enrollment.objects.filter(individual=self.jsmith.individual)
+        self.assertEqual(len(enrollments), 1)
+
+        enrollment = enrollments[0]
+        self.assertEqual(enrollment.organization.name, 'Example')
+        self.assertEqual(enrollment.start, datetime.datetime(1999, 1, 1, tzinfo=UTC))
+        self.assertEqual(enrollment.end, datetime.datetime(2001, 1, 1, tzinfo=UTC))
+
+        # Enrollments of John Doe were moved
+        enrollments = Enrollment.objects.filter(individual=self.jdoe.individual)\
+            .order_by('organization__name')
+        self.assertEqual(len(enrollments), 2)
+
+        enrollment = enrollments[0]
+        self.assertEqual(enrollment.organization.name, 'Bitergia')
+
+        enrollment = enrollments[1]
+        self.assertEqual(enrollment.organization.name, 'Example')
+        self.assertEqual(enrollment.start, datetime.datetime(2010, 1, 1, tzinfo=UTC))
+        self.assertEqual(enrollment.end, datetime.datetime(2011, 1, 1, tzinfo=UTC))
+
+    def test_affiliation_recommendations(self):
+        """Check if affiliation recommendations are updated"""
+
+        # Updates are enqueued once the transaction is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            api.merge_organizations(self.ctx, 'Example Inc.', 'Example')
+
+        individual = Individual.objects.get(mk=self.jroe.uuid)
+        recs = individual.affiliation_recommendations.all()
+        self.assertListEqual([rec.organization.name for rec in recs], ['Example'])
+
+    def test_locked_individual(self):
+        """Check if it fails when an individual enrolled in the organization is locked"""
+
+        api.lock(self.ctx, self.jdoe.uuid)
+
+        with self.assertRaisesRegex(LockedIdentityError,
+                                    UUID_LOCKED_ERROR.format(uuid=self.jdoe.uuid)):
+            api.merge_organizations(self.ctx, 'Example Inc.', 'Example')
+
+        # Nothing was modified
+        org = Organization.objects.get(name='Example Inc.')
+        self.assertEqual(org.domains.count(), 2)
+        self.assertEqual(org.enrollments.count(), 2)
+
+    def test_non_existing_organization(self):
+        """Check if it fails when any of the organizations does not exist"""
+
+        trx_date = datetime_utcnow()  # After this datetime no transactions should be created
+
+        with self.assertRaisesRegex(NotFoundError, ORGANIZATION_NOT_FOUND_ERROR.format(name='Ghost')):
+            api.merge_organizations(self.ctx, 'Ghost', 'Example')
+
+        with self.assertRaisesRegex(NotFoundError, ORGANIZATION_NOT_FOUND_ERROR.format(name='Ghost')):
+            api.merge_organizations(self.ctx, 'Example Inc.', 'Ghost')
+
+        # Check if there are no transactions created when there is an error
+        transactions = Transaction.objects.filter(created_at__gt=trx_date)
+        self.assertEqual(len(transactions), 0)
+
+    def test_equal_organizations(self):
+        """Check if it fails when both organizations are the same"""
+
+        with self.assertRaisesRegex(InvalidValueError,
+                                    FROM_ORG_TO_ORG_EQUAL_ERROR.format(to_org='Example')):
+            api.merge_organizations(self.ctx, 'Example', 'Example')
+
+    def test_organization_name_none_or_empty(self):
+        """Check if it fails when any of the names is `None` or empty"""
+
+        trx_date = datetime_utcnow()  # After this datetime no transactions should be created
+
+        with self.assertRaisesRegex(InvalidValueError, FROM_ORG_NONE_OR_EMPTY_ERROR):
+            api.merge_organizations(self.ctx, None, 'Example')
+
+        with self.assertRaisesRegex(InvalidValueError, FROM_ORG_NONE_OR_EMPTY_ERROR):
+            api.merge_organizations(self.ctx, '', 'Example')
+
+        with self.assertRaisesRegex(InvalidValueError, TO_ORG_NONE_OR_EMPTY_ERROR):
+            api.merge_organizations(self.ctx, 'Example Inc.', None)
+
+        with self.assertRaisesRegex(InvalidValueError, TO_ORG_NONE_OR_EMPTY_ERROR):
+            api.merge_organizations(self.ctx, 'Example Inc.', '')
+
+        # Check if there are no transactions created when there is an error
+        transactions = Transaction.objects.filter(created_at__gt=trx_date)
+        self.assertEqual(len(transactions), 0)
+
+    def test_transaction(self):
+        """Check if a transaction is created when merging organizations"""
+
+        timestamp = datetime_utcnow()
+
+        api.merge_organizations(self.ctx, 'Example Inc.', 'Example')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 1)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'merge_organizations')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, self.ctx.user.username)
+
+    def test_operations(self):
+        """Check if the right operations are created when merging organizations"""
+
+        timestamp = datetime_utcnow()
+
+        api.merge_organizations(self.ctx, 'Example Inc.', 'Example')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        trx = transactions[0]
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 10)
+
+        # Two domains and three enrollments were removed; the two
+        # domains and two merged enrollments were added to 'Example'
+        ops = [(op.op_type, op.entity_type, op.target) for op in operations[:9]]
+        self.assertListEqual(ops[:4], [
+            (Operation.OpType.DELETE.value, 'domain', 'example.net'),
+            (Operation.OpType.ADD.value, 'domain', 'Example'),
+            (Operation.OpType.DELETE.value, 'domain', 'example.org'),
+            (Operation.OpType.ADD.value, 'domain', 'Example')
+        ])
+
+        deleted = [target for op_type, entity_type, target in ops[4:]
+                   if op_type == Operation.OpType.DELETE.value and entity_type == 'enrollment']
+        self.assertListEqual(sorted(deleted),
+                             sorted([self.jsmith.uuid, self.jsmith.uuid, self.jdoe.uuid]))
+
+        added = [target for op_type, entity_type, target in ops[4:]
+                 if op_type == Operation.OpType.ADD.value and entity_type == 'enrollment']
+        self.assertListEqual(sorted(added), sorted([self.jsmith.uuid, self.jdoe.uuid]))
+
+        op1 = operations[9]
+        self.assertIsInstance(op1, Operation)
+        self.assertEqual(op1.op_type, Operation.OpType.UPDATE.value)
+        self.assertEqual(op1.entity_type, 'organization')
+        self.assertEqual(op1.target, 'Example')
+        self.assertEqual(op1.trx, trx)
+        self.assertGreater(op1.timestamp, timestamp)
+
+        op1_args = json.loads(op1.args)
+        self.assertEqual(len(op1_args), 2)
+        self.assertEqual(op1_args['from_org'], 'Example Inc.')
+        self.assertEqual(op1_args['to_org'], 'Example')
+
+
 class TestDeleteDomain(TestCase):
     """Unit tests for delete_domain"""
 
@@ -3312,6 +3587,221 @@ class TestEnroll(TestCase):
         self.assertEqual(op1_args['end'], str(datetime_to_utc(datetime.datetime(2000, 1, 1))))
 
 
+class TestEnrollMany(TestCase):
+    """Unit tests for enroll_many"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        api.add_organization(self.ctx, 'Example')
+        api.add_organization(self.ctx, 'Bitergia')
+        api.add_organization(self.ctx, 'LibreSoft')
+
+        self.jsmith = api.add_identity(self.ctx, 'scm', email='jsmith@example')
+        self.jsmith_alt = api.add_identity(self.ctx, 'git', email='jsmith@example',
+                                           uuid=self.jsmith.uuid)
+        api.enroll(self.ctx, self.jsmith.uuid, 'Example',
+                   from_date=datetime.datetime(2010, 1, 1),
+                   to_date=datetime.datetime(2015, 1, 1))
+        api.enroll(self.ctx, self.jsmith.uuid, 'Bitergia',
+                   from_date=datetime.datetime(2000, 1, 1),
+                   to_date=datetime.datetime(2005, 1, 1))
+
+        self.jdoe = api.add_identity(self.ctx, 'scm', email='jdoe@example')
+
+        self.jroe = api.add_identity(self.ctx, 'scm', email='jroe@example')
+        api.lock(self.ctx, self.jroe.uuid)
+
+    def test_enroll_many(self):
+        """Check whether it enrolls several individuals at once"""
+
+        enrollments = [
+            (self.jsmith_alt.uuid, 'Example',
+             datetime.datetime(2014, 1, 1), datetime.datetime(2017, 1, 1)),
+            (self.jsmith.uuid, 'Example',
+             datetime.datetime(2016, 1, 1), datetime.datetime(2018, 1, 1)),
+            (self.jsmith.uuid, 'LibreSoft', None, None),
+            (self.jdoe.uuid, 'Bitergia',
+             datetime.datetime(2001, 1, 1), None)
+        ]
+
+        enrolled, errors = api.enroll_many(self.ctx, enrollments)
+
+        self.assertEqual(len(enrolled), 4)
+        self.assertListEqual([(uuid, org) for uuid, org, _, _ in enrolled],
+                             [(uuid, org) for uuid, org, _, _ in enrollments])
+        self.assertListEqual(errors, [])
+
+        # Periods of the same individual and organization are merged
+        individual = Individual.objects.get(mk=self.jsmith.uuid)
+        enrollments_db = individual.enrollments.order_by('organization__name', 'start')
+        self.assertEqual(len(enrollments_db), 3)
+
+        rol = enrollments_db[0]
+        self.assertEqual(rol.organization.name, 'Bitergia')
+        self.assertEqual(rol.start, datetime.datetime(2000, 1, 1, tzinfo=UTC))
+        self.assertEqual(rol.end, datetime.datetime(2005, 1, 1, tzinfo=UTC))
+
+        rol = enrollments_db[1]
+        self.assertEqual(rol.organization.name, 'Example')
+        self.assertEqual(rol.start, datetime.datetime(2010, 1, 1, tzinfo=UTC))
+        self.assertEqual(rol.end, datetime.datetime(2018, 1, 1, tzinfo=UTC))
+
+        rol = enrollments_db[2]
+        self.assertEqual(rol.organization.name, 'LibreSoft')
+        self.assertEqual(rol.start, datetime.datetime(1900, 1, 1, tzinfo=UTC))
+        self.assertEqual(rol.end, datetime.datetime(2100, 1, 1, tzinfo=UTC))
+
+        individual = Individual.objects.get(mk=self.jdoe.uuid)
+        enrollments_db = individual.enrollments.all()
+        self.assertEqual(len(enrollments_db), 1)
+
+        rol = enrollments_db[0]
+        self.assertEqual(rol.organization.name, 'Bitergia')
+        self.assertEqual(rol.start, datetime.datetime(2001, 1, 1, tzinfo=UTC))
+        self.assertEqual(rol.end, datetime.datetime(2100, 1, 1, tzinfo=UTC))
+
+    def test_enrollment_errors(self):
+        """Check if invalid enrollments are not applied while the rest are"""
+
+        enrollments = [
+            ('FFFFFFFFFFFFFFF', 'Example', None, None),
+            (self.jdoe.uuid, 'Unknown', None, None),
+            (self.jdoe.uuid, 'Example', None, None),
+            (None, 'Example', None, None),
+            (self.jdoe.uuid, '', None, None),
+            (self.jsmith.uuid, 'Example',
+             datetime.datetime(2011, 1, 1), datetime.datetime(2012, 1, 1)),
+            (self.jdoe.uuid, 'Bitergia',
+             datetime.datetime(2005, 1, 1), datetime.datetime(2001, 1, 1)),
+            (self.jdoe.uuid, 'Example',
+             datetime.datetime(2001, 1, 1), datetime.datetime(2002, 1, 1)),
+            (self.jroe.uuid, 'Example', None, None)
+        ]
+
+        enrolled, errors = api.enroll_many(self.ctx, enrollments)
+
+        self.assertListEqual([(uuid, org) for uuid, org, _, _ in enrolled],
+                             [(self.jdoe.uuid, 'Example')])
+
+        errors = [str(error) for error in errors]
+        expected = [
+            NOT_FOUND_ERROR.format(entity='FFFFFFFFFFFFFFF'),
+            NOT_FOUND_ERROR.format(entity='Unknown'),
+            UUID_NONE_OR_EMPTY_ERROR + " None",
+            "'organization' cannot be an empty string",
+            ENROLLMENT_RANGE_INVALID.format(start=datetime_to_utc(datetime.datetime(2011, 1, 1)),
+                                            end=datetime_to_utc(datetime.datetime(2012, 1, 1)),
+                                            org='Example'),
+            PERIOD_INVALID_ERROR.format(start=datetime_to_utc(datetime.datetime(2005, 1, 1)),
+                                        end=datetime_to_utc(datetime.datetime(2001, 1, 1))),
+            ENROLLMENT_RANGE_INVALID.format(start=datetime_to_utc(datetime.datetime(2001, 1, 1)),
+                                            end=datetime_to_utc(datetime.datetime(2002, 1, 1)),
+                                            org='Example'),
+            UUID_LOCKED_ERROR.format(uuid=self.jroe.uuid)
+        ]
+        self.assertListEqual(errors, expected)
+
+        # Individuals of the invalid enrollments were not modified
+        individual = Individual.objects.get(mk=self.jsmith.uuid)
+        self.assertEqual(len(individual.enrollments.all()), 2)
+
+        individual = Individual.objects.get(mk=self.jroe.uuid)
+        self.assertEqual(len(individual.enrollments.all()), 0)
+
+    def test_num_queries(self):
+        """Check if the number of queries does not depend on the number of enrollments"""
+
+        enrollments = [
+            (self.jsmith.uuid, 'Example',
+             datetime.datetime(2014, 1, 1), datetime.datetime(2017, 1, 1))
+        ]
+
+        with CaptureQueriesContext(connection) as single:
+            api.enroll_many(self.ctx, enrollments)
+
+        enrollments = [
+            (self.jsmith.uuid, 'Bitergia',
+             datetime.datetime(2004, 1, 1), datetime.datetime(2008, 1, 1)),
+            (self.jsmith.uuid, 'LibreSoft', None, None),
+            (self.jdoe.uuid, 'Example', None, None),
+            (self.jdoe.uuid, 'Bitergia', None, None)
+        ]
+
+        with CaptureQueriesContext(connection) as several:
+            api.enroll_many(self.ctx, enrollments)
+
+        self.assertEqual(len(several), len(single))
+
+    def test_none_enrollments(self):
+        """Check if it fails when enrollments is `None`"""
+
+        with self.assertRaisesRegex(InvalidValueError, "'enrollments' cannot be None"):
+            api.enroll_many(self.ctx, None)
+
+    def test_transaction(self):
+        """Check if a single transaction is created for all the enrollments"""
+
+        timestamp = datetime_utcnow()
+
+        enrollments = [
+            (self.jsmith.uuid, 'LibreSoft', None, None),
+            (self.jdoe.uuid, 'Example', None, None)
+        ]
+        api.enroll_many(self.ctx, enrollments)
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 1)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'enroll_many')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, self.ctx.user.username)
+
+    def test_operations(self):
+        """Check if only the enrollments that changed are logged"""
+
+        timestamp = datetime_utcnow()
+
+        enrollments = [
+            (self.jsmith.uuid, 'Example',
+             datetime.datetime(2014, 1, 1), datetime.datetime(2017, 1, 1)),
+            (self.jsmith.uuid, 'Example',
+             datetime.datetime(2016, 1, 1), datetime.datetime(2018, 1, 1)),
+            (self.jdoe.uuid, 'Example', None, None)
+        ]
+        api.enroll_many(self.ctx, enrollments)
+
+        trx = Transaction.objects.filter(created_at__gte=timestamp)[0]
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 3)
+
+        expected = [
+            (Operation.OpType.DELETE.value, 'enrollment', self.jsmith.uuid),
+            (Operation.OpType.ADD.value, 'enrollment', self.jsmith.uuid),
+            (Operation.OpType.ADD.value, 'enrollment', self.jdoe.uuid)
+        ]
+        ops = [(op.op_type, op.entity_type, op.target) for op in operations]
+        self.assertListEqual(ops, expected)
+
+        op_args = json.loads(operations[0].args)
+        self.assertDictEqual(op_args, {'mk': self.jsmith.uuid,
+                                       'organization': 'Example',
+                                       'start': str(datetime_to_utc(datetime.datetime(2010, 1, 1))),
+                                       'end': str(datetime_to_utc(datetime.datetime(2015, 1, 1)))})
+
+        op_args = json.loads(operations[1].args)
+        self.assertDictEqual(op_args, {'individual': self.jsmith.uuid,
+                                       'organization': 'Example',
+                                       'start': str(datetime_to_utc(datetime.datetime(2010, 1, 1))),
+                                       'end': str(datetime_to_utc(datetime.datetime(2018, 1, 1)))})
+
+
 class TestWithdraw(TestCase):
     """Unit tests for withdraw"""
 
@@ -4229,7 +4719,7 @@ class TestUpdateEnrollment(TestCase):
                               new_to_date=datetime.datetime(2013, 12, 31))
 
         transactions = Transaction.objects.filter(created_at__gte=timestamp)
-        self.assertEqual(len(transactions), 3)
+        self.assertEqual(len(transactions), 1)
 
         trx = transactions[0]
         self.assertIsInstance(trx, Transaction)
@@ -4237,18 +4727,6 @@ class TestUpdateEnrollment(TestCase):
         self.assertGreater(trx.created_at, timestamp)
         self.assertEqual(trx.authored_by, self.ctx.user.username)
 
-        trx = transactions[1]
-        self.assertIsInstance(trx, Transaction)
-        self.assertEqual(trx.name, 'withdraw')
-        self.assertGreater(trx.created_at, timestamp)
-        self.assertEqual(trx.authored_by, self.ctx.user.username)
-
-        trx = transactions[2]
-        self.assertIsInstance(trx, Transaction)
-        self.assertEqual(trx.name, 'enroll')
-        self.assertGreater(trx.created_at, timestamp)
-        self.assertEqual(trx.authored_by, self.ctx.user.username)
-
     def test_operations(self):
         """Check if the right operations are created when updating an enrollment"""
 
@@ -4262,15 +4740,11 @@ class TestUpdateEnrollment(TestCase):
                               new_to_date=datetime.datetime(2013, 12, 31))
 
         transactions = Transaction.objects.filter(created_at__gte=timestamp)
-        self.assertEqual(len(transactions), 3)
+        self.assertEqual(len(transactions), 1)
 
         trx = transactions[0]
         operations = Operation.objects.filter(trx=trx)
-        self.assertEqual(len(operations), 0)
-
-        trx = transactions[1]
-        operations = Operation.objects.filter(trx=trx)
-        self.assertEqual(len(operations), 1)
+        self.assertEqual(len(operations), 2)
 
         op1 = operations[0]
         self.assertIsInstance(op1, Operation)
@@ -4287,11 +4761,7 @@ class TestUpdateEnrollment(TestCase):
         self.assertEqual(op1_args['start'], str(datetime_to_utc(datetime.datetime(2012, 1, 1))))
         self.assertEqual(op1_args['end'], str(datetime_to_utc(datetime.datetime(2014, 1, 1))))
 
-        trx = transactions[2]
-        operations = Operation.objects.filter(trx=trx)
-        self.assertEqual(len(operations), 1)
-
-        op2 = operations[0]
+        op2 = operations[1]
         self.assertIsInstance(op2, Operation)
         self.assertEqual(op2.op_type, Operation.OpType.ADD.value)
         self.assertEqual(op2.entity_type, 'enrollment')
@@ -4307,6 +4777,65 @@ class TestUpdateEnrollment(TestCase):
         self.assertEqual(op2_args['end'], str(datetime_to_utc(datetime.datetime(2013, 12, 31))))
 
 
+    def test_operations_only_changes(self):
+        """Check if only the enrollments that change are removed or added"""
+
+        individual = Individual.objects.get(mk='e8284285566fdc1f41c8a22bb84a295fc3c4cbb3')
+        enrollment_ids = list(individual.enrollments.order_by('id').values_list('id', flat=True))
+
+        timestamp = datetime_utcnow()
+
+        api.update_enrollment(self.ctx,
+                              'e8284285566fdc1f41c8a22bb84a295fc3c4cbb3', 'Example',
+                              datetime.datetime(2009, 1, 1),
+                              datetime.datetime(2011, 1, 1),
+                              new_to_date=datetime.datetime(2011, 6, 1))
+
+        trx = Transaction.objects.filter(created_at__gte=timestamp)[0]
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 2)
+
+        op_args = json.loads(operations[0].args)
+        self.assertEqual(operations[0].op_type, Operation.OpType.DELETE.value)
+        self.assertEqual(op_args['start'], str(datetime_to_utc(datetime.datetime(2009, 1, 1))))
+        self.assertEqual(op_args['end'], str(datetime_to_utc(datetime.datetime(2011, 1, 1))))
+
+        op_args = json.loads(operations[1].args)
+        self.assertEqual(operations[1].op_type, Operation.OpType.ADD.value)
+        self.assertEqual(op_args['start'], str(datetime_to_utc(datetime.datetime(2009, 1, 1))))
+        self.assertEqual(op_args['end'], str(datetime_to_utc(datetime.datetime(2011, 6, 1))))
+
+        # The rest of enrollments were not written again
+        enrollments = individual.enrollments.order_by('id')
+        self.assertEqual(len(enrollments), 4)
+
+        ids = [enrollment.id for enrollment in enrollments]
+        self.assertListEqual(ids[:-1], [enrollment_ids[0]] + enrollment_ids[2:])
+
+    def test_no_changes(self):
+        """Check if no operations are created when the enrollments do not change"""
+
+        timestamp = datetime_utcnow()
+
+        individual = api.update_enrollment(self.ctx,
+                                           '3283e58cef2b80007aa1dfc16f6dd20ace1aee96', 'Example',
+                                           datetime.datetime(2012, 1, 1),
+                                           datetime.datetime(2014, 1, 1),
+                                           new_from_date=datetime.datetime(2012, 1, 1),
+                                           new_to_date=datetime.datetime(2014, 1, 1))
+
+        enrollments = individual.enrollments.all()
+        self.assertEqual(len(enrollments), 1)
+        self.assertEqual(enrollments[0].start, datetime.datetime(2012, 1, 1, tzinfo=UTC))
+        self.assertEqual(enrollments[0].end, datetime.datetime(2014, 1, 1, tzinfo=UTC))
+
+        trx = Transaction.objects.filter(created_at__gte=timestamp)[0]
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 0)
+
+
 class TestMergeIndividuals(TestCase):
     """Unit tests for merge"""
 
@@ -4852,6 +5381,28 @@ class TestMergeIndividuals(TestCase):
         self.assertLessEqual(before_merge_dt, id4.last_modified)
         self.assertGreaterEqual(after_merge_dt, id4.last_modified)
 
+    def test_num_queries(self):
+        """Check if the number of queries does not depend on the number of identities"""
+
+        jdoe = api.add_identity(self.ctx, 'scm', email='jdoe@example')
+        jdoe_alt = api.add_identity(self.ctx, 'scm', email='jdoe@example.net')
+
+        with CaptureQueriesContext(connection) as single:
+            api.merge(self.ctx, from_uuids=[jdoe_alt.uuid], to_uuid=jdoe.uuid)
+
+        jroe = api.add_identity(self.ctx, 'scm', email='jroe@example')
+        for i in range(20):
+            api.add_identity(self.ctx, 'git', email='jroe{}@example'.format(i), uuid=jroe.uuid)
+        jroe_alt = api.add_identity(self.ctx, 'scm', email='jroe@example.net')
+
+        with CaptureQueriesContext(connection) as several:
+            api.merge(self.ctx, from_uuids=[jroe.uuid], to_uuid=jroe_alt.uuid)
+
+        individual = Individual.objects.get(mk=jroe_alt.uuid)
+        self.assertEqual(len(individual.identities.all()), 22)
+
+        self.assertEqual(len(several), len(single))
+
     def test_merge_identities_and_swap_profile(self):
         """Check whether it merges two individuals, merging their profiles"""
 
@@ -5100,6 +5651,225 @@ class TestMergeIndividuals(TestCase):
         self.assertEqual(op8_args['individual'], 'e8284285566fdc1f41c8a22bb84a295fc3c4cbb3')
 
 
+class TestMergeMany(TestCase):
+    """Unit tests for merge_many"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        api.add_organization(self.ctx, 'Example')
+        api.add_organization(self.ctx, 'Bitergia')
+
+        self.jsmith = api.add_identity(self.ctx, 'scm', email='jsmith@example')
+        api.enroll(self.ctx, self.jsmith.uuid, 'Example',
+                   from_date=datetime.datetime(2010, 1, 1),
+                   to_date=datetime.datetime(2017, 6, 1))
+
+        self.jsmith_git = api.add_identity(self.ctx, 'git', email='jsmith@example')
+        api.enroll(self.ctx, self.jsmith_git.uuid, 'Example',
+                   from_date=datetime.datetime(2015, 1, 1),
+                   to_date=datetime.datetime(2020, 1, 1))
+        api.update_profile(self.ctx, self.jsmith_git.uuid,
+                           name='John Smith', is_bot=True)
+
+        self.jdoe = api.add_identity(self.ctx, 'scm', email='jdoe@example')
+        api.enroll(self.ctx, self.jdoe.uuid, 'Bitergia')
+        self.jdoe_alt = api.add_identity(self.ctx, 'mls', email='jdoe@bitergia',
+                                         uuid=self.jdoe.uuid)
+
+        self.jdoe_git = api.add_identity(self.ctx, 'git', email='jdoe@bitergia')
+
+        self.jroe = api.add_identity(self.ctx, 'scm', email='jroe@example')
+        api.lock(self.ctx, self.jroe.uuid)
+
+    def test_merge_many(self):
+        """Check whether it merges several groups of individuals"""
+
+        groups = [
+            (self.jsmith.uuid, [self.jsmith_git.uuid]),
+            (self.jdoe_alt.uuid, [self.jdoe_git.uuid])
+        ]
+
+        merged, errors = api.merge_many(self.ctx, groups)
+
+        self.assertListEqual(merged, [self.jsmith.uuid, self.jdoe.uuid])
+        self.assertListEqual(errors, [])
+
+        # First group
+        individual = Individual.objects.get(mk=self.jsmith.uuid)
+
+        identities = individual.identities.order_by('uuid')
+        self.assertListEqual([identity.uuid for identity in identities],
+                             sorted([self.jsmith.uuid, self.jsmith_git.uuid]))
+
+        enrollments = individual.enrollments.all()
+        self.assertEqual(len(enrollments), 1)
+
+        rol = enrollments[0]
+        self.assertEqual(rol.organization.name, 'Example')
+        self.assertEqual(rol.start, datetime.datetime(2010, 1, 1, tzinfo=UTC))
+        self.assertEqual(rol.end, datetime.datetime(2020, 1, 1, tzinfo=UTC))
+
+        self.assertEqual(individual.profile.name, 'John Smith')
+        self.assertEqual(individual.profile.is_bot, True)
+
+        # Second group
+        individual = Individual.objects.get(mk=self.jdoe.uuid)
+
+        identities = individual.identities.all()
+        self.assertEqual(len(identities), 3)
+
+        enrollments = individual.enrollments.all()
+        self.assertEqual(len(enrollments), 1)
+        self.assertEqual(enrollments[0].organization.name, 'Bitergia')
+
+        # Merged individuals were removed
+        for uuid in [self.jsmith_git.uuid, self.jdoe_git.uuid]:
+            with self.assertRaises(ObjectDoesNotExist):
+                Individual.objects.get(mk=uuid)
+
+    def test_group_errors(self):
+        """Check if invalid groups are not merged while the rest of groups are"""
+
+        groups = [
+            ('FFFFFFFFFFFFFFF', [self.jdoe.uuid]),
+            (self.jsmith.uuid, [self.jsmith_git.uuid]),
+            (self.jdoe.uuid, [self.jdoe_alt.uuid]),
+            (self.jdoe.uuid, [self.jroe.uuid]),
+            (self.jdoe.uuid, []),
+            (None, [self.jdoe.uuid])
+        ]
+
+        merged, errors = api.merge_many(self.ctx, groups)
+
+        self.assertListEqual(merged, [self.jsmith.uuid])
+
+        errors = [str(error) for error in errors]
+        expected = [
+            FROM_UUIDS_NONE_OR_EMPTY_ERROR + " an empty list",
+            TO_UUID_NONE_OR_EMPTY_ERROR + " None",
+            NOT_FOUND_ERROR.format(entity='FFFFFFFFFFFFFFF'),
+            FROM_UUID_TO_UUID_EQUAL_ERROR.format(to_uuid=self.jdoe.uuid),
+            UUID_LOCKED_ERROR.format(uuid=self.jroe.uuid)
+        ]
+        self.assertListEqual(errors, expected)
+
+        # Individuals of the invalid groups were not modified
+        individual = Individual.objects.get(mk=self.jdoe.uuid)
+        self.assertEqual(len(individual.identities.all()), 2)
+
+        individual = Individual.objects.get(mk=self.jroe.uuid)
+        self.assertEqual(len(individual.identities.all()), 1)
+
+    def test_chained_groups(self):
+        """Check if groups sharing individuals are merged in order"""
+
+        groups = [
+            (self.jsmith.uuid, [self.jsmith_git.uuid]),
+            (self.jdoe.uuid, [self.jsmith_git.uuid])
+        ]
+
+        merged, errors = api.merge_many(self.ctx, groups)
+
+        self.assertListEqual(merged, [self.jsmith.uuid, self.jdoe.uuid])
+        self.assertListEqual(errors, [])
+
+        # The second group found the individual resulting from the first one
+        with self.assertRaises(ObjectDoesNotExist):
+            Individual.objects.get(mk=self.jsmith.uuid)
+
+        individual = Individual.objects.get(mk=self.jdoe.uuid)
+        self.assertEqual(len(individual.identities.all()), 4)
+        self.assertEqual(len(individual.enrollments.all()), 2)
+        self.assertEqual(individual.profile.name, 'John Smith')
+
+    def test_num_queries(self):
+        """Check if the number of queries does not depend on the number of groups"""
+
+        groups = [
+            (self.jsmith.uuid, [self.jsmith_git.uuid])
+        ]
+
+        with CaptureQueriesContext(connection) as single:
+            api.merge_many(self.ctx, groups)
+
+        groups = [
+            (self.jdoe.uuid, [self.jdoe_git.uuid]),
+            (self.jsmith.uuid, [self.jroe.uuid])
+        ]
+        api.unlock(self.ctx, self.jroe.uuid)
+
+        with CaptureQueriesContext(connection) as several:
+            api.merge_many(self.ctx, groups)
+
+        self.assertEqual(len(several), len(single))
+
+    def test_none_groups(self):
+        """Check if it fails when groups is `None`"""
+
+        with self.assertRaisesRegex(InvalidValueError, "'groups' cannot be None"):
+            api.merge_many(self.ctx, None)
+
+    def test_transaction(self):
+        """Check if a single transaction is created for all the groups"""
+
+        timestamp = datetime_utcnow()
+
+        groups = [
+            (self.jsmith.uuid, [self.jsmith_git.uuid]),
+            (self.jdoe.uuid, [self.jdoe_git.uuid])
+        ]
+        api.merge_many(self.ctx, groups)
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 1)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'merge_many')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, self.ctx.user.username)
+
+    def test_operations(self):
+        """Check if the operations of each merge are created"""
+
+        timestamp = datetime_utcnow()
+
+        groups = [
+            (self.jsmith.uuid, [self.jsmith_git.uuid])
+        ]
+        api.merge_many(self.ctx, groups)
+
+        trx = Transaction.objects.filter(created_at__gte=timestamp)[0]
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 6)
+
+        expected = [
+            (Operation.OpType.UPDATE.value, 'identity', self.jsmith_git.uuid),
+            (Operation.OpType.DELETE.value, 'enrollment', self.jsmith.uuid),
+            (Operation.OpType.DELETE.value, 'enrollment', self.jsmith_git.uuid),
+            (Operation.OpType.ADD.value, 'enrollment', self.jsmith.uuid),
+            (Operation.OpType.UPDATE.value, 'profile', self.jsmith.uuid),
+            (Operation.OpType.DELETE.value, 'individual', self.jsmith_git.uuid)
+        ]
+        ops = [(op.op_type, op.entity_type, op.target) for op in operations]
+        self.assertListEqual(ops, expected)
+
+        op_args = json.loads(operations[0].args)
+        self.assertDictEqual(op_args, {'identity': self.jsmith_git.uuid,
+                                       'individual': self.jsmith.uuid})
+
+        op_args = json.loads(operations[3].args)
+        self.assertDictEqual(op_args, {'individual': self.jsmith.uuid,
+                                       'organization': 'Example',
+                                       'start': str(datetime_to_utc(datetime.datetime(2010, 1, 1))),
+                                       'end': str(datetime_to_utc(datetime.datetime(2020, 1, 1)))})
+
+
 class TestUnmergeIdentities(TestCase):
     """Unit tests for unmerge_identities"""
 
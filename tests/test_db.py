@@ -45,8 +45,11 @@ from sortinghat.core.models import (MIN_PERIOD_DATE,
                                     Identity,
                                     Profile,
                                     Enrollment,
+                                    MatchingKey,
+                                    MatchingBlacklist,
                                     Transaction,
-                                    Operation)
+                                    Operation,
+                                    RegistryVersion)
 
 
 DUPLICATED_ORG_ERROR = "Organization 'Example' already exists in the registry"
@@ -155,6 +158,40 @@ class TestFindIndividualbyUUID(TestCase):
             db.find_individual_by_uuid('zyxwuv')
 
 
+class TestFindIndividualsByUUIDs(TestCase):
+    """Unit tests for find_individuals_by_uuids"""
+
+    def test_find_individuals(self):
+        """Test if it finds the individuals of a list of main keys and uuids"""
+
+        individual = Individual.objects.create(mk='AAAA')
+        Profile.objects.create(individual=individual, name='John Smith')
+        Identity.objects.create(uuid='AAAA', source='scm', individual=individual)
+        Identity.objects.create(uuid='0001', source='mls', individual=individual)
+
+        individual = Individual.objects.create(mk='BBBB')
+        Profile.objects.create(individual=individual)
+
+        with self.assertNumQueries(2):
+            individuals = db.find_individuals_by_uuids(['AAAA', '0001', 'BBBB', 'ZZZZ'])
+            self.assertEqual(individuals['AAAA'].profile.name, 'John Smith')
+
+        self.assertEqual(len(individuals), 3)
+        self.assertEqual(individuals['AAAA'].mk, 'AAAA')
+        self.assertEqual(individuals['0001'].mk, 'AAAA')
+        self.assertEqual(individuals['BBBB'].mk, 'BBBB')
+
+    def test_main_key_precedence(self):
+        """Test if main keys take precedence over identity uuids"""
+
+        individual_a = Individual.objects.create(mk='AAAA')
+        individual_b = Individual.objects.create(mk='BBBB')
+        Identity.objects.create(uuid='AAAA', source='scm', individual=individual_b)
+
+        individuals = db.find_individuals_by_uuids(['AAAA'])
+        self.assertEqual(individuals['AAAA'], individual_a)
+
+
 class TestFindIdentity(TestCase):
     """Unit tests for find_identity"""
 
@@ -366,6 +403,29 @@ class TestSearchEnrollmentsInPeriod(TestCase):
         self.assertEqual(len(enrollments), 0)
 
 
+class TestRegistryVersions(TestCase):
+    """Unit tests for find_registry_version and increase_registry_versions"""
+
+    def test_increase_versions(self):
+        """Check if the given counters are increased"""
+
+        db.increase_registry_versions(['registry'])
+        db.increase_registry_versions(['registry', 'example'])
+
+        self.assertEqual(db.find_registry_version(), 2)
+        self.assertEqual(db.find_registry_version('registry'), 2)
+        self.assertEqual(db.find_registry_version('example'), 1)
+
+        versions = RegistryVersion.objects.order_by('name').values_list('name', 'version')
+        self.assertListEqual(list(versions), [('example', 1), ('registry', 2)])
+
+    def test_no_version(self):
+        """Check if 0 is returned when a counter was never increased"""
+
+        self.assertEqual(db.find_registry_version(), 0)
+        self.assertEqual(db.find_registry_version('example'), 0)
+
+
 class TestAddOrganization(TestCase):
     """Unit tests for add_organization"""
 
@@ -578,6 +638,155 @@ class TestDeleteOrganization(TestCase):
         self.assertEqual(op1_args['organization'], 'Example')
 
 
+class TestMergeOrganizations(TestCase):
+    """Unit tests for merge_organizations"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        self.trxl = TransactionsLog.open('merge_organizations', self.ctx)
+
+        self.org_ex = Organization.objects.create(name='Example')
+        Domain.objects.create(domain='example.com',
+                              organization=self.org_ex)
+        self.org_inc = Organization.objects.create(name='Example Inc.')
+        Domain.objects.create(domain='example.org',
+                              organization=self.org_inc)
+
+        self.jsmith = Individual.objects.create(mk='AAAA')
+        Enrollment.objects.create(individual=self.jsmith, organization=self.org_ex,
+                                  start=datetime.datetime(1999, 6, 1, tzinfo=UTC),
+                                  end=datetime.datetime(2001, 1, 1, tzinfo=UTC))
+        Enrollment.objects.create(individual=self.jsmith, organization=self.org_inc,
+                                  start=datetime.datetime(1999, 1, 1, tzinfo=UTC),
+                                  end=datetime.datetime(2000, 1, 1, tzinfo=UTC))
+
+        self.jdoe = Individual.objects.create(mk='BBBB')
+        Enrollment.objects.create(individual=self.jdoe, organization=self.org_inc)
+
+    def test_merge_organizations(self):
+        """Check whether domains and enrollments are moved to the organization"""
+
+        db.merge_organizations(self.trxl, self.org_inc, self.org_ex)
+
+        # Tests
+        with self.assertRaises(ObjectDoesNotExist):
+            Organization.objects.get(name='Example Inc.')
+
+        domain = Domain.objects.get(domain='example.org')
+        self.assertEqual(domain.organization, self.org_ex)
+
+        enrollments = Enrollment.objects.filter(individual=self.jsmith)
+        self.assertEqual(len(enrollments), 1)
+
+        enrollment = enrollments[0]
+        self.assertEqual(enrollment.organization, self.org_ex)
+        self.assertEqual(enrollment.start, datetime.datetime(1999, 1, 1, tzinfo=UTC))
+        self.assertEqual(enrollment.end, datetime.datetime(2001, 1, 1, tzinfo=UTC))
+
+        enrollments = Enrollment.objects.filter(individual=self.jdoe)
+        self.assertEqual(len(enrollments), 1)
+
+        enrollment = enrollments[0]
+        self.assertEqual(enrollment.organization, self.org_ex)
+        self.assertEqual(enrollment.start, MIN_PERIOD_DATE)
+        self.assertEqual(enrollment.end, MAX_PERIOD_DATE)
+
+    def test_last_modified(self):
+        """Check if last modification date is updated"""
+
+        before_dt = datetime_utcnow()
+        db.merge_organizations(self.trxl, self.org_inc, self.org_ex)
+        after_dt = datetime_utcnow()
+
+        jsmith = Individual.objects.get(mk='AAAA')
+        self.assertLessEqual(before_dt, jsmith.last_modified)
+        self.assertGreaterEqual(after_dt, jsmith.last_modified)
+
+        jdoe = Individual.objects.get(mk='BBBB')
+        self.assertEqual(jsmith.last_modified, jdoe.last_modified)
+
+    def test_locked_individual(self):
+        """Check if it fails when any of the individuals is locked"""
+
+        self.jdoe.is_locked = True
+        self.jdoe.save()
+
+        msg = INDIVIDUAL_LOCKED_ERROR.format(mk='BBBB')
+        with self.assertRaisesRegex(LockedIdentityError, msg):
+            db.merge_organizations(self.trxl, self.org_inc, self.org_ex)
+
+        self.assertEqual(self.org_inc.domains.count(), 1)
+        self.assertEqual(self.org_inc.enrollments.count(), 2)
+
+    def test_operations(self):
+        """Check if the right operations are created when merging organizations"""
+
+        timestamp = datetime_utcnow()
+
+        transactions = Transaction.objects.filter(name='merge_organizations')
+        trx = transactions[0]
+
+        db.merge_organizations(self.trxl, self.org_inc, self.org_ex)
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 8)
+
+        min_date = str(MIN_PERIOD_DATE)
+        max_date = str(MAX_PERIOD_DATE)
+
+        # Domains and enrollments are logged as if they were
+        # removed and added again one by one
+        expected = [
+            (Operation.OpType.DELETE.value, 'domain', 'example.org',
+             {'domain': 'example.org'}),
+            (Operation.OpType.ADD.value, 'domain', 'Example',
+             {'organization': 'Example',
+              'domain_name': 'example.org',
+              'is_top_domain': False}),
+            (Operation.OpType.DELETE.value, 'enrollment', 'AAAA',
+             {'mk': 'AAAA',
+              'organization': 'Example Inc.',
+              'start': '1999-01-01 00:00:00+00:00',
+              'end': '2000-01-01 00:00:00+00:00'}),
+            (Operation.OpType.DELETE.value, 'enrollment', 'AAAA',
+             {'mk': 'AAAA',
+              'organization': 'Example',
+              'start': '1999-06-01 00:00:00+00:00',
+              'end': '2001-01-01 00:00:00+00:00'}),
+            (Operation.OpType.DELETE.value, 'enrollment', 'BBBB',
+             {'mk': 'BBBB',
+              'organization': 'Example Inc.',
+              'start': min_date,
+              'end': max_date}),
+            (Operation.OpType.ADD.value, 'enrollment', 'AAAA',
+             {'individual': 'AAAA',
+              'organization': 'Example',
+              'start': '1999-01-01 00:00:00+00:00',
+              'end': '2001-01-01 00:00:00+00:00'}),
+            (Operation.OpType.ADD.value, 'enrollment', 'BBBB',
+             {'individual': 'BBBB',
+              'organization': 'Example',
+              'start': min_date,
+              'end': max_date}),
+            (Operation.OpType.UPDATE.value, 'organization', 'Example',
+             {'from_org': 'Example Inc.',
+              'to_org': 'Example'})
+        ]
+
+        for op, (op_type, entity_type, target, args) in zip(operations, expected):
+            self.assertIsInstance(op, Operation)
+            self.assertEqual(op.op_type, op_type)
+            self.assertEqual(op.entity_type, entity_type)
+            self.assertEqual(op.trx, trx)
+            self.assertEqual(op.target, target)
+            self.assertGreater(op.timestamp, timestamp)
+            self.assertDictEqual(json.loads(op.args), args)
+
+
 class TestAddDomain(TestCase):
     """"Unit tests for add_domain"""
 
@@ -1071,6 +1280,43 @@ class TestAddIdentity(TestCase):
         self.assertEqual(identity.email, 'jsmith@example.org')
         self.assertEqual(identity.username, 'jsmith')
 
+    def test_matching_keys(self):
+        """Check if the matching keys of the new identity are added"""
+
+        individual = Individual.objects.create(mk='AAAA')
+        db.add_identity(self.trxl, individual, 'AAAA', 'scm',
+                        name='John Smith',
+                        email='jsmith@example.org',
+                        username=None)
+
+        keys = MatchingKey.objects.filter(identity='AAAA').order_by('criterion')
+        keys = [(key.criterion, key.value) for key in keys]
+        self.assertListEqual(keys, [('email', 'jsmith@example.org'),
+                                    ('name', 'John Smith')])
+
+    def test_normalized_values(self):
+        """Check if the normalized values of the new identity are stored"""
+
+        individual = Individual.objects.create(mk='AAAA')
+        db.add_identity(self.trxl, individual, 'AAAA', 'scm',
+                        name='Jöhn Smith',
+                        email='John.Smith+dev@Gmail.com',
+                        username='JSmith')
+        db.add_identity(self.trxl, individual, 'BBBB', 'scm',
+                        name=None,
+                        email=None,
+                        username='jsmith')
+
+        identity = Identity.objects.get(uuid='AAAA')
+        self.assertEqual(identity.normalized_name, 'john smith')
+        self.assertEqual(identity.canonical_email, 'johnsmith@gmail.com')
+        self.assertEqual(identity.normalized_username, 'jsmith')
+
+        identity = Identity.objects.get(uuid='BBBB')
+        self.assertEqual(identity.normalized_name, None)
+        self.assertEqual(identity.canonical_email, None)
+        self.assertEqual(identity.normalized_username, 'jsmith')
+
     def test_add_multiple_identities(self):
         """Check if multiple identities can be added"""
 
@@ -1401,6 +1647,25 @@ class TestDeleteIdentity(TestCase):
         jsmith.refresh_from_db()
         self.assertEqual(len(jsmith.identities.all()), 2)
 
+    def test_delete_matching_keys(self):
+        """Check whether the matching keys of the identity are deleted"""
+
+        jsmith = Individual.objects.create(mk='AAAA')
+        db.add_identity(self.trxl, jsmith, '0001', 'scm',
+                        name='John Smith', email='jsmith@example.net')
+        db.add_identity(self.trxl, jsmith, '0002', 'scm',
+                        email='jsmith@example.net')
+
+        identity = Identity.objects.get(uuid='0001')
+        db.delete_identity(self.trxl, identity)
+
+        # Tests
+        keys = MatchingKey.objects.all()
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(keys[0].identity.uuid, '0002')
+        self.assertEqual(keys[0].criterion, 'email')
+        self.assertEqual(keys[0].value, 'jsmith@example.net')
+
     def test_last_modified(self):
         """Check if last modification date is updated"""
 
@@ -2241,6 +2506,85 @@ class TestMoveIdentity(TestCase):
         self.assertEqual(op1_args['individual'], 'BBBB')
 
 
+class TestMergeIndividuals(TestCase):
+    """Unit tests for merge_individuals"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.ctx = SortingHatContext(self.user)
+
+        self.trxl = TransactionsLog.open('merge_individuals', self.ctx)
+
+        self.org = Organization.objects.create(name='Example')
+
+        self.individuals = {}
+        for mk in ['AAAA', 'BBBB', 'CCCC', 'DDDD']:
+            individual = Individual.objects.create(mk=mk)
+            Profile.objects.create(individual=individual)
+            Identity.objects.create(uuid=mk, source='scm', individual=individual)
+            self.individuals[mk] = individual
+
+    def test_merge_individuals(self):
+        """Test if several sets of individuals are merged"""
+
+        Enrollment.objects.create(individual=self.individuals['AAAA'], organization=self.org,
+                                  start=datetime.datetime(2010, 1, 1, tzinfo=UTC),
+                                  end=datetime.datetime(2015, 1, 1, tzinfo=UTC))
+        Enrollment.objects.create(individual=self.individuals['BBBB'], organization=self.org,
+                                  start=datetime.datetime(2014, 1, 1, tzinfo=UTC),
+                                  end=datetime.datetime(2020, 1, 1, tzinfo=UTC))
+
+        profile = self.individuals['BBBB'].profile
+        profile.email = 'jsmith@example.com'
+        profile.save()
+
+        merges = [
+            (self.individuals['AAAA'], [self.individuals['BBBB']]),
+            (self.individuals['CCCC'], [self.individuals['DDDD']])
+        ]
+        db.merge_individuals(self.trxl, merges)
+
+        individual = Individual.objects.get(mk='AAAA')
+        identities = individual.identities.order_by('uuid')
+        self.assertListEqual([identity.uuid for identity in identities], ['AAAA', 'BBBB'])
+        self.assertEqual(individual.profile.email, 'jsmith@example.com')
+
+        enrollments = individual.enrollments.all()
+        self.assertEqual(len(enrollments), 1)
+        self.assertEqual(enrollments[0].start, datetime.datetime(2010, 1, 1, tzinfo=UTC))
+        self.assertEqual(enrollments[0].end, datetime.datetime(2020, 1, 1, tzinfo=UTC))
+
+        individual = Individual.objects.get(mk='CCCC')
+        identities = individual.identities.order_by('uuid')
+        self.assertListEqual([identity.uuid for identity in identities], ['CCCC', 'DDDD'])
+
+        individuals = Individual.objects.filter(mk__in=['BBBB', 'DDDD'])
+        self.assertEqual(len(individuals), 0)
+
+        operations = Operation.objects.filter(trx=self.trxl.trx)
+        self.assertEqual(len(operations), 9)
+
+    def test_locked_individual(self):
+        """Test if it raises an error when any of the individuals is locked"""
+
+        individual = self.individuals['DDDD']
+        individual.is_locked = True
+        individual.save()
+
+        merges = [
+            (self.individuals['AAAA'], [self.individuals['BBBB']]),
+            (self.individuals['CCCC'], [self.individuals['DDDD']])
+        ]
+
+        with self.assertRaisesRegex(LockedIdentityError, INDIVIDUAL_LOCKED_ERROR.format(mk='DDDD')):
+            db.merge_individuals(self.trxl, merges)
+
+        individual = Individual.objects.get(mk='BBBB')
+        self.assertEqual(len(individual.identities.all()), 1)
+
+
 class TestLock(TestCase):
     """Unit tests for lock"""
 
@@ -2348,3 +2692,169 @@ class TestUnlock(TestCase):
         self.assertEqual(len(op1_args), 2)
         self.assertEqual(op1_args['mk'], jsmith.mk)
         self.assertEqual(op1_args['is_locked'], jsmith.is_locked)
+
+
+class TestRebuildMatchingIndex(TestCase):
+    """Unit tests for rebuild_matching_index"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        jsmith = Individual.objects.create(mk='AAAA')
+        Identity.objects.create(uuid='0001', name='John Smith',
+                                email='jsmith@example.net',
+                                individual=jsmith)
+        Identity.objects.create(uuid='0002', username='jsmith',
+                                individual=jsmith)
+        jdoe = Individual.objects.create(mk='BBBB')
+        Identity.objects.create(uuid='0003', email='jdoe@example.net',
+                                individual=jdoe)
+
+    def test_rebuild(self):
+        """Check if the index is created from the identities"""
+
+        nkeys = db.rebuild_matching_index()
+        self.assertEqual(nkeys, 4)
+
+        keys = MatchingKey.objects.order_by('identity', 'criterion')
+        keys = [(key.identity.uuid, key.criterion, key.value) for key in keys]
+
+        expected = [
+            ('0001', 'email', 'jsmith@example.net'),
+            ('0001', 'name', 'John Smith'),
+            ('0002', 'username', 'jsmith'),
+            ('0003', 'email', 'jdoe@example.net')
+        ]
+        self.assertListEqual(keys, expected)
+
+    def test_rebuild_batches(self):
+        """Check if the index is created using small batches"""
+
+        nkeys = db.rebuild_matching_index(batch_size=1)
+        self.assertEqual(nkeys, 4)
+
+        keys = MatchingKey.objects.all()
+        self.assertEqual(len(keys), 4)
+
+    def test_rebuild_removes_keys(self):
+        """Check if stale keys are removed"""
+
+        identity = Identity.objects.get(uuid='0003')
+        MatchingKey.objects.create(criterion='name', value='John Doe',
+                                   identity=identity)
+
+        db.rebuild_matching_index()
+
+        keys = MatchingKey.objects.filter(identity='0003')
+        self.assertEqual(len(keys), 1)
+        self.assertEqual(keys[0].criterion, 'email')
+
+
+class TestCheckMatchingIndex(TestCase):
+    """Unit tests for check_matching_index"""
+
+    def setUp(self):
+        """Load initial dataset"""
+
+        jsmith = Individual.objects.create(mk='AAAA')
+        Identity.objects.create(uuid='0001', name='John Smith',
+                                email='jsmith@example.net',
+                                individual=jsmith)
+        Identity.objects.create(uuid='0002', username='jsmith',
+                                individual=jsmith)
+
+        db.rebuild_matching_index()
+
+    def test_consistent(self):
+        """Check if no inconsistencies are found on a valid index"""
+
+        inconsistencies = db.check_matching_index(batch_size=1)
+        self.assertListEqual(inconsistencies, [])
+
+    def test_inconsistent(self):
+        """Check if missing and unexpected keys are found"""
+
+        MatchingKey.objects.filter(identity='0001', criterion='name').delete()
+        MatchingKey.objects.create(criterion='email', value='jsmith@example.org',
+                                   identity=Identity.objects.get(uuid='0002'))
+
+        inconsistencies = db.check_matching_index()
+
+        expected = [
+            ('0001', {('name', 'John Smith')}, set()),
+            ('0002', set(), {('email', 'jsmith@example.org')})
+        ]
+        self.assertListEqual(sorted(inconsistencies), expected)
+
+
+class TestAddToMatchingBlacklist(TestCase):
+    """Unit tests for add_to_matching_blacklist"""
+
+    def test_add_values(self):
+        """Check if new values are added to the blacklist"""
+
+        MatchingBlacklist.objects.create(excluded='root')
+
+        nvalues = db.add_to_matching_blacklist(['unknown', 'root',
+                                                'none', 'unknown'])
+        self.assertEqual(nvalues, 2)
+
+        excluded = MatchingBlacklist.objects.values_list('excluded', flat=True)
+        self.assertListEqual(sorted(excluded), ['none', 'root', 'unknown'])
+
+    def test_values_differ_in_case(self):
+        """Check if values that only differ in case are added once"""
+
+        MatchingBlacklist.objects.create(excluded='Root')
+
+        nvalues = db.add_to_matching_blacklist(['None', 'root', 'none',
+                                                'ROOT', 'unknown'])
+        self.assertEqual(nvalues, 2)
+
+        excluded = MatchingBlacklist.objects.values_list('excluded', flat=True)
+        self.assertListEqual(sorted(excluded), ['None', 'Root', 'unknown'])
+
+    def test_empty_values(self):
+        """Check if nothing is added when the list is empty"""
+
+        nvalues = db.add_to_matching_blacklist([])
+        self.assertEqual(nvalues, 0)
+        self.assertEqual(MatchingBlacklist.objects.count(), 0)
+
+
+class TestRebuildNormalizedValues(TestCase):
+    """Unit tests for rebuild_normalized_values"""
+
+    def test_rebuild(self):
+        """Check if the normalized values of every identity are stored"""
+
+        jsmith = Individual.objects.create(mk='AAAA')
+        Identity.objects.create(uuid='0001', name='Jöhn Smith',
+                                email='JSmith@Example.net',
+                                individual=jsmith)
+        Identity.objects.create(uuid='0002', username='JSmith',
+                                individual=jsmith)
+        Identity.objects.create(uuid='0003', name='John Smith',
+                                normalized_name='wrong value',
+                                individual=jsmith)
+
+        nidentities = db.rebuild_normalized_values(batch_size=2)
+        self.assertEqual(nidentities, 3)
+
+        identities = Identity.objects.order_by('uuid')
+        values = [
+            (identity.normalized_name, identity.canonical_email, identity.normalized_username)
+            for identity in identities
+        ]
+        expected = [
+            ('john smith', 'jsmith@example.net', None),
+            (None, None, 'jsmith'),
+            ('john smith', None, None)
+        ]
+        self.assertListEqual(values, expected)
+
+    def test_empty_registry(self):
+        """Check if nothing is updated when the registry is empty"""
+
+        nidentities = db.rebuild_normalized_values()
+        self.assertEqual(nidentities, 0)
@@ -21,6 +21,8 @@
 #     Miguel Ángel Fernández <mafesan@bitergia.com>
 #
 
+import pickle
+
 from django.test import TestCase
 
 from sortinghat.core.errors import (BaseError,
@@ -83,6 +85,21 @@ class TestBaseError(TestCase):
         kwargs = {'code': 1, 'error': 'Fatal error'}
         self.assertRaises(KeyError, MockErrorArgs, **kwargs)
 
+    def test_pickle(self):
+        """Check if errors keep their data after pickling them"""
+
+        e = pickle.loads(pickle.dumps(MockErrorArgs(code=1, msg='Fatal error')))
+
+        self.assertIsInstance(e, MockErrorArgs)
+        self.assertEqual("Mock error with args. Error: 1 Fatal error",
+                         str(e))
+
+        e = pickle.loads(pickle.dumps(AlreadyExistsError(entity='Domain', eid='example.com')))
+
+        self.assertIsInstance(e, AlreadyExistsError)
+        self.assertEqual(e.entity, 'Domain')
+        self.assertEqual(e.eid, 'example.com')
+
 
 class TestAlreadyExistsError(TestCase):
     """Unit tests for AlreadyExistsError"""
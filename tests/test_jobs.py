@@ -21,6 +21,7 @@
 #
 
 import datetime
+import pickle
 import unittest.mock
 
 from dateutil.tz import UTC
@@ -28,19 +29,43 @@ from dateutil.tz import UTC
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
+import django_rq
 from django_rq import enqueue
 
 from grimoirelab_toolkit.datetime import datetime_utcnow
 
 from sortinghat.core import api
 from sortinghat.core.context import SortingHatContext
-from sortinghat.core.errors import DuplicateRangeError, NotFoundError
+from sortinghat.core.errors import NotFoundError
 from sortinghat.core.jobs import (find_job,
+                                  get_jobs,
+                                  get_job_progress,
+                                  get_job_status,
+                                  JobProgress,
+                                  JobResults,
+                                  check_criteria,
                                   affiliate,
+                                  check_children,
+                                  mark_bots,
                                   unify,
+                                  unify_organizations,
                                   recommend_affiliations,
-                                  recommend_matches)
-from sortinghat.core.models import Individual, Transaction
+                                  recommend_bots,
+                                  recommend_matches,
+                                  recommend_organizations,
+                                  update_stored_affiliation_recommendations,
+                                  CHECK_CHILDREN_INTERVAL,
+                                  FAN_IN_PENDING_KEY,
+                                  FAN_IN_TTL,
+                                  JOB_RESULTS_KEY,
+                                  _chunk_keys,
+                                  _finish_child,
+                                  _split_keys)
+from sortinghat.core.models import (AffiliationRecommendation,
+                                    Individual,
+                                    Operation,
+                                    Organization,
+                                    Transaction)
 
 
 JOB_NOT_FOUND_ERROR = "DEF not found in the registry"
@@ -51,6 +76,20 @@ def job_echo(s):
     return s
 
 
+def job_fail(s):
+    """Function to test failed jobs"""
+    raise RuntimeError(s)
+
+
+def _read_job_result(job):
+    """Read the result of a job with its results stored in pages"""
+
+    result = dict(job.result)
+    result['results'] = dict(result['results'])
+
+    return result
+
+
 class TestFindJob(TestCase):
     """Unit tests for find_job"""
 
@@ -71,6 +110,511 @@ class TestFindJob(TestCase):
             find_job('DEF')
 
 
+class TestGetJobs(TestCase):
+    """Unit tests for get_jobs"""
+
+    def setUp(self):
+        """Add some jobs to the queue and to its registries"""
+
+        conn = django_rq.queues.get_redis_connection(None, True)
+        conn.flushall()
+
+        queue = django_rq.get_queue(is_async=True)
+
+        queue.enqueue(job_echo, 'A', job_id='A')
+        queue.enqueue(job_echo, 'B', job_id='B')
+
+        for job_id, registry in (('C', queue.finished_job_registry),
+                                 ('D', queue.finished_job_registry),
+                                 ('E', queue.failed_job_registry)):
+            job = queue.enqueue(job_echo, job_id, job_id=job_id)
+            queue.remove(job)
+            registry.add(job, -1)
+
+    def test_get_jobs(self):
+        """Check if it returns the jobs of every status"""
+
+        jobs = get_jobs()
+        self.assertEqual(len(jobs), 5)
+
+        # Jobs are sorted by status
+        job_ids = [job.id for job in jobs]
+        self.assertListEqual(job_ids, ['A', 'B', 'C', 'D', 'E'])
+
+        self.assertEqual(jobs[0].id, 'A')
+        self.assertEqual(jobs[-1].id, 'E')
+
+    def test_slice(self):
+        """Check if only the jobs of a slice are returned"""
+
+        jobs = get_jobs()
+
+        job_ids = [job.id for job in jobs[1:3]]
+        self.assertListEqual(job_ids, ['B', 'C'])
+
+        job_ids = [job.id for job in jobs[3:10]]
+        self.assertListEqual(job_ids, ['D', 'E'])
+
+        self.assertListEqual(jobs[5:7], [])
+
+        with self.assertRaises(IndexError):
+            jobs[5]
+
+    def test_statuses(self):
+        """Check if only the jobs with the given statuses are returned"""
+
+        jobs = get_jobs(statuses=['failed'])
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].id, 'E')
+
+        jobs = get_jobs(statuses=['finished', 'queued'])
+        job_ids = [job.id for job in jobs]
+        self.assertListEqual(job_ids, ['A', 'B', 'C', 'D'])
+
+        jobs = get_jobs(statuses=['started', 'scheduled'])
+        self.assertEqual(len(jobs), 0)
+        self.assertListEqual(list(jobs), [])
+
+    def test_expired_jobs(self):
+        """Check if jobs removed after counting them are not returned"""
+
+        jobs = get_jobs(statuses=['finished'])
+        self.assertEqual(len(jobs), 2)
+
+        find_job('C').delete(remove_from_queue=False)
+
+        job_ids = [job.id for job in jobs[0:2]]
+        self.assertListEqual(job_ids, ['D'])
+
+    def test_child_jobs(self):
+        """Check if child jobs are listed with their parent"""
+
+        queue = django_rq.get_queue(is_async=True)
+        queue.enqueue(job_echo, 'A-0', job_id='A-0', meta={'parent': 'A'})
+
+        jobs = get_jobs(statuses=['queued'])
+
+        job_ids = [job.id for job in jobs]
+        self.assertListEqual(job_ids, ['A', 'B', 'A-0'])
+        self.assertNotIn('parent', jobs[0].meta)
+        self.assertEqual(jobs[2].meta['parent'], 'A')
+
+    def test_invalid_status(self):
+        """Check if it fails when a status is not valid"""
+
+        with self.assertRaisesRegex(ValueError, "'done' is not a valid job status"):
+            get_jobs(statuses=['finished', 'done'])
+
+
+class TestJobProgress(TestCase):
+    """Unit tests for JobProgress"""
+
+    def setUp(self):
+        """Create a job"""
+
+        conn = django_rq.queues.get_redis_connection(None, True)
+        conn.flushall()
+
+        self.job = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF')
+
+    @unittest.mock.patch('sortinghat.core.jobs.time.monotonic')
+    def test_update(self, mock_monotonic):
+        """Check if the progress is written when the interval passed"""
+
+        mock_monotonic.return_value = 100.0
+        progress = JobProgress(self.job, total=100, interval=5)
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(job.meta['progress'],
+                             {'processed': 0, 'total': 100, 'rate': None, 'eta': None})
+
+        # Progress is not written until the interval passes
+        mock_monotonic.return_value = 102.0
+        progress.update(5)
+        progress.update(5)
+
+        job = find_job(self.job.id)
+        self.assertEqual(job.meta['progress']['processed'], 0)
+
+        mock_monotonic.return_value = 105.0
+        progress.update(10)
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(job.meta['progress'],
+                             {'processed': 20, 'total': 100, 'rate': 4.0, 'eta': 20.0})
+
+        # Rate is calculated with the items of the last interval
+        mock_monotonic.return_value = 115.0
+        progress.update(20)
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(job.meta['progress'],
+                             {'processed': 40, 'total': 100, 'rate': 2.0, 'eta': 30.0})
+
+    @unittest.mock.patch('sortinghat.core.jobs.time.monotonic')
+    def test_finish(self, mock_monotonic):
+        """Check if the final progress is written"""
+
+        mock_monotonic.return_value = 100.0
+        progress = JobProgress(self.job)
+        progress.update(30)
+
+        mock_monotonic.return_value = 103.0
+        progress.finish()
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(job.meta['progress'],
+                             {'processed': 30, 'total': 30, 'rate': 10.0, 'eta': 0.0})
+
+    def test_add_total(self):
+        """Check if items are added to the total and the progress is written"""
+
+        progress = JobProgress(self.job, total=10)
+        progress.update(10)
+        progress.add_total(5)
+
+        job = find_job(self.job.id)
+        self.assertEqual(job.meta['progress']['processed'], 10)
+        self.assertEqual(job.meta['progress']['total'], 15)
+
+    def test_unknown_total(self):
+        """Check if the ETA is not estimated when the total is unknown"""
+
+        progress = JobProgress(self.job, interval=0)
+        progress.update(10)
+
+        job = find_job(self.job.id)
+        self.assertEqual(job.meta['progress']['processed'], 10)
+        self.assertIsNone(job.meta['progress']['total'])
+        self.assertIsNone(job.meta['progress']['eta'])
+
+    def test_get_job_progress(self):
+        """Check if it returns the progress of a job"""
+
+        job = find_job(self.job.id)
+        self.assertIsNone(get_job_progress(job))
+
+        JobProgress(self.job, total=10)
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(get_job_progress(job),
+                             {'processed': 0, 'total': 10, 'rate': None, 'eta': None})
+
+    def test_get_job_progress_children(self):
+        """Check if the progress of a job is the sum of the progress of its children"""
+
+        self.job.meta['children'] = ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1', 'FFFF']
+        self.job.meta['progress'] = JobProgress.describe(0, 100, None)
+        self.job.save_meta()
+
+        child = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF-0')
+        child.meta['progress'] = JobProgress.describe(20, 50, 2.0)
+        child.save_meta()
+
+        child = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF-1')
+        child.meta['progress'] = JobProgress.describe(10, 50, 3.0)
+        child.save_meta()
+
+        job = find_job(self.job.id)
+        self.assertDictEqual(get_job_progress(job),
+                             {'processed': 30, 'total': 100, 'rate': 5.0, 'eta': 14.0})
+
+
+class TestJobResults(TestCase):
+    """Unit tests for JobResults"""
+
+    def setUp(self):
+        """Store five results in pages of two items"""
+
+        self.connection = django_rq.queues.get_redis_connection(None, True)
+        self.connection.flushall()
+
+        key = JOB_RESULTS_KEY.format('1234-5678-90AB-CDEF')
+        self.connection.rpush(key, pickle.dumps([('A', 0), ('B', 1)]))
+        self.connection.rpush(key, pickle.dumps([('C', 2), ('D', 3)]))
+        self.connection.rpush(key, pickle.dumps([('E', 4)]))
+
+        self.results = JobResults('1234-5678-90AB-CDEF', 5, page_size=2)
+
+    def test_len(self):
+        """Check if the number of results is returned"""
+
+        self.assertEqual(len(self.results), 5)
+
+    def test_iter(self):
+        """Check if all the results are iterated in order"""
+
+        self.assertListEqual(list(self.results),
+                             [('A', 0), ('B', 1), ('C', 2), ('D', 3), ('E', 4)])
+
+    def test_slice(self):
+        """Check if slices across pages are returned"""
+
+        self.assertListEqual(self.results[1:4], [('B', 1), ('C', 2), ('D', 3)])
+        self.assertListEqual(self.results[4:10], [('E', 4)])
+        self.assertListEqual(self.results[::2], [('A', 0), ('C', 2), ('E', 4)])
+        self.assertListEqual(self.results[5:10], [])
+
+    def test_index(self):
+        """Check if a single result is returned"""
+
+        self.assertEqual(self.results[2], ('C', 2))
+        self.assertEqual(self.results[-1], ('E', 4))
+
+        with self.assertRaises(IndexError):
+            self.results[5]
+
+    def test_read_pages(self):
+        """Check if only the pages of the slice are read"""
+
+        with unittest.mock.patch.object(self.results, '_read_pages',
+                                        wraps=self.results._read_pages) as mock_read:
+            self.results[2:4]
+            mock_read.assert_called_once_with(1, 1)
+
+
+class TestFinishChild(TestCase):
+    """Unit tests for _finish_child"""
+
+    def setUp(self):
+        """Create a parent job with two children running"""
+
+        conn = django_rq.queues.get_redis_connection(None, True)
+        conn.flushall()
+
+        self.parent = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF')
+        self.parent.meta['children'] = ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1']
+        self.parent.save_meta()
+
+        self.connection = self.parent.connection
+        self.connection.set(FAN_IN_PENDING_KEY.format(self.parent.id), 2)
+
+        self.child0 = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF-0')
+        self.child1 = enqueue(job_echo, None, job_id='1234-5678-90AB-CDEF-1')
+
+    def test_last_child(self):
+        """Check if the last child writes the aggregated result into the parent"""
+
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': ['error B']})
+
+        parent = find_job(self.parent.id)
+        self.assertIsNone(parent.result)
+        self.assertEqual(get_job_status(parent), 'started')
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': ['error A']})
+
+        # Results are aggregated by position
+        expected = {
+            'results': {
+                'AAAA': ['Example'],
+                'BBBB': ['Bitergia']
+            },
+            'errors': ['error A', 'error B']
+        }
+
+        parent = find_job(self.parent.id)
+        self.assertDictEqual(_read_job_result(parent), expected)
+        self.assertListEqual(list(parent.result['results']),
+                             [('AAAA', ['Example']), ('BBBB', ['Bitergia'])])
+        self.assertEqual(get_job_status(parent), 'finished')
+        self.assertGreater(self.connection.ttl(parent.key), 0)
+
+        # Partial results are removed
+        self.assertFalse(self.connection.exists(FAN_IN_PENDING_KEY.format(self.parent.id)))
+
+    def test_failed_child(self):
+        """Check if the parent is marked as failed when any child failed"""
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'errors': ['Job 1234-5678-90AB-CDEF-1 failed; connection lost']},
+                      failed=True)
+
+        parent = find_job(self.parent.id)
+        self.assertListEqual(parent.meta['failed'], ['1234-5678-90AB-CDEF-1'])
+        self.assertEqual(get_job_status(parent), 'failed')
+        self.assertListEqual(parent.result['errors'],
+                             ['Job 1234-5678-90AB-CDEF-1 failed; connection lost'])
+
+    def test_killed_child(self):
+        """Check if the parent fails when a child died without fanning in"""
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+
+        # The work horse was killed, so RQ marked the child as failed
+        self.child1.set_status('failed')
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'started')
+
+        enqueue(check_children, self.parent.id)
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'failed')
+
+        expected = {
+            'results': {
+                'AAAA': ['Example']
+            },
+            'errors': ['Job 1234-5678-90AB-CDEF-1 failed; job failed']
+        }
+
+        parent = find_job(self.parent.id)
+        self.assertDictEqual(_read_job_result(parent), expected)
+        self.assertListEqual(parent.meta['failed'], ['1234-5678-90AB-CDEF-1'])
+        self.assertFalse(self.connection.exists(FAN_IN_PENDING_KEY.format(self.parent.id)))
+
+    def test_removed_child(self):
+        """Check if the parent waits for the running children when a child was removed"""
+
+        self.child0.set_status('started')
+        self.child1.delete()
+
+        enqueue(check_children, self.parent.id)
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'started')
+        self.assertEqual(int(self.connection.get(FAN_IN_PENDING_KEY.format(self.parent.id))), 1)
+
+        # Checking the children again does not fan in twice
+        enqueue(check_children, self.parent.id)
+
+        self.assertEqual(get_job_status(parent), 'started')
+        self.assertEqual(int(self.connection.get(FAN_IN_PENDING_KEY.format(self.parent.id))), 1)
+
+        # The next checks are scheduled while children are pending
+        scheduled = django_rq.get_queue().scheduled_job_registry
+        self.assertEqual(len(scheduled), 2)
+
+        check = find_job(scheduled.get_job_ids()[0])
+        self.assertEqual(check.func_name, 'sortinghat.core.jobs.check_children')
+        self.assertEqual(check.meta['parent'], self.parent.id)
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'failed')
+        self.assertListEqual(parent.result['errors'],
+                             ['Job 1234-5678-90AB-CDEF-1 failed; job not found'])
+
+    def test_running_children(self):
+        """Check if the parent is started while its children are running"""
+
+        self.child0.set_status('started')
+        self.child1.set_status('queued')
+
+        enqueue(check_children, self.parent.id)
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'started')
+        self.assertIsNone(parent.result)
+        self.assertEqual(int(self.connection.get(FAN_IN_PENDING_KEY.format(self.parent.id))), 2)
+
+    def test_status_read_only(self):
+        """Check if reading the status of the parent does not check its children"""
+
+        self.child0.set_status('failed')
+        self.child1.set_status('failed')
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'started')
+        self.assertEqual(int(self.connection.get(FAN_IN_PENDING_KEY.format(self.parent.id))), 2)
+
+    def test_parent_result_ttl(self):
+        """Check if the parent is kept for its own result time to live"""
+
+        self.parent.meta['result_ttl'] = 86400 * 7
+        self.parent.save_meta()
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': []})
+
+        self.assertGreater(self.connection.ttl(self.parent.key), 86400)
+        self.assertGreater(self.connection.ttl(JOB_RESULTS_KEY.format(self.parent.id)), 86400)
+
+    def test_parent_result_ttl_forever(self):
+        """Check if the parent is kept forever when its result does not expire"""
+
+        self.parent.meta['result_ttl'] = -1
+        self.parent.save_meta()
+        self.connection.expire(self.parent.key, 100)
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': []})
+
+        self.assertEqual(self.connection.ttl(self.parent.key), -1)
+        self.assertEqual(self.connection.ttl(JOB_RESULTS_KEY.format(self.parent.id)), -1)
+
+        registry = django_rq.get_queue().finished_job_registry
+        self.assertEqual(registry.connection.zscore(registry.key, self.parent.id), float('inf'))
+
+    def test_parent_finished_registry(self):
+        """Check if the parent is kept in the finished registry for its own time to live"""
+
+        # The worker kept the parent for the time to live of the fan in
+        registry = django_rq.get_queue().finished_job_registry
+        registry.add(self.parent, FAN_IN_TTL)
+        self.connection.expire(self.parent.key, FAN_IN_TTL)
+
+        self.parent.meta['result_ttl'] = 500
+        self.parent.save_meta()
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': []})
+
+        self.assertLessEqual(self.connection.ttl(self.parent.key), 500)
+        self.assertEqual(registry.get_expired_job_ids(datetime_utcnow().timestamp() + 501),
+                         [self.parent.id])
+
+    @unittest.mock.patch('sortinghat.core.jobs.time.sleep')
+    def test_parent_not_finished(self, mock_sleep):
+        """Check if the last child waits for the worker of the parent to finish it"""
+
+        self.parent.set_status('started')
+
+        def finish_parent(_):
+            self.parent.set_status('finished')
+
+        mock_sleep.side_effect = finish_parent
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        mock_sleep.assert_not_called()
+
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': []})
+        mock_sleep.assert_called_once()
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(get_job_status(parent), 'finished')
+        self.assertEqual(len(parent.result['results']), 2)
+
+    @unittest.mock.patch('sortinghat.core.jobs.FAN_IN_WAIT', 0)
+    def test_parent_never_finished(self):
+        """Check if the result is written when the parent does not finish in time"""
+
+        self.parent.set_status('started')
+
+        _finish_child(self.child0, self.parent.id, 0,
+                      {'results': {'AAAA': ['Example']}, 'errors': []})
+        _finish_child(self.child1, self.parent.id, 1,
+                      {'results': {'BBBB': ['Bitergia']}, 'errors': []})
+
+        parent = find_job(self.parent.id)
+        self.assertEqual(len(parent.result['results']), 2)
+
+
 class TestRecommendAffiliations(TestCase):
     """Unit tests for recommend_affiliations"""
 
@@ -138,14 +682,13 @@ class TestRecommendAffiliations(TestCase):
         # Test
         expected = {
             'results': {
-                '0c1e1701bc819495acf77ef731023b7d789a9c71': [],
                 '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
                 'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
             }
         }
 
         job = recommend_affiliations.delay(ctx)
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
@@ -164,10 +707,39 @@ class TestRecommendAffiliations(TestCase):
         uuids = ['dc31d2afbee88a6d1dbc1ef05ec827b878067744']
         job = recommend_affiliations.delay(ctx, uuids=uuids)
 
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
+    @unittest.mock.patch('sortinghat.core.jobs.MAX_CHUNK_SIZE', 1)
+    def test_recommend_affiliations_chunks(self):
+        """Check if recommendations are aggregated from child jobs"""
+
+        ctx = SortingHatContext(self.user)
+
+        # Test
+        expected = {
+            'results': {
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example'],
+                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example']
+            }
+        }
+
+        uuids = ['dc31d2afbee88a6d1dbc1ef05ec827b878067744',
+                 '17ab00ed3825ec2f50483e33c88df223264182ba']
+        job = recommend_affiliations.delay(ctx, uuids=uuids, job_id='1234-5678-90AB-CDEF')
+
+        self.assertDictEqual(_read_job_result(job), expected)
+        self.assertListEqual(job.meta['children'],
+                             ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1'])
+        self.assertEqual(get_job_status(job), 'finished')
+
+        # Each child only generated the recommendations of its chunk
+        child = find_job('1234-5678-90AB-CDEF-1')
+        self.assertEqual(child.get_status(), 'finished')
+        self.assertDictEqual(child.result,
+                             {'results': {'17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example']}})
+
     @unittest.mock.patch('sortinghat.core.api.find_individual_by_uuid')
     def test_not_found_uuid_error(self, mock_find_indv):
         """Check if the recommendation process returns no results when an individual is not found"""
@@ -184,7 +756,7 @@ class TestRecommendAffiliations(TestCase):
 
         uuids = ['1234567890abcdefg']
         job = recommend_affiliations.delay(ctx, uuids=uuids)
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
@@ -274,7 +846,6 @@ class TestAffiliateIndividuals(TestCase):
         # Test
         expected = {
             'results': {
-                '0c1e1701bc819495acf77ef731023b7d789a9c71': [],
                 '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
                 'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
             },
@@ -282,7 +853,7 @@ class TestAffiliateIndividuals(TestCase):
         }
 
         job = affiliate.delay(ctx)
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
@@ -331,7 +902,7 @@ class TestAffiliateIndividuals(TestCase):
         uuids = ['dc31d2afbee88a6d1dbc1ef05ec827b878067744']
         job = affiliate.delay(ctx, uuids=uuids)
 
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
@@ -356,20 +927,118 @@ class TestAffiliateIndividuals(TestCase):
         enrollments_db = individual_db.enrollments.all()
         self.assertEqual(len(enrollments_db), 0)
 
-    @unittest.mock.patch('sortinghat.core.api.find_individual_by_uuid')
-    def test_not_found_uuid_error(self, mock_find_indv):
-        """Check if the affiliation process logs the error when an individual is not found"""
+    @unittest.mock.patch('sortinghat.core.jobs.MAX_CHUNK_SIZE', 2)
+    def test_affiliate_chunks(self):
+        """Check if the individuals are affiliated by child jobs of ranges of main keys"""
 
-        exc = NotFoundError(entity='dc31d2afbee88a6d1dbc1ef05ec827b878067744')
-        mock_find_indv.side_effect = exc
+        ctx = SortingHatContext(self.user)
+
+        # Test
+        expected = {
+            'results': {
+                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
+            },
+            'errors': []
+        }
+
+        job = affiliate.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        self.assertDictEqual(_read_job_result(job), expected)
+        self.assertListEqual(job.meta['children'],
+                             ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1'])
+        self.assertEqual(get_job_status(job), 'finished')
+
+        progress = get_job_progress(job)
+        self.assertEqual(progress['processed'], 3)
+        self.assertEqual(progress['total'], 3)
+        self.assertEqual(progress['eta'], 0)
+
+        child = find_job('1234-5678-90AB-CDEF-0')
+        self.assertEqual(child.meta['parent'], '1234-5678-90AB-CDEF')
+        self.assertEqual(child.meta['progress']['processed'], 2)
+        self.assertEqual(child.meta['progress']['total'], 2)
+        self.assertEqual(child.kwargs['mk_range'],
+                         (None, 'dc31d2afbee88a6d1dbc1ef05ec827b878067744'))
+
+        child = find_job('1234-5678-90AB-CDEF-1')
+        self.assertEqual(child.kwargs['mk_range'],
+                         ('dc31d2afbee88a6d1dbc1ef05ec827b878067744', None))
+        self.assertDictEqual(child.result,
+                             {'results': {'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']},
+                              'errors': []})
+
+    @unittest.mock.patch('sortinghat.core.jobs.MAX_CHUNK_SIZE', 2)
+    @unittest.mock.patch('sortinghat.core.jobs._chunk_keys')
+    def test_affiliate_chunk_failed(self, mock_chunk_keys):
+        """Check if the status of the job is failed when any of its children fails"""
+
+        mock_chunk_keys.side_effect = [
+            ['0c1e1701bc819495acf77ef731023b7d789a9c71',
+             '17ab00ed3825ec2f50483e33c88df223264182ba'],
+            RuntimeError('connection lost')
+        ]
 
         ctx = SortingHatContext(self.user)
 
         # Test
         expected = {
             'results': {
-                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': []
+                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example']
             },
+            'errors': [
+                "Job 1234-5678-90AB-CDEF-1 failed; connection lost"
+            ]
+        }
+
+        job = affiliate.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        self.assertDictEqual(_read_job_result(job), expected)
+        self.assertListEqual(job.meta['failed'], ['1234-5678-90AB-CDEF-1'])
+        self.assertEqual(get_job_status(job), 'failed')
+
+        child = find_job('1234-5678-90AB-CDEF-1')
+        self.assertEqual(child.get_status(), 'failed')
+
+    @unittest.mock.patch('sortinghat.core.jobs._fan_in')
+    def test_affiliate_children_pending(self, mock_fan_in):
+        """Check if the job is started while its children are running"""
+
+        # Children have not finished
+        mock_fan_in.return_value = None
+
+        ctx = SortingHatContext(self.user)
+
+        job = affiliate.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        self.assertIsNone(job.result)
+        self.assertEqual(job.get_status(), 'finished')
+        self.assertEqual(get_job_status(job), 'started')
+
+    def test_affiliate_empty_registry(self):
+        """Check if the job finishes when there are not individuals to affiliate"""
+
+        Individual.objects.all().delete()
+
+        ctx = SortingHatContext(self.user)
+
+        job = affiliate.delay(ctx)
+
+        self.assertDictEqual(_read_job_result(job), {'results': {}, 'errors': []})
+        self.assertListEqual(job.meta['children'], [])
+        self.assertEqual(get_job_status(job), 'finished')
+
+    @unittest.mock.patch('sortinghat.core.api.find_individuals_by_uuids')
+    def test_not_found_uuid_error(self, mock_find_indvs):
+        """Check if the affiliation process logs the error when an individual is not found"""
+
+        mock_find_indvs.return_value = {}
+
+        ctx = SortingHatContext(self.user)
+
+        # Test
+        expected = {
+            'results': {},
             'errors': [
                 "dc31d2afbee88a6d1dbc1ef05ec827b878067744 not found in the registry"
             ]
@@ -377,35 +1046,29 @@ class TestAffiliateIndividuals(TestCase):
 
         uuids = ['dc31d2afbee88a6d1dbc1ef05ec827b878067744']
         job = affiliate.delay(ctx, uuids=uuids)
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
-    @unittest.mock.patch('sortinghat.core.api.add_enrollment')
-    def test_enrollment_errors(self, mock_enroll):
+    def test_enrollment_errors(self):
         """Check if the affiliation process logs the errors there are errors
         adding enrollments"""
 
-        exc = DuplicateRangeError(start='1900-01-01',
-                                  end='2100-01-01',
-                                  org='Example')
-        mock_enroll.side_effect = exc
-
         ctx = SortingHatContext(self.user)
 
+        api.lock(ctx, 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+
         # Test
         expected = {
-            'results': {
-                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': []
-            },
+            'results': {},
             'errors': [
-                "range date '1900-01-01'-'2100-01-01' is part of an existing range for Example"
+                "Individual dc31d2afbee88a6d1dbc1ef05ec827b878067744 is locked"
             ]
         }
 
         uuids = ['dc31d2afbee88a6d1dbc1ef05ec827b878067744']
         job = affiliate.delay(ctx, uuids=uuids)
-        result = job.result
+        result = _read_job_result(job)
 
         self.assertDictEqual(result, expected)
 
@@ -419,7 +1082,7 @@ class TestAffiliateIndividuals(TestCase):
         affiliate.delay(ctx, job_id='1234-5678-90AB-CDEF')
 
         transactions = Transaction.objects.filter(created_at__gte=timestamp)
-        self.assertEqual(len(transactions), 4)
+        self.assertEqual(len(transactions), 2)
 
         trx = transactions[0]
         self.assertIsInstance(trx, Transaction)
@@ -427,11 +1090,15 @@ class TestAffiliateIndividuals(TestCase):
         self.assertGreater(trx.created_at, timestamp)
         self.assertEqual(trx.authored_by, ctx.user.username)
 
-        for trx in transactions[1:]:
-            self.assertIsInstance(trx, Transaction)
-            self.assertEqual(trx.name, 'enroll-1234-5678-90AB-CDEF')
-            self.assertGreater(trx.created_at, timestamp)
-            self.assertEqual(trx.authored_by, ctx.user.username)
+        # Enrollments of each chunk are applied in a single transaction
+        trx = transactions[1]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'enroll_many-1234-5678-90AB-CDEF')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, ctx.user.username)
+
+        operations = Operation.objects.filter(trx=trx)
+        self.assertEqual(len(operations), 3)
 
 
 class TestRecommendMatches(TestCase):
@@ -593,27 +1260,58 @@ class TestRecommendMatches(TestCase):
 
         self.assertDictEqual(result, expected)
 
-    def test_recommend_source_not_mk(self):
-        """Check if recommendations work when the provided uuid is not an Individual's main key"""
+    def test_recommend_matches_workers(self):
+        """Check if recommendations are obtained using several processes"""
 
         ctx = SortingHatContext(self.user)
 
         # Test
         expected = {
             'results': {
-                self.js_alt3.uuid: [self.jsmith.uuid]
+                self.john_smith.uuid: sorted([self.jsmith.uuid]),
+                self.jrae3.uuid: sorted([self.jrae.uuid,
+                                         self.jane_rae.uuid]),
+                self.jr2.uuid: sorted([self.jrae.uuid,
+                                       self.jane_rae.uuid])
             }
         }
 
-        source_uuids = [self.js_alt3.uuid]
-        target_uuids = [self.jsm3.uuid]
+        source_uuids = [self.john_smith.uuid, self.jrae3.uuid, self.jr2.uuid]
         criteria = ['email', 'name', 'username']
 
         job = recommend_matches.delay(ctx,
                                       source_uuids,
-                                      target_uuids,
-                                      criteria)
-        result = job.result
+                                      None,
+                                      criteria,
+                                      workers=2)
+        # Preserve job results order for the comparison against the expected results
+        result = job.result
+        for key in result['results']:
+            result['results'][key] = sorted(result['results'][key])
+
+        self.assertDictEqual(result, expected)
+
+    def test_recommend_source_not_mk(self):
+        """Check if recommendations work when the provided uuid is not an Individual's main key"""
+
+        ctx = SortingHatContext(self.user)
+
+        # Test
+        expected = {
+            'results': {
+                self.js_alt3.uuid: [self.jsmith.uuid]
+            }
+        }
+
+        source_uuids = [self.js_alt3.uuid]
+        target_uuids = [self.jsm3.uuid]
+        criteria = ['email', 'name', 'username']
+
+        job = recommend_matches.delay(ctx,
+                                      source_uuids,
+                                      target_uuids,
+                                      criteria)
+        result = job.result
 
         self.assertDictEqual(result, expected)
 
@@ -645,6 +1343,83 @@ class TestRecommendMatches(TestCase):
 
         self.assertDictEqual(result, expected)
 
+    def test_recommend_matches_fuzzy_name(self):
+        """Check if recommendations are obtained comparing names by similarity"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                self.jane_rae.uuid: [self.jrae.uuid]
+            }
+        }
+
+        source_uuids = [self.jane_rae.uuid]
+        criteria = ['fuzzy_name']
+
+        job = recommend_matches.delay(ctx,
+                                      source_uuids,
+                                      None,
+                                      criteria)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_recommend_matches_compound_criteria(self):
+        """Check if recommendations are obtained using compound criteria"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                self.jsmith.uuid: [self.js_alt.uuid]
+            }
+        }
+
+        source_uuids = [self.jsmith.uuid]
+        criteria = [['name', 'username']]
+
+        job = recommend_matches.delay(ctx,
+                                      source_uuids,
+                                      None,
+                                      criteria)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_progress(self):
+        """Check if the progress is reported while matching and merging"""
+
+        ctx = SortingHatContext(self.user)
+
+        saved = []
+        save = JobProgress._save
+
+        def _save(progress):
+            saved.append((progress.processed, progress.total))
+            save(progress)
+
+        source_uuids = [self.john_smith.uuid, self.jrae3.uuid, self.jr2.uuid]
+        criteria = ['email', 'name', 'username']
+
+        with unittest.mock.patch.object(JobProgress, '_save', autospec=True,
+                                        side_effect=_save):
+            job = unify.delay(ctx, source_uuids, None, criteria)
+
+        ngroups = len(job.result['results'])
+        self.assertGreater(ngroups, 0)
+
+        # Matching the source individuals is the first phase
+        # and the groups to merge are added to the total later
+        self.assertListEqual(saved, [(0, 3),
+                                     (3, 3 + ngroups),
+                                     (3 + ngroups, 3 + ngroups)])
+
+        progress = job.meta['progress']
+        self.assertEqual(progress['processed'], 3 + ngroups)
+        self.assertEqual(progress['total'], 3 + ngroups)
+        self.assertEqual(progress['eta'], 0)
+
     def test_no_matches_found(self):
         """Check whether it returns no results when there is no matches for the input identity"""
 
@@ -1060,6 +1835,530 @@ class TestUnify(TestCase):
 
         trx = transactions[1]
         self.assertIsInstance(trx, Transaction)
-        self.assertEqual(trx.name, 'merge-ABCD-EF12-3456-7890')
+        self.assertEqual(trx.name, 'merge_many-ABCD-EF12-3456-7890')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, ctx.user.username)
+
+
+class TestRecommendBots(TestCase):
+    """Unit tests for recommend_bots"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        self.jenkins = api.add_identity(ctx,
+                                        source='scm',
+                                        email='jenkins@example.com',
+                                        name='Jenkins',
+                                        username='jenkins')
+        self.jsmith = api.add_identity(ctx,
+                                       source='scm',
+                                       email='jsmith@example.com',
+                                       name='John Smith',
+                                       username='jsmith')
+        self.jsmith_ci = api.add_identity(ctx,
+                                          source='gitlab',
+                                          username='jsmith-ci',
+                                          uuid=self.jsmith.uuid)
+
+    def test_recommend_bots(self):
+        """Check if recommendations are generated for all the individuals"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                self.jenkins.uuid: 1.0,
+                self.jsmith.uuid: 0.5
+            }
+        }
+
+        job = recommend_bots.delay(ctx)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_recommend_bots_uuid(self):
+        """Check if recommendations are generated only for the given individuals"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                self.jsmith.uuid: 0.5
+            }
+        }
+
+        job = recommend_bots.delay(ctx, uuids=[self.jsmith_ci.uuid])
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_min_score(self):
+        """Check if individuals below the minimum score are not recommended"""
+
+        ctx = SortingHatContext(self.user)
+
+        job = recommend_bots.delay(ctx, min_score=0.75)
+        result = job.result
+
+        self.assertDictEqual(result, {'results': {self.jenkins.uuid: 1.0}})
+
+    def test_transactions(self):
+        """Check if the right transactions were created"""
+
+        timestamp = datetime_utcnow()
+
+        ctx = SortingHatContext(self.user)
+
+        recommend_bots.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 1)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'recommend_bots-1234-5678-90AB-CDEF')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, ctx.user.username)
+
+
+class TestMarkBots(TestCase):
+    """Unit tests for mark_bots"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        self.jenkins = api.add_identity(ctx,
+                                        source='scm',
+                                        email='jenkins@example.com',
+                                        name='Jenkins',
+                                        username='jenkins')
+        self.dependabot = api.add_identity(ctx,
+                                           source='github',
+                                           username='dependabot[bot]')
+        self.jsmith = api.add_identity(ctx,
+                                       source='scm',
+                                       email='jsmith@example.com',
+                                       name='John Smith',
+                                       username='jsmith')
+
+    def test_mark_bots(self):
+        """Check if the recommended individuals are marked as bots"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': sorted([self.jenkins.uuid, self.dependabot.uuid]),
+            'errors': []
+        }
+
+        job = mark_bots.delay(ctx)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+        # Check the progress of the job
+        progress = job.meta['progress']
+        self.assertEqual(progress['processed'], 2)
+        self.assertEqual(progress['total'], 2)
+        self.assertEqual(progress['eta'], 0)
+
+        # Check database objects
+        individual_db = Individual.objects.get(mk=self.jenkins.uuid)
+        self.assertTrue(individual_db.profile.is_bot)
+
+        individual_db = Individual.objects.get(mk=self.dependabot.uuid)
+        self.assertTrue(individual_db.profile.is_bot)
+
+        individual_db = Individual.objects.get(mk=self.jsmith.uuid)
+        self.assertFalse(individual_db.profile.is_bot)
+
+        # Individuals already marked are not marked again
+        job = mark_bots.delay(ctx)
+        self.assertDictEqual(job.result, {'results': [], 'errors': []})
+
+    def test_mark_bots_uuid(self):
+        """Check if only the given individuals are marked as bots"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': [self.jenkins.uuid],
+            'errors': []
+        }
+
+        job = mark_bots.delay(ctx, uuids=[self.jenkins.uuid, self.jsmith.uuid])
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+        individual_db = Individual.objects.get(mk=self.dependabot.uuid)
+        self.assertFalse(individual_db.profile.is_bot)
+
+    @unittest.mock.patch('sortinghat.core.jobs.update_profile')
+    def test_update_errors(self, mock_update):
+        """Check if the errors updating the profiles are logged"""
+
+        exc = NotFoundError(entity=self.jenkins.uuid)
+        mock_update.side_effect = exc
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': [],
+            'errors': [
+                "{} not found in the registry".format(self.jenkins.uuid)
+            ]
+        }
+
+        job = mark_bots.delay(ctx, uuids=[self.jenkins.uuid])
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_transactions(self):
+        """Check if the right transactions were created"""
+
+        timestamp = datetime_utcnow()
+
+        ctx = SortingHatContext(self.user)
+
+        mark_bots.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 3)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'mark_bots-1234-5678-90AB-CDEF')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, ctx.user.username)
+
+        for trx in transactions[1:]:
+            self.assertIsInstance(trx, Transaction)
+            self.assertEqual(trx.name, 'update_profile-1234-5678-90AB-CDEF')
+            self.assertGreater(trx.created_at, timestamp)
+            self.assertEqual(trx.authored_by, ctx.user.username)
+
+
+class TestRecommendOrganizations(TestCase):
+    """Unit tests for recommend_organizations"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example')
+        api.add_organization(ctx, 'Example, Inc.')
+        api.add_organization(ctx, 'Bitergia')
+        api.add_organization(ctx, 'Bitergia S.L.')
+        api.add_organization(ctx, 'LibreSoft')
+
+    def test_recommend_organizations(self):
+        """Check if recommendations are generated for all the organizations"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                'Bitergia': ['Bitergia S.L.'],
+                'Example': ['Example, Inc.']
+            }
+        }
+
+        job = recommend_organizations.delay(ctx)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_recommend_organizations_names(self):
+        """Check if recommendations are generated only for the given organizations"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                'Example': ['Example, Inc.']
+            }
+        }
+
+        job = recommend_organizations.delay(ctx, names=['Example, Inc.', 'LibreSoft'])
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+    def test_transactions(self):
+        """Check if the right transactions were created"""
+
+        timestamp = datetime_utcnow()
+
+        ctx = SortingHatContext(self.user)
+
+        recommend_organizations.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 1)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'recommend_organizations-1234-5678-90AB-CDEF')
         self.assertGreater(trx.created_at, timestamp)
         self.assertEqual(trx.authored_by, ctx.user.username)
+
+
+class TestUnifyOrganizations(TestCase):
+    """Unit tests for unify_organizations"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example')
+        api.add_organization(ctx, 'Example, Inc.')
+        api.add_organization(ctx, 'example')
+        api.add_organization(ctx, 'Bitergia')
+        api.add_organization(ctx, 'Bitergia S.L.')
+
+        api.add_domain(ctx, 'Example, Inc.', 'example.com')
+
+        self.jsmith = api.add_identity(ctx, 'scm', email='jsmith@example.com')
+        api.enroll(ctx, self.jsmith.uuid, 'example')
+
+    def test_unify_organizations(self):
+        """Check if duplicate organizations are merged"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                'Bitergia': ['Bitergia S.L.'],
+                'example': ['Example', 'Example, Inc.']
+            },
+            'errors': []
+        }
+
+        job = unify_organizations.delay(ctx)
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+        # Check database objects
+        orgs = Organization.objects.order_by('name').values_list('name', flat=True)
+        self.assertListEqual(list(orgs), ['Bitergia', 'example'])
+
+        org = Organization.objects.get(name='example')
+        self.assertListEqual([d.domain for d in org.domains.all()], ['example.com'])
+        self.assertEqual(org.enrollments.count(), 1)
+
+    def test_unify_organizations_names(self):
+        """Check if only the groups of the given organizations are merged"""
+
+        ctx = SortingHatContext(self.user)
+
+        expected = {
+            'results': {
+                'Bitergia': ['Bitergia S.L.']
+            },
+            'errors': []
+        }
+
+        job = unify_organizations.delay(ctx, names=['Bitergia S.L.'])
+        result = job.result
+
+        self.assertDictEqual(result, expected)
+
+        orgs = Organization.objects.order_by('name').values_list('name', flat=True)
+        self.assertListEqual(list(orgs), ['Bitergia', 'Example', 'Example, Inc.', 'example'])
+
+    def test_merge_errors(self):
+        """Check if the errors merging organizations are logged"""
+
+        ctx = SortingHatContext(self.user)
+        api.lock(ctx, self.jsmith.uuid)
+
+        api.add_organization(ctx, 'Example Inc')
+        api.enroll(SortingHatContext(self.user),
+                   api.add_identity(ctx, 'scm', email='jdoe@example.com').uuid,
+                   'Example Inc')
+        api.enroll(ctx, api.add_identity(ctx, 'scm', email='jroe@example.com').uuid,
+                   'Example Inc')
+
+        job = unify_organizations.delay(ctx, names=['example'])
+        result = job.result
+
+        # 'example' cannot be merged because John Smith is locked
+        expected = {
+            'results': {
+                'Example Inc': ['Example', 'Example, Inc.']
+            },
+            'errors': [
+                "Individual {} is locked".format(self.jsmith.uuid)
+            ]
+        }
+        self.assertDictEqual(result, expected)
+
+    def test_transactions(self):
+        """Check if the right transactions were created"""
+
+        timestamp = datetime_utcnow()
+
+        ctx = SortingHatContext(self.user)
+
+        unify_organizations.delay(ctx, job_id='1234-5678-90AB-CDEF')
+
+        transactions = Transaction.objects.filter(created_at__gte=timestamp)
+        self.assertEqual(len(transactions), 4)
+
+        trx = transactions[0]
+        self.assertIsInstance(trx, Transaction)
+        self.assertEqual(trx.name, 'unify_organizations-1234-5678-90AB-CDEF')
+        self.assertGreater(trx.created_at, timestamp)
+        self.assertEqual(trx.authored_by, ctx.user.username)
+
+        for trx in transactions[1:]:
+            self.assertIsInstance(trx, Transaction)
+            self.assertEqual(trx.name, 'merge_organizations-1234-5678-90AB-CDEF')
+            self.assertGreater(trx.created_at, timestamp)
+            self.assertEqual(trx.authored_by, ctx.user.username)
+
+
+class TestUpdateStoredAffiliationRecommendations(TestCase):
+    """Unit tests for update_stored_affiliation_recommendations"""
+
+    def setUp(self):
+        """Initialize database with a dataset"""
+
+        self.user = get_user_model().objects.create(username='test')
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example')
+        api.add_domain(ctx, 'Example', 'example.com')
+        api.add_organization(ctx, 'Bitergia')
+        api.add_domain(ctx, 'Bitergia', 'bitergia.com')
+
+        # Updates are not enqueued because the tests
+        # run inside a transaction that is never committed
+        self.jsmith = api.add_identity(ctx, 'scm', email='jsmith@example.com')
+        self.jdoe = api.add_identity(ctx, 'scm', email='jdoe@bitergia.com')
+        self.jrae = api.add_identity(ctx, 'scm', email='jrae@it.bitergia.com')
+
+    @staticmethod
+    def _stored_recommendations():
+        recs = AffiliationRecommendation.objects.order_by('individual_id', 'organization__name')
+        return list(recs.values_list('individual', 'organization__name'))
+
+    def test_update_individuals(self):
+        """Check if the recommendations of the given individuals are stored"""
+
+        job = update_stored_affiliation_recommendations.delay(mks=[self.jsmith.uuid])
+
+        self.assertEqual(job.result, 1)
+        self.assertListEqual(self._stored_recommendations(),
+                             [(self.jsmith.uuid, 'Example')])
+
+    def test_update_domains(self):
+        """Check if the recommendations of the individuals in the domains are stored"""
+
+        job = update_stored_affiliation_recommendations.delay(domain_names=['bitergia.com'])
+
+        expected = sorted([(self.jdoe.uuid, 'Bitergia'),
+                           (self.jrae.uuid, 'Bitergia')])
+
+        self.assertEqual(job.result, 2)
+        self.assertListEqual(self._stored_recommendations(), expected)
+
+
+class TestSplitKeys(TestCase):
+    """Unit tests for _split_keys and _chunk_keys"""
+
+    def setUp(self):
+        """Initialize database with a set of individuals"""
+
+        for mk in ['AAAA', 'CCCC', 'EEEE', 'GGGG', 'IIII']:
+            Individual.objects.create(mk=mk)
+
+    def test_split_uuids(self):
+        """Check if the given identifiers are split in lists"""
+
+        chunks = list(_split_keys(['AAAA', 'CCCC', 'EEEE'], 2))
+
+        self.assertListEqual(chunks, [{'uuids': ['AAAA', 'CCCC']},
+                                      {'uuids': ['EEEE']}])
+        self.assertListEqual(_chunk_keys(**chunks[1]), ['EEEE'])
+
+    def test_split_registry(self):
+        """Check if the registry is split in contiguous ranges of main keys"""
+
+        chunks = list(_split_keys(None, 2))
+
+        self.assertListEqual(chunks, [{'mk_range': (None, 'EEEE')},
+                                      {'mk_range': ('EEEE', 'IIII')},
+                                      {'mk_range': ('IIII', None)}])
+
+        keys = [_chunk_keys(**chunk) for chunk in chunks]
+        self.assertListEqual(keys, [['AAAA', 'CCCC'], ['EEEE', 'GGGG'], ['IIII']])
+
+    def test_individuals_added_after_split(self):
+        """Check if individuals added after splitting the registry are not skipped"""
+
+        chunks = list(_split_keys(None, 2))
+
+        for mk in ['0000', 'BBBB', 'DDDD', 'FFFF', 'HHHH', 'ZZZZ']:
+            Individual.objects.create(mk=mk)
+
+        keys = [_chunk_keys(**chunk) for chunk in chunks]
+        self.assertListEqual(keys, [['0000', 'AAAA', 'BBBB', 'CCCC', 'DDDD'],
+                                    ['EEEE', 'FFFF', 'GGGG', 'HHHH'],
+                                    ['IIII', 'ZZZZ']])
+
+    def test_empty_registry(self):
+        """Check if there are no chunks when the registry is empty"""
+
+        Individual.objects.all().delete()
+
+        chunks = list(_split_keys(None, 2))
+        self.assertListEqual(chunks, [])
+
+
+class TestCheckCriteria(TestCase):
+    """Unit tests for check_criteria"""
+
+    def test_valid_criteria(self):
+        """Check if simple and compound criteria are accepted"""
+
+        check_criteria(['email', 'name', 'username', 'fuzzy_name'])
+        check_criteria([['name', 'source'], ['email', 'username'], 'name'])
+        check_criteria([['fuzzy_name']])
+        check_criteria([])
+
+    def test_invalid_criteria(self):
+        """Check if an error is raised when a simple criterion is not valid"""
+
+        with self.assertRaisesRegex(ValueError, "Invalid criteria"):
+            check_criteria(['email', 'source'])
+
+    def test_invalid_compound_criteria(self):
+        """Check if an error is raised when a compound criterion is not valid"""
+
+        with self.assertRaisesRegex(ValueError, "Invalid compound criterion"):
+            check_criteria([['name', 'fuzzy_name']])
+
+        with self.assertRaisesRegex(ValueError, "Invalid compound criterion"):
+            check_criteria([['email', 'uuid']])
+
+        with self.assertRaisesRegex(ValueError, "Invalid compound criterion"):
+            check_criteria([[]])
+
+        with self.assertRaisesRegex(ValueError, "'source' cannot be used alone"):
+            check_criteria([['source', 'source']])
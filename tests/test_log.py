@@ -31,6 +31,7 @@ from django.test import TestCase
 from grimoirelab_toolkit.datetime import datetime_utcnow
 
 from sortinghat.core.context import SortingHatContext
+from sortinghat.core.db import DOMAINS_VERSION, find_registry_version
 from sortinghat.core.errors import (AlreadyExistsError,
                                     ClosedTransactionError)
 from sortinghat.core.log import TransactionsLog
@@ -245,6 +246,118 @@ class TestLogTransaction(TestCase):
         self.assertEqual(operation_db.args, json.dumps(input_args2))
         self.assertEqual(input_args2, json.loads(operation_db.args))
 
+    def test_log_operations(self):
+        """Check if a set of operations is logged at once"""
+
+        trxl = TransactionsLog.open('test', self.ctx)
+        timestamp = datetime_utcnow()
+
+        operations = [
+            {
+                'op_type': Operation.OpType.ADD,
+                'entity_type': 'test_entity',
+                'timestamp': timestamp,
+                'args': {'mk': '12345abcd'},
+                'target': 'test1'
+            },
+            {
+                'op_type': Operation.OpType.DELETE,
+                'entity_type': 'test_entity',
+                'timestamp': timestamp,
+                'args': {'mk': '67890efgh'},
+                'target': 'test2'
+            }
+        ]
+
+        with self.assertNumQueries(1):
+            ops = trxl.log_operations(operations)
+
+        self.assertEqual(len(ops), 2)
+
+        # Operations keep their order
+        operations_db = Operation.objects.filter(trx=trxl.trx)
+        self.assertEqual(len(operations_db), 2)
+
+        operation_db = operations_db[0]
+        self.assertEqual(operation_db.ouid, ops[0].ouid)
+        self.assertEqual(operation_db.op_type, Operation.OpType.ADD.value)
+        self.assertEqual(operation_db.entity_type, 'test_entity')
+        self.assertEqual(operation_db.timestamp, timestamp)
+        self.assertEqual(operation_db.target, 'test1')
+        self.assertEqual(json.loads(operation_db.args), {'mk': '12345abcd'})
+
+        operation_db = operations_db[1]
+        self.assertEqual(operation_db.ouid, ops[1].ouid)
+        self.assertEqual(operation_db.op_type, Operation.OpType.DELETE.value)
+        self.assertGreater(operation_db.timestamp, timestamp)
+        self.assertEqual(operation_db.target, 'test2')
+        self.assertEqual(json.loads(operation_db.args), {'mk': '67890efgh'})
+
+    def test_registry_version(self):
+        """Check if the version of the registry is increased after committing"""
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            trxl = TransactionsLog.open('test', self.ctx)
+            trxl.log_operation(op_type=Operation.OpType.ADD, timestamp=datetime_utcnow(),
+                               entity_type='test_entity', target='test', args={})
+            trxl.log_operations([
+                {
+                    'op_type': Operation.OpType.DELETE,
+                    'entity_type': 'test_entity',
+                    'timestamp': datetime_utcnow(),
+                    'args': {},
+                    'target': 'test'
+                }
+            ])
+
+        # The version is increased once per transaction
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(find_registry_version(), 0)
+
+        callbacks[0]()
+        self.assertEqual(find_registry_version(), 1)
+        self.assertEqual(find_registry_version(DOMAINS_VERSION), 0)
+
+    def test_domains_version(self):
+        """Check if the version of the domains is increased after committing"""
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trxl = TransactionsLog.open('test', self.ctx)
+            trxl.log_operation(op_type=Operation.OpType.ADD, timestamp=datetime_utcnow(),
+                               entity_type='domain', target='example.com', args={})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            trxl = TransactionsLog.open('test', self.ctx)
+            trxl.log_operation(op_type=Operation.OpType.DELETE, timestamp=datetime_utcnow(),
+                               entity_type='organization', target='Example', args={})
+
+        self.assertEqual(find_registry_version(), 2)
+        self.assertEqual(find_registry_version(DOMAINS_VERSION), 2)
+
+    def test_log_operations_closed_transaction(self):
+        """Check if it fails when logging a set of operations on a closed transaction"""
+
+        trxl = TransactionsLog.open('test', self.ctx)
+        tuid = trxl.trx.tuid
+        trxl.close()
+
+        operations = [
+            {
+                'op_type': Operation.OpType.ADD,
+                'entity_type': 'test_entity',
+                'timestamp': datetime_utcnow(),
+                'args': {'mk': '12345abcd'},
+                'target': 'test'
+            }
+        ]
+
+        error_msg = OPERATION_TRANSACTION_CLOSED_ERROR.format(tuid=tuid)
+        with self.assertRaisesRegex(ClosedTransactionError, error_msg):
+            trxl.log_operations(operations)
+
+        operations = Operation.objects.filter(trx=trxl.trx)
+        self.assertEqual(len(operations), 0)
+
     def test_log_operation_closed_transaction(self):
         """Check if it fails when logging an operation on a closed transaction"""
 
@@ -47,7 +47,8 @@ from sortinghat.core import api
 from sortinghat.core import db
 from sortinghat.core.context import SortingHatContext
 from sortinghat.core.log import TransactionsLog
-from sortinghat.core.models import (Organization,
+from sortinghat.core.models import (AffiliationRecommendation,
+                                    Organization,
                                     Domain,
                                     Country,
                                     Individual,
@@ -99,6 +100,7 @@ INVALID_FILTER_RANGE_ERROR = "Error in {} filter: Date range is invalid. {}"
 FROM_DATE_EMPTY_ERROR = "'from_date' cannot be empty"
 TO_DATE_EMPTY_ERROR = "'to_date' cannot be empty"
 BOTH_NEW_DATES_NONE_ERROR = "'new_from_date' and 'to_from_date' cannot be None at the same time"
+JOB_RESULT_PAGE_ERROR = "'page' and 'pageSize' must be greater than 0"
 
 
 # Test queries
@@ -396,6 +398,13 @@ SH_INDIVIDUALS_SOURCE_FILTER = """{
       }
     }
 }"""
+SH_INDIVIDUALS_IDENTITY_FILTER = """{
+    individuals(filters: {%s: "%s"}) {
+      entities {
+        mk
+      }
+    }
+}"""
 SH_INDIVIDUALS_ENROLLMENT_FILTER = """{
     individuals(filters: {enrollment: "%s"}) {
       entities {
@@ -694,6 +703,34 @@ SH_JOB_QUERY_AFFILIATE = """{
   }
 }
 """
+SH_JOB_QUERY_AFFILIATE_PAGE = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    result(page: %d, pageSize: %d) {
+      __typename
+      ... on AffiliationResultType {
+          uuid
+          organizations
+      }
+    }
+  }
+}
+"""
+SH_JOB_QUERY_PROGRESS = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    status
+    processed
+    total
+    rate
+    eta
+  }
+}
+"""
 SH_JOB_QUERY_RECOMMEND_AFFILIATIONS = """{
   job(
     jobId:"%s"
@@ -746,6 +783,77 @@ SH_JOB_QUERY_UNIFY = """{
     }
   }
 }"""
+SH_JOB_QUERY_RECOMMEND_BOTS = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    jobType
+    status
+    errors
+    result {
+      __typename
+      ... on BotRecommendationType {
+          uuid
+          score
+      }
+    }
+  }
+}
+"""
+SH_JOB_QUERY_MARK_BOTS = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    jobType
+    status
+    errors
+    result {
+      __typename
+      ... on MarkBotsResultType {
+          marked
+      }
+    }
+  }
+}
+"""
+SH_JOB_QUERY_RECOMMEND_ORGANIZATIONS = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    jobType
+    status
+    errors
+    result {
+      __typename
+      ... on OrganizationsRecommendationType {
+          organization
+          duplicates
+      }
+    }
+  }
+}
+"""
+SH_JOB_QUERY_UNIFY_ORGANIZATIONS = """{
+  job(
+    jobId:"%s"
+  ){
+    jobId
+    jobType
+    status
+    errors
+    result {
+      __typename
+      ... on UnifyOrganizationsResultType {
+          organization
+          merged
+      }
+    }
+  }
+}
+"""
 SH_JOBS_QUERY = """{
   jobs(page: 1) {
     entities {
@@ -762,6 +870,19 @@ SH_JOBS_QUERY = """{
   }
 }
 """
+SH_JOBS_QUERY_FILTER = """{
+  jobs(filters: {status: %s}) {
+    entities {
+      jobId
+      jobType
+      status
+    }
+    pageInfo{
+      totalResults
+    }
+  }
+}
+"""
 SH_JOBS_QUERY_PAGINATION = """{
   jobs(page: %d, pageSize: %d) {
     entities {
@@ -788,6 +909,49 @@ SH_JOBS_QUERY_PAGINATION = """{
 GRAPHQL_ENDPOINT = '/graphql/'
 
 
+SH_AFFILIATION_RECOMMENDATIONS_QUERY = """{
+  affiliationRecommendations {
+    entities {
+      uuid
+      organizations
+    }
+  }
+}"""
+SH_AFFILIATION_RECOMMENDATIONS_QUERY_FILTER = """{
+  affiliationRecommendations(
+    filters:{
+      %s:"%s"
+    }
+  ){
+    entities {
+      uuid
+      organizations
+    }
+  }
+}"""
+SH_AFFILIATION_RECOMMENDATIONS_QUERY_PAGINATION = """{
+  affiliationRecommendations(
+    page: %d
+    pageSize: %d
+  ){
+    entities {
+      uuid
+      organizations
+    }
+    pageInfo{
+      page
+      pageSize
+      numPages
+      hasNext
+      hasPrev
+      startIndex
+      endIndex
+      totalResults
+    }
+  }
+}"""
+
+
 class TestQuery(SortingHatQuery, graphene.ObjectType):
     pass
 
@@ -2248,6 +2412,53 @@ class TestQueryIndividuals(django.test.TestCase):
         individuals = executed['data']['individuals']['entities']
         self.assertEqual(len(individuals), 0)
 
+    def test_filter_identity_values(self):
+        """Check whether it returns the individuals with equivalent identity values"""
+
+        ctx = SortingHatContext(self.user)
+
+        jsmith = api.add_identity(ctx, source='git',
+                                  name='Jöhn Smith',
+                                  email='John.Smith+dev@gmail.com',
+                                  username='JSmith')
+        api.add_identity(ctx, source='git',
+                         name='John Smith Doe',
+                         email='jsmith@example.com',
+                         username='jsmith_doe')
+
+        client = graphene.test.Client(schema)
+
+        for field, value in [('name', 'john smith'),
+                             ('email', 'johnsmith@gmail.com'),
+                             ('username', 'jsmith')]:
+            executed = client.execute(SH_INDIVIDUALS_IDENTITY_FILTER % (field, value),
+                                      context_value=self.context_value)
+
+            individuals = executed['data']['individuals']['entities']
+            self.assertEqual(len(individuals), 1)
+            self.assertEqual(individuals[0]['mk'], jsmith.individual.mk)
+
+    def test_filter_identity_values_non_exist_registry(self):
+        """Check whether it returns an empty list when no identity has the given values"""
+
+        ctx = SortingHatContext(self.user)
+
+        api.add_identity(ctx, source='git',
+                         name='John Smith',
+                         email='jsmith@example.com',
+                         username='jsmith')
+
+        client = graphene.test.Client(schema)
+
+        for field, value in [('name', 'John'),
+                             ('email', 'j.smith@example.com'),
+                             ('username', 'smith')]:
+            executed = client.execute(SH_INDIVIDUALS_IDENTITY_FILTER % (field, value),
+                                      context_value=self.context_value)
+
+            individuals = executed['data']['individuals']['entities']
+            self.assertEqual(len(individuals), 0)
+
     def test_filter_enrollment_date(self):
         """Check whether it returns the individual searched when using an enrollment date filter"""
 
@@ -3262,6 +3473,121 @@ class TestQueryOperations(django.test.TestCase):
         self.assertEqual(msg, AUTHENTICATION_ERROR)
 
 
+class TestQueryAffiliationRecommendations(django.test.TransactionTestCase):
+    """Unit tests for affiliation recommendations queries"""
+
+    def setUp(self):
+        """Load initial dataset and set queries context"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        self.context_value.user = self.user
+
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example')
+        api.add_domain(ctx, 'Example', 'example.com', is_top_domain=True)
+        api.add_organization(ctx, 'Bitergia')
+        api.add_domain(ctx, 'Bitergia', 'bitergia.com')
+
+        self.jsmith = api.add_identity(ctx, source='scm',
+                                       email='jsmith@example.com')
+        api.add_identity(ctx, source='scm',
+                         email='jsmith@bitergia.com',
+                         uuid=self.jsmith.uuid)
+
+        self.jdoe = api.add_identity(ctx, source='scm',
+                                     email='jdoe@us.example.com')
+
+        self.jrae = api.add_identity(ctx, source='scm',
+                                     email='jrae@bitergia.com')
+        api.enroll(ctx, self.jrae.uuid, 'Bitergia')
+
+    def test_affiliation_recommendations(self):
+        """Check if it returns the stored affiliation recommendations"""
+
+        client = graphene.test.Client(schema)
+        executed = client.execute(SH_AFFILIATION_RECOMMENDATIONS_QUERY,
+                                  context_value=self.context_value)
+
+        recs = executed['data']['affiliationRecommendations']['entities']
+
+        expected = sorted([
+            {'uuid': self.jsmith.uuid, 'organizations': ['Bitergia', 'Example']},
+            {'uuid': self.jdoe.uuid, 'organizations': ['Example']}
+        ], key=lambda rec: rec['uuid'])
+        self.assertListEqual(recs, expected)
+
+    def test_filter_registry(self):
+        """Check whether it returns the recommendations searched when using filters"""
+
+        client = graphene.test.Client(schema)
+
+        test_query = SH_AFFILIATION_RECOMMENDATIONS_QUERY_FILTER % ('uuid', self.jdoe.uuid)
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        recs = executed['data']['affiliationRecommendations']['entities']
+        self.assertListEqual(recs, [{'uuid': self.jdoe.uuid, 'organizations': ['Example']}])
+
+        test_query = SH_AFFILIATION_RECOMMENDATIONS_QUERY_FILTER % ('organization', 'Bitergia')
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        recs = executed['data']['affiliationRecommendations']['entities']
+        self.assertListEqual(recs, [{'uuid': self.jsmith.uuid,
+                                     'organizations': ['Bitergia', 'Example']}])
+
+    def test_pagination(self):
+        """Check whether it returns the recommendations searched when using pagination"""
+
+        client = graphene.test.Client(schema)
+        test_query = SH_AFFILIATION_RECOMMENDATIONS_QUERY_PAGINATION % (2, 1)
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        recs = executed['data']['affiliationRecommendations']['entities']
+        self.assertEqual(len(recs), 1)
+        self.assertEqual(recs[0]['uuid'], max(self.jsmith.uuid, self.jdoe.uuid))
+
+        pag_data = executed['data']['affiliationRecommendations']['pageInfo']
+        self.assertEqual(len(pag_data), 8)
+        self.assertEqual(pag_data['page'], 2)
+        self.assertEqual(pag_data['pageSize'], 1)
+        self.assertEqual(pag_data['numPages'], 2)
+        self.assertFalse(pag_data['hasNext'])
+        self.assertTrue(pag_data['hasPrev'])
+        self.assertEqual(pag_data['startIndex'], 2)
+        self.assertEqual(pag_data['endIndex'], 2)
+        self.assertEqual(pag_data['totalResults'], 2)
+
+    def test_empty_registry(self):
+        """Check whether it returns an empty list when there are no recommendations"""
+
+        AffiliationRecommendation.objects.all().delete()
+
+        client = graphene.test.Client(schema)
+        executed = client.execute(SH_AFFILIATION_RECOMMENDATIONS_QUERY,
+                                  context_value=self.context_value)
+
+        recs = executed['data']['affiliationRecommendations']['entities']
+        self.assertListEqual(recs, [])
+
+    def test_authentication(self):
+        """Check if it fails when a non-authenticated user executes the query"""
+
+        context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        context_value.user = AnonymousUser()
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(SH_AFFILIATION_RECOMMENDATIONS_QUERY,
+                                  context_value=context_value)
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, AUTHENTICATION_ERROR)
+
+
 class TestParseDateFilter(django.test.TestCase):
     """Unit tests for parse_date_filter method"""
 
@@ -3323,6 +3649,11 @@ class TestParseDateFilter(django.test.TestCase):
             parse_date_filter(filter_string)
 
 
+def job_echo(s):
+    """Function to test job queuing"""
+    return s
+
+
 class MockJob:
     """Class mock job queries."""
 
@@ -3333,6 +3664,7 @@ class MockJob:
         self.result = result
         self.exc_info = error
         self.enqueued_at = datetime_utcnow()
+        self.meta = {}
 
     def get_status(self):
         return self.status
@@ -3456,36 +3788,222 @@ class TestQueryJob(django.test.TestCase):
         self.assertEqual(job_data['errors'], errors)
 
     @unittest.mock.patch('sortinghat.core.schema.find_job')
-    def test_recommend_affiliation_job(self, mock_job):
-        """Check if it returns an affiliation recommendation type"""
+    def test_affiliate_job_children_running(self, mock_job):
+        """Check if the job is started while its children are running"""
+
+        job = MockJob('1234-5678-90AB-CDEF', 'affiliate', 'finished', None)
+        job.meta['children'] = ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1']
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_AFFILIATE % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'affiliate')
+        self.assertEqual(job_data['status'], 'started')
+        self.assertEqual(job_data['errors'], None)
+        self.assertEqual(job_data['result'], None)
 
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_affiliate_job_children_failed(self, mock_job):
+        """Check if the job failed when any of its children failed"""
+
+        errors = [
+            "Job 1234-5678-90AB-CDEF-1 failed; connection lost"
+        ]
         result = {
             'results': {
-                '0c1e1701bc819495acf77ef731023b7d789a9c71': [],
-                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
                 'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
-            }
+            },
+            'errors': errors
         }
 
-        job = MockJob('1234-5678-90AB-CDEF', 'recommend_affiliations', 'finished', result)
+        job = MockJob('1234-5678-90AB-CDEF', 'affiliate', 'finished', result)
+        job.meta['children'] = ['1234-5678-90AB-CDEF-0', '1234-5678-90AB-CDEF-1']
+        job.meta['failed'] = ['1234-5678-90AB-CDEF-1']
         mock_job.return_value = job
 
         # Tests
         client = graphene.test.Client(schema)
 
-        query = SH_JOB_QUERY_RECOMMEND_AFFILIATIONS % '1234-5678-90AB-CDEF'
+        query = SH_JOB_QUERY_AFFILIATE % '1234-5678-90AB-CDEF'
 
         executed = client.execute(query,
                                   context_value=self.context_value)
 
         job_data = executed['data']['job']
-        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
-        self.assertEqual(job_data['jobType'], 'recommend_affiliations')
-        self.assertEqual(job_data['status'], 'finished')
-        self.assertEqual(job_data['errors'], None)
+        self.assertEqual(job_data['status'], 'failed')
+        self.assertEqual(job_data['errors'], errors)
 
         job_results = job_data['result']
-        self.assertEqual(len(job_results), 3)
+        self.assertEqual(len(job_results), 1)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'AffiliationResultType')
+        self.assertEqual(res['uuid'], 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+        self.assertEqual(res['organizations'], ['Example'])
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_affiliate_job_result_page(self, mock_job):
+        """Check if it returns a page of the results"""
+
+        result = {
+            'results': {
+                '0c1e1701bc819495acf77ef731023b7d789a9c71': ['LibreSoft'],
+                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
+            },
+            'errors': []
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'affiliate', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_AFFILIATE_PAGE % ('1234-5678-90AB-CDEF', 2, 2)
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_results = executed['data']['job']['result']
+        self.assertEqual(len(job_results), 1)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'AffiliationResultType')
+        self.assertEqual(res['uuid'], 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+        self.assertEqual(res['organizations'], ['Example'])
+
+        # Pages beyond the last one are empty
+        query = SH_JOB_QUERY_AFFILIATE_PAGE % ('1234-5678-90AB-CDEF', 3, 2)
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_results = executed['data']['job']['result']
+        self.assertListEqual(job_results, [])
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_affiliate_job_result_invalid_page(self, mock_job):
+        """Check if it fails when the page or the page size are not valid"""
+
+        result = {
+            'results': {
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
+            },
+            'errors': []
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'affiliate', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_AFFILIATE_PAGE % ('1234-5678-90AB-CDEF', 0, 2)
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, JOB_RESULT_PAGE_ERROR)
+
+        query = SH_JOB_QUERY_AFFILIATE_PAGE % ('1234-5678-90AB-CDEF', 1, -2)
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, JOB_RESULT_PAGE_ERROR)
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_job_progress(self, mock_job):
+        """Check if it returns the progress of a job"""
+
+        job = MockJob('1234-5678-90AB-CDEF', 'unify', 'started', None)
+        job.meta['progress'] = {
+            'processed': 250,
+            'total': 1000,
+            'rate': 50.0,
+            'eta': 15.0
+        }
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_PROGRESS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['status'], 'started')
+        self.assertEqual(job_data['processed'], 250)
+        self.assertEqual(job_data['total'], 1000)
+        self.assertEqual(job_data['rate'], 50.0)
+        self.assertEqual(job_data['eta'], 15.0)
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_job_no_progress(self, mock_job):
+        """Check if progress fields are empty when a job does not report it"""
+
+        job = MockJob('1234-5678-90AB-CDEF', 'unify', 'queued', None)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_PROGRESS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertIsNone(job_data['processed'])
+        self.assertIsNone(job_data['total'])
+        self.assertIsNone(job_data['rate'])
+        self.assertIsNone(job_data['eta'])
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_recommend_affiliation_job(self, mock_job):
+        """Check if it returns an affiliation recommendation type"""
+
+        result = {
+            'results': {
+                '0c1e1701bc819495acf77ef731023b7d789a9c71': [],
+                '17ab00ed3825ec2f50483e33c88df223264182ba': ['Bitergia', 'Example'],
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': ['Example']
+            }
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'recommend_affiliations', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_RECOMMEND_AFFILIATIONS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'recommend_affiliations')
+        self.assertEqual(job_data['status'], 'finished')
+        self.assertEqual(job_data['errors'], None)
+
+        job_results = job_data['result']
+        self.assertEqual(len(job_results), 3)
 
         res = job_results[0]
         self.assertEqual(res['__typename'], 'AffiliationRecommendationType')
@@ -3635,6 +4153,158 @@ class TestQueryJob(django.test.TestCase):
         self.assertEqual(res['__typename'], 'UnifyResultType')
         self.assertEqual(res['merged'], ['880b3dfcb3a08712e5831bddc3dfe81fc5d7b331'])
 
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_recommend_bots_job(self, mock_job):
+        """Check if it returns a bot recommendation type"""
+
+        result = {
+            'results': {
+                '17ab00ed3825ec2f50483e33c88df223264182ba': 1.0,
+                'dc31d2afbee88a6d1dbc1ef05ec827b878067744': 0.5
+            }
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'recommend_bots', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_RECOMMEND_BOTS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'recommend_bots')
+        self.assertEqual(job_data['status'], 'finished')
+        self.assertEqual(job_data['errors'], None)
+
+        job_results = job_data['result']
+        self.assertEqual(len(job_results), 2)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'BotRecommendationType')
+        self.assertEqual(res['uuid'], '17ab00ed3825ec2f50483e33c88df223264182ba')
+        self.assertEqual(res['score'], 1.0)
+
+        res = job_results[1]
+        self.assertEqual(res['__typename'], 'BotRecommendationType')
+        self.assertEqual(res['uuid'], 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+        self.assertEqual(res['score'], 0.5)
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_mark_bots_job(self, mock_job):
+        """Check if it returns a mark bots result type"""
+
+        result = {
+            'results': ['17ab00ed3825ec2f50483e33c88df223264182ba'],
+            'errors': ['dc31d2afbee88a6d1dbc1ef05ec827b878067744 not found in the registry']
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'mark_bots', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_MARK_BOTS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'mark_bots')
+        self.assertEqual(job_data['status'], 'finished')
+        self.assertEqual(job_data['errors'],
+                         ['dc31d2afbee88a6d1dbc1ef05ec827b878067744 not found in the registry'])
+
+        job_results = job_data['result']
+        self.assertEqual(len(job_results), 1)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'MarkBotsResultType')
+        self.assertEqual(res['marked'], ['17ab00ed3825ec2f50483e33c88df223264182ba'])
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_recommend_organizations_job(self, mock_job):
+        """Check if it returns an organizations recommendation type"""
+
+        result = {
+            'results': {
+                'Bitergia': ['Bitergia S.L.'],
+                'Example': ['Example Inc', 'Example, Inc.']
+            }
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'recommend_organizations', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_RECOMMEND_ORGANIZATIONS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'recommend_organizations')
+        self.assertEqual(job_data['status'], 'finished')
+        self.assertEqual(job_data['errors'], None)
+
+        job_results = job_data['result']
+        self.assertEqual(len(job_results), 2)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'OrganizationsRecommendationType')
+        self.assertEqual(res['organization'], 'Bitergia')
+        self.assertListEqual(res['duplicates'], ['Bitergia S.L.'])
+
+        res = job_results[1]
+        self.assertEqual(res['__typename'], 'OrganizationsRecommendationType')
+        self.assertEqual(res['organization'], 'Example')
+        self.assertListEqual(res['duplicates'], ['Example Inc', 'Example, Inc.'])
+
+    @unittest.mock.patch('sortinghat.core.schema.find_job')
+    def test_unify_organizations_job(self, mock_job):
+        """Check if it returns an unify organizations result type"""
+
+        result = {
+            'results': {
+                'Example': ['Example Inc', 'Example, Inc.']
+            },
+            'errors': ['Individual AAAA is locked']
+        }
+
+        job = MockJob('1234-5678-90AB-CDEF', 'unify_organizations', 'finished', result)
+        mock_job.return_value = job
+
+        # Tests
+        client = graphene.test.Client(schema)
+
+        query = SH_JOB_QUERY_UNIFY_ORGANIZATIONS % '1234-5678-90AB-CDEF'
+
+        executed = client.execute(query,
+                                  context_value=self.context_value)
+
+        job_data = executed['data']['job']
+        self.assertEqual(job_data['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(job_data['jobType'], 'unify_organizations')
+        self.assertEqual(job_data['status'], 'finished')
+        self.assertEqual(job_data['errors'], ['Individual AAAA is locked'])
+
+        job_results = job_data['result']
+        self.assertEqual(len(job_results), 1)
+
+        res = job_results[0]
+        self.assertEqual(res['__typename'], 'UnifyOrganizationsResultType')
+        self.assertEqual(res['organization'], 'Example')
+        self.assertListEqual(res['merged'], ['Example Inc', 'Example, Inc.'])
+
     @unittest.mock.patch('sortinghat.core.schema.find_job')
     def test_unify_job_no_results(self, mock_job):
         """Check if it does not fail when there are not results ready"""
@@ -3768,6 +4438,63 @@ class TestQueryJob(django.test.TestCase):
         self.assertEqual(jobs_pagination['endIndex'], 3)
         self.assertEqual(jobs_pagination['totalResults'], 3)
 
+    @unittest.mock.patch('sortinghat.core.schema.get_jobs')
+    def test_jobs_filter_status(self, mock_jobs):
+        """Check if it returns the jobs with the given statuses"""
+
+        job = MockJob('1234-5678-90AB-CDEF', 'affiliate', 'failed', None)
+        mock_jobs.return_value = [job]
+
+        # Tests
+        client = graphene.test.Client(schema)
+        test_query = SH_JOBS_QUERY_FILTER % '["failed", "started"]'
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        mock_jobs.assert_called_once_with(statuses=['failed', 'started'])
+
+        jobs_entities = executed['data']['jobs']['entities']
+        self.assertEqual(len(jobs_entities), 1)
+        self.assertEqual(jobs_entities[0]['jobId'], '1234-5678-90AB-CDEF')
+        self.assertEqual(jobs_entities[0]['status'], 'failed')
+
+        jobs_pagination = executed['data']['jobs']['pageInfo']
+        self.assertEqual(jobs_pagination['totalResults'], 1)
+
+    def test_jobs_filter_registries(self):
+        """Check if only the jobs of the registries of the given statuses are returned"""
+
+        queue = django_rq.get_queue(is_async=True)
+        queue.enqueue(job_echo, 'A', job_id='A')
+
+        job = queue.enqueue(job_echo, 'B', job_id='B')
+        queue.remove(job)
+        job.set_status('failed')
+        queue.failed_job_registry.add(job, -1)
+
+        # Tests
+        client = graphene.test.Client(schema)
+        test_query = SH_JOBS_QUERY_FILTER % '["failed"]'
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        jobs_entities = executed['data']['jobs']['entities']
+        self.assertEqual(len(jobs_entities), 1)
+        self.assertEqual(jobs_entities[0]['jobId'], 'B')
+        self.assertEqual(jobs_entities[0]['jobType'], 'job_echo')
+        self.assertEqual(jobs_entities[0]['status'], 'failed')
+
+    def test_jobs_filter_invalid_status(self):
+        """Check if it fails when a status is not valid"""
+
+        client = graphene.test.Client(schema)
+        test_query = SH_JOBS_QUERY_FILTER % '["done"]'
+        executed = client.execute(test_query,
+                                  context_value=self.context_value)
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, "Error in status filter: 'done' is not a valid job status")
+
 
 class TestAddOrganizationMutation(django.test.TestCase):
     """Unit tests for mutation to add organizations"""
@@ -3892,68 +4619,163 @@ class TestDeleteOrganizationMutation(django.test.TestCase):
         self.context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
         self.context_value.user = self.user
 
-    def test_delete_organization(self):
-        """Check whether it deletes an organization"""
+    def test_delete_organization(self):
+        """Check whether it deletes an organization"""
+
+        org_ex = Organization.objects.create(name='Example')
+        Domain.objects.create(domain='example.org',
+                              organization=org_ex)
+        org_bit = Organization.objects.create(name='Bitergia')
+
+        jsmith = Individual.objects.create(mk='AAAA')
+        Profile.objects.create(name='John Smith',
+                               email='jsmith@example.net',
+                               individual=jsmith)
+        Enrollment.objects.create(individual=jsmith, organization=org_ex)
+
+        jdoe = Individual.objects.create(mk='BBBB')
+        Profile.objects.create(name='John Doe',
+                               email='jdoe@bitergia.com',
+                               individual=jdoe)
+        Enrollment.objects.create(individual=jdoe, organization=org_ex)
+        Enrollment.objects.create(individual=jdoe, organization=org_bit)
+
+        # Delete organization
+        client = graphene.test.Client(schema)
+        executed = client.execute(self.SH_DELETE_ORG,
+                                  context_value=self.context_value)
+
+        # Check result
+        org = executed['data']['deleteOrganization']['organization']
+        self.assertEqual(org['name'], 'Example')
+
+        # Tests
+        with self.assertRaises(django.core.exceptions.ObjectDoesNotExist):
+            Organization.objects.get(name='Example')
+
+        with self.assertRaises(django.core.exceptions.ObjectDoesNotExist):
+            Domain.objects.get(domain='example.org')
+
+        enrollments = Enrollment.objects.filter(organization__name='Example')
+        self.assertEqual(len(enrollments), 0)
+
+        enrollments = Enrollment.objects.filter(organization__name='Bitergia')
+        self.assertEqual(len(enrollments), 1)
+
+    def test_not_found_organization(self):
+        """Check if it returns an error when an organization does not exist"""
+
+        client = graphene.test.Client(schema)
+        executed = client.execute(self.SH_DELETE_ORG,
+                                  context_value=self.context_value)
+
+        # Check error
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, ORGANIZATION_EXAMPLE_DOES_NOT_EXIST_ERROR)
+
+        # It should not remove anything
+        Organization.objects.create(name='Bitergia')
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, ORGANIZATION_EXAMPLE_DOES_NOT_EXIST_ERROR)
+
+        orgs = Organization.objects.all()
+        self.assertEqual(len(orgs), 1)
+
+    def test_authentication(self):
+        """Check if it fails when a non-authenticated user executes the query"""
+
+        context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        context_value.user = AnonymousUser()
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(self.SH_DELETE_ORG,
+                                  context_value=context_value)
+
+        msg = executed['errors'][0]['message']
+        self.assertEqual(msg, AUTHENTICATION_ERROR)
+
+
+class TestMergeOrganizationsMutation(django.test.TestCase):
+    """Unit tests for mutation to merge organizations"""
+
+    SH_MERGE_ORGS = """
+      mutation mergeOrgs($fromOrg: String, $toOrg: String) {
+        mergeOrganizations(fromOrg: $fromOrg, toOrg: $toOrg) {
+          organization {
+            name
+            domains {
+              domain
+            }
+            enrollments {
+              individual {
+                mk
+              }
+            }
+          }
+        }
+      }
+    """
+
+    def setUp(self):
+        """Set queries context"""
+
+        self.user = get_user_model().objects.create(username='test')
+        self.context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        self.context_value.user = self.user
+
+        ctx = SortingHatContext(self.user)
 
-        org_ex = Organization.objects.create(name='Example')
-        Domain.objects.create(domain='example.org',
-                              organization=org_ex)
-        org_bit = Organization.objects.create(name='Bitergia')
+        api.add_organization(ctx, 'Example')
+        api.add_organization(ctx, 'Example, Inc.')
+        api.add_domain(ctx, 'Example, Inc.', 'example.com')
 
-        jsmith = Individual.objects.create(mk='AAAA')
-        Profile.objects.create(name='John Smith',
-                               email='jsmith@example.net',
-                               individual=jsmith)
-        Enrollment.objects.create(individual=jsmith, organization=org_ex)
+        self.jsmith = api.add_identity(ctx, 'scm', email='jsmith@example.net')
+        api.enroll(ctx, self.jsmith.uuid, 'Example, Inc.')
 
-        jdoe = Individual.objects.create(mk='BBBB')
-        Profile.objects.create(name='John Doe',
-                               email='jdoe@bitergia.com',
-                               individual=jdoe)
-        Enrollment.objects.create(individual=jdoe, organization=org_ex)
-        Enrollment.objects.create(individual=jdoe, organization=org_bit)
+    def test_merge_organizations(self):
+        """Check if an organization is merged into another one"""
+
+        params = {
+            'fromOrg': 'Example, Inc.',
+            'toOrg': 'Example'
+        }
 
-        # Delete organization
         client = graphene.test.Client(schema)
-        executed = client.execute(self.SH_DELETE_ORG,
-                                  context_value=self.context_value)
+        executed = client.execute(self.SH_MERGE_ORGS,
+                                  context_value=self.context_value,
+                                  variables=params)
 
         # Check result
-        org = executed['data']['deleteOrganization']['organization']
+        org = executed['data']['mergeOrganizations']['organization']
         self.assertEqual(org['name'], 'Example')
+        self.assertListEqual(org['domains'], [{'domain': 'example.com'}])
+        self.assertListEqual(org['enrollments'],
+                             [{'individual': {'mk': self.jsmith.uuid}}])
 
-        # Tests
-        with self.assertRaises(django.core.exceptions.ObjectDoesNotExist):
-            Organization.objects.get(name='Example')
-
+        # Check database objects
         with self.assertRaises(django.core.exceptions.ObjectDoesNotExist):
-            Domain.objects.get(domain='example.org')
+            Organization.objects.get(name='Example, Inc.')
 
         enrollments = Enrollment.objects.filter(organization__name='Example')
-        self.assertEqual(len(enrollments), 0)
-
-        enrollments = Enrollment.objects.filter(organization__name='Bitergia')
         self.assertEqual(len(enrollments), 1)
 
     def test_not_found_organization(self):
         """Check if it returns an error when an organization does not exist"""
 
-        client = graphene.test.Client(schema)
-        executed = client.execute(self.SH_DELETE_ORG,
-                                  context_value=self.context_value)
-
-        # Check error
-        msg = executed['errors'][0]['message']
-        self.assertEqual(msg, ORGANIZATION_EXAMPLE_DOES_NOT_EXIST_ERROR)
+        params = {
+            'fromOrg': 'Bitergia',
+            'toOrg': 'Example'
+        }
 
-        # It should not remove anything
-        Organization.objects.create(name='Bitergia')
+        client = graphene.test.Client(schema)
+        executed = client.execute(self.SH_MERGE_ORGS,
+                                  context_value=self.context_value,
+                                  variables=params)
 
         msg = executed['errors'][0]['message']
-        self.assertEqual(msg, ORGANIZATION_EXAMPLE_DOES_NOT_EXIST_ERROR)
-
-        orgs = Organization.objects.all()
-        self.assertEqual(len(orgs), 1)
+        self.assertEqual(msg, "Bitergia not found in the registry")
 
     def test_authentication(self):
         """Check if it fails when a non-authenticated user executes the query"""
@@ -3961,10 +4783,15 @@ class TestDeleteOrganizationMutation(django.test.TestCase):
         context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
         context_value.user = AnonymousUser()
 
-        client = graphene.test.Client(schema)
+        params = {
+            'fromOrg': 'Example, Inc.',
+            'toOrg': 'Example'
+        }
 
-        executed = client.execute(self.SH_DELETE_ORG,
-                                  context_value=context_value)
+        client = graphene.test.Client(schema)
+        executed = client.execute(self.SH_MERGE_ORGS,
+                                  context_value=context_value,
+                                  variables=params)
 
         msg = executed['errors'][0]['message']
         self.assertEqual(msg, AUTHENTICATION_ERROR)
@@ -4190,13 +5017,15 @@ class TestAddIdentityMutation(django.test.TestCase):
         $name: String,
         $email: String,
         $username: String
-        $uuid: String) {
+        $uuid: String
+        $ifExists: String) {
           addIdentity(
             source: $source
             name: $name
             email: $email
             username: $username
-            uuid: $uuid) {
+            uuid: $uuid
+            ifExists: $ifExists) {
               uuid
               individual {
                 mk
@@ -4385,6 +5214,42 @@ class TestAddIdentityMutation(django.test.TestCase):
         self.assertEqual(id0.email, identity['email'])
         self.assertEqual(id0.username, identity['username'])
 
+    def test_existing_identity_return(self):
+        """Check if the stored identity is returned when it already exists"""
+
+        api.add_identity(self.ctx, 'scm', name='Jane Roe',
+                         email='jroe@example.com', username='jrae')
+
+        timestamp = datetime_utcnow()
+
+        client = graphene.test.Client(schema)
+
+        params = {
+            'source': 'scm',
+            'name': 'jane roe',
+            'email': 'jroe@example.com',
+            'username': 'jrae',
+            'ifExists': 'return'
+        }
+        executed = client.execute(self.SH_ADD_IDENTITY,
+                                  context_value=self.context_value,
+                                  variables=params)
+
+        # Check results
+        uuid = executed['data']['addIdentity']['uuid']
+        self.assertEqual(uuid, 'eda9f62ad321b1fbe5f283cc05e2484516203117')
+
+        individual = executed['data']['addIdentity']['individual']
+        self.assertEqual(individual['mk'], 'eda9f62ad321b1fbe5f283cc05e2484516203117')
+
+        identities = individual['identities']
+        self.assertEqual(len(identities), 1)
+        self.assertEqual(identities[0]['name'], 'Jane Roe')
+
+        # No transactions were created
+        transactions = Transaction.objects.filter(created_at__gt=timestamp)
+        self.assertEqual(len(transactions), 0)
+
     def test_integrity_error(self):
         """Check if it fails adding an identity that already exists"""
 
@@ -7393,6 +8258,194 @@ class TestAffiliateMutation(django.test.TestCase):
         self.assertEqual(msg, AUTHENTICATION_ERROR)
 
 
+class TestMarkBotsMutation(django.test.TestCase):
+    """Unit tests for mutation to mark individuals as bots"""
+
+    SH_MARK_BOTS = """
+        mutation markBots($uuids: [String], $minScore: Float) {
+            markBots(uuids: $uuids, minScore: $minScore) {
+                jobId
+            }
+        }
+    """
+
+    def setUp(self):
+        """Load initial dataset and set queries context"""
+
+        conn = django_rq.queues.get_redis_connection(None, True)
+        conn.flushall()
+
+        self.user = get_user_model().objects.create(username='test')
+        self.context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        self.context_value.user = self.user
+
+        ctx = SortingHatContext(self.user)
+
+        self.jenkins = api.add_identity(ctx,
+                                        source='scm',
+                                        email='jenkins@example.com',
+                                        name='Jenkins',
+                                        username='jenkins')
+        self.jsmith = api.add_identity(ctx,
+                                       source='scm',
+                                       email='jsmith@example.com',
+                                       name='John Smith',
+                                       username='jsmith')
+        api.add_identity(ctx,
+                         source='gitlab',
+                         username='jsmith-ci',
+                         uuid=self.jsmith.uuid)
+
+    @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
+    def test_mark_bots(self, mock_job_id_gen):
+        """Check if the individuals that look like bots are marked"""
+
+        mock_job_id_gen.return_value = "1234-5678-90AB-CDEF"
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(self.SH_MARK_BOTS,
+                                  context_value=self.context_value)
+
+        # Check if the job was run and individuals were marked
+        job_id = executed['data']['markBots']['jobId']
+        self.assertEqual(job_id, "1234-5678-90AB-CDEF")
+
+        # Check database objects
+        individual_db = Individual.objects.get(mk=self.jenkins.uuid)
+        self.assertTrue(individual_db.profile.is_bot)
+
+        individual_db = Individual.objects.get(mk=self.jsmith.uuid)
+        self.assertTrue(individual_db.profile.is_bot)
+
+    @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
+    def test_mark_bots_min_score(self, mock_job_id_gen):
+        """Check if only individuals with the minimum score are marked"""
+
+        mock_job_id_gen.return_value = "1234-5678-90AB-CDEF"
+
+        client = graphene.test.Client(schema)
+
+        params = {
+            'minScore': 0.75
+        }
+
+        executed = client.execute(self.SH_MARK_BOTS,
+                                  context_value=self.context_value,
+                                  variables=params)
+
+        job_id = executed['data']['markBots']['jobId']
+        self.assertEqual(job_id, "1234-5678-90AB-CDEF")
+
+        # Check database objects
+        individual_db = Individual.objects.get(mk=self.jenkins.uuid)
+        self.assertTrue(individual_db.profile.is_bot)
+
+        individual_db = Individual.objects.get(mk=self.jsmith.uuid)
+        self.assertFalse(individual_db.profile.is_bot)
+
+    def test_authentication(self):
+        """Check if it fails when a non-authenticated user executes the query"""
+
+        context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        context_value.user = AnonymousUser()
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(self.SH_MARK_BOTS,
+                                  context_value=context_value)
+
+        msg = executed['errors'][0]['message']
+
+        self.assertEqual(msg, AUTHENTICATION_ERROR)
+
+
+class TestUnifyOrganizationsMutation(django.test.TestCase):
+    """Unit tests for mutation to unify duplicate organizations"""
+
+    SH_UNIFY_ORGS = """
+        mutation unifyOrgs($names: [String], $threshold: Float) {
+            unifyOrganizations(names: $names, threshold: $threshold) {
+                jobId
+            }
+        }
+    """
+
+    def setUp(self):
+        """Load initial dataset and set queries context"""
+
+        conn = django_rq.queues.get_redis_connection(None, True)
+        conn.flushall()
+
+        self.user = get_user_model().objects.create(username='test')
+        self.context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        self.context_value.user = self.user
+
+        ctx = SortingHatContext(self.user)
+
+        api.add_organization(ctx, 'Example')
+        api.add_organization(ctx, 'Example, Inc.')
+        api.add_organization(ctx, 'LibreSoft')
+        api.add_organization(ctx, 'LibreSoft Lab')
+
+    @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
+    def test_unify_organizations(self, mock_job_id_gen):
+        """Check if duplicate organizations are merged"""
+
+        mock_job_id_gen.return_value = "1234-5678-90AB-CDEF"
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(self.SH_UNIFY_ORGS,
+                                  context_value=self.context_value)
+
+        job_id = executed['data']['unifyOrganizations']['jobId']
+        self.assertEqual(job_id, "1234-5678-90AB-CDEF")
+
+        # Check database objects
+        orgs = Organization.objects.order_by('name').values_list('name', flat=True)
+        self.assertListEqual(list(orgs), ['Example', 'LibreSoft', 'LibreSoft Lab'])
+
+    @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
+    def test_unify_organizations_threshold(self, mock_job_id_gen):
+        """Check if the threshold is used to find duplicates"""
+
+        mock_job_id_gen.return_value = "1234-5678-90AB-CDEF"
+
+        client = graphene.test.Client(schema)
+
+        params = {
+            'names': ['LibreSoft'],
+            'threshold': 0.6
+        }
+
+        executed = client.execute(self.SH_UNIFY_ORGS,
+                                  context_value=self.context_value,
+                                  variables=params)
+
+        job_id = executed['data']['unifyOrganizations']['jobId']
+        self.assertEqual(job_id, "1234-5678-90AB-CDEF")
+
+        # Check database objects
+        orgs = Organization.objects.order_by('name').values_list('name', flat=True)
+        self.assertListEqual(list(orgs), ['Example', 'Example, Inc.', 'LibreSoft'])
+
+    def test_authentication(self):
+        """Check if it fails when a non-authenticated user executes the query"""
+
+        context_value = RequestFactory().get(GRAPHQL_ENDPOINT)
+        context_value.user = AnonymousUser()
+
+        client = graphene.test.Client(schema)
+
+        executed = client.execute(self.SH_UNIFY_ORGS,
+                                  context_value=context_value)
+
+        msg = executed['errors'][0]['message']
+
+        self.assertEqual(msg, AUTHENTICATION_ERROR)
+
+
 class TestUnifyMutation(django.test.TestCase):
     """Unit tests for mutation to unify individuals"""
 
@@ -7407,6 +8460,15 @@ class TestUnifyMutation(django.test.TestCase):
             }
         }
     """
+    SH_UNIFY_COMPOUND = """
+        mutation unify($sourceUuids: [String],
+                       $compoundCriteria: [[String]]) {
+            unify(sourceUuids: $sourceUuids,
+                  compoundCriteria: $compoundCriteria) {
+                jobId
+            }
+        }
+    """
 
     def setUp(self):
         """Load initial dataset and set queries context"""
@@ -7564,6 +8626,42 @@ class TestUnifyMutation(django.test.TestCase):
         id5 = identities[4]
         self.assertEqual(id5, self.jr2)
 
+    @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
+    def test_unify_compound_criteria(self, mock_job_id_gen):
+        """Check if unify is applied using compound criteria"""
+
+        mock_job_id_gen.return_value = "1234-5678-90AB-CDEF"
+
+        client = graphene.test.Client(schema)
+
+        params = {
+            'sourceUuids': [self.jsmith.uuid, self.jrae.uuid],
+            'compoundCriteria': [['name', 'username'], ['name', 'source']]
+        }
+
+        executed = client.execute(self.SH_UNIFY_COMPOUND,
+                                  context_value=self.context_value,
+                                  variables=params)
+
+        job_id = executed['data']['unify']['jobId']
+        self.assertEqual(job_id, "1234-5678-90AB-CDEF")
+
+        # 'J. Smith' identities share name and username
+        jsmith = Identity.objects.get(uuid=self.jsmith.uuid)
+        js_alt = Identity.objects.get(uuid=self.js_alt.uuid)
+        self.assertEqual(jsmith.individual, js_alt.individual)
+        self.assertEqual(jsmith.individual.identities.count(), 7)
+
+        # 'Jane Rae Doe' identities share name and source
+        jrae = Identity.objects.get(uuid=self.jrae.uuid)
+        jane_rae = Identity.objects.get(uuid=self.jane_rae.uuid)
+        self.assertEqual(jrae.individual, jane_rae.individual)
+        self.assertEqual(jrae.individual.identities.count(), 5)
+
+        # Same names from different sources were not merged
+        john_smith = Identity.objects.get(uuid=self.john_smith.uuid)
+        self.assertEqual(john_smith.individual.identities.count(), 3)
+
     @unittest.mock.patch('sortinghat.core.jobs.rq.job.uuid4')
     def test_unify_source_not_mk(self, mock_job_id_gen):
         """Check if unify works when the provided uuid is not an Individual's main key"""
@@ -25,7 +25,12 @@ from dateutil.tz import UTC
 
 from django.test import TestCase
 
-from sortinghat.core.utils import merge_datetime_ranges, unaccent_string, validate_field
+from sortinghat.core.utils import (merge_datetime_ranges,
+                                   unaccent_string,
+                                   validate_field,
+                                   normalize_identity_name,
+                                   normalize_identity_username,
+                                   canonicalize_email)
 
 
 CANT_COMPARE_DATES_ERROR = "can't compare offset-naive and offset-aware datetimes"
@@ -401,6 +406,76 @@ class TestUnnacentString(TestCase):
             unaccent_string(1234)
 
 
+class TestNormalizeIdentityName(TestCase):
+    """Unit tests for normalize_identity_name"""
+
+    def test_normalize(self):
+        """Check if names are converted to lower case without accents"""
+
+        result = normalize_identity_name('Tomáš Čechvala')
+        self.assertEqual(result, 'tomas cechvala')
+
+        result = normalize_identity_name('SANTIAGO DUEÑAS')
+        self.assertEqual(result, 'santiago duenas')
+
+    def test_none(self):
+        """Check if None is returned when the name is None"""
+
+        self.assertIsNone(normalize_identity_name(None))
+
+
+class TestNormalizeIdentityUsername(TestCase):
+    """Unit tests for normalize_identity_username"""
+
+    def test_normalize(self):
+        """Check if usernames are converted to lower case"""
+
+        result = normalize_identity_username('JSmith')
+        self.assertEqual(result, 'jsmith')
+
+    def test_none(self):
+        """Check if None is returned when the username is None"""
+
+        self.assertIsNone(normalize_identity_username(None))
+
+
+class TestCanonicalizeEmail(TestCase):
+    """Unit tests for canonicalize_email"""
+
+    def test_canonicalize(self):
+        """Check if email addresses are converted to lower case"""
+
+        result = canonicalize_email('JSmith@Example.com')
+        self.assertEqual(result, 'jsmith@example.com')
+
+        # Dots and tags are kept on domains without policies
+        result = canonicalize_email('John.Smith+dev@example.com')
+        self.assertEqual(result, 'john.smith+dev@example.com')
+
+    def test_domain_policy(self):
+        """Check if the rules of the domain are applied"""
+
+        result = canonicalize_email('John.Smith+dev@Gmail.com')
+        self.assertEqual(result, 'johnsmith@gmail.com')
+
+        result = canonicalize_email('j.smith@googlemail.com')
+        self.assertEqual(result, 'jsmith@googlemail.com')
+
+    def test_invalid_email(self):
+        """Check if values which are not email addresses are only converted to lower case"""
+
+        result = canonicalize_email('John.Smith+dev')
+        self.assertEqual(result, 'john.smith+dev')
+
+        result = canonicalize_email('@gmail.com')
+        self.assertEqual(result, '@gmail.com')
+
+    def test_none(self):
+        """Check if None is returned when the email is None"""
+
+        self.assertIsNone(canonicalize_email(None))
+
+
 class TestValidateField(TestCase):
     """Unit tests for validate_field"""
 
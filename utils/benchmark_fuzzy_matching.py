@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import argparse
+import logging
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+import django
+
+
+DESC_MSG = """This script measures the memory and the wall time needed to
+find identity matches with the `fuzzy_name` criterion of SortingHat.
+
+Identities are generated randomly, so no database is needed. Names are
+built from pools of given names and surnames and some of them include
+typos, swapped words or punctuation. The registry is streamed, as it
+happens when identities are read from the database, so only the names
+of the source identities are kept in memory.
+
+    Execute:
+    ```
+    $ PYTHONPATH=. python3 utils/benchmark_fuzzy_matching.py -n 1000000 -s 2000
+    [2021-07-05 11:02:18,900][INFO] Generating 1000000 identities (2000 sources) ...
+    [2021-07-05 11:07:58,189][INFO] fuzzy_name: 93.32 s; peak memory 8.87 MB
+    [2021-07-05 11:07:58,191][INFO] 1789 sources with matches
+    ```
+"""
+
+CRITERIA = ['fuzzy_name']
+
+logging.basicConfig(format='[%(asctime)s][%(levelname)s] %(message)s',
+                    level=logging.INFO)
+logger = logging.getLogger('benchmark_fuzzy_matching')
+
+
+def main():
+    args = parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', args.settings)
+    django.setup()
+
+    from sortinghat.core.recommendations.matching import _find_matches
+
+    logger.info(f"Generating {args.identities} identities ({args.sources} sources) ...")
+
+    rnd = random.Random(args.seed)
+    identities = generate_identities(rnd, args.identities)
+    sources = rnd.sample(identities, min(args.sources, len(identities)))
+
+    before = time.perf_counter()
+    matched = _find_matches(sources, iter(identities), CRITERIA, False,
+                            fuzzy_threshold=args.threshold,
+                            workers=args.workers)
+    elapsed = time.perf_counter() - before
+
+    tracemalloc.start()
+    _find_matches(sources, iter(identities), CRITERIA, False,
+                  fuzzy_threshold=args.threshold,
+                  workers=args.workers)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    logger.info(f"fuzzy_name: {elapsed:.2f} s; peak memory {peak / 2**20:.2f} MB")
+    logger.info(f"{len(matched)} sources with matches")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=DESC_MSG,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-n', '--identities', type=int, default=100000,
+                        help="number of identities (by default = 100000)")
+    parser.add_argument('-s', '--sources', type=int, default=1000,
+                        help="number of source identities (by default = 1000)")
+    parser.add_argument('-t', '--threshold', type=float, default=0.6,
+                        help="similarity threshold (by default = 0.6)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="number of processes (by default = 1)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="random seed (by default = 0)")
+    parser.add_argument('--settings', default='config.settings.testing',
+                        help="Django settings module (by default = 'config.settings.testing')")
+    args = parser.parse_args()
+
+    return args
+
+
+def generate_identities(rnd, total):
+    """Generate a list of random identities data tuples.
+
+    Tuples follow the format `(uuid, individual, name)`.
+    """
+    pool = max(int(total ** 0.5), 1)
+    given_names = [_word(rnd) for _ in range(pool)]
+    surnames = [_word(rnd) for _ in range(pool)]
+
+    identities = []
+
+    for i in range(total):
+        uuid = '{:040x}'.format(i)
+        individual = '{:040x}'.format(rnd.randrange(total))
+        name = _name(rnd, given_names, surnames)
+        identities.append((uuid, individual, name))
+
+    return identities
+
+
+def _word(rnd):
+    length = rnd.randint(4, 9)
+    return ''.join(rnd.choice(string.ascii_lowercase) for _ in range(length)).title()
+
+
+def _name(rnd, given_names, surnames):
+    """Return a random name, a variation of it or `None`."""
+
+    dice = rnd.random()
+
+    if dice < 0.1:
+        return None
+
+    given_name = rnd.choice(given_names)
+    surname = rnd.choice(surnames)
+
+    if dice < 0.2:
+        pos = rnd.randrange(len(surname))
+        surname = surname[:pos] + rnd.choice(string.ascii_lowercase) + surname[pos + 1:]
+    elif dice < 0.3:
+        return f"{surname}, {given_name}"
+
+    return f"{given_name} {surname}"
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        s = "\n\nReceived Ctrl-C or other break signal. Exiting.\n"
+        sys.stdout.write(s)
+        sys.exit(0)
+    except RuntimeError as e:
+        s = f"Error: {e}\n"
+        sys.stderr.write(s)
+        sys.exit(1)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import argparse
+import functools
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import django
+import pandas
+
+
+DESC_MSG = """This script compares the memory and the wall time needed to
+find identity matches with the hash-join engine of SortingHat and with
+the former Pandas implementation.
+
+Identities are generated randomly, so no database is needed. Both engines
+run over the same data and their results are checked to be equal, once
+the groups of the former implementation are made transitive. Take
+into account the figures for Pandas do not include the cost of loading
+`Identity` objects from the database, which was also part of the former
+implementation.
+
+    Execute:
+    ```
+    $ PYTHONPATH=. python3 utils/benchmark_matching.py -n 1000000 -s 2000
+    [2021-07-08 11:11:07,968][INFO] Generating 1000000 identities (2000 sources) ...
+    [2021-07-08 11:11:55,178][INFO] pandas: 10.01 s; peak memory 309.70 MB
+    [2021-07-08 11:12:18,066][INFO] hash-join: 2.08 s; peak memory 3.54 MB
+    [2021-07-08 11:12:18,122][INFO] Results are equal
+    ```
+"""
+
+CRITERIA = ['email', 'name', 'username']
+
+logging.basicConfig(format='[%(asctime)s][%(levelname)s] %(message)s',
+                    level=logging.INFO)
+logger = logging.getLogger('benchmark_matching')
+
+
+def main():
+    args = parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', args.settings)
+    django.setup()
+
+    from sortinghat.core.recommendations.clustering import DisjointSet
+    from sortinghat.core.recommendations.matching import _find_matches
+
+    logger.info(f"Generating {args.identities} identities ({args.sources} sources) ...")
+
+    rnd = random.Random(args.seed)
+    identities = generate_identities(rnd, args.identities)
+    sources = rnd.sample(identities, min(args.sources, len(identities)))
+
+    if not args.skip_pandas:
+        expected = run('pandas', pandas_find_matches,
+                       sources, identities, args.verbose)
+
+    result = run('hash-join', _find_matches,
+                 sources, identities, args.verbose)
+
+    if args.workers > 1:
+        find_matches = functools.partial(_find_matches, workers=args.workers)
+        partitioned = run(f"partitioned ({args.workers} workers)", find_matches,
+                          sources, identities, args.verbose)
+        if partitioned != result:
+            raise RuntimeError("results from partitioned hash-join differ")
+
+    if not args.skip_pandas:
+        # Former groups were not always transitive
+        expected = close_groups(DisjointSet(), expected)
+        if expected != result:
+            raise RuntimeError("results from both engines differ")
+        logger.info("Results are equal")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=DESC_MSG,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument('-n', '--identities', type=int, default=100000,
+                        help="number of identities (by default = 100000)")
+    parser.add_argument('-s', '--sources', type=int, default=1000,
+                        help="number of source identities (by default = 1000)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="random seed (by default = 0)")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="also run the partitioned hash-join with this number of processes")
+    parser.add_argument('--verbose', action='store_true', default=False,
+                        help="match identities instead of individuals")
+    parser.add_argument('--skip-pandas', action='store_true', default=False,
+                        help="do not run the Pandas implementation")
+    parser.add_argument('--settings', default='config.settings.testing',
+                        help="Django settings module (by default = 'config.settings.testing')")
+    args = parser.parse_args()
+
+    return args
+
+
+def generate_identities(rnd, total):
+    """Generate a list of random identities data tuples.
+
+    Tuples follow the format `(uuid, individual, email, name, username)`.
+    Values are taken from pools smaller than the number of identities,
+    so many of them will match.
+    """
+    pool = max(total // 4, 1)
+    identities = []
+
+    for i in range(total):
+        uuid = '{:040x}'.format(i)
+        individual = '{:040x}'.format(rnd.randrange(total))
+        email = _pick(rnd, 'user{}@example.com', pool)
+        name = _pick(rnd, 'User Name {}', pool)
+        username = _pick(rnd, 'user{}', pool)
+        identities.append((uuid, individual, email, name, username))
+
+    return identities
+
+
+def _pick(rnd, fmt, pool):
+    """Return a random value from a pool or `None`."""
+
+    if rnd.random() < 0.3:
+        return None
+    return fmt.format(rnd.randrange(pool))
+
+
+def run(name, find_matches, sources, identities, verbose):
+    """Run a matching engine measuring time and memory.
+
+    Memory is measured on a second run because tracing
+    allocations slows down the execution.
+    """
+    before = time.perf_counter()
+    matched = find_matches(sources, iter(identities), CRITERIA, verbose)
+    elapsed = time.perf_counter() - before
+
+    tracemalloc.start()
+    find_matches(sources, iter(identities), CRITERIA, verbose)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    logger.info(f"{name}: {elapsed:.2f} s; peak memory {peak / 2**20:.2f} MB")
+
+    return matched
+
+
+def close_groups(dset, matched):
+    """Join the groups of matches that share any element."""
+
+    for group in matched.values():
+        group = iter(group)
+        first = next(group)
+        dset.add(first)
+        for element in group:
+            dset.union(first, element)
+
+    groups = {}
+    for members in dset.groups():
+        group = set(members)
+        for element in members:
+            groups[element] = group
+
+    return {key: groups[next(iter(group))] for key, group in matched.items()}
+
+
+def pandas_find_matches(set_x, set_y, criteria, verbose):
+    """Former Pandas implementation of `_find_matches`.
+
+    Identities are converted to dictionaries, like `model_to_dict`
+    did with `Identity` objects, before creating the dataframes.
+    """
+    def _to_dicts(data_set):
+        fields = ['uuid', 'individual'] + criteria
+        return [dict(zip(fields, row)) for row in data_set]
+
+    def _to_df(data_set):
+        df = pandas.DataFrame(data_set)
+        return df.sort_values(['individual'])
+
+    def _filter_criteria(df, c):
+        cols = ['uuid', 'individual', c]
+        cdf = df[cols]
+        return cdf.dropna(subset=[c])
+
+    def _calculate_matches_groups(grouped_uids, verbose=False):
+        matches = {}
+        col_name = 'uuid_y' if verbose else 'individual_y'
+
+        sorted_keys = sorted(grouped_uids.groups.keys())
+
+        while sorted_keys:
+            group_key = sorted_keys.pop(0)
+            uuid_set = set()
+            for uuid in grouped_uids.get_group(group_key)[col_name]:
+                uuid_set.add(uuid)
+
+            for key in matches:
+                prev_match = matches[key]
+                if prev_match == uuid_set:
+                    continue
+                elif prev_match.intersection(uuid_set):
+                    prev_match.update(uuid_set)
+                    uuid_set = prev_match
+            matches[group_key] = uuid_set
+
+        return matches
+
+    data_x = _to_dicts(set_x)
+    data_y = _to_dicts(set_y)
+
+    if (not data_x) or (not data_y):
+        return {}
+
+    df_x = _to_df(data_x)
+    df_y = _to_df(data_y)
+
+    cdfs = []
+
+    for c in criteria:
+        cdf_x = _filter_criteria(df_x, c)
+        cdf_y = _filter_criteria(df_y, c)
+        cdf = pandas.merge(cdf_x, cdf_y, on=c, how='inner')
+        cdf = cdf[['individual_y', 'uuid_x', 'uuid_y']]
+        cdfs.append(cdf)
+
+    result = pandas.concat(cdfs)
+    result = result.drop_duplicates()
+
+    g_result = result.groupby(by=['uuid_x'],
+                              as_index=True, sort=True)
+
+    return _calculate_matches_groups(g_result, verbose=verbose)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        s = "\n\nReceived Ctrl-C or other break signal. Exiting.\n"
+        sys.stdout.write(s)
+        sys.exit(0)
+    except RuntimeError as e:
+        s = f"Error: {e}\n"
+        sys.stderr.write(s)
+        sys.exit(1)
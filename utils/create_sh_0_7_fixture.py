@@ -53,6 +53,20 @@ database to load into the new SortingHat using Django.
     $ python3 manage.py loaddata test_sh_fixture.json --settings=config.settings.devel
     Installed 148542 object(s) from 1 fixture(s)
     ```
+    Build the index of matching keys for the loaded identities.
+    ```
+    $ python3 manage.py rebuild_matching_index --settings=config.settings.devel
+    Matching index rebuilt; 391040 keys created
+    ```
+    Store the normalized values of the loaded identities.
+    ```
+    $ python3 manage.py rebuild_normalized_values --settings=config.settings.devel
+    Normalized values rebuilt; 160734 identities updated
+    ```
+    Store the affiliation recommendations of the loaded individuals.
+    ```
+    $ python3 manage.py rebuild_affiliation_recommendations --settings=config.settings.devel
+    ```
 """
 
 TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S%z'